@@ -0,0 +1,413 @@
+#!/usr/bin/env python3
+# autotune.py
+
+"""
+Calibración del número de workers (NUM_PROCESSORS) y de modelos por paso de
+loop (NUM_MODELS_LOOP) para un tipo de nodo.
+
+Para cada número de workers candidato se lanza, en un proceso y una carpeta
+aparte, una construcción corta de AutoModel y un paso de DOPEHRLoopModel con los
+mismos parámetros que el pipeline. Se mide el rendimiento (modelos/hora) y el
+pico de memoria del árbol de procesos, y se escribe el perfil recomendado en
+AUTOTUNE_PROFILE_DIR/<tipo de nodo>.json, que config.py aplica en las
+siguientes ejecuciones en ese mismo tipo de nodo con MODELLER_USE_AUTOTUNE=1
+(solo a NUM_PROCESSORS y NUM_MODELS_LOOP que sigan en None).
+
+Uso (dentro de una reserva de SLURM con el nodo completo):
+    python3 autotune.py                         # candidatos: 1x, 1.5x y 2x las CPUs
+    python3 autotune.py --workers 24,48,72,96 --models-per-worker 2
+    python3 autotune.py --loop 120-131 --node-type cascadelake-48cpu
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import threading
+import subprocess
+from typing import List, Tuple, Dict, Any, Optional
+
+import config
+import pipeline_log
+from config import AUTOTUNE_PROFILE_DIR, AUTOTUNE_NODE_TYPE, ALIGNMENT_FILE, ALIGN_CODE_SEQUENCE, CHAIN_ID
+from config import MIN_LOOP_LENGTH, MAX_LOOP_LENGTH
+
+logger = pipeline_log.get_logger(__name__)
+
+AUTOTUNE_WORK_DIR = 'autotune_runs'
+RESULT_MARKER = 'AUTOTUNE_RESULT '
+MEMORY_SAMPLE_INTERVAL = 1.0   # s entre muestras de memoria del árbol de procesos
+MEMORY_MARGIN = 0.9            # Fracción de la memoria disponible que pueden ocupar los workers
+THROUGHPUT_TOLERANCE = 0.03    # Con rendimientos a menos de un 3% del mejor se prefieren menos workers
+
+# =================================================================
+# RECURSOS DEL NODO
+# =================================================================
+
+def allocated_cpus() -> int:
+    """CPUs asignadas al trabajo: SLURM_CPUS_PER_TASK o la afinidad del proceso."""
+    if os.environ.get('SLURM_CPUS_PER_TASK'):
+        return int(os.environ['SLURM_CPUS_PER_TASK'])
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+def available_memory_mb() -> Optional[float]:
+    """Memoria utilizable por el trabajo: límite de SLURM si existe, si no MemAvailable del nodo."""
+    if os.environ.get('SLURM_MEM_PER_NODE'):
+        return float(os.environ['SLURM_MEM_PER_NODE'])
+    if os.environ.get('SLURM_MEM_PER_CPU'):
+        return float(os.environ['SLURM_MEM_PER_CPU']) * allocated_cpus()
+    try:
+        with open('/proc/meminfo', 'r') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    return None
+
+def _process_tree_rss_mb(root_pid: int) -> float:
+    """Suma del RSS (MB) de un proceso y todos sus descendientes, leída de /proc."""
+    children: Dict[int, List[int]] = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat', 'r') as f:
+                # El nombre del proceso va entre paréntesis y puede contener espacios
+                ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+
+    total_kb = 0
+    pending = [root_pid]
+    while pending:
+        pid = pending.pop()
+        pending.extend(children.get(pid, []))
+        try:
+            with open(f'/proc/{pid}/status', 'r') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total_kb += int(line.split()[1])
+                        break
+        except OSError:
+            continue
+    return total_kb / 1024.0
+
+class MemorySampler(threading.Thread):
+    """Muestrea en segundo plano el pico de memoria del árbol de procesos de la calibración."""
+
+    def __init__(self, root_pid: int, interval: float = MEMORY_SAMPLE_INTERVAL):
+        super().__init__(daemon=True)
+        self.root_pid = root_pid
+        self.interval = interval
+        self.peak_mb = 0.0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            self.peak_mb = max(self.peak_mb, _process_tree_rss_mb(self.root_pid))
+            self._stop_event.wait(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+# =================================================================
+# CALIBRACIÓN DE UN NÚMERO DE WORKERS (PROCESO HIJO)
+# =================================================================
+
+def calibration_loop(alignment_file: str) -> Optional[Tuple[int, int]]:
+    """Primer loop del alineamiento con longitud entre MIN_LOOP_LENGTH y MAX_LOOP_LENGTH."""
+    import sequence_utils
+    entries = sequence_utils.read_aligned_sequences_from_ali(alignment_file)
+    target = [seq for code, seq in entries if code == ALIGN_CODE_SEQUENCE]
+    templates = [seq for code, seq in entries if code != ALIGN_CODE_SEQUENCE]
+    if not target or not templates:
+        return None
+    for start, end in sequence_utils.find_missing_residues(sequence_utils.merge_template_sequences(templates), target[0]):
+        if MIN_LOOP_LENGTH <= end - start + 1 <= MAX_LOOP_LENGTH:
+            return start, end
+    return None
+
+def directory_usage(path: str = '.') -> Tuple[int, int]:
+    """Número de archivos y bytes de una carpeta (sin subcarpetas)."""
+    files = 0
+    total_bytes = 0
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.is_file():
+                files += 1
+                total_bytes += entry.stat().st_size
+    return files, total_bytes
+
+def run_calibration(workers: int, num_models: int, alignment_file: str, input_dir: str,
+                    loop_range: Optional[Tuple[int, int]]) -> Dict[str, Any]:
+    """
+    Ejecuta AutoModel y un paso de DOPEHRLoopModel con 'workers' workers locales
+    y num_models modelos cada uno, en la carpeta actual. Retorna los tiempos, los
+    archivos y bytes escritos por cada etapa y el coste de evaluar un modelo
+    (complete_pdb + DOPE-HR, como en la evaluación final).
+    """
+    from modeller import Environ, log
+    from modeller.selection import Selection
+    from modeller.automodel import AutoModel, assess, autosched, refine
+    from modeller.parallel import Job, LocalWorker
+    from modeller.scripts import complete_pdb
+    from custom_models import DynamicLoopRefiner
+    import sequence_utils
+
+    log.minimal()
+    env = Environ()
+    env.io.atom_files_directory = [input_dir, '.', os.path.join(input_dir, '..', 'atom_files')]
+    env.io.hetatm = True
+    env.jobs = workers
+
+    job = Job()
+    for _ in range(workers):
+        job.append(LocalWorker())
+    job.start()
+
+    knowns = [code for code, _ in sequence_utils.read_aligned_sequences_from_ali(alignment_file) if code != ALIGN_CODE_SEQUENCE]
+    a = AutoModel(env,
+                  alnfile=alignment_file,
+                  knowns=knowns,
+                  sequence=ALIGN_CODE_SEQUENCE,
+                  assess_methods=(assess.DOPEHR, assess.GA341))
+    a.use_parallel_job(job)
+    a.starting_model = 1
+    a.ending_model = num_models
+    a.library_schedule = autosched.slow
+    a.max_var_iterations = 1000
+    files_before, bytes_before = directory_usage()
+    auto_start = time.time()
+    a.make()
+    auto_seconds = time.time() - auto_start
+    files_after_auto, bytes_after_auto = directory_usage()
+
+    auto_outputs = [m for m in a.outputs if m.get('failure') is None]
+    result = {
+        'workers': workers,
+        'auto_models': len(auto_outputs),
+        'auto_seconds': auto_seconds,
+        'auto_files': files_after_auto - files_before,
+        'auto_bytes': bytes_after_auto - bytes_before,
+        'loop_models': 0,
+        'loop_seconds': None,
+        'loop_files': 0,
+        'loop_bytes': 0,
+        'loop': None,
+        'eval_seconds': None
+    }
+    if not auto_outputs:
+        return result
+
+    best_auto = min(auto_outputs, key=lambda m: m.get('DOPE-HR score', 9999999.0))['name']
+    eval_start = time.time()
+    mdl = complete_pdb(env, best_auto)
+    Selection(mdl.chains[0]).assess_dopehr()
+    mdl.assess_normalized_dopehr()
+    result['eval_seconds'] = time.time() - eval_start
+
+    loop_range = loop_range or calibration_loop(alignment_file)
+    if loop_range is None:
+        return result
+
+    ml = DynamicLoopRefiner(env,
+                            inimodel=best_auto,
+                            sequence=ALIGN_CODE_SEQUENCE,
+                            loop_start=loop_range[0],
+                            loop_end=loop_range[1],
+                            chain_id=CHAIN_ID)
+    ml.use_parallel_job(job)
+    ml.loop.starting_model = 1
+    ml.loop.ending_model = num_models
+    ml.loop.md_level = refine.slow_large
+    ml.loop.assess_methods = (assess.DOPEHR, assess.GA341)
+    ml.max_var_iterations = 1000
+    loop_start_time = time.time()
+    ml.make()
+
+    result['loop_seconds'] = time.time() - loop_start_time
+    files_after_loop, bytes_after_loop = directory_usage()
+    result['loop_files'] = files_after_loop - files_after_auto
+    result['loop_bytes'] = bytes_after_loop - bytes_after_auto
+    result['loop_models'] = len([m for m in ml.loop.outputs if m.get('failure') is None])
+    result['loop'] = list(loop_range)
+    return result
+
+# =================================================================
+# BARRIDO, RECOMENDACIÓN Y PERFIL
+# =================================================================
+
+def default_worker_counts(cpus: int) -> List[int]:
+    """Candidatos por defecto: 1x, 1.5x y 2x las CPUs asignadas (hilos por CPU)."""
+    return sorted({cpus, max(1, int(cpus * 1.5)), cpus * 2})
+
+def measure_worker_count(workers: int, models_per_worker: int, alignment_file: str,
+                         loop_range: Optional[Tuple[int, int]]) -> Dict[str, Any]:
+    """Lanza la calibración de un número de workers en un proceso hijo y mide su memoria."""
+    work_dir = os.path.join(AUTOTUNE_WORK_DIR, f'w{workers}')
+    shutil.rmtree(work_dir, ignore_errors=True)
+    os.makedirs(work_dir)
+
+    command = [sys.executable, os.path.abspath(__file__), '--run-one', str(workers),
+               '--models-per-worker', str(models_per_worker),
+               '--alignment', os.path.abspath(alignment_file),
+               '--input-dir', os.getcwd()]
+    if loop_range:
+        command += ['--loop', f'{loop_range[0]}-{loop_range[1]}']
+
+    with open(os.path.join(work_dir, 'calibration.log'), 'w') as log_file:
+        process = subprocess.Popen(command, cwd=work_dir, stdout=subprocess.PIPE, stderr=log_file, text=True)
+        sampler = MemorySampler(process.pid)
+        sampler.start()
+        stdout, _ = process.communicate()
+        sampler.stop()
+        log_file.write(stdout)
+
+    result_lines = [line for line in stdout.splitlines() if line.startswith(RESULT_MARKER)]
+    if process.returncode != 0 or not result_lines:
+        raise RuntimeError(f"la calibración con {workers} workers terminó con código {process.returncode} "
+                           f"(ver {os.path.join(work_dir, 'calibration.log')})")
+
+    result = json.loads(result_lines[-1][len(RESULT_MARKER):])
+    result['auto_models_per_hour'] = result['auto_models'] / result['auto_seconds'] * 3600 if result['auto_seconds'] else 0.0
+    result['loop_models_per_hour'] = (result['loop_models'] / result['loop_seconds'] * 3600
+                                      if result['loop_seconds'] else None)
+    result['peak_memory_mb'] = round(sampler.peak_mb, 1)
+    result['memory_per_worker_mb'] = round(sampler.peak_mb / workers, 1)
+    return result
+
+def recommend(results: List[Dict[str, Any]], memory_mb: Optional[float], loop_rounds: int = 1) -> Dict[str, Any]:
+    """
+    Elige el número de workers con mayor rendimiento combinado (AutoModel y loops,
+    normalizados al mejor de cada uno) cuyo pico de memoria cabe en la memoria
+    disponible. Entre rendimientos a menos de THROUGHPUT_TOLERANCE del mejor se
+    elige el menor número de workers. NUM_MODELS_LOOP es un múltiplo de los workers
+    para que ninguna ronda del DOPEHRLoopModel deje workers ociosos.
+    """
+    best_auto = max(r['auto_models_per_hour'] for r in results) or 1.0
+    loop_rates = [r['loop_models_per_hour'] for r in results if r['loop_models_per_hour']]
+    best_loop = max(loop_rates) if loop_rates else None
+
+    def combined(r: Dict[str, Any]) -> float:
+        score = r['auto_models_per_hour'] / best_auto
+        if best_loop and r['loop_models_per_hour']:
+            score = (score + r['loop_models_per_hour'] / best_loop) / 2
+        return score
+
+    fitting = [r for r in results
+               if memory_mb is None or r['peak_memory_mb'] <= memory_mb * MEMORY_MARGIN]
+    candidates = fitting or [min(results, key=lambda r: r['peak_memory_mb'])]
+    best_score = max(combined(r) for r in candidates)
+    chosen = min((r for r in candidates if combined(r) >= best_score * (1 - THROUGHPUT_TOLERANCE)),
+                 key=lambda r: r['workers'])
+
+    return {
+        'NUM_PROCESSORS': chosen['workers'],
+        'NUM_MODELS_LOOP': chosen['workers'] * max(1, loop_rounds),
+        'combined_throughput': round(combined(chosen), 3),
+        'memory_limited': len(fitting) < len(results)
+    }
+
+def write_profile(node_type: str, profile: Dict[str, Any], profile_dir: str = AUTOTUNE_PROFILE_DIR) -> str:
+    """Guarda el perfil del tipo de nodo (escritura atómica) y retorna su ruta."""
+    os.makedirs(profile_dir, exist_ok=True)
+    profile_file = os.path.join(profile_dir, f'{node_type}.json')
+    temp_file = profile_file + '.tmp'
+    with open(temp_file, 'w') as f:
+        json.dump(profile, f, indent=2)
+    os.replace(temp_file, profile_file)
+    return profile_file
+
+def log_results_table(results: List[Dict[str, Any]], chosen_workers: int) -> None:
+    logger.info(f"\n{'Workers':<9} {'AutoModel/h':<13} {'Loop/h':<10} {'Pico MB':<10} {'MB/worker':<10}")
+    logger.info('-' * 55)
+    for r in results:
+        loop_rate = f"{r['loop_models_per_hour']:.1f}" if r['loop_models_per_hour'] else '-'
+        marker = '  <-- recomendado' if r['workers'] == chosen_workers else ''
+        logger.info(f"{r['workers']:<9} {r['auto_models_per_hour']:<13.1f} {loop_rate:<10} "
+                    f"{r['peak_memory_mb']:<10.0f} {r['memory_per_worker_mb']:<10.0f}{marker}")
+
+def _parse_loop(value: Optional[str]) -> Optional[Tuple[int, int]]:
+    if not value:
+        return None
+    start, end = value.split('-')
+    return int(start), int(end)
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Calibra NUM_PROCESSORS y NUM_MODELS_LOOP para este tipo de nodo.")
+    parser.add_argument('--workers', default='',
+                        help="Números de workers a probar, separados por comas (por defecto 1x, 1.5x y 2x las CPUs)")
+    parser.add_argument('--models-per-worker', type=int, default=2,
+                        help="Modelos por worker en cada construcción de calibración")
+    parser.add_argument('--loop-rounds', type=int, default=1,
+                        help="Rondas de DOPEHRLoopModel por paso de loop (NUM_MODELS_LOOP = workers x rondas)")
+    parser.add_argument('--loop', default='', help="Loop de calibración INICIO-FIN (por defecto el primero del alineamiento)")
+    parser.add_argument('--alignment', default=ALIGNMENT_FILE, help="Alineamiento PIR (generado por controller.py)")
+    parser.add_argument('--node-type', default=AUTOTUNE_NODE_TYPE or config.detect_node_type(), help="Nombre del perfil (tipo de nodo)")
+    parser.add_argument('--run-one', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--input-dir', default=os.getcwd(), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.run_one:
+        result = run_calibration(args.run_one, args.run_one * args.models_per_worker,
+                                 args.alignment, args.input_dir, _parse_loop(args.loop))
+        print(RESULT_MARKER + json.dumps(result), flush=True)
+        return 0
+
+    pipeline_log.setup_logging(log_file=None)
+    if not os.path.exists(args.alignment):
+        parser.error(f"No existe el alineamiento '{args.alignment}'. Ejecute antes controller.py (etapa de alineamiento).")
+
+    cpus = allocated_cpus()
+    worker_counts = ([int(w) for w in args.workers.split(',') if w.strip()] if args.workers
+                     else default_worker_counts(cpus))
+    memory_mb = available_memory_mb()
+    loop_range = _parse_loop(args.loop)
+
+    logger.info(f"[AUTOTUNE] Nodo '{args.node_type}': {cpus} CPUs, "
+                f"{f'{memory_mb:.0f} MB' if memory_mb else 'memoria desconocida'}. Workers a probar: {worker_counts}")
+
+    results = []
+    for workers in worker_counts:
+        logger.info(f"[AUTOTUNE] Calibrando con {workers} workers ({workers * args.models_per_worker} modelos por etapa)...")
+        try:
+            result = measure_worker_count(workers, args.models_per_worker, args.alignment, loop_range)
+        except (RuntimeError, OSError, ValueError) as e:
+            logger.error(str(e))
+            continue
+        results.append(result)
+
+    if not results:
+        logger.error("Ninguna calibración terminó correctamente. No se escribe el perfil.")
+        return 1
+
+    recommendation = recommend(results, memory_mb, args.loop_rounds)
+    log_results_table(results, recommendation['NUM_PROCESSORS'])
+    if recommendation['memory_limited']:
+        logger.warning("Algunos números de workers se descartaron por superar la memoria disponible.")
+
+    profile = {
+        'node_type': args.node_type,
+        'cpus': cpus,
+        'memory_mb': memory_mb,
+        'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'NUM_PROCESSORS': recommendation['NUM_PROCESSORS'],
+        'NUM_MODELS_LOOP': recommendation['NUM_MODELS_LOOP'],
+        'recommendation': recommendation,
+        'measurements': results
+    }
+    profile_file = write_profile(args.node_type, profile)
+    logger.info(f"\n[AUTOTUNE] Perfil guardado en {profile_file}: NUM_PROCESSORS = {profile['NUM_PROCESSORS']}, "
+                f"NUM_MODELS_LOOP = {profile['NUM_MODELS_LOOP']}. config.py lo aplicará en este tipo de nodo.")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
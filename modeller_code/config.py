@@ -3,6 +3,7 @@
 
 from typing import List, Tuple, Dict, Any
 import os
+import json
 
 # =================================================================
 # CONFIGURACIÓN Y PARÁMETROS DE ENTRADA CRÍTICOS
@@ -19,16 +20,27 @@ CHAIN_ID = "A"
 sequence_full = "MSYDYHQNWGRDGGPRSSGGGYGGSYGGSHGGGHGGNRGSGGGGGGGGGRGGRGRHPGHLKGREIGLWYAKKQGQKNKEAERQERAVVHMDERREEQIVQLLHSVQTKNDKDEEAQISWFAPEDHGYGTEAPAENKPNSVKNVEHQEKKMINQEKRPFRIRDKYIDRDSEYLLQENEPDATLDQQLLEDLQKKKTDLRYIEMQRFREKLPSYGMQKELVNMIDNHQVTVISGETGCGKTTQVTQFILDNYIERGKGSACRIVCTQPRRISAISVAERVAAERAESCGNGNSTGYQIRLQSRLPRKQGSILYCTTGIILQWLQSDPHLSSVSHIVLDEIHERNLQSDVLMTVVKDLLSYRPDLKVVLMSATLNAEKFSEYFGNCPMIHIPGFTFPVVEYLLEDIIEKIRYVPEQKEHRSQFKKGFMQGHVNRQEKEEKEAIYKERWPGYLRELRQRYSASTVDVVEMMDDEKVDLNLIAALIRYIVLEEEDGAILVFLPGWDNISTLHDLLMSQVMFKSDKFIIIPLHSLMPTVNQTQVFKRTPPGVRKIVIATNIAETSITIDDVVYVIDGGKIKETHFDTQNNISTMSAEWVSKANAKQRKGRAGRVQPGHCYHLYNSLRASLLDDYQLPEILRTPLEELCLQIKILRLGGIAHFLSRLMDPPSNEAVLLSIKHLMELNALDKQEELTPLGVHLARLPVEPHIGKMILFGALFCCLDPVLTIAASLSFKDPFVIPLGKEKVADARRKELAKDTKSDHLTVVNAFKGWEKAKQRGFRYEKDYCWEYFLSSNTLQMLHNMKGQFAEHLLGAGFVSSRNPQDPESNINSDNEKIIKAVICAGLYPKVAKIRLNLGKKRKMVKVYTKTDGVVAIHPKSVNVEQTEFNYNWLIYHLKMRTSSIYLYDCTEVSPYCLLFFGGDISIQKDNDQETIAVDEWIIFQSPARIAHLVKELRKELDILLQEKIESPHPVDWKDTKSRDCAVLSAIIDLIKTQEKATPRNLPPRFQDGYYS"
 pdb_aa = "LKGREIGLWYAKKQGQKNKEAERQERAVVHMDERREEQIVQLLHSVATLDQQLLEDLQKKKTDLRYIEMQRFREKLPSYGMQKELVNMIDNHQVTVISGETGCGKTTQVTQFILDNYIERGKGSACRIVCTQPRRISAISVAERVAAERAESCGNGNSTGYQIRLQSRLPRKQGSILYCTTGIILQWLQSDPHLSSVSHIVLDEIHERNLQSDVLMTVVKDLLSYRPDLKVVLMSATLNAEKFSEYFGNCPMIHIPGFTFPVVEYLLEDIIEKIRYVPEQKEHRSQFKKGFMQGHVNRQEKEEKEAIYKERWPGYLRELRQRYSASTVDVVEMMDDEKVDLNLIAALIRYIVLEEEDGAILVFLPGWDNISTLHDLLMSQVMFKSDKFIIIPLHSLMPTVNQTQVFKRTPPGVRKIVIATNIAETSITIDDVVYVIDGGKIKETHFDTQNNISTMSAEWVSKANAKQRKGRAGRVQPGHCYHLYNSLRASLLDDYQLPEILRTPLEELCLQIKILRLGGIAHFLSRLMDPPSNEAVLLSIKHLMELNALDKQEELTPLGVHLARLPVEPHIGKMILFGALFCCLDPVLTIAASLSFKDPFVIPLGKEKVADARRKELAKDTKSDHLTVVNAFKGWEKAKQRGFRYEKDYCWEYFLSSNTLQMLHNMKGQFAEHLLGAGFVSSRNPQDPESNINSDNEKIIKAVICAGLYPKVAKIRLNLGKKRKMVKVYTKTDGVVAIHPKSVNVEQTEFNYNWLIYHLKMRTSSIYLYDCTEVSPYCLLFFGGDISIQKDNDQETIAVDEWIIFQSPARIAHLVKELRKELDILLQEKIESPHPVDWKDTKSRDCAVLSAIIDLIKTQEK"
 
+# --- Preparación Automática del Template (template_prep.py) ---
+RAW_PDB_TEMPLATE_FILE = None      # Si se indica un PDB crudo (ej: '8vx1.pdb'), se prepara y se usa como PDB_TEMPLATE_FILE
+TEMPLATE_EXCLUDE_RESNAMES = ('HOH', 'WAT', 'DOD', 'NA', 'CL', 'K', 'MG', 'CA', 'ZN', 'MN',
+                             'SO4', 'PO4', 'GOL', 'EDO', 'PEG', 'ACT', 'IOD', 'BR')  # Aguas, iones y aditivos a eliminar
+TEMPLATE_HETATM_CHAINS = ()       # Cadenas originales que se escriben como HETATM (ej: ('B', 'C') para ADN/ligandos)
+if RAW_PDB_TEMPLATE_FILE:
+    PDB_TEMPLATE_FILE = os.path.splitext(RAW_PDB_TEMPLATE_FILE)[0] + '_prep.pdb'
 
 # --- Configuración de Procesamiento y Modelos ---
-NUM_PROCESSORS = int(os.environ.get('SLURM_CPUS_PER_TASK', 1))  # Se recomeinda cambiar por el doble del .sh
+_SLURM_CPUS = int(os.environ.get('SLURM_CPUS_PER_TASK', 1))
+NUM_PROCESSORS = None  # None = perfil de autotune o SLURM_CPUS_PER_TASK. Se recomeinda cambiar por el doble del .sh
 NUM_MODELS_AUTO = 10000             # Número de modelos iniciales generados por AutoModel
 NUM_MODELS_TO_REFINE = 20        # Número de modelos del AutoModel (Top N por DOPEHR) que entran al DOPEHRLoopModel
-NUM_MODELS_LOOP = int(os.environ.get('SLURM_CPUS_PER_TASK', 1))             # Número de modelos a generar por cada refinamiento de DOPEHRLoopModel ### int(os.environ.get('SLURM_CPUS_PER_TASK', 1)) ## Mínimo la misma cantidad que procesadores (máxima eficiencia) 
+NUM_MODELS_LOOP = None             # Número de modelos a generar por cada refinamiento de DOPEHRLoopModel (None = perfil de autotune o SLURM_CPUS_PER_TASK) ## Mínimo la misma cantidad que procesadores (máxima eficiencia)
 NUM_BEST_FINAL_MODELS = 100       # Cuántos de los mejores modelos finales se mostrarán en el ranking
 
 # --- Configuración de Alineamiento ---
 USE_MANUAL_ALIGNMENT = False    # Si es True, se usan los archivos PIR manuales
+TEMPLATE_DIRECTORY = None       # Modo multi-template: carpeta con PDBs candidatos (None = solo PDB_TEMPLATE_FILE)
+NUM_TEMPLATES_TO_USE = 1        # Cuántos de los mejores templates (cobertura x identidad) entran al PIR y a AutoModel
+TEMPLATE_RANKING_FILE = 'template_ranking.csv'  # Ranking de templates candidatos
 MANUAL_ALIGNMENT_FILE = 'manual_template_FullSeq.ali'        # Archivo PIR manual SIN CDE
 MANUAL_ALIGNMENT_CDE_FILE = 'manual_template_FullSeq_cde.ali' # Archivo PIR manual CON CDE
 
@@ -36,10 +48,260 @@ MANUAL_ALIGNMENT_CDE_FILE = 'manual_template_FullSeq_cde.ali' # Archivo PIR manu
 ALIGNMENT_FILE = f'{ALIGN_CODE_TEMPLATE}_{ALIGN_CODE_SEQUENCE}.ali' 
 ALIGNMENT_CDE_FILE = f'{ALIGN_CODE_TEMPLATE}_{ALIGN_CODE_SEQUENCE}_cde.ali' 
 
-# Exportar las variables de configuración para el uso en otros módulos
+# =================================================================
+# REFINAMIENTO DE LOOPS
+# =================================================================
+
+# --- Configuración de Loops Largos (refinamiento por ventanas) ---
+MIN_LOOP_LENGTH = 4               # Loops más cortos no se refinan
+MAX_LOOP_LENGTH = 30              # Loops más largos se dividen en ventanas solapadas refinadas en paralelo
+LONG_LOOP_WINDOW = 20             # Residuos por ventana
+LONG_LOOP_OVERLAP = 6             # Solapamiento mínimo entre ventanas consecutivas
+LONG_LOOP_FINAL_PASS = False      # Si es True, tras unir las ventanas se hace una pasada rápida (refine.fast) sobre el segmento completo
+
+# --- Selección de Regiones por Perfil de Energía (region_selection.py) ---
+LOOP_SELECTION = 'gaps'           # 'gaps': solo huecos coil del alineamiento | 'profile': peores segmentos según el perfil DOPE-HR de cada modelo base (incluye huecos del alineamiento)
+PROFILE_SMOOTHING_WINDOW = 15     # Ventana de suavizado (residuos) del perfil DOPE-HR normalizado
+PROFILE_THRESHOLD = None          # Umbral de energía del perfil; None = media + PROFILE_THRESHOLD_SIGMA desviaciones de cada modelo
+PROFILE_THRESHOLD_SIGMA = 1.0     # Desviaciones estándar sobre la media para el umbral automático
+PROFILE_MERGE_GAP = 2             # Tramos sobre el umbral separados por estos residuos o menos se unen
+REFINE_MAX_SEGMENTS = 4           # Segmentos refinados por modelo base (0 = sin límite)
+REFINE_MAX_RESIDUES = 80          # Residuos refinados en total por modelo base (0 = sin límite)
+ENERGY_PROFILE_DIR = 'energy_profiles'  # Perfiles DOPE-HR de los modelos base (<modelo>.profile)
+
+# --- Refinamiento sobre Subsistema Recortado (entorno local del loop) ---
+LOOP_CROP_ENABLED = False         # Si es True, cada loop se refina y puntúa en un subsistema recortado y luego se reinserta en el modelo completo
+LOOP_CROP_RADIUS = 12.0           # Å: se incluyen los residuos con algún átomo a esta distancia de un átomo del loop
+LOOP_CROP_ANCHOR_RESIDUES = 2     # Residuos de anclaje a cada lado del loop que siempre se incluyen
+LOOP_CROP_DIR = 'cropped_systems' # Carpeta de los subsistemas recortados (temporales)
+
+# --- Semillas de Loops desde Biblioteca de Fragmentos (fragment_library.py) ---
+FRAGMENT_SEEDING = False          # Si es True, cada muestra de loop parte de un fragmento de los templates con anclajes compatibles
+FRAGMENT_LIBRARY_DIR = 'fragment_library'  # Carpeta de la biblioteca (arrays .npy por longitud + index.json)
+FRAGMENT_MAX_LENGTH = 30          # Longitud máxima de fragmento indexada
+FRAGMENT_ANCHOR_TOLERANCE = 1.0   # Å: diferencia RMS máxima entre la geometría de anclajes del fragmento y la del modelo
+FRAGMENT_SEEDED_MD_LEVEL = 'slow' # Nivel de refinamiento (refine.<nivel>) para loops con semillas; sin semillas se usa slow_large
+
+# --- Tolerancia a Fallos del Refinamiento (fault_tolerance.py) ---
+TASK_MAX_RETRIES = 2              # Reintentos de un paso de loop que falla o no produce modelos (cada uno con nueva semilla)
+TASK_TIMEOUT = 6 * 3600           # Segundos máximos de un paso de refinamiento (0 = sin límite); al superarlo se terminan los workers
+TASK_TIMEOUT_FACTOR = 5.0         # Con pasos ya medidos, el límite es este factor x la duración esperada (sin superar TASK_TIMEOUT)
+WORKER_MAX_RSS_MB = 4000          # Workers que superan esta memoria residente (MB) se reemplazan antes del siguiente paso (0 = sin límite)
+TASK_FAILURE_REPORT = 'task_failures.csv'  # Fallos por modelo: paso, intento, semilla, error y acción tomada
+
+# =================================================================
+# EJECUCIÓN Y RECURSOS DEL NODO
+# =================================================================
+
+# --- Perfil de Autoajuste por Tipo de Nodo (autotune.py) ---
+USE_AUTOTUNE_PROFILE = os.environ.get('MODELLER_USE_AUTOTUNE', '0') == '1'  # Opt-in: si existe un perfil calibrado para este tipo de nodo, da valor a NUM_PROCESSORS y NUM_MODELS_LOOP que sigan en None
+AUTOTUNE_PROFILE_DIR = 'autotune_profiles'  # Carpeta con un perfil JSON por tipo de nodo
+
+def detect_node_type() -> str:
+    """Tipo de nodo: modelo de CPU y CPUs asignadas (ej: 'intel-xeon-gold-6248-48cpu')."""
+    cpu_model = 'cpu'
+    try:
+        with open('/proc/cpuinfo', 'r') as f:
+            for line in f:
+                if line.startswith('model name'):
+                    cpu_model = line.split(':', 1)[1]
+                    break
+    except OSError:
+        pass
+    cpus = os.environ.get('SLURM_CPUS_PER_TASK') or str(os.cpu_count() or 1)
+    slug = ''.join(c if c.isalnum() else '-' for c in cpu_model.lower().replace('(r)', '').replace('(tm)', ''))
+    slug = '-'.join(part for part in slug.split('-') if part and part not in ('cpu', 'processor'))
+    return f'{slug}-{cpus}cpu'
+
+def _load_autotune_profile(node_type: str) -> Dict[str, Any]:
+    """Perfil calibrado para el tipo de nodo ({} si no existe o no se puede leer)."""
+    try:
+        with open(os.path.join(AUTOTUNE_PROFILE_DIR, f'{node_type}.json'), 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+# Nombre del perfil a usar (/proc/cpuinfo solo se lee con el perfil activado)
+AUTOTUNE_NODE_TYPE = os.environ.get('MODELLER_NODE_TYPE') or (detect_node_type() if USE_AUTOTUNE_PROFILE else None)
+AUTOTUNE_PROFILE = _load_autotune_profile(AUTOTUNE_NODE_TYPE) if USE_AUTOTUNE_PROFILE else {}
+AUTOTUNE_OVERRIDES: Dict[str, Tuple[int, int]] = {}  # {constante: (valor anterior, valor del perfil)}; el controller lo registra
+if AUTOTUNE_PROFILE:
+    # Solo se da valor a los que siguen en None: un valor fijado a mano en este archivo se respeta,
+    # aunque coincida con las CPUs de SLURM
+    if NUM_PROCESSORS is None:
+        NUM_PROCESSORS = int(AUTOTUNE_PROFILE['NUM_PROCESSORS'])
+        AUTOTUNE_OVERRIDES['NUM_PROCESSORS'] = (_SLURM_CPUS, NUM_PROCESSORS)
+    if NUM_MODELS_LOOP is None:
+        NUM_MODELS_LOOP = int(AUTOTUNE_PROFILE['NUM_MODELS_LOOP'])
+        AUTOTUNE_OVERRIDES['NUM_MODELS_LOOP'] = (_SLURM_CPUS, NUM_MODELS_LOOP)
+# Sin valor fijado ni perfil: las CPUs asignadas por SLURM
+if NUM_PROCESSORS is None:
+    NUM_PROCESSORS = _SLURM_CPUS
+if NUM_MODELS_LOOP is None:
+    NUM_MODELS_LOOP = _SLURM_CPUS
+
+# --- Pool de Workers Multi-nodo (worker_pool.py) ---
+WORKER_LAUNCHER = os.environ.get('MODELLER_WORKER_LAUNCHER', 'local')  # 'local' (solo este nodo) | 'srun' | 'ssh' | 'standin' (nodos simulados con subprocesos locales)
+WORKER_NODES = None               # Nodos del pool en formato SLURM (ej. 'node[01-04]'); None = SLURM_JOB_NODELIST
+WORKERS_PER_NODE = 0              # Workers por nodo remoto (0 = CPUs asignadas al nodo por SLURM)
+WORKER_SHARED_FILESYSTEM = True   # True: los nodos remotos trabajan en la misma carpeta | False: se copian entradas y se recogen salidas
+WORKER_SCRATCH_DIR = '/tmp/modeller_workers'  # Carpeta de trabajo en cada nodo remoto (sin sistema de archivos compartido)
+WORKER_MASTER_HOST = None         # Nombre con el que los workers remotos contactan al controller (None = nombre del nodo)
+
+# --- Colocación de Workers en CPUs (cpu_placement.py) ---
+WORKER_PINNING = os.environ.get('MODELLER_WORKER_PINNING', 'none')  # 'none' | 'core' (un núcleo por worker) | 'numa' (dominio NUMA por worker)
+WORKER_THREADS = 1                # Hilos de BLAS/OpenMP por worker (OMP_NUM_THREADS, MKL_NUM_THREADS...); 0 = sin límite
+CONTROLLER_RESERVED_CPUS = 1      # Con WORKER_PINNING, CPUs exclusivas del controller (evaluación final, selección de regiones)
+
+# --- Límite de Tiempo de la Reserva (walltime.py) ---
+WALLTIME_AWARE = True             # Si el trabajo de SLURM tiene límite de tiempo, AutoModel y los loops se recortan para garantizar el ranking final
+WALLTIME_LOOP_FRACTION = 0.3      # Fracción del tiempo restante al empezar AutoModel que se reserva para el refinamiento de loops
+WALLTIME_SAFETY_MARGIN = 300      # s de margen fijo antes del límite (además del tiempo de evaluación final)
+AUTOMODEL_BATCH_SIZE = 0          # Modelos por tanda de AutoModel cuando hay límite de tiempo (0 = 4 x NUM_PROCESSORS)
+RANKING_SECONDS_PER_MODEL = 2.0   # Coste inicial estimado de evaluar un modelo; se sustituye por el medido
+
+# --- Modo de Ensayo (controller.py --dry-run) ---
+DRY_RUN_MODELS_PER_WORKER = 1     # Modelos de calibración por worker (AutoModel y un paso de loop)
+DRY_RUN_REPORT_FILE = 'dry_run_estimate.json'  # Calibración, proyección y sugerencias del ensayo
+
+# --- Comprobación Previa (validate_setup.py --preflight) ---
+PREFLIGHT_WRITE_MB = 64           # MB escritos (con fsync) para medir la velocidad de escritura
+PREFLIGHT_MIN_WRITE_MBPS = 20     # Velocidad de escritura mínima aceptada (MB/s)
+PREFLIGHT_OUTPUT_FACTOR = 2.0     # Bytes en disco por modelo respecto al PDB (intermedios .D, .V, .ini, .rsr...)
+PREFLIGHT_FILES_PER_MODEL = 3     # Archivos por modelo (PDB + intermedios)
+PREFLIGHT_SPACE_MARGIN = 1.2      # Margen sobre el espacio y los inodos proyectados
+
+# =================================================================
+# SALIDAS, REANUDACIÓN Y LOGS
+# =================================================================
+
+# --- Organización de Salidas (output_layout.py) ---
+OUTPUT_DIR = 'models'             # Raíz del árbol de salidas: auto/<tramo de rank>, loops/<modelo base>, intermediate/<etapa>
+OUTPUT_SHARD_SIZE = 1000          # Modelos de AutoModel por subcarpeta
+OUTPUT_MANIFEST_FILE = os.path.join(OUTPUT_DIR, 'manifest.jsonl')  # Índice de modelos (nombre, ruta, etapa)
+
+# --- Configuración de Reanudación (Checkpoints) ---
+LOOP_CHECKPOINT_DIR = 'loop_checkpoints'  # Carpeta con el estado de refinamiento de cada modelo base (reanudable)
+USE_STAGE_CACHE = True            # Si es True, las etapas cuyas entradas no cambiaron no se vuelven a ejecutar
+STAGE_CACHE_DIR = '.stage_cache'  # Carpeta con las claves (hash de entradas) y resultados de cada etapa
+RANKING_CACHE_SAVE_EVERY = 200    # La evaluación final guarda las puntuaciones calculadas cada N modelos (y al detenerla el límite de tiempo)
+
+# --- Configuración de Logging (pipeline_log.py) ---
+LOG_MODE = os.environ.get('MODELLER_LOG_MODE', 'summary')  # 'summary': hitos y errores | 'full': todo, incluido el detalle por modelo y log.verbose()
+PIPELINE_LOG_FILE = 'pipeline_log.jsonl'  # Log estructurado (una línea JSON por evento); None para desactivarlo
+WORKER_LOG_DIR = 'worker_logs'    # Carpeta con los logs comprimidos de los workers de Modeller
+WORKER_LOG_KEEP = 5               # Rotaciones comprimidas que se conservan por worker
+WORKER_LOG_PATTERNS = ('*.slave*', '*.worker*')  # Archivos de log de los workers locales de Modeller
+WORKER_LOG_MAX_MB = 200           # Dentro de una etapa, los logs se rotan tras una tanda o un paso de loop si alguno supera este tamaño (0 = solo al final de cada etapa)
+
+# --- Top de Modelos en Vivo (leaderboard.py) ---
+LIVE_LEADERBOARD = True           # Mantener un top de modelos actualizado durante la ejecución
+LEADERBOARD_FILE = 'live_leaderboard.csv'  # Top actual (rank, nombre, DOPE-HR, Z-score, etapa, ruta); se reescribe de forma atómica
+LEADERBOARD_SIZE = 25             # Modelos en el top
+LEADERBOARD_MIN_INTERVAL = 5.0    # Segundos mínimos entre reescrituras durante la evaluación final
+
+# --- Informe de Coste-Eficiencia (cost_report.py) ---
+WRITE_COST_REPORT = True          # Al final, mejora de DOPE-HR por CPU-hora de AutoModel y de cada loop
+STAGE_TIMINGS_FILE = 'stage_timings.jsonl'  # Duración y workers de cada tanda de AutoModel y cada paso de loop
+COST_REPORT_FILE = 'cost_report.json'       # Informe completo (distribución, pasos y agregados)
+COST_REPORT_TABLE = 'cost_report.txt'       # El mismo informe como tabla legible
+
+# =================================================================
+# FILTRADO Y ANÁLISIS DE MODELOS
+# =================================================================
+
+# --- Filtro Geométrico (geometry_check.py) ---
+GEOMETRY_PREFILTER = True         # Comprueba roturas CA-CA, choques y átomos ausentes antes de puntuar o refinar un modelo
+GEOMETRY_REJECT = False           # False: los modelos marcados se puntúan y se señalan en el CSV | True: no se puntúan ni se refinan (figuran como rechazados en el CSV)
+GEOMETRY_MAX_CA_DISTANCE = 4.3    # Å: distancia CA-CA consecutiva por encima de la cual hay rotura de cadena
+GEOMETRY_CLASH_DISTANCE = 2.2     # Å: átomos pesados no enlazados más cerca que esto cuentan como choque
+GEOMETRY_MAX_CHAIN_BREAKS = 2     # Roturas CA-CA permitidas (el template ya tiene 1)
+GEOMETRY_MAX_CLASHES = 10         # Choques permitidos
+GEOMETRY_MAX_MISSING_ATOMS = 500  # Átomos pesados ausentes permitidos en residuos estándar (el template ya tiene 411)
+GEOMETRY_REPORT_FILE = 'geometry_report.csv'  # Modelos marcados por el filtro y motivos
+
+# --- Almacén de Coordenadas (coord_store.py) ---
+BUILD_COORD_STORE = False         # Si es True, tras el ranking final se guardan las coordenadas de los modelos en un array memory-map
+COORD_STORE_DIR = 'coord_store'   # Carpeta del almacén (coords.npy, atoms.npy, residues.npy, models.csv, index.json)
+COORD_STORE_TOP_K = 0             # Modelos que entran al almacén, los mejores por DOPE-HR (0 = todos)
+
+# --- Análisis del Conjunto (ensemble_analysis.py) ---
+RUN_ENSEMBLE_ANALYSIS = False     # Opt-in. Tras el ranking: RMSF por residuo, dispersión de loops y medoide de los NUM_BEST_FINAL_MODELS mejores
+ENSEMBLE_ANALYSIS_DIR = 'ensemble_analysis'  # residue_rmsf.csv, loop_spread.csv, pairwise_rmsd.npy, summary.json
+
+# =================================================================
+# HERRAMIENTAS DE DIAGNÓSTICO
+# =================================================================
+
+# --- Banco de Pruebas de E/S (io_benchmark.py) ---
+IO_BENCHMARK_DIR = 'io_benchmark_runs'             # Carpeta de las ejecuciones sintéticas (mismo sistema de archivos que producción)
+IO_BENCHMARK_SIZES = [10000, 50000, 100000, 200000]  # Modelos de cada ejecución sintética
+IO_BENCHMARK_LOOP_FRACTION = 0.5  # Fracción de los modelos sintéticos que son de loops
+IO_BENCHMARK_VARIANTS = 16        # Versiones perturbadas del template que se reparten entre los modelos
+IO_BENCHMARK_REPORT = 'io_benchmark.json'  # Segundos, µs por modelo y exponente de escalado de cada ruta
+IO_BENCHMARK_TOLERANCE = 1.5      # Con --baseline, regresión si el coste por modelo crece más de este factor
+
+# Exportar las variables de configuración para el uso en otros módulos (agrupadas como las secciones)
 __all__ = [
+    # Parámetros de Entrada
     'SS2_FILE', 'PDB_TEMPLATE_FILE', 'ALIGN_CODE_TEMPLATE', 'ALIGN_CODE_SEQUENCE', 'CHAIN_ID',
-    'sequence_full', 'pdb_aa', 'NUM_PROCESSORS', 'NUM_MODELS_AUTO', 'NUM_MODELS_TO_REFINE',
-    'NUM_MODELS_LOOP', 'NUM_BEST_FINAL_MODELS', 'USE_MANUAL_ALIGNMENT', 'MANUAL_ALIGNMENT_FILE',
-    'MANUAL_ALIGNMENT_CDE_FILE', 'ALIGNMENT_FILE', 'ALIGNMENT_CDE_FILE'
+    'sequence_full', 'pdb_aa',
+    # Preparación Automática del Template (template_prep.py)
+    'RAW_PDB_TEMPLATE_FILE', 'TEMPLATE_EXCLUDE_RESNAMES', 'TEMPLATE_HETATM_CHAINS',
+    # Configuración de Procesamiento y Modelos
+    'NUM_PROCESSORS', 'NUM_MODELS_AUTO', 'NUM_MODELS_TO_REFINE', 'NUM_MODELS_LOOP', 'NUM_BEST_FINAL_MODELS',
+    # Configuración de Alineamiento
+    'USE_MANUAL_ALIGNMENT', 'TEMPLATE_DIRECTORY', 'NUM_TEMPLATES_TO_USE', 'TEMPLATE_RANKING_FILE',
+    'MANUAL_ALIGNMENT_FILE', 'MANUAL_ALIGNMENT_CDE_FILE',
+    # Variables Derivadas y Nombres de Archivo
+    'ALIGNMENT_FILE', 'ALIGNMENT_CDE_FILE',
+    # Configuración de Loops Largos (refinamiento por ventanas)
+    'MIN_LOOP_LENGTH', 'MAX_LOOP_LENGTH', 'LONG_LOOP_WINDOW', 'LONG_LOOP_OVERLAP', 'LONG_LOOP_FINAL_PASS',
+    # Selección de Regiones por Perfil de Energía (region_selection.py)
+    'LOOP_SELECTION', 'PROFILE_SMOOTHING_WINDOW', 'PROFILE_THRESHOLD', 'PROFILE_THRESHOLD_SIGMA',
+    'PROFILE_MERGE_GAP', 'REFINE_MAX_SEGMENTS', 'REFINE_MAX_RESIDUES', 'ENERGY_PROFILE_DIR',
+    # Refinamiento sobre Subsistema Recortado (entorno local del loop)
+    'LOOP_CROP_ENABLED', 'LOOP_CROP_RADIUS', 'LOOP_CROP_ANCHOR_RESIDUES', 'LOOP_CROP_DIR',
+    # Semillas de Loops desde Biblioteca de Fragmentos (fragment_library.py)
+    'FRAGMENT_SEEDING', 'FRAGMENT_LIBRARY_DIR', 'FRAGMENT_MAX_LENGTH', 'FRAGMENT_ANCHOR_TOLERANCE',
+    'FRAGMENT_SEEDED_MD_LEVEL',
+    # Tolerancia a Fallos del Refinamiento (fault_tolerance.py)
+    'TASK_MAX_RETRIES', 'TASK_TIMEOUT', 'TASK_TIMEOUT_FACTOR', 'WORKER_MAX_RSS_MB', 'TASK_FAILURE_REPORT',
+    # Perfil de Autoajuste por Tipo de Nodo (autotune.py)
+    'USE_AUTOTUNE_PROFILE', 'AUTOTUNE_PROFILE_DIR', 'AUTOTUNE_NODE_TYPE', 'AUTOTUNE_PROFILE',
+    'AUTOTUNE_OVERRIDES',
+    # Pool de Workers Multi-nodo (worker_pool.py)
+    'WORKER_LAUNCHER', 'WORKER_NODES', 'WORKERS_PER_NODE', 'WORKER_SHARED_FILESYSTEM', 'WORKER_SCRATCH_DIR',
+    'WORKER_MASTER_HOST',
+    # Colocación de Workers en CPUs (cpu_placement.py)
+    'WORKER_PINNING', 'WORKER_THREADS', 'CONTROLLER_RESERVED_CPUS',
+    # Límite de Tiempo de la Reserva (walltime.py)
+    'WALLTIME_AWARE', 'WALLTIME_LOOP_FRACTION', 'WALLTIME_SAFETY_MARGIN', 'AUTOMODEL_BATCH_SIZE',
+    'RANKING_SECONDS_PER_MODEL',
+    # Modo de Ensayo (controller.py --dry-run)
+    'DRY_RUN_MODELS_PER_WORKER', 'DRY_RUN_REPORT_FILE',
+    # Comprobación Previa (validate_setup.py --preflight)
+    'PREFLIGHT_WRITE_MB', 'PREFLIGHT_MIN_WRITE_MBPS', 'PREFLIGHT_OUTPUT_FACTOR', 'PREFLIGHT_FILES_PER_MODEL',
+    'PREFLIGHT_SPACE_MARGIN',
+    # Organización de Salidas (output_layout.py)
+    'OUTPUT_DIR', 'OUTPUT_SHARD_SIZE', 'OUTPUT_MANIFEST_FILE',
+    # Configuración de Reanudación (Checkpoints)
+    'LOOP_CHECKPOINT_DIR', 'USE_STAGE_CACHE', 'STAGE_CACHE_DIR', 'RANKING_CACHE_SAVE_EVERY',
+    # Configuración de Logging (pipeline_log.py)
+    'LOG_MODE', 'PIPELINE_LOG_FILE', 'WORKER_LOG_DIR', 'WORKER_LOG_KEEP', 'WORKER_LOG_PATTERNS',
+    'WORKER_LOG_MAX_MB',
+    # Top de Modelos en Vivo (leaderboard.py)
+    'LIVE_LEADERBOARD', 'LEADERBOARD_FILE', 'LEADERBOARD_SIZE', 'LEADERBOARD_MIN_INTERVAL',
+    # Informe de Coste-Eficiencia (cost_report.py)
+    'WRITE_COST_REPORT', 'STAGE_TIMINGS_FILE', 'COST_REPORT_FILE', 'COST_REPORT_TABLE',
+    # Filtro Geométrico (geometry_check.py)
+    'GEOMETRY_PREFILTER', 'GEOMETRY_REJECT', 'GEOMETRY_MAX_CA_DISTANCE', 'GEOMETRY_CLASH_DISTANCE',
+    'GEOMETRY_MAX_CHAIN_BREAKS', 'GEOMETRY_MAX_CLASHES', 'GEOMETRY_MAX_MISSING_ATOMS', 'GEOMETRY_REPORT_FILE',
+    # Almacén de Coordenadas (coord_store.py)
+    'BUILD_COORD_STORE', 'COORD_STORE_DIR', 'COORD_STORE_TOP_K',
+    # Análisis del Conjunto (ensemble_analysis.py)
+    'RUN_ENSEMBLE_ANALYSIS', 'ENSEMBLE_ANALYSIS_DIR',
+    # Banco de Pruebas de E/S (io_benchmark.py)
+    'IO_BENCHMARK_DIR', 'IO_BENCHMARK_SIZES', 'IO_BENCHMARK_LOOP_FRACTION', 'IO_BENCHMARK_VARIANTS',
+    'IO_BENCHMARK_REPORT', 'IO_BENCHMARK_TOLERANCE',
 ]
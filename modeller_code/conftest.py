@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Fixtures compartidas de las pruebas. fake_modeller sustituye el paquete
+modeller por módulos mínimos para importar los módulos del pipeline que lo
+importan al cargarse (homology_modeling, loop_refinement, custom_models...).
+"""
+
+import sys
+import types
+
+import pytest
+
+# Módulos del pipeline que importan modeller al cargarse: se reimportan con los módulos falsos de cada prueba
+MODELLER_DEPENDENT_MODULES = ('custom_models', 'homology_modeling', 'loop_refinement', 'controller')
+
+class _Placeholder:
+    """Clase de Modeller sin comportamiento: las pruebas que la usan la sustituyen."""
+    def __init__(self, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+
+def _placeholder(name):
+    return type(name, (_Placeholder,), {})
+
+@pytest.fixture
+def fake_modeller(monkeypatch):
+    """
+    Instala módulos falsos modeller, modeller.automodel, modeller.parallel,
+    modeller.scripts y modeller.selection. Retorna {nombre: módulo}; las pruebas
+    reemplazan sus clases antes de importar el módulo del pipeline que prueban.
+    """
+    modules = {name: types.ModuleType(name) for name in
+               ('modeller', 'modeller.automodel', 'modeller.parallel', 'modeller.scripts', 'modeller.selection')}
+    for name in ('Environ', 'Alignment', 'Model'):
+        setattr(modules['modeller'], name, _placeholder(name))
+    modules['modeller'].log = types.SimpleNamespace(none=lambda: None, verbose=lambda: None, minimal=lambda: None)
+    for name in ('AutoModel', 'LoopModel', 'DOPEHRLoopModel'):
+        setattr(modules['modeller.automodel'], name, _placeholder(name))
+    modules['modeller.automodel'].assess = types.SimpleNamespace(DOPE='DOPE', DOPEHR='DOPEHR', GA341='GA341')
+    modules['modeller.automodel'].autosched = types.SimpleNamespace(slow='slow', normal='normal', fast='fast')
+    modules['modeller.automodel'].refine = types.SimpleNamespace(very_fast='very_fast', fast='fast', slow='slow',
+                                                                 slow_large='slow_large')
+    for name in ('Job', 'Worker', 'LocalWorker', 'Task'):
+        setattr(modules['modeller.parallel'], name, _placeholder(name))
+    modules['modeller.scripts'].complete_pdb = lambda *args, **kwargs: None
+    modules['modeller.selection'].Selection = _placeholder('Selection')
+    for name, module in modules.items():
+        monkeypatch.setitem(sys.modules, name, module)
+    for name, child in (('automodel', 'modeller.automodel'), ('parallel', 'modeller.parallel'),
+                        ('scripts', 'modeller.scripts'), ('selection', 'modeller.selection')):
+        setattr(modules['modeller'], name, modules[child])
+
+    for name in MODELLER_DEPENDENT_MODULES:
+        sys.modules.pop(name, None)
+    yield modules
+    for name in MODELLER_DEPENDENT_MODULES:
+        sys.modules.pop(name, None)
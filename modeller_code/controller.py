@@ -2,11 +2,13 @@
 # controller.py
 
 import sys
+import time
+import argparse
+from typing import List, Tuple, Optional
 from modeller import *
 from modeller.automodel import *
 from modeller.scripts import complete_pdb
 from modeller.selection import Selection
-from modeller.parallel import Job, LocalWorker
 
 # Importar configuraciones
 import config
@@ -16,66 +18,226 @@ from config import ALIGNMENT_FILE, ALIGNMENT_CDE_FILE, NUM_PROCESSORS, USE_MANUA
 import utils
 import homology_modeling
 import loop_refinement
-
-def main_workflow():
-    """Ejecuta el pipeline completo de modelado de Modeller."""
+import stage_cache
+import template_prep
+import template_selection
+import coord_store
+import ensemble_analysis
+import walltime
+import worker_pool
+import pipeline_log
+import cost_report
+import leaderboard
+
+logger = pipeline_log.get_logger(__name__)
+
+def _alignment_stage_key(templates: List[Tuple[str, str]]) -> str:
+    """Clave de la etapa de alineamiento: templates, secuencia, SS2, modo manual y código."""
+    return stage_cache.stage_key('alignment', {
+        'templates': [(code, stage_cache.file_digest(f)) for code, f in templates],
+        'ss2': stage_cache.file_digest(config.SS2_FILE),
+        'sequence_full': config.sequence_full,
+        'codes': [config.ALIGN_CODE_TEMPLATE, config.ALIGN_CODE_SEQUENCE, config.CHAIN_ID],
+        'manual_mode': USE_MANUAL_ALIGNMENT,
+        'manual_files': [stage_cache.file_digest(config.MANUAL_ALIGNMENT_FILE),
+                         stage_cache.file_digest(config.MANUAL_ALIGNMENT_CDE_FILE)] if USE_MANUAL_ALIGNMENT else [],
+        'code': stage_cache.code_version(['utils.py', 'sequence_utils.py'])
+    })
+
+def _loops_stage_key(aligned_template_seq: str, aligned_target_seq: str, use_ss_filter: bool) -> str:
+    """Clave de la etapa de detección de loops: alineamiento, SS2 y código."""
+    return stage_cache.stage_key('loops', {
+        'aligned': [aligned_template_seq, aligned_target_seq],
+        'ss2': stage_cache.file_digest(config.SS2_FILE) if use_ss_filter else '',
+        'code': stage_cache.code_version(['sequence_utils.py'])
+    })
+
+def _automodel_stage_key(templates: List[Tuple[str, str]]) -> str:
+    """Clave de la etapa AutoModel: archivo de alineamiento, templates, nº de modelos y código."""
+    return stage_cache.stage_key('automodel', {
+        'alignment': stage_cache.file_digest(ALIGNMENT_FILE),
+        'templates': [(code, stage_cache.file_digest(f)) for code, f in templates],
+        'NUM_MODELS_AUTO': config.NUM_MODELS_AUTO,
+        'code': stage_cache.code_version(['homology_modeling.py', 'output_layout.py'])
+    })
+
+def main_workflow(dry_run: bool = False, time_budget: Optional[str] = None, deadline: Optional[str] = None):
+    """
+    Ejecuta el pipeline completo de modelado de Modeller.
+    Con dry_run=True solo se hacen el alineamiento y la detección de loops, y se
+    estima el coste de la configuración completa (ver dry_run.py).
+    deadline: fecha/hora ISO o duración de SLURM; por defecto, el fin de la reserva
+    de SLURM. AutoModel y los loops se recortan para que el ranking final se escriba
+    antes del límite (ver walltime.py).
+    """
     
     # 1. Configuración de Modeller
     env = Environ()
     env.io.atom_files_directory = ['.', '../atom_files'] 
     env.io.hetatm = True
     
+    pipeline_log.setup_logging()
     try:
-        log.verbose()
+        pipeline_log.configure_modeller_log()
     except Exception as e:
-        print(f"[WARNING] Fallo al habilitar Modeller logging. La ejecución continuará. Error: {e}")
-
-    # Configurar el paralelismo
-    env.jobs = config.NUM_PROCESSORS
-    job = Job()
-    
-    print(f"[PARALLEL] Configurando {NUM_PROCESSORS} workers locales.")
-    for _ in range(NUM_PROCESSORS):
-        job.append(LocalWorker()) 
-    job.start() 
+        logger.warning(f"Fallo al configurar el logging de Modeller. La ejecución continuará. Error: {e}")
+
+    if config.AUTOTUNE_PROFILE:
+        for name in ('NUM_PROCESSORS', 'NUM_MODELS_LOOP'):
+            if name in config.AUTOTUNE_OVERRIDES:
+                previous, tuned = config.AUTOTUNE_OVERRIDES[name]
+                logger.info(f"[AUTOTUNE] Perfil '{config.AUTOTUNE_NODE_TYPE}': {name} {previous} -> {tuned}")
+            else:
+                logger.info(f"[AUTOTUNE] Perfil '{config.AUTOTUNE_NODE_TYPE}': {name} = {getattr(config, name)} fijado en "
+                            f"config.py; se ignora el valor del perfil ({config.AUTOTUNE_PROFILE[name]}).")
+    elif config.USE_AUTOTUNE_PROFILE:
+        logger.info(f"[AUTOTUNE] No hay perfil para el nodo '{config.AUTOTUNE_NODE_TYPE}'; se usan los valores de config.py.")
+
+    # 1.1 Preparación automática del template (si se parte de un PDB crudo)
+    if config.RAW_PDB_TEMPLATE_FILE:
+        try:
+            template_prep.prepare_template(config.RAW_PDB_TEMPLATE_FILE, config.PDB_TEMPLATE_FILE)
+        except Exception as e:
+            logger.error(f"\n[ERROR FATAL] Fallo al preparar el template {config.RAW_PDB_TEMPLATE_FILE}. Terminando. Error: {e}")
+            sys.exit(1)
+
+    # 1.2 Selección de templates (modo multi-template)
+    templates = [(config.ALIGN_CODE_TEMPLATE, config.PDB_TEMPLATE_FILE)]
+    if config.TEMPLATE_DIRECTORY and not USE_MANUAL_ALIGNMENT:
+        try:
+            template_ranking = template_selection.rank_templates(config.TEMPLATE_DIRECTORY)
+            templates = template_selection.select_templates(template_ranking, config.NUM_TEMPLATES_TO_USE)
+        except Exception as e:
+            logger.error(f"\n[ERROR FATAL] Fallo en la selección de templates de {config.TEMPLATE_DIRECTORY}. Terminando. Error: {e}")
+            sys.exit(1)
 
     # 2. Preparación de Alineamiento
-    try:
-        cde_line, aligned_template_seq, aligned_target_seq = utils.generate_pir_files(
-            env, ALIGNMENT_FILE, ALIGNMENT_CDE_FILE, manual_mode=USE_MANUAL_ALIGNMENT
-        )
-    except Exception as e:
-        print(f"\n[ERROR FATAL] Fallo al generar los archivos PIR. Terminando. Error: {e}")
-        sys.exit(1)
+    alignment_key = _alignment_stage_key(templates)
+    cached_alignment = stage_cache.load_stage('alignment', alignment_key)
+    if cached_alignment:
+        cde_line, aligned_template_seq, aligned_target_seq = cached_alignment
+    else:
+        try:
+            cde_line, aligned_template_seq, aligned_target_seq = utils.generate_pir_files(
+                env, ALIGNMENT_FILE, ALIGNMENT_CDE_FILE, manual_mode=USE_MANUAL_ALIGNMENT, templates=templates
+            )
+        except Exception as e:
+            logger.error(f"\n[ERROR FATAL] Fallo al generar los archivos PIR. Terminando. Error: {e}")
+            sys.exit(1)
+        if aligned_template_seq and aligned_target_seq:
+            stage_cache.save_stage('alignment', alignment_key,
+                                   [cde_line, aligned_template_seq, aligned_target_seq],
+                                   outputs=[ALIGNMENT_FILE, ALIGNMENT_CDE_FILE])
 
     # 3. Detección de Loops
     if not aligned_template_seq or not aligned_target_seq:
-        print("\n[ERROR] No se pudo obtener el alineamiento. Terminando la ejecución.")
+        logger.error("\nNo se pudo obtener el alineamiento. Terminando la ejecución.")
         sys.exit(1)
 
-    loop_ranges_to_refine = utils.find_missing_residues(aligned_template_seq, aligned_target_seq)
-
-    # 4. Filtrado de Loops Flexibles
-    if cde_line:
-        # La función get_flexible_missing_ranges ya tiene acceso a las constantes SS2_FILE y sequence_full
-        loop_ranges_to_refine = utils.get_flexible_missing_ranges(loop_ranges_to_refine)
+    loops_key = _loops_stage_key(aligned_template_seq, aligned_target_seq, bool(cde_line))
+    cached_loops = stage_cache.load_stage('loops', loops_key)
+    if cached_loops is not None:
+        loop_ranges_to_refine = [tuple(r) for r in cached_loops]
+    else:
+        loop_ranges_to_refine = utils.find_missing_residues(aligned_template_seq, aligned_target_seq)
+
+        # 4. Filtrado de Loops Flexibles
+        if cde_line:
+            # La función get_flexible_missing_ranges ya tiene acceso a las constantes SS2_FILE y sequence_full
+            loop_ranges_to_refine = utils.get_flexible_missing_ranges(loop_ranges_to_refine)
+        stage_cache.save_stage('loops', loops_key, [list(r) for r in loop_ranges_to_refine])
+
+    if dry_run:
+        import dry_run as dry_run_estimator
+        dry_run_estimator.run_dry_run(loop_ranges_to_refine, time_budget)
+        return
+
+    # Configurar el paralelismo (workers locales y, con WORKER_LAUNCHER, los de otros nodos)
+    job = worker_pool.create_job(NUM_PROCESSORS)
+    env.jobs = len(job)
+
+    run_deadline = walltime.Deadline.from_environment(deadline)
+    if run_deadline.active:
+        logger.info(f"[WALLTIME] Tiempo restante de la ejecución: {walltime.format_duration(run_deadline.remaining())}",
+                    extra={'stage': 'walltime'})
 
     # 5. Modelado por Homología (AutoModel)
-    initial_models_names = homology_modeling.run_automodel(env, ALIGNMENT_FILE, job)
+    automodel_key = _automodel_stage_key(templates)
+    ranked_auto_models = stage_cache.load_stage('automodel', automodel_key)
+    if ranked_auto_models is None:
+        knowns = tuple(code for code, _ in templates)
+        loop_reserve = config.WALLTIME_LOOP_FRACTION * run_deadline.remaining() if run_deadline.active and loop_ranges_to_refine else 0.0
+        ranked_auto_models = homology_modeling.run_automodel(env, ALIGNMENT_FILE, job, knowns=knowns,
+                                                             deadline=run_deadline, reserve_s=loop_reserve,
+                                                             progress_key=automodel_key)
+        # Un AutoModel recortado por el límite de tiempo no se guarda como etapa terminada: su avance
+        # por tandas queda en 'automodel_batches' y la próxima ejecución continúa en la tanda siguiente
+        if ranked_auto_models and 'automodel' not in run_deadline.truncated:
+            stage_cache.save_stage('automodel', automodel_key, ranked_auto_models,
+                                   outputs=[m['path'] for m in ranked_auto_models])
+        pipeline_log.rotate_worker_logs('automodel')
+    # Con AutoModel en caché (reanudación) el top en vivo parte de sus modelos
+    leaderboard.record(ranked_auto_models or [], 'automodel', force=True)
+    initial_models_names = homology_modeling.select_models_to_refine(ranked_auto_models)
+    if run_deadline.active and ranked_auto_models:
+        run_deadline.measure_evaluation(env, ranked_auto_models[0]['path'])
 
     # 6. Refinamiento de Loops
+    if initial_models_names and config.FRAGMENT_SEEDING:
+        import fragment_library
+        fragment_library.build_library([template_file for _, template_file in templates])
+
     if initial_models_names:
-        loop_refinement.run_loop_refinement(env, job, initial_models_names, loop_ranges_to_refine)
+        try:
+            # Si el supervisor reemplazó los workers, el Job anterior está cerrado: se sigue con el nuevo
+            job = loop_refinement.run_loop_refinement(env, job, initial_models_names, loop_ranges_to_refine,
+                                                      deadline=run_deadline)
+            env.jobs = len(job)
+        except Exception as e:
+            # El ranking final se escribe aunque el refinamiento falle: los modelos ya generados siguen siendo válidos
+            logger.error(f"\nFallo en el refinamiento de loops. Se continúa con la evaluación final. Error: {e}")
+        pipeline_log.rotate_worker_logs('loop_refinement')
 
     # Asegurar que todos los procesos paralelos han terminado antes de la evaluación final
-    print("[PARALLEL] Todos los procesos de Modeller han finalizado.")
+    logger.info("[PARALLEL] Todos los procesos de Modeller han finalizado.", extra={'stage': 'parallel'})
 
     # 7. Evaluación Final y Ranking
-    final_ranking, best_final_model = utils.final_evaluation_and_ranking(env)
+    final_start_time = time.time()
+    final_ranking, best_final_model = utils.final_evaluation_and_ranking(env, deadline=run_deadline)
+    cost_report.record_timing('final_evaluation', time.time() - final_start_time, 1, models=len(final_ranking))
+    pipeline_log.rotate_worker_logs('final')
+
+    store_dir = None
+    if config.BUILD_COORD_STORE and final_ranking:
+        # Solo modelos evaluados correctamente; el orden del almacén es el del ranking
+        scored_models = [m for m in final_ranking if m['DOPEHR score'] != float('inf')]
+        store_dir = coord_store.build_store(scored_models[:config.COORD_STORE_TOP_K] if config.COORD_STORE_TOP_K > 0 else scored_models)
+
+    if config.RUN_ENSEMBLE_ANALYSIS and final_ranking:
+        best_scored = [m for m in final_ranking[:config.NUM_BEST_FINAL_MODELS] if m['DOPEHR score'] != float('inf')]
+        try:
+            ensemble_analysis.run_analysis(best_scored, loop_ranges_to_refine, store_dir=store_dir)
+        except (OSError, ValueError) as e:
+            logger.warning(f"No se pudo completar el análisis del conjunto. Error: {e}")
+
+    if config.WRITE_COST_REPORT and final_ranking:
+        try:
+            cost_report.report_run(final_ranking)
+        except (OSError, ValueError) as e:
+            logger.warning(f"No se pudo generar el informe de coste-eficiencia. Error: {e}")
 
     if best_final_model:
-        print(f"\nEl modelo de más alta calidad (DOPEHR más negativo) fue: {best_final_model['name']} con un Z-score de {best_final_model['DOPEHR Z-score']:.3f}")
+        logger.info(f"\nEl modelo de más alta calidad (DOPEHR más negativo) fue: {best_final_model['name']} con un Z-score de {best_final_model['DOPEHR Z-score']:.3f}",
+                    extra={'stage': 'final', 'model': best_final_model['name'], 'score': best_final_model['DOPEHR Z-score']})
 
 
 if __name__ == '__main__':
-    main_workflow()
+    parser = argparse.ArgumentParser(description="Pipeline de modelado por homología con Modeller.")
+    parser.add_argument('--dry-run', action='store_true',
+                        help="Alineamiento y detección de loops reales + calibración corta; estima CPU-horas, tiempo y disco")
+    parser.add_argument('--time-budget',
+                        help="Presupuesto de tiempo para las sugerencias del dry-run (formato de --time de SLURM, ej: 2-00:00:00)")
+    parser.add_argument('--deadline',
+                        help="Límite de tiempo (fecha/hora ISO o duración de SLURM); por defecto, el fin de la reserva de SLURM")
+    args = parser.parse_args()
+    main_workflow(dry_run=args.dry_run, time_budget=args.time_budget, deadline=args.deadline)
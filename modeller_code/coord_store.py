@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+# coord_store.py
+
+"""
+Almacén de coordenadas del conjunto de modelos para análisis sin releer PDBs.
+
+Convierte los modelos de una ejecución (todos o los K mejores por DOPE-HR) en
+un único array de NumPy modelos x átomos x 3 (float32) que se abre con
+memory-map, de modo que las herramientas de análisis pueden tomar cortes
+(ej. solo los CA de un loop en todos los modelos) sin copiar ni parsear texto.
+
+Formato en disco (carpeta COORD_STORE_DIR):
+
+    coords.npy      (modelos, átomos, 3) float32; NaN en átomos que faltan en un modelo
+    atoms.npy       índice de átomos común: cadena, residuo, nombre de residuo, nombre de átomo, índice de residuo
+    residues.npy    índice de residuos: cadena, número, nombre y rango [start, stop) de sus átomos
+    models.csv      una fila por modelo (en el orden de coords.npy): nombre, ruta, etapa y puntuaciones
+    index.json      forma del array, átomos de referencia y recuento de átomos ausentes/sobrantes
+
+El orden de átomos se toma del primer modelo; en los modelos de Modeller de la
+misma secuencia coincide y la copia es directa.
+
+Uso:
+    python3 coord_store.py build                 # todos los modelos del manifiesto
+    python3 coord_store.py build --top 500       # solo los 500 mejores por DOPE-HR
+    python3 coord_store.py info
+"""
+
+import os
+import sys
+import csv
+import json
+import argparse
+from typing import List, Tuple, Dict, Any, Optional
+
+import numpy as np
+
+import config
+import stage_cache
+import pdb_utils
+import pipeline_log
+import output_layout
+from config import COORD_STORE_DIR
+
+logger = pipeline_log.get_logger(__name__)
+
+AtomKey = Tuple[str, int, str]   # (cadena, número de residuo, nombre de átomo)
+
+ATOM_DTYPE = np.dtype([('chain', 'U1'), ('resnum', 'i4'), ('resname', 'U4'), ('name', 'U4'), ('residue', 'i4')])
+RESIDUE_DTYPE = np.dtype([('chain', 'U1'), ('resnum', 'i4'), ('resname', 'U4'), ('start', 'i4'), ('stop', 'i4')])
+METADATA_FIELDS = ['Index', 'Model Name', 'Stage', 'DOPEHR Score', 'DOPEHR Z-score', 'Model Path']
+
+# =================================================================
+# LECTURA DE COORDENADAS
+# =================================================================
+
+def read_atoms(pdb_file: str) -> Tuple[List[AtomKey], List[str], np.ndarray]:
+    """
+    Lee los registros ATOM/HETATM de un PDB (solo la ubicación alternativa ' '/'A').
+    Retorna (claves de átomo, nombres de residuo, coordenadas (n, 3) float32).
+    """
+    keys: List[AtomKey] = []
+    resnames: List[str] = []
+    xyz: List[Tuple[float, float, float]] = []
+    with open(pdb_file, 'r') as f:
+        for line in f:
+            if not pdb_utils.is_atom_record(line) or line[16] not in (' ', 'A'):
+                continue
+            chain, res_num = pdb_utils.residue_key(line)
+            keys.append((chain, res_num, line[12:16].strip()))
+            resnames.append(line[17:21].strip())
+            xyz.append((float(line[30:38]), float(line[38:46]), float(line[46:54])))
+    return keys, resnames, np.array(xyz, dtype=np.float32).reshape(-1, 3)
+
+def atom_index(keys: List[AtomKey], resnames: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """Índices de átomos y de residuos (arrays estructurados) a partir del modelo de referencia."""
+    atoms = np.zeros(len(keys), dtype=ATOM_DTYPE)
+    residues = []
+    for i, ((chain, res_num, name), resname) in enumerate(zip(keys, resnames)):
+        if not residues or tuple(residues[-1][:2]) != (chain, res_num):
+            if residues:
+                residues[-1][4] = i
+            residues.append([chain, res_num, resname, i, i])
+        atoms[i] = (chain, res_num, resname, name, len(residues) - 1)
+    if residues:
+        residues[-1][4] = len(keys)
+    return atoms, np.array([tuple(r) for r in residues], dtype=RESIDUE_DTYPE)
+
+# =================================================================
+# CONSTRUCCIÓN Y APERTURA DEL ALMACÉN
+# =================================================================
+
+def ranked_models(top_k: int = 0, stages: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    """
+    Modelos del manifiesto con sus puntuaciones de la evaluación final (caché
+    'ranking_scores'), ordenados por DOPE-HR; los no evaluados van al final.
+    Con top_k > 0 solo se conservan los top_k primeros.
+    """
+    scores = stage_cache.load_item_cache('ranking_scores', stage_cache.code_version(['utils.py']))
+    models = []
+    for record in output_layout.manifest_models(stages):
+        score = scores.get(record['name'], {})
+        models.append({'name': record['name'], 'path': record['path'], 'stage': record.get('stage', ''),
+                       'DOPEHR score': score.get('DOPEHR score', float('inf')),
+                       'DOPEHR Z-score': score.get('DOPEHR Z-score', float('inf'))})
+    models.sort(key=lambda m: (m['DOPEHR score'], m['name']))
+    return models[:top_k] if top_k > 0 else models
+
+def _store_stage_key(models: List[Dict[str, Any]]) -> str:
+    return stage_cache.stage_key('coord_store', {
+        'models': [(m['name'], stage_cache.file_stat_key(m['path'])) for m in models],
+        'code': stage_cache.code_version(['coord_store.py'])
+    })
+
+def build_store(models: List[Dict[str, Any]], store_dir: str = COORD_STORE_DIR) -> Optional[str]:
+    """
+    Escribe el almacén de coordenadas de los modelos indicados (dicts con 'name',
+    'path' y, opcionalmente, 'stage', 'DOPEHR score' y 'DOPEHR Z-score'), en ese
+    orden. Se reutiliza si los modelos y sus archivos no cambiaron.
+    """
+    models = [m for m in models if os.path.exists(m['path'])]
+    if not models:
+        logger.info("[COORDS] No hay modelos para el almacén de coordenadas.")
+        return None
+
+    key = _store_stage_key(models)
+    index_file = os.path.join(store_dir, 'index.json')
+    if stage_cache.load_stage('coord_store', key) is not None and os.path.exists(index_file):
+        return store_dir
+
+    logger.info(f"\n[COORDS] Construyendo almacén de coordenadas de {len(models)} modelos en {store_dir}...",
+                extra={'stage': 'coord_store', 'count': len(models)})
+    ref_keys, ref_resnames, ref_xyz = read_atoms(models[0]['path'])
+    atoms, residues = atom_index(ref_keys, ref_resnames)
+    ref_position = {k: i for i, k in enumerate(ref_keys)}
+
+    os.makedirs(store_dir, exist_ok=True)
+    coords_file = os.path.join(store_dir, 'coords.npy')
+    temp_coords = coords_file + '.tmp'
+    # Se escribe modelo a modelo sobre el memory-map: nunca se tiene todo el conjunto en memoria
+    coords = np.lib.format.open_memmap(temp_coords, mode='w+', dtype=np.float32,
+                                       shape=(len(models), len(ref_keys), 3))
+    missing_atoms: Dict[str, int] = {}
+    extra_atoms: Dict[str, int] = {}
+    for i, model in enumerate(models):
+        if i == 0:
+            coords[0] = ref_xyz
+            continue
+        try:
+            keys, _, xyz = read_atoms(model['path'])
+        except (OSError, ValueError) as e:
+            logger.warning(f"No se pudieron leer las coordenadas de {model['name']}. Error: {e}")
+            coords[i] = np.nan
+            missing_atoms[model['name']] = len(ref_keys)
+            continue
+        if keys == ref_keys:
+            coords[i] = xyz
+            continue
+        # Orden o contenido distinto: se colocan átomo a átomo y los ausentes quedan en NaN
+        row = np.full((len(ref_keys), 3), np.nan, dtype=np.float32)
+        positions = np.array([ref_position.get(k, -1) for k in keys], dtype=np.int64)
+        found = positions >= 0
+        row[positions[found]] = xyz[found]
+        coords[i] = row
+        placed = len(np.unique(positions[found]))
+        if placed < len(ref_keys):
+            missing_atoms[model['name']] = len(ref_keys) - placed
+        if not found.all():
+            extra_atoms[model['name']] = int(np.count_nonzero(~found))
+    coords.flush()
+    del coords
+
+    np.save(os.path.join(store_dir, 'atoms.npy'), atoms)
+    np.save(os.path.join(store_dir, 'residues.npy'), residues)
+    metadata_file = os.path.join(store_dir, 'models.csv')
+    with open(metadata_file + '.tmp', 'w', newline='') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=METADATA_FIELDS)
+        writer.writeheader()
+        for i, model in enumerate(models):
+            writer.writerow({
+                'Index': i,
+                'Model Name': model['name'],
+                'Stage': model.get('stage', ''),
+                'DOPEHR Score': f"{model.get('DOPEHR score', float('inf')):.3f}",
+                'DOPEHR Z-score': f"{model.get('DOPEHR Z-score', float('inf')):.3f}",
+                'Model Path': model['path']
+            })
+    os.replace(metadata_file + '.tmp', metadata_file)
+    os.replace(temp_coords, coords_file)
+
+    with open(index_file + '.tmp', 'w') as f:
+        json.dump({'shape': [len(models), len(ref_keys), 3], 'dtype': 'float32',
+                   'residues': int(len(residues)), 'reference_model': models[0]['name'],
+                   'missing_atoms': missing_atoms, 'extra_atoms': extra_atoms}, f, indent=2)
+    os.replace(index_file + '.tmp', index_file)
+
+    if missing_atoms or extra_atoms:
+        logger.warning(f"{len(set(missing_atoms) | set(extra_atoms))} modelos no coinciden con los átomos de {models[0]['name']}; "
+                       f"los átomos ausentes quedan en NaN (ver {index_file}).")
+    logger.info(f"[COORDS] Almacén guardado: {len(models)} modelos x {len(ref_keys)} átomos "
+                f"({os.path.getsize(coords_file) / 1024 ** 2:.1f} MB).", extra={'stage': 'coord_store'})
+    stage_cache.save_stage('coord_store', key, {'models': len(models), 'atoms': len(ref_keys)},
+                           outputs=[coords_file, metadata_file, index_file])
+    return store_dir
+
+class CoordStore:
+    """
+    Almacén abierto en modo lectura: coords es un memory-map (modelos, átomos, 3),
+    atoms/residues los índices comunes y models la tabla de metadatos.
+    """
+
+    def __init__(self, store_dir: str = COORD_STORE_DIR):
+        self.store_dir = store_dir
+        self.coords = np.load(os.path.join(store_dir, 'coords.npy'), mmap_mode='r')
+        self.atoms = np.load(os.path.join(store_dir, 'atoms.npy'))
+        self.residues = np.load(os.path.join(store_dir, 'residues.npy'))
+        with open(os.path.join(store_dir, 'models.csv'), 'r', newline='') as csvfile:
+            self.models = list(csv.DictReader(csvfile))
+        self._model_position = {m['Model Name']: i for i, m in enumerate(self.models)}
+
+    def __len__(self) -> int:
+        return self.coords.shape[0]
+
+    def model_indices(self, names: List[str]) -> np.ndarray:
+        """Filas de coords correspondientes a los modelos indicados por nombre."""
+        return np.array([self._model_position[name] for name in names], dtype=np.int64)
+
+    def atom_mask(self, atom_names: Optional[List[str]] = None,
+                  residue_range: Optional[Tuple[int, int]] = None, chain_id: Optional[str] = None) -> np.ndarray:
+        """Máscara booleana de átomos por nombre (ej. ['CA']), rango de residuos [inicio, fin] y cadena."""
+        mask = np.ones(len(self.atoms), dtype=bool)
+        if atom_names is not None:
+            mask &= np.isin(self.atoms['name'], list(atom_names))
+        if residue_range is not None:
+            mask &= (self.atoms['resnum'] >= residue_range[0]) & (self.atoms['resnum'] <= residue_range[1])
+        if chain_id is not None:
+            mask &= self.atoms['chain'] == chain_id
+        return mask
+
+    def select(self, atom_names: Optional[List[str]] = None, residue_range: Optional[Tuple[int, int]] = None,
+               chain_id: Optional[str] = None, models: Optional[List[str]] = None) -> np.ndarray:
+        """
+        Coordenadas (modelos, átomos seleccionados, 3). Si los átomos forman un
+        tramo contiguo el resultado es una vista del memory-map (sin copia).
+        """
+        rows = slice(None) if models is None else self.model_indices(models)
+        positions = np.flatnonzero(self.atom_mask(atom_names, residue_range, chain_id))
+        if len(positions) and positions[-1] - positions[0] + 1 == len(positions):
+            return self.coords[rows, positions[0]:positions[-1] + 1]
+        return self.coords[rows][:, positions]
+
+def open_store(store_dir: str = COORD_STORE_DIR) -> CoordStore:
+    return CoordStore(store_dir)
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Almacén de coordenadas (memory-map) de los modelos de una ejecución.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    build_parser = sub.add_parser('build', help="Construye el almacén a partir del manifiesto de modelos")
+    build_parser.add_argument('--top', type=int, default=config.COORD_STORE_TOP_K,
+                              help="Solo los K mejores modelos por DOPE-HR (0 = todos)")
+    build_parser.add_argument('--stages', default='',
+                              help="Etapas del manifiesto a incluir, separadas por comas (ej: auto,loop)")
+    build_parser.add_argument('-o', '--output', default=COORD_STORE_DIR)
+    info_parser = sub.add_parser('info', help="Resume un almacén existente")
+    info_parser.add_argument('store_dir', nargs='?', default=COORD_STORE_DIR)
+    args = parser.parse_args(argv)
+    pipeline_log.setup_logging(log_file=None)
+
+    if args.command == 'build':
+        stages = [s.strip() for s in args.stages.split(',') if s.strip()] or None
+        return 0 if build_store(ranked_models(args.top, stages), args.output) else 1
+
+    try:
+        store = open_store(args.store_dir)
+    except OSError as e:
+        print(f"[ERROR] No se pudo abrir el almacén {args.store_dir}. Error: {e}")
+        return 1
+    print(f"{args.store_dir}: {len(store)} modelos x {store.coords.shape[1]} átomos ({len(store.residues)} residuos)")
+    for model in store.models[:5]:
+        print(f"  {model['Index']:>6} {model['Model Name']:<45} DOPEHR: {model['DOPEHR Score']}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
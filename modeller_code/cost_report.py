@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+# cost_report.py
+
+"""
+Informe de coste-eficiencia de la ejecución: mejora de DOPE-HR por CPU-hora
+en cada etapa.
+
+Durante la ejecución, AutoModel (por tanda), cada paso de loop y la evaluación
+final añaden su duración y sus workers a STAGE_TIMINGS_FILE. Al final, esas
+mediciones se combinan con las puntuaciones de la evaluación final (las mismas
+para todos los modelos):
+
+- AutoModel: distribución de DOPE-HR, mejor modelo esperado con menos muestras
+  (mínimo esperado de un subconjunto aleatorio de n modelos) y mejora marginal
+  por CPU-hora de la segunda mitad del muestreo.
+- Refinamiento de loops: mejora de cada paso (DOPE-HR del modelo de partida
+  menos el mejor modelo del paso), agregada por número de loop y por segmento,
+  y mejora del mejor modelo global por CPU-hora.
+
+El informe se escribe en COST_REPORT_FILE (JSON) y COST_REPORT_TABLE (tabla).
+Con los datos de varias ejecuciones se pueden ajustar NUM_MODELS_AUTO,
+NUM_MODELS_TO_REFINE y NUM_MODELS_LOOP.
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import argparse
+import statistics
+from typing import Any, Dict, List, Optional
+
+import config
+import pipeline_log
+from config import STAGE_TIMINGS_FILE, COST_REPORT_FILE, COST_REPORT_TABLE
+
+logger = pipeline_log.get_logger(__name__)
+
+# =================================================================
+# MEDICIONES
+# =================================================================
+
+def record_timing(stage: str, seconds: float, workers: int, **fields: Any) -> None:
+    """Añade una medición (etapa, segundos de reloj, workers y campos propios) a STAGE_TIMINGS_FILE."""
+    entry = {'stage': stage, 'seconds': round(seconds, 3), 'workers': workers, 'time': time.time(), **fields}
+    with open(STAGE_TIMINGS_FILE, 'a') as f:
+        f.write(json.dumps(entry) + '\n')
+
+def _timing_key(entry: Dict[str, Any]) -> Any:
+    """Identidad de una medición: al repetirse (reanudación, relanzamiento) prevalece la última."""
+    if entry['stage'] == 'automodel':
+        return ('automodel', entry.get('first_model'), entry.get('last_model'))
+    if entry['stage'] == 'loop':
+        return ('loop', entry.get('prefix'))
+    return (entry['stage'],)
+
+def read_timings(timings_file: str = STAGE_TIMINGS_FILE) -> List[Dict[str, Any]]:
+    """Mediciones de STAGE_TIMINGS_FILE, sin duplicados. Las líneas incompletas se ignoran."""
+    entries: Dict[Any, Dict[str, Any]] = {}
+    try:
+        with open(timings_file, 'r') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                entries[_timing_key(entry)] = entry
+    except OSError:
+        return []
+    return list(entries.values())
+
+def cpu_hours(entries: List[Dict[str, Any]]) -> float:
+    return sum(e['seconds'] * e['workers'] for e in entries) / 3600.0
+
+# =================================================================
+# ESTADÍSTICAS
+# =================================================================
+
+def _percentile(sorted_values: List[float], q: float) -> float:
+    position = (len(sorted_values) - 1) * q
+    low = math.floor(position)
+    high = min(low + 1, len(sorted_values) - 1)
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (position - low)
+
+def distribution(values: List[float]) -> Dict[str, float]:
+    ordered = sorted(values)
+    return {'min': ordered[0], 'p10': _percentile(ordered, 0.10), 'p25': _percentile(ordered, 0.25),
+            'median': _percentile(ordered, 0.5), 'mean': statistics.fmean(ordered),
+            'p75': _percentile(ordered, 0.75), 'p90': _percentile(ordered, 0.90), 'max': ordered[-1]}
+
+def _log_comb(n: int, k: int) -> float:
+    return math.lgamma(n + 1) - math.lgamma(k + 1) - math.lgamma(n - k + 1)
+
+def expected_best_of(sorted_scores: List[float], k: int) -> float:
+    """
+    DOPE-HR esperado del mejor modelo de un subconjunto aleatorio de k de los
+    modelos (sin reemplazo): P(mínimo = i-ésimo) = C(N-1-i, k-1) / C(N, k).
+    """
+    n = len(sorted_scores)
+    k = max(1, min(k, n))
+    log_total = _log_comb(n, k)
+    return sum(score * math.exp(_log_comb(n - 1 - i, k - 1) - log_total)
+               for i, score in enumerate(sorted_scores[:n - k + 1]))
+
+def parent_model(name: str) -> Optional[str]:
+    """Modelo de partida de un modelo de loop: 'AUTO_3_LOOP1_R2_LOOP2_R1.pdb' -> 'AUTO_3_LOOP1_R2.pdb'."""
+    base = name[:-4] if name.endswith('.pdb') else name
+    if '_LOOP' not in base:
+        return None
+    return base[:base.rindex('_LOOP')] + '.pdb'
+
+def _gain_per_cpu_hour(gain: Optional[float], hours: float) -> Optional[float]:
+    return gain / hours if gain is not None and hours > 0 else None
+
+# =================================================================
+# INFORME
+# =================================================================
+
+def build_report(ranking: List[Dict[str, Any]], timings: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """Informe de coste-eficiencia a partir del ranking final (todos los modelos evaluados) y de las mediciones."""
+    timings = read_timings() if timings is None else timings
+    scores = {m['name']: m['DOPEHR score'] for m in ranking if math.isfinite(m['DOPEHR score'])}
+    by_stage: Dict[str, List[Dict[str, Any]]] = {}
+    for entry in timings:
+        by_stage.setdefault(entry['stage'], []).append(entry)
+
+    # AutoModel
+    auto_scores = sorted(score for name, score in scores.items() if '_LOOP' not in name)
+    auto_hours = cpu_hours(by_stage.get('automodel', []))
+    automodel: Dict[str, Any] = {'models': len(auto_scores), 'cpu_hours': auto_hours}
+    best_auto = auto_scores[0] if auto_scores else None
+    if auto_scores:
+        n = len(auto_scores)
+        sample_sizes = sorted({max(1, n // d) for d in (8, 4, 2, 1)})
+        half_best = expected_best_of(auto_scores, n // 2) if n >= 2 else best_auto
+        automodel.update({
+            'distribution': distribution(auto_scores),
+            'best': best_auto,
+            'expected_best': {str(k): expected_best_of(auto_scores, k) for k in sample_sizes},
+            'second_half_gain': half_best - best_auto,
+            'second_half_gain_per_cpu_hour': _gain_per_cpu_hour(half_best - best_auto, auto_hours / 2.0)
+        })
+
+    # Refinamiento de loops: un registro por paso
+    steps = []
+    for entry in sorted(by_stage.get('loop', []), key=lambda e: (e.get('prefix', ''))):
+        prefix = entry.get('prefix', '')
+        # Solo las salidas del paso (<prefijo><rank>.pdb), no los modelos de pasos posteriores que parten de ellas
+        children = [score for name, score in scores.items()
+                    if name.startswith(prefix) and name[len(prefix):-4].isdigit() and name.endswith('.pdb')]
+        parent_score = scores.get(entry.get('parent'))
+        best_child = min(children) if children else None
+        gain = parent_score - best_child if parent_score is not None and best_child is not None else None
+        hours = entry['seconds'] * entry['workers'] / 3600.0
+        steps.append({'parent': entry.get('parent'), 'loop': entry.get('loop'), 'range': entry.get('range'),
+                      'models': len(children), 'parent_score': parent_score, 'best_score': best_child,
+                      'gain': gain, 'cpu_hours': hours})
+
+    def aggregate(group_steps: List[Dict[str, Any]]) -> Dict[str, Any]:
+        gains = [s['gain'] for s in group_steps if s['gain'] is not None]
+        hours = sum(s['cpu_hours'] for s in group_steps)
+        return {'steps': len(group_steps), 'improved': sum(1 for g in gains if g > 0),
+                'mean_gain': statistics.fmean(gains) if gains else None, 'cpu_hours': hours,
+                'gain_per_cpu_hour': _gain_per_cpu_hour(sum(gains), hours) if gains else None}
+
+    by_loop: Dict[str, List[Dict[str, Any]]] = {}
+    by_range: Dict[str, List[Dict[str, Any]]] = {}
+    for step in steps:
+        by_loop.setdefault(str(step['loop']), []).append(step)
+        if step['range']:
+            by_range.setdefault(f"{step['range'][0]}-{step['range'][1]}", []).append(step)
+
+    loop_scores = [score for name, score in scores.items() if '_LOOP' in name]
+    loop_hours = sum(s['cpu_hours'] for s in steps)
+    best_final = min(scores.values()) if scores else None
+    best_gain = best_auto - best_final if best_auto is not None and best_final is not None else None
+    loop_refinement = {
+        'steps': len(steps), 'models': len(loop_scores), 'cpu_hours': loop_hours,
+        'best_final': best_final, 'best_gain': best_gain,
+        'best_gain_per_cpu_hour': _gain_per_cpu_hour(best_gain, loop_hours) if steps else None,
+        'by_loop': {k: aggregate(v) for k, v in sorted(by_loop.items(), key=lambda item: int(item[0]) if item[0].isdigit() else 0)},
+        'by_range': {k: aggregate(v) for k, v in sorted(by_range.items(), key=lambda item: int(item[0].split('-')[0]))}
+    }
+
+    return {
+        'settings': {'NUM_MODELS_AUTO': config.NUM_MODELS_AUTO, 'NUM_MODELS_TO_REFINE': config.NUM_MODELS_TO_REFINE,
+                     'NUM_MODELS_LOOP': config.NUM_MODELS_LOOP, 'NUM_PROCESSORS': config.NUM_PROCESSORS},
+        'automodel': automodel,
+        'loop_refinement': loop_refinement,
+        'final_evaluation': {'cpu_hours': cpu_hours(by_stage.get('final_evaluation', [])),
+                             'models': len(scores)},
+        'steps': steps
+    }
+
+def _fmt(value: Optional[float], spec: str = '.3f') -> str:
+    return format(value, spec) if value is not None else '-'
+
+def format_table(report: Dict[str, Any]) -> str:
+    """Tabla legible del informe."""
+    auto = report['automodel']
+    loops = report['loop_refinement']
+    lines = [f"{'='*75}", "COSTE-EFICIENCIA POR ETAPA (DOPE-HR: más negativo es mejor; mejora = descenso)", f"{'='*75}",
+             f"{'Etapa':<22} {'Modelos':<9} {'CPU-h':<9} {'Mejora':<12} {'Mejora/CPU-h':<12}",
+             '-' * 75,
+             f"{'AutoModel (2a mitad)':<22} {auto['models']:<9} {auto['cpu_hours']:<9.2f} "
+             f"{_fmt(auto.get('second_half_gain')):<12} {_fmt(auto.get('second_half_gain_per_cpu_hour')):<12}",
+             f"{'Refinamiento loops':<22} {loops['models']:<9} {loops['cpu_hours']:<9.2f} "
+             f"{_fmt(loops['best_gain']):<12} {_fmt(loops['best_gain_per_cpu_hour']):<12}",
+             f"{'Evaluación final':<22} {report['final_evaluation']['models']:<9} "
+             f"{report['final_evaluation']['cpu_hours']:<9.2f}"]
+
+    if auto.get('distribution'):
+        d = auto['distribution']
+        lines += ['', "Distribución DOPE-HR tras AutoModel:",
+                  '  ' + '  '.join(f"{k}={v:.1f}" for k, v in d.items()),
+                  "Mejor esperado con n modelos: " + ', '.join(f"n={k}: {v:.1f}" for k, v in auto['expected_best'].items())]
+
+    for title, column, groups in (("Por número de loop", 'Loop', loops['by_loop']),
+                                  ("Por segmento", 'Segmento', loops['by_range'])):
+        if not groups:
+            continue
+        lines += ['', title + ':', f"  {column:<12} {'Pasos':<7} {'Mejoran':<9} {'Mejora media':<14} {'CPU-h':<9} {'Mejora/CPU-h':<12}"]
+        for key, group in groups.items():
+            lines.append(f"  {key:<12} {group['steps']:<7} {group['improved']:<9} {_fmt(group['mean_gain']):<14} "
+                         f"{group['cpu_hours']:<9.2f} {_fmt(group['gain_per_cpu_hour']):<12}")
+    lines.append('=' * 75)
+    return '\n'.join(lines)
+
+def write_report(report: Dict[str, Any], report_file: str = COST_REPORT_FILE,
+                 table_file: str = COST_REPORT_TABLE) -> str:
+    """Escribe el JSON y la tabla (escritura atómica). Retorna la tabla."""
+    table = format_table(report)
+    for path, content in ((report_file, json.dumps(report, indent=2)), (table_file, table + '\n')):
+        temp_file = path + '.tmp'
+        with open(temp_file, 'w') as f:
+            f.write(content)
+        os.replace(temp_file, path)
+    return table
+
+def report_run(ranking: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Construye, escribe y muestra el informe de la ejecución."""
+    if not ranking:
+        return None
+    report = build_report(ranking)
+    table = write_report(report)
+    logger.info('\n' + table)
+    logger.info(f"[COST] Informe de coste-eficiencia guardado en {COST_REPORT_FILE} y {COST_REPORT_TABLE}",
+                extra={'stage': 'cost_report'})
+    return report
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Informe de mejora de DOPE-HR por CPU-hora de una ejecución terminada.")
+    parser.add_argument('--timings', default=STAGE_TIMINGS_FILE, help="Mediciones de la ejecución")
+    args = parser.parse_args(argv)
+
+    pipeline_log.setup_logging(log_file=None)
+    import coord_store
+    ranking = [m for m in coord_store.ranked_models() if math.isfinite(m['DOPEHR score'])]
+    if not ranking:
+        logger.error("No hay modelos evaluados (caché 'ranking_scores'); ejecute antes la evaluación final.")
+        return 1
+    report = build_report(ranking, read_timings(args.timings))
+    logger.info('\n' + write_report(report))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
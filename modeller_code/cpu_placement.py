@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+# cpu_placement.py
+
+"""
+Colocación de los workers locales de Modeller en CPUs y dominios NUMA.
+
+Sin fijar, los procesos LocalWorker migran entre sockets y los hilos de
+BLAS/OpenMP que abran pueden competir por los mismos núcleos. Con WORKER_PINNING:
+
+- 'core': cada worker se fija a un núcleo, repartiendo los workers entre los
+          dominios NUMA por turnos mientras queden núcleos libres en ellos.
+- 'numa': cada worker se fija a todas las CPUs de su dominio NUMA.
+- 'none': sin fijar (comportamiento original).
+
+Las primeras CONTROLLER_RESERVED_CPUS CPUs quedan para el controller (que se
+fija a ellas), de modo que su evaluación y su lógica de refinamiento no compiten
+con los workers. Cada worker recibe además límites de hilos (WORKER_THREADS en
+OMP_NUM_THREADS, OPENBLAS_NUM_THREADS, MKL_NUM_THREADS...).
+
+La afinidad y el entorno se heredan: se aplican en el controller justo antes de
+arrancar cada worker y se restauran después. La topología se lee de
+/sys/devices/system/node (Linux); sin ella, todas las CPUs forman un dominio.
+Para ver la colocación prevista: python3 cpu_placement.py
+"""
+
+import os
+import sys
+import glob
+import argparse
+import contextlib
+from typing import Dict, Iterator, List, Optional
+
+import pipeline_log
+from config import NUM_PROCESSORS, WORKER_PINNING, WORKER_THREADS, CONTROLLER_RESERVED_CPUS
+
+logger = pipeline_log.get_logger(__name__)
+
+PINNING_MODES = ('none', 'core', 'numa')
+THREAD_VARIABLES = ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS', 'BLIS_NUM_THREADS',
+                    'VECLIB_MAXIMUM_THREADS', 'NUMEXPR_NUM_THREADS')
+
+# CPUs de la reserva al importar el módulo: el controller se fija después a sus CPUs
+# reservadas y los Job nuevos (reemplazo de workers) deben repartir las originales
+_INITIAL_CPUS = sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else list(range(os.cpu_count() or 1))
+
+# =================================================================
+# TOPOLOGÍA
+# =================================================================
+
+def parse_cpulist(text: str) -> List[int]:
+    """'0-3,8,10-11' -> [0, 1, 2, 3, 8, 10, 11]."""
+    cpus = []
+    for item in text.strip().split(','):
+        if not item:
+            continue
+        first, _, last = item.partition('-')
+        cpus.extend(range(int(first), int(last or first) + 1))
+    return cpus
+
+def numa_domains(cpus: Optional[List[int]] = None) -> Dict[int, List[int]]:
+    """
+    CPUs disponibles agrupadas por dominio NUMA: {número de nodo: [cpus]}, en
+    orden de nodo (los nodos sin CPUs disponibles se omiten).
+    """
+    available = set(_INITIAL_CPUS if cpus is None else cpus)
+    domains: Dict[int, List[int]] = {}
+    for cpulist_file in sorted(glob.glob('/sys/devices/system/node/node[0-9]*/cpulist'),
+                               key=lambda p: int(os.path.basename(os.path.dirname(p))[4:])):
+        try:
+            with open(cpulist_file, 'r') as f:
+                domain = [cpu for cpu in parse_cpulist(f.read()) if cpu in available]
+        except (OSError, ValueError):
+            continue
+        if domain:
+            domains[int(os.path.basename(os.path.dirname(cpulist_file))[4:])] = domain
+    covered = {cpu for domain in domains.values() for cpu in domain}
+    if covered != available:
+        # Sin topología (o incompleta): las CPUs restantes forman un dominio más (nodo 0 si no hay ninguno)
+        domains[max(domains, default=-1) + 1] = sorted(available - covered)
+    return domains
+
+# =================================================================
+# PLAN DE COLOCACIÓN
+# =================================================================
+
+def plan_placement(num_workers: int = NUM_PROCESSORS, mode: str = WORKER_PINNING,
+                   reserved: int = CONTROLLER_RESERVED_CPUS,
+                   domains: Optional[Dict[int, List[int]]] = None) -> Dict[str, object]:
+    """
+    Plan de colocación: {'mode', 'controller': [cpus], 'workers': [{'cpus', 'domain'}]},
+    con 'domain' el número de nodo NUMA de numa_domains (o las claves de domains).
+    Con mode 'none' las listas de CPUs de los workers quedan vacías (sin fijar).
+    """
+    if mode not in PINNING_MODES:
+        raise ValueError(f"WORKER_PINNING desconocido: '{mode}' (opciones: {', '.join(PINNING_MODES)})")
+    domains = numa_domains() if domains is None else {node: list(d) for node, d in domains.items()}
+    if mode == 'none':
+        return {'mode': mode, 'controller': [], 'workers': [{'cpus': [], 'domain': None} for _ in range(num_workers)]}
+
+    # CPUs reservadas para el controller: las primeras del primer dominio (nunca todas)
+    total = sum(len(d) for d in domains.values())
+    reserved = max(0, min(reserved, total - 1))
+    controller = [cpu for domain in domains.values() for cpu in domain][:reserved]
+    # (nodo, CPUs libres): los nodos que ceden todas sus CPUs al controller no reciben workers
+    worker_domains = [(node, [cpu for cpu in domain if cpu not in controller]) for node, domain in domains.items()]
+    worker_domains = [(node, domain) for node, domain in worker_domains if domain]
+
+    # Núcleos por turnos entre dominios; un dominio agotado (p. ej. el que cede
+    # las CPUs del controller) deja su turno a los demás
+    core_order = [(node, domain[k]) for k in range(max(len(domain) for _, domain in worker_domains))
+                  for node, domain in worker_domains if k < len(domain)]
+    workers = []
+    for i in range(num_workers):
+        if mode == 'numa':
+            node, domain = worker_domains[i % len(worker_domains)]
+            cpus = list(domain)
+        else:
+            node, cpu = core_order[i % len(core_order)]
+            cpus = [cpu]
+        workers.append({'cpus': cpus, 'domain': node})
+
+    worker_cpus = sum(len(domain) for _, domain in worker_domains)
+    if mode == 'core' and num_workers > worker_cpus:
+        logger.warning(f"[PINNING] {num_workers} workers para {worker_cpus} CPUs libres: algunos núcleos tendrán "
+                       f"más de un worker (reduzca NUM_PROCESSORS o CONTROLLER_RESERVED_CPUS).", extra={'stage': 'worker_pool', 'count': num_workers})
+    return {'mode': mode, 'controller': controller, 'workers': workers}
+
+def thread_environ(threads: int = WORKER_THREADS) -> Dict[str, str]:
+    """Variables de entorno que limitan los hilos de BLAS/OpenMP de un worker ({} si threads <= 0)."""
+    return {name: str(threads) for name in THREAD_VARIABLES} if threads > 0 else {}
+
+def thread_env_prefix(threads: int = WORKER_THREADS) -> str:
+    """Prefijo de shell con los límites de hilos, para workers lanzados en otros nodos."""
+    env = thread_environ(threads)
+    return ('env ' + ' '.join(f'{k}={v}' for k, v in env.items()) + ' ') if env else ''
+
+@contextlib.contextmanager
+def applied(cpus: List[int], env: Dict[str, str]) -> Iterator[None]:
+    """
+    Aplica afinidad y variables de entorno al hilo actual mientras dura el
+    bloque; los procesos arrancados dentro las heredan.
+    """
+    previous_cpus = os.sched_getaffinity(0) if cpus and hasattr(os, 'sched_setaffinity') else None
+    previous_env = {name: os.environ.get(name) for name in env}
+    try:
+        if previous_cpus is not None:
+            os.sched_setaffinity(0, cpus)
+        os.environ.update(env)
+        yield
+    finally:
+        if previous_cpus is not None:
+            os.sched_setaffinity(0, previous_cpus)
+        for name, value in previous_env.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+def pin_controller(plan: Dict[str, object]) -> None:
+    """Fija el controller a sus CPUs reservadas (si el plan reserva alguna)."""
+    if plan['controller'] and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, plan['controller'])
+
+def process_cpus(pid: int) -> Optional[List[int]]:
+    """CPUs permitidas de un proceso (None si ya no existe)."""
+    try:
+        return sorted(os.sched_getaffinity(pid))
+    except OSError:
+        return None
+
+def _format_cpus(cpus: List[int]) -> str:
+    """[0, 1, 2, 5] -> '0-2,5'."""
+    ranges = []
+    for cpu in cpus:
+        if ranges and cpu == ranges[-1][1] + 1:
+            ranges[-1][1] = cpu
+        else:
+            ranges.append([cpu, cpu])
+    return ','.join(f'{a}-{b}' if a != b else f'{a}' for a, b in ranges) or '-'
+
+def log_placement(plan: Dict[str, object], worker_pids: Optional[List[int]] = None) -> None:
+    """Muestra la colocación: CPUs del controller, workers por dominio y, con worker_pids, la afinidad real."""
+    if plan['mode'] == 'none':
+        logger.info(f"[PINNING] Workers sin fijar a CPUs; límite de hilos por worker: {WORKER_THREADS or 'sin límite'}.",
+                    extra={'stage': 'worker_pool'})
+        return
+    by_domain: Dict[object, int] = {}
+    for worker in plan['workers']:
+        by_domain[worker['domain']] = by_domain.get(worker['domain'], 0) + 1
+    logger.info(f"[PINNING] Modo '{plan['mode']}': controller en CPUs {_format_cpus(plan['controller'])}; "
+                f"workers por dominio NUMA: " + ', '.join(f"{d}: {n}" for d, n in sorted(by_domain.items()))
+                + f"; límite de hilos por worker: {WORKER_THREADS or 'sin límite'}.",
+                extra={'stage': 'worker_pool', 'count': len(plan['workers'])})
+    for i, worker in enumerate(plan['workers']):
+        logger.debug(f"  worker {i}: dominio {worker['domain']}, CPUs {_format_cpus(worker['cpus'])}",
+                     extra={'stage': 'worker_pool'})
+    for pid in worker_pids or []:
+        logger.debug(f"  proceso {pid}: CPUs permitidas {_format_cpus(process_cpus(pid) or [])}",
+                     extra={'stage': 'worker_pool'})
+
+# =================================================================
+# CLI
+# =================================================================
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Muestra la topología NUMA y la colocación prevista de los workers.")
+    parser.add_argument('--workers', type=int, default=NUM_PROCESSORS)
+    parser.add_argument('--mode', default=WORKER_PINNING, choices=PINNING_MODES)
+    args = parser.parse_args(argv)
+
+    pipeline_log.setup_logging(log_file=None)
+    for node, domain in numa_domains().items():
+        logger.info(f"Dominio NUMA {node}: CPUs {_format_cpus(domain)}")
+    plan = plan_placement(args.workers, args.mode)
+    if plan['mode'] != 'none':
+        logger.info(f"{'Worker':<8} {'Dominio':<8} CPUs")
+        for i, worker in enumerate(plan['workers']):
+            logger.info(f"{i:<8} {worker['domain']!s:<8} {_format_cpus(worker['cpus'])}")
+    log_placement(plan)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,9 +1,16 @@
 #!/usr/bin/env python3
 # custom_models.py
 
+import os
+import socket
+
 from modeller import *
-from modeller.automodel import DOPEHRLoopModel
+from modeller.automodel import AutoModel, DOPEHRLoopModel, refine, assess
 from modeller.selection import Selection
+from modeller.parallel import Task
+import pipeline_log
+
+logger = pipeline_log.get_logger(__name__)
 
 class DynamicLoopRefiner(DOPEHRLoopModel):
     """
@@ -11,7 +18,7 @@ class DynamicLoopRefiner(DOPEHRLoopModel):
     para permitir el procesamiento paralelo (pickling).
     """
 
-    def __init__(self, env, inimodel, sequence, loop_start, loop_end, chain_id, **kwargs):
+    def __init__(self, env, inimodel, sequence, loop_start, loop_end, chain_id, seed_conformation=None, **kwargs):
         super().__init__(env,
                          inimodel=inimodel,
                          sequence=sequence,
@@ -19,9 +26,124 @@ class DynamicLoopRefiner(DOPEHRLoopModel):
         self.loop_start = loop_start
         self.loop_end = loop_end
         self.chain_id = chain_id
+        # {'<resnum>:<átomo>': (x, y, z)} de fragment_library (opcional; solo esqueleto N/CA/C/O)
+        self.seed_conformation = seed_conformation
+        self.seeded_atoms = 0
+        self.loop_atoms = 0
 
     def select_loop_atoms(self):
         """Define los residuos que serán refinados usando los atributos de la instancia."""
         range_start = f'{self.loop_start}:{self.chain_id}'
         range_end = f'{self.loop_end}:{self.chain_id}'
         return Selection(self.residue_range(range_start, range_end))
+
+    def build_ini_loop(self, atmsel):
+        """
+        Conformación inicial del loop. Con seed_conformation, los átomos del
+        esqueleto (N/CA/C/O) parten del fragmento; las cadenas laterales
+        conservan la conformación por defecto de Modeller. Modeller construye la
+        conformación inicial una vez por make(), por lo que para tener una
+        semilla por muestra cada muestra se genera con su propio make()
+        (LoopWindowTask). seeded_atoms/loop_atoms registran la cobertura lograda.
+        """
+        super().build_ini_loop(atmsel)
+        self.loop_atoms = len(atmsel)
+        self.seeded_atoms = 0
+        if not self.seed_conformation:
+            return
+        for atom in atmsel:
+            xyz = self.seed_conformation.get(f'{atom.residue.num}:{atom.name}')
+            if xyz is not None:
+                atom.x, atom.y, atom.z = xyz
+                self.seeded_atoms += 1
+
+class BatchAutoModel(AutoModel):
+    """
+    AutoModel que se ejecuta por tandas (starting_model..ending_model) sin
+    repetir la preparación: con reuse_restraints, make() parte del modelo
+    inicial (.ini) y las restricciones (.rsr) que escribió la primera tanda en
+    lugar de volver a construirlos con homcsr(). Definida globalmente para que
+    los workers puedan deserializarla.
+    """
+
+    reuse_restraints = False
+
+    def homcsr(self, exit_stage):
+        if self.reuse_restraints and os.path.exists(self.inifile) and os.path.exists(self.csrfile):
+            self.read_initial_model()
+            self.restraints.clear()
+            self.restraints.append(file=self.csrfile)
+            return
+        super().homcsr(exit_stage)
+
+def sample_seed(rand_seed, model_num):
+    """Semilla de Modeller de una muestra: distinta por número de modelo y dentro del rango válido (-50000, -2)."""
+    base = -8123 if rand_seed is None else rand_seed
+    return -2 - (abs(base) + model_num) % 49998
+
+class LoopWindowTask(Task):
+    """
+    Tarea paralela que refina un segmento (una ventana de un loop largo o una
+    muestra con semilla) dentro de un worker, generando en serie los modelos
+    starting_model..ending_model. Definida aquí (módulo importable) para que el
+    worker pueda deserializarla.
+
+    Con seed_conformations, cada modelo se genera con su propio make() y parte
+    del fragmento seed_conformations[(modelo - 1) % len(seed_conformations)];
+    las salidas registran el fragmento ('seed') y los átomos sembrados.
+    """
+
+    def run(self, inimodel, sequence, loop_start, loop_end, chain_id, starting_model, ending_model,
+            seed_conformations=None, md_level=refine.slow_large, rand_seed=None):
+        if seed_conformations:
+            samples = [(num, num, num - 1) for num in range(starting_model, ending_model + 1)]
+        else:
+            samples = [(starting_model, ending_model, None)]
+
+        results = []
+        for first, last, seed_index in samples:
+            if seed_index is None:
+                env = Environ(rand_seed=rand_seed) if rand_seed is not None else Environ()
+                seed = None
+            else:
+                env = Environ(rand_seed=sample_seed(rand_seed, first))
+                seed_index %= len(seed_conformations)
+                seed = seed_conformations[seed_index]
+            env.io.hetatm = True
+            env.io.atom_files_directory = ['.', '../atom_files']
+
+            try:
+                ml = DynamicLoopRefiner(env,
+                                        inimodel=inimodel,
+                                        sequence=sequence,
+                                        loop_start=loop_start,
+                                        loop_end=loop_end,
+                                        chain_id=chain_id,
+                                        seed_conformation=seed)
+                ml.loop.starting_model = first
+                ml.loop.ending_model = last
+                ml.loop.md_level = md_level
+                ml.loop.assess_methods = (assess.DOPEHR, assess.GA341)
+                ml.max_var_iterations = 1000
+                ml.make()
+            except Exception as e:
+                logger.error(f"Falló el segmento {loop_start}-{loop_end} ({sequence}, modelos {first}-{last}). Error: {e}")
+                continue
+
+            for o in ml.loop.outputs:
+                if o.get('failure') is None:
+                    results.append({'name': o['name'], 'DOPE-HR score': o.get('DOPE-HR score', 9999999.0),
+                                    'seed': seed_index, 'seeded_atoms': ml.seeded_atoms, 'loop_atoms': ml.loop_atoms})
+        return results
+
+class WorkerProbeTask(Task):
+    """
+    Tarea mínima para probar el pool de workers (worker_pool.py test): escribe un
+    archivo en la carpeta del worker y retorna en qué nodo y carpeta se ejecutó.
+    """
+
+    def run(self, probe_id):
+        output_file = f'worker_probe_{probe_id}.txt'
+        with open(output_file, 'w') as f:
+            f.write(f'{probe_id} {socket.gethostname()} {os.getcwd()}\n')
+        return {'probe': probe_id, 'host': socket.gethostname(), 'cwd': os.getcwd(), 'file': output_file}
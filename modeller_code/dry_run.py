@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# dry_run.py
+
+"""
+Modo de ensayo (controller.py --dry-run): estima el coste de la configuración
+completa antes de lanzarla en SLURM.
+
+El alineamiento y la detección de loops se hacen de verdad; después se lanzan
+unas pocas construcciones de calibración de AutoModel y un paso de loop con
+NUM_PROCESSORS workers (mismo mecanismo que autotune.py) y se proyectan las
+CPU-horas, el tiempo de reloj, el disco y el número de archivos de los
+NUM_MODELS_AUTO modelos + NUM_MODELS_TO_REFINE cadenas de loops. Con un
+presupuesto de tiempo (--time-budget) se sugieren valores que caben en él.
+"""
+
+import os
+import json
+import math
+from typing import List, Tuple, Dict, Any, Optional
+
+import config
+import pipeline_log
+import pdb_utils
+from walltime import parse_duration, format_duration
+from config import NUM_PROCESSORS, NUM_MODELS_AUTO, NUM_MODELS_TO_REFINE, NUM_MODELS_LOOP, ALIGNMENT_FILE
+from config import MIN_LOOP_LENGTH, MAX_LOOP_LENGTH, LONG_LOOP_WINDOW, LONG_LOOP_OVERLAP, LONG_LOOP_FINAL_PASS
+from config import DRY_RUN_MODELS_PER_WORKER, DRY_RUN_REPORT_FILE
+
+logger = pipeline_log.get_logger(__name__)
+
+BUDGET_SAFETY = 0.9   # Fracción del presupuesto de tiempo que se planifica (margen para arranque y E/S)
+
+# =================================================================
+# PROYECCIÓN
+# =================================================================
+
+def _per_model_worker_seconds(seconds: Optional[float], models: int, workers: int) -> Optional[float]:
+    """Tiempo de un worker por modelo: los 'models' modelos se repartieron entre min(workers, models) workers."""
+    if not seconds or not models:
+        return None
+    return seconds * min(workers, models) / models
+
+def loop_plan(loop_ranges: List[Tuple[int, int]]) -> List[Dict[str, Any]]:
+    """Pasos de refinamiento de una cadena: longitud, ventanas y modelos por loop."""
+    plan = []
+    for start, end in loop_ranges:
+        length = end - start + 1
+        if length < MIN_LOOP_LENGTH:
+            continue
+        windows = pdb_utils.split_loop_windows(start, end, LONG_LOOP_WINDOW, LONG_LOOP_OVERLAP) if length > MAX_LOOP_LENGTH else [(start, end)]
+        plan.append({
+            'loop': [start, end],
+            'window_lengths': [e - s + 1 for s, e in windows],
+            'final_pass': length > MAX_LOOP_LENGTH and LONG_LOOP_FINAL_PASS
+        })
+    return plan
+
+def project(calibration: Dict[str, Any], loop_ranges: List[Tuple[int, int]],
+            num_models_auto: int = NUM_MODELS_AUTO, num_models_to_refine: int = NUM_MODELS_TO_REFINE,
+            num_models_loop: int = NUM_MODELS_LOOP, workers: int = NUM_PROCESSORS) -> Dict[str, Any]:
+    """
+    Proyecta la configuración completa a partir de una calibración. El coste de un
+    modelo de loop se escala linealmente con la longitud del loop (o de la ventana)
+    respecto al loop de calibración. La evaluación final es serie (proceso principal).
+    """
+    auto_model_s = _per_model_worker_seconds(calibration['auto_seconds'], calibration['auto_models'], calibration['workers'])
+    loop_model_s = _per_model_worker_seconds(calibration['loop_seconds'], calibration['loop_models'], calibration['workers'])
+    calibration_loop_length = (calibration['loop'][1] - calibration['loop'][0] + 1) if calibration.get('loop') else None
+    eval_s = calibration.get('eval_seconds') or 0.0
+
+    auto_wall = math.ceil(num_models_auto / workers) * auto_model_s
+    auto_cpu = num_models_auto * auto_model_s
+
+    chain_wall = 0.0
+    chain_cpu = 0.0
+    chain_models = 0
+    for step in loop_plan(loop_ranges) if loop_model_s else []:
+        # Las ventanas de un loop largo se refinan a la vez en el pool de workers
+        window_model_s = [loop_model_s * length / calibration_loop_length for length in step['window_lengths']]
+        chain_wall += math.ceil(num_models_loop * len(window_model_s) / workers) * max(window_model_s)
+        chain_cpu += num_models_loop * sum(window_model_s)
+        chain_models += num_models_loop * len(window_model_s)
+        if step['final_pass']:
+            final_model_s = loop_model_s * (step['loop'][1] - step['loop'][0] + 1) / calibration_loop_length
+            chain_wall += math.ceil(num_models_loop / workers) * final_model_s
+            chain_cpu += num_models_loop * final_model_s
+            chain_models += num_models_loop
+
+    loop_models = num_models_to_refine * chain_models
+    eval_models = num_models_auto + loop_models
+    auto_files = calibration['auto_files'] / max(1, calibration['auto_models'])
+    auto_bytes = calibration['auto_bytes'] / max(1, calibration['auto_models'])
+    loop_files = calibration['loop_files'] / max(1, calibration['loop_models'])
+    loop_bytes = calibration['loop_bytes'] / max(1, calibration['loop_models'])
+
+    stages = {
+        'automodel': {'wall_s': auto_wall, 'cpu_s': auto_cpu, 'models': num_models_auto},
+        'loop_refinement': {'wall_s': num_models_to_refine * chain_wall, 'cpu_s': num_models_to_refine * chain_cpu,
+                            'models': loop_models},
+        'final_evaluation': {'wall_s': eval_models * eval_s, 'cpu_s': eval_models * eval_s, 'models': eval_models}
+    }
+    return {
+        'workers': workers,
+        'NUM_MODELS_AUTO': num_models_auto,
+        'NUM_MODELS_TO_REFINE': num_models_to_refine,
+        'NUM_MODELS_LOOP': num_models_loop,
+        'stages': stages,
+        'wall_s': sum(s['wall_s'] for s in stages.values()),
+        'cpu_hours': sum(s['cpu_s'] for s in stages.values()) / 3600.0,
+        'disk_gb': (num_models_auto * auto_bytes + loop_models * loop_bytes) / 1024 ** 3,
+        'files': int(num_models_auto * auto_files + loop_models * loop_files),
+        'per_model': {'auto_s': auto_model_s, 'loop_s_per_residue': loop_model_s / calibration_loop_length
+                      if loop_model_s else None, 'eval_s': eval_s}
+    }
+
+def suggest_for_budget(calibration: Dict[str, Any], loop_ranges: List[Tuple[int, int]],
+                       budget_s: float) -> Dict[str, Any]:
+    """
+    Ajustes que caben en el presupuesto: primero se reduce NUM_MODELS_AUTO (en
+    múltiplos de NUM_PROCESSORS); si ni con el mínimo caben las cadenas de loops,
+    se reduce también NUM_MODELS_TO_REFINE.
+    """
+    usable_s = budget_s * BUDGET_SAFETY
+    full = project(calibration, loop_ranges)
+    if full['wall_s'] <= usable_s:
+        return {'fits': True, 'NUM_MODELS_AUTO': NUM_MODELS_AUTO, 'NUM_MODELS_TO_REFINE': NUM_MODELS_TO_REFINE}
+
+    for num_to_refine in range(NUM_MODELS_TO_REFINE, 0, -1):
+        minimum_auto = max(num_to_refine, NUM_PROCESSORS)
+        base = project(calibration, loop_ranges, num_models_auto=0, num_models_to_refine=num_to_refine)
+        per_wave_s = base['per_model']['auto_s'] + base['per_model']['eval_s'] * NUM_PROCESSORS
+        waves = int((usable_s - base['wall_s']) // per_wave_s) if per_wave_s else 0
+        num_auto = min(NUM_MODELS_AUTO, waves * NUM_PROCESSORS)
+        if num_auto >= minimum_auto:
+            return {'fits': False, 'NUM_MODELS_AUTO': num_auto, 'NUM_MODELS_TO_REFINE': num_to_refine}
+    return {'fits': False, 'NUM_MODELS_AUTO': None, 'NUM_MODELS_TO_REFINE': None}
+
+# =================================================================
+# EJECUCIÓN Y REPORTE
+# =================================================================
+
+def log_projection(estimate: Dict[str, Any]) -> None:
+    logger.info(f"\n{'='*75}")
+    logger.info(f"ESTIMACIÓN (dry-run) - {estimate['workers']} workers, {estimate['NUM_MODELS_AUTO']} modelos AutoModel, "
+                f"{estimate['NUM_MODELS_TO_REFINE']} cadenas x {estimate['NUM_MODELS_LOOP']} modelos por loop")
+    logger.info(f"{'='*75}")
+    logger.info(f"{'Etapa':<20} {'Modelos':<10} {'Reloj':<14} {'CPU-horas':<10}")
+    logger.info('-' * 75)
+    for stage, values in estimate['stages'].items():
+        logger.info(f"{stage:<20} {values['models']:<10} {format_duration(values['wall_s']):<14} {values['cpu_s'] / 3600.0:<10.1f}")
+    logger.info('-' * 75)
+    logger.info(f"{'Total':<20} {'':<10} {format_duration(estimate['wall_s']):<14} {estimate['cpu_hours']:<10.1f}")
+    logger.info(f"\nDisco (pico): {estimate['disk_gb']:.2f} GB | Archivos: {estimate['files']}")
+
+def run_dry_run(loop_ranges: List[Tuple[int, int]], time_budget: Optional[str] = None) -> Dict[str, Any]:
+    """Calibra con NUM_PROCESSORS workers, proyecta la configuración completa y guarda DRY_RUN_REPORT_FILE."""
+    import autotune
+
+    logger.info(f"\n[DRY-RUN] Calibrando con {NUM_PROCESSORS} workers "
+                f"({NUM_PROCESSORS * DRY_RUN_MODELS_PER_WORKER} modelos AutoModel + 1 paso de loop)...",
+                extra={'stage': 'dry_run'})
+    calibration_loop = next(((s, e) for s, e in loop_ranges if MIN_LOOP_LENGTH <= e - s + 1 <= MAX_LOOP_LENGTH), None)
+    calibration = autotune.measure_worker_count(NUM_PROCESSORS, DRY_RUN_MODELS_PER_WORKER, ALIGNMENT_FILE, calibration_loop)
+
+    estimate = project(calibration, loop_ranges)
+    log_projection(estimate)
+    if estimate['per_model']['loop_s_per_residue'] is None and loop_plan(loop_ranges):
+        logger.warning("No se pudo calibrar un paso de loop; el refinamiento de loops no está incluido en la estimación.")
+
+    report = {'calibration': calibration, 'estimate': estimate,
+              'recommended_slurm_time': format_duration(estimate['wall_s'] / BUDGET_SAFETY)}
+    logger.info(f"Tiempo de SLURM recomendado para esta configuración: --time={report['recommended_slurm_time']}")
+
+    if time_budget:
+        budget_s = parse_duration(time_budget)
+        suggestion = suggest_for_budget(calibration, loop_ranges, budget_s)
+        report['budget'] = {'time_budget': time_budget, 'seconds': budget_s, **suggestion}
+        if suggestion['fits']:
+            logger.info(f"[DRY-RUN] La configuración actual cabe en el presupuesto de {time_budget}.")
+        elif suggestion['NUM_MODELS_AUTO']:
+            logger.info(f"[DRY-RUN] Para caber en {time_budget}: NUM_MODELS_AUTO = {suggestion['NUM_MODELS_AUTO']}, "
+                        f"NUM_MODELS_TO_REFINE = {suggestion['NUM_MODELS_TO_REFINE']}")
+        else:
+            logger.warning(f"Ni una sola cadena de loops cabe en {time_budget} con {NUM_PROCESSORS} workers.")
+
+    temp_file = DRY_RUN_REPORT_FILE + '.tmp'
+    with open(temp_file, 'w') as f:
+        json.dump(report, f, indent=2)
+    os.replace(temp_file, DRY_RUN_REPORT_FILE)
+    logger.info(f"[DRY-RUN] Estimación guardada en {DRY_RUN_REPORT_FILE}", extra={'stage': 'dry_run'})
+    return report
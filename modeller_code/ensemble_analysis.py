@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+# ensemble_analysis.py
+
+"""
+Análisis de convergencia del conjunto de mejores modelos (tras el ranking final).
+
+Sobre los NUM_BEST_FINAL_MODELS primeros modelos del ranking, con operaciones de
+NumPy por lotes sobre el almacén de coordenadas (coord_store.py):
+
+- Superposición de todos los modelos sobre los CA fuera de los loops refinados
+  (Kabsch por lotes, iterado sobre la estructura media).
+- RMSF por residuo (CA y promedio de todos sus átomos).
+- Dispersión de cada loop detectado por find_missing_residues: RMSF medio y
+  máximo, y RMSD por pares del loop sin reajustar (posición respecto al núcleo).
+- Modelo medoide (consenso): el de menor suma de RMSD óptimo por pares sobre los CA.
+
+Las salidas se guardan en ENSEMBLE_ANALYSIS_DIR: residue_rmsf.csv,
+loop_spread.csv, pairwise_rmsd.npy y summary.json. Con BUILD_COORD_STORE el
+análisis reutiliza el almacén de la ejecución en lugar de construir otro. Las
+coordenadas de todos los átomos se procesan en float32 (el tipo del almacén);
+solo los subconjuntos de CA de los ajustes y de los RMSD pasan a float64.
+
+Uso:
+    python3 ensemble_analysis.py                       # top NUM_BEST_FINAL_MODELS de final_models_ranking.csv
+    python3 ensemble_analysis.py --top 300 --loops 120-131,200-212
+    python3 ensemble_analysis.py --store coord_store   # usa un almacén ya construido
+"""
+
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+from typing import List, Tuple, Dict, Any, Optional
+
+import numpy as np
+
+import config
+import stage_cache
+import coord_store
+import pipeline_log
+from config import NUM_BEST_FINAL_MODELS, ENSEMBLE_ANALYSIS_DIR, CHAIN_ID
+
+logger = pipeline_log.get_logger(__name__)
+
+FINAL_RANKING_FILE = 'final_models_ranking.csv'
+SUPERPOSITION_ITERATIONS = 3   # Ajustes sucesivos sobre la estructura media
+PAIRWISE_BLOCK = 256           # Modelos por bloque al calcular la matriz de RMSD por pares
+
+# =================================================================
+# SUPERPOSICIÓN Y RMSD (POR LOTES)
+# =================================================================
+
+def kabsch_rotations(mobile: np.ndarray, target: np.ndarray) -> np.ndarray:
+    """
+    Rotaciones óptimas (n, 3, 3) que llevan cada conjunto centrado de mobile
+    (n, k, 3) sobre target (k, 3) centrado: mobile[i] @ R[i] ≈ target.
+    """
+    h = np.einsum('nki,kj->nij', mobile, target)
+    u, _, vt = np.linalg.svd(h)
+    d = np.sign(np.linalg.det(u @ vt))
+    u[:, :, -1] *= d[:, None]   # Evita reflexiones
+    return u @ vt
+
+def superpose(coords: np.ndarray, fit_mask: np.ndarray,
+              iterations: int = SUPERPOSITION_ITERATIONS) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Superpone todos los modelos (n, átomos, 3) usando los átomos de fit_mask.
+    Primero sobre el primer modelo y después sobre la media del conjunto.
+    El ajuste se calcula en float64 sobre los átomos de ajuste; la rotación se
+    aplica a todos los átomos en el tipo de coords.
+    Retorna (coordenadas superpuestas, estructura media de los átomos de ajuste).
+    """
+    fit = coords[:, fit_mask].astype(np.float64)
+    centroids = fit.mean(axis=1, keepdims=True)
+    centered_fit = fit - centroids
+    target = centered_fit[0]
+    for _ in range(iterations):
+        rotations = kabsch_rotations(centered_fit, target)
+        aligned_fit = centered_fit @ rotations
+        target = aligned_fit.mean(axis=0)
+        target -= target.mean(axis=0)
+    rotations = kabsch_rotations(centered_fit, target)
+    aligned_all = coords - centroids.astype(coords.dtype)
+    return np.einsum('nai,nij->naj', aligned_all, rotations.astype(coords.dtype)), target
+
+def pairwise_rmsd(coords: np.ndarray, block: int = PAIRWISE_BLOCK) -> np.ndarray:
+    """
+    Matriz (n, n) de RMSD tras superposición óptima de cada par, sin bucles por
+    par: las matrices de covarianza 3x3 de todos los pares salen de un único
+    producto matricial por bloque y el RMSD de sus valores singulares.
+    """
+    n, atoms, _ = coords.shape
+    centered = coords - coords.mean(axis=1, keepdims=True)
+    sq_norms = np.einsum('nai,nai->n', centered, centered)
+    flat = centered.transpose(0, 2, 1).reshape(n * 3, atoms)   # filas: (modelo, eje)
+    rmsd = np.zeros((n, n))
+    for start in range(0, n, block):
+        stop = min(n, start + block)
+        cov = (flat[start * 3:stop * 3] @ flat.T).reshape(stop - start, 3, n, 3).transpose(0, 2, 1, 3)
+        singular = np.linalg.svd(cov, compute_uv=False)
+        singular[..., -1] *= np.sign(np.linalg.det(cov))
+        msd = (sq_norms[start:stop, None] + sq_norms[None, :] - 2.0 * singular.sum(axis=-1)) / atoms
+        rmsd[start:stop] = np.sqrt(np.clip(msd, 0.0, None))
+    np.fill_diagonal(rmsd, 0.0)
+    return rmsd
+
+def fixed_frame_rmsd(coords: np.ndarray) -> np.ndarray:
+    """RMSD (n, n) por pares sin reajustar (los modelos ya están superpuestos por el núcleo)."""
+    n, atoms, _ = coords.shape
+    flat = coords.reshape(n, -1)
+    sq_norms = np.einsum('nk,nk->n', flat, flat)
+    msd = (sq_norms[:, None] + sq_norms[None, :] - 2.0 * (flat @ flat.T)) / atoms
+    return np.sqrt(np.clip(msd, 0.0, None))
+
+# =================================================================
+# ANÁLISIS DEL CONJUNTO
+# =================================================================
+
+def _residue_mask(store: coord_store.CoordStore, loop_ranges: List[Tuple[int, int]]) -> np.ndarray:
+    in_loops = np.zeros(len(store.atoms), dtype=bool)
+    for start, end in loop_ranges:
+        in_loops |= store.atom_mask(residue_range=(start, end), chain_id=CHAIN_ID)
+    return in_loops
+
+def analyze_store(store: coord_store.CoordStore, loop_ranges: List[Tuple[int, int]],
+                  num_models: int = NUM_BEST_FINAL_MODELS) -> Dict[str, Any]:
+    """Superposición, RMSF por residuo, dispersión por loop y medoide de los num_models primeros modelos del almacén."""
+    num_models = min(num_models, len(store)) if num_models > 0 else len(store)
+    coords = np.array(store.coords[:num_models])   # Copia en float32, el tipo del almacén
+    models = store.models[:num_models]
+
+    # Átomos presentes en todos los modelos (los ausentes están en NaN)
+    finite = np.isfinite(coords)
+    complete = finite.all(axis=(0, 2))
+    coords[~finite] = 0.0
+    del finite
+    ca_mask = complete & (store.atoms['name'] == 'CA')
+    loop_atoms = _residue_mask(store, loop_ranges)
+    fit_mask = ca_mask & ~loop_atoms
+    if np.count_nonzero(fit_mask) < 3:
+        fit_mask = ca_mask
+
+    aligned, _ = superpose(coords, fit_mask)
+    del coords
+    mean_structure = aligned.mean(axis=0, dtype=np.float64).astype(aligned.dtype)
+    atom_msf = ((aligned - mean_structure) ** 2).sum(axis=-1).mean(axis=0, dtype=np.float64)
+    atom_rmsf = np.where(complete, np.sqrt(atom_msf), np.nan)
+
+    residues = store.residues
+    sums = np.add.reduceat(np.where(complete, atom_msf, 0.0), residues['start'])
+    counts = np.add.reduceat(complete.astype(np.int64), residues['start'])
+    residue_rmsf_all = np.sqrt(np.divide(sums, counts, out=np.full(len(residues), np.nan), where=counts > 0))
+    residue_rmsf_ca = np.full(len(residues), np.nan)
+    residue_rmsf_ca[store.atoms['residue'][ca_mask]] = atom_rmsf[ca_mask]
+
+    loops = []
+    for start, end in loop_ranges:
+        mask = ca_mask & store.atom_mask(residue_range=(start, end), chain_id=CHAIN_ID)
+        if not mask.any():
+            continue
+        spread = fixed_frame_rmsd(aligned[:, mask].astype(np.float64))
+        upper = spread[np.triu_indices(num_models, k=1)]
+        loops.append({
+            'start': start, 'end': end, 'residues': end - start + 1,
+            'mean_rmsf': float(np.nanmean(atom_rmsf[mask])), 'max_rmsf': float(np.nanmax(atom_rmsf[mask])),
+            'mean_pairwise_rmsd': float(upper.mean()) if len(upper) else 0.0,
+            'max_pairwise_rmsd': float(upper.max()) if len(upper) else 0.0
+        })
+
+    rmsd_matrix = pairwise_rmsd(aligned[:, ca_mask].astype(np.float64))
+    medoid = int(np.argmin(rmsd_matrix.sum(axis=1)))
+    return {
+        'models': models,
+        'fit_atoms': int(np.count_nonzero(fit_mask)),
+        'residue_rmsf_ca': residue_rmsf_ca,
+        'residue_rmsf_all': residue_rmsf_all,
+        'loops': loops,
+        'pairwise_rmsd': rmsd_matrix,
+        'medoid': medoid,
+        'medoid_mean_rmsd': float(rmsd_matrix[medoid].sum() / max(1, num_models - 1))
+    }
+
+def write_results(store: coord_store.CoordStore, result: Dict[str, Any], output_dir: str = ENSEMBLE_ANALYSIS_DIR) -> None:
+    os.makedirs(output_dir, exist_ok=True)
+    with open(os.path.join(output_dir, 'residue_rmsf.csv'), 'w', newline='') as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(['Chain', 'Residue', 'Resname', 'RMSF CA', 'RMSF All Atoms'])
+        for residue, rmsf_ca, rmsf_all in zip(store.residues, result['residue_rmsf_ca'], result['residue_rmsf_all']):
+            writer.writerow([residue['chain'], int(residue['resnum']), residue['resname'],
+                             f"{rmsf_ca:.3f}", f"{rmsf_all:.3f}"])
+    with open(os.path.join(output_dir, 'loop_spread.csv'), 'w', newline='') as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(['Loop Start', 'Loop End', 'Residues', 'Mean RMSF', 'Max RMSF',
+                         'Mean Pairwise RMSD', 'Max Pairwise RMSD'])
+        for loop in result['loops']:
+            writer.writerow([loop['start'], loop['end'], loop['residues'], f"{loop['mean_rmsf']:.3f}",
+                             f"{loop['max_rmsf']:.3f}", f"{loop['mean_pairwise_rmsd']:.3f}",
+                             f"{loop['max_pairwise_rmsd']:.3f}"])
+    np.save(os.path.join(output_dir, 'pairwise_rmsd.npy'), result['pairwise_rmsd'].astype(np.float32))
+    medoid_model = result['models'][result['medoid']]
+    summary = {
+        'num_models': len(result['models']),
+        'fit_atoms': result['fit_atoms'],
+        'medoid': {'name': medoid_model['Model Name'], 'path': medoid_model['Model Path'],
+                   'ranking_index': result['medoid'], 'mean_rmsd': result['medoid_mean_rmsd']},
+        'loops': result['loops']
+    }
+    with open(os.path.join(output_dir, 'summary.json'), 'w') as f:
+        json.dump(summary, f, indent=2)
+
+def log_results(result: Dict[str, Any]) -> None:
+    medoid_model = result['models'][result['medoid']]
+    logger.info(f"\n{'='*75}")
+    logger.info(f"ANÁLISIS DEL CONJUNTO - {len(result['models'])} modelos ({result['fit_atoms']} CA de ajuste)")
+    logger.info(f"{'='*75}")
+    if result['loops']:
+        logger.info(f"{'Loop':<14} {'Residuos':<10} {'RMSF medio':<12} {'RMSF máx':<12} {'RMSD pares':<12}")
+        logger.info('-' * 75)
+        for loop in result['loops']:
+            logger.info(f"{loop['start']}-{loop['end']:<10} {loop['residues']:<10} {loop['mean_rmsf']:<12.2f} "
+                        f"{loop['max_rmsf']:<12.2f} {loop['mean_pairwise_rmsd']:<12.2f}")
+        logger.info('-' * 75)
+    logger.info(f"Modelo medoide (consenso): {medoid_model['Model Name']} (puesto {result['medoid'] + 1} del ranking, "
+                f"RMSD medio al resto {result['medoid_mean_rmsd']:.2f} Å)",
+                extra={'stage': 'ensemble', 'model': medoid_model['Model Name']})
+
+def run_analysis(models: List[Dict[str, Any]], loop_ranges: List[Tuple[int, int]],
+                 output_dir: str = ENSEMBLE_ANALYSIS_DIR, store_dir: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """
+    Analiza el conjunto de los modelos indicados (dicts con 'name' y 'path', en
+    orden de ranking). Si store_dir (el almacén de BUILD_COORD_STORE) empieza por
+    esos mismos modelos se reutiliza; si no, se construye (o reutiliza) un
+    almacén propio en output_dir/coords.
+    """
+    if len(models) < 2:
+        logger.info("[ENSEMBLE] Se necesitan al menos 2 modelos para el análisis del conjunto.")
+        return None
+    if store_dir and os.path.exists(os.path.join(store_dir, 'index.json')):
+        store = coord_store.open_store(store_dir)
+        if [m['Model Name'] for m in store.models[:len(models)]] == [m['name'] for m in models]:
+            logger.debug(f"[ENSEMBLE] Se reutiliza el almacén de coordenadas {store_dir}", extra={'stage': 'ensemble'})
+            return analyze_and_report(store, loop_ranges, len(models), output_dir)
+    store_dir = coord_store.build_store(models, os.path.join(output_dir, 'coords'))
+    if store_dir is None:
+        return None
+    return analyze_and_report(coord_store.open_store(store_dir), loop_ranges, len(models), output_dir)
+
+def analyze_and_report(store: coord_store.CoordStore, loop_ranges: List[Tuple[int, int]],
+                       num_models: int, output_dir: str = ENSEMBLE_ANALYSIS_DIR) -> Dict[str, Any]:
+    start_time = time.time()
+    result = analyze_store(store, loop_ranges, num_models)
+    write_results(store, result, output_dir)
+    log_results(result)
+    logger.info(f"[ENSEMBLE] Análisis completado en {time.time() - start_time:.1f} s. Resultados en {output_dir}/",
+                extra={'stage': 'ensemble'})
+    return result
+
+# =================================================================
+# LÍNEA DE COMANDOS
+# =================================================================
+
+def read_ranking(ranking_file: str = FINAL_RANKING_FILE, top: int = NUM_BEST_FINAL_MODELS) -> List[Dict[str, Any]]:
+    """Modelos del CSV del ranking final, en orden, con su ruta (sin los rechazados por el filtro geométrico, que no tienen rank)."""
+    with open(ranking_file, 'r', newline='') as csvfile:
+        rows = [row for row in csv.DictReader(csvfile) if row.get('Rank')]
+    models = [{'name': row['Model Name'], 'path': row.get('Model Path') or row['Model Name'],
+               'DOPEHR score': float(row['DOPEHR Score']), 'DOPEHR Z-score': float(row['DOPEHR Z-score'])}
+              for row in rows]
+    return models[:top] if top > 0 else models
+
+def parse_loop_ranges(value: str) -> List[Tuple[int, int]]:
+    """'120-131,200-212' -> [(120, 131), (200, 212)]"""
+    ranges = []
+    for part in value.split(','):
+        part = part.strip()
+        if part:
+            start, _, end = part.partition('-')
+            ranges.append((int(start), int(end or start)))
+    return ranges
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="RMSF, dispersión de loops y medoide de los mejores modelos.")
+    parser.add_argument('--top', type=int, default=NUM_BEST_FINAL_MODELS, help="Modelos a analizar (0 = todos)")
+    parser.add_argument('--ranking', default=FINAL_RANKING_FILE, help="CSV del ranking final")
+    parser.add_argument('--store', help="Almacén de coordenadas ya construido (en orden de ranking) en lugar del CSV")
+    parser.add_argument('--loops', help="Loops a analizar (ej: 120-131,200-212); por defecto los detectados en la ejecución")
+    parser.add_argument('-o', '--output', default=ENSEMBLE_ANALYSIS_DIR)
+    args = parser.parse_args(argv)
+    pipeline_log.setup_logging(log_file=None)
+
+    loop_ranges = parse_loop_ranges(args.loops) if args.loops else \
+        [tuple(r) for r in (stage_cache.last_result('loops') or [])]
+    try:
+        if args.store:
+            analyze_and_report(coord_store.open_store(args.store), loop_ranges, args.top, args.output)
+        elif run_analysis(read_ranking(args.ranking, args.top), loop_ranges, args.output) is None:
+            return 1
+    except OSError as e:
+        print(f"[ERROR] No se pudo leer el ranking o el almacén de coordenadas. Error: {e}")
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
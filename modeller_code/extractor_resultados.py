@@ -1,33 +1,44 @@
 import os
+import sys
 import shutil
+import argparse
+from typing import List, Optional
 
-# Lista de carpetas en el directorio actual
-models_folders = [f for f in os.listdir('.') if os.path.isdir(f)]
+import output_layout
 
-for folder in models_folders:
+RANKING_CSV = 'final_models_ranking.csv'   # El resto de CSV de la carpeta (top en vivo, filtro geométrico, fallos...) no se copian
+
+def process_folder(folder: str) -> int:
+    """Copia los modelos de loops y el ranking final (RANKING_CSV) de una carpeta de ejecución a <carpeta>_processed. Retorna cuántos modelos copió."""
     print(f"Processing folder: {folder}")
 
     models_to_copy = []
-    csv_to_copy = []
 
-    # Buscar modelos y CSV dentro de la carpeta
-    for file in os.listdir(folder):
-        file_path = os.path.join(folder, file)
-        if "LOOP" in file:
-            models_to_copy.append(file_path)
-        elif file.endswith('.csv'):
-            csv_to_copy.append(file_path)
+    # Buscar modelos en el manifiesto de salidas de la carpeta (sin listar los subdirectorios de modelos)
+    manifest = output_layout.read_manifest(folder)
+    if manifest:
+        for record in manifest.values():
+            model_path = os.path.join(folder, record['path'])
+            if "LOOP" in record['name'] and os.path.exists(model_path):
+                models_to_copy.append(model_path)
+
+    # Modelos de ejecuciones con la estructura plana anterior (sin manifiesto)
+    if not manifest:
+        for file in os.listdir(folder):
+            if "LOOP" in file:
+                models_to_copy.append(os.path.join(folder, file))
 
     # Crear carpeta destino
     processed_folder = f"{folder}_processed"
     os.makedirs(processed_folder, exist_ok=True)
 
-    # Copiar CSV (solo si hay uno)
-    if len(csv_to_copy) == 1:
-        shutil.copy(csv_to_copy[0], os.path.join(processed_folder, os.path.basename(csv_to_copy[0])))
-        print(f"Copied CSV file to {processed_folder}")
+    # Copiar el ranking final
+    ranking_path = os.path.join(folder, RANKING_CSV)
+    if os.path.isfile(ranking_path):
+        shutil.copy(ranking_path, os.path.join(processed_folder, RANKING_CSV))
+        print(f"Copied {RANKING_CSV} to {processed_folder}")
     else:
-        print(f"No unique CSV file found in {folder} to copy.")
+        print(f"No {RANKING_CSV} found in {folder} to copy.")
 
     # Copiar modelos
     for model_path in models_to_copy:
@@ -38,4 +49,20 @@ for folder in models_folders:
             shutil.copy(model_path, dest_path)
 
     print(f"Copied {len(models_to_copy)} models to {processed_folder}\n")
+    return len(models_to_copy)
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Copia los modelos de loops y el CSV de cada carpeta de ejecución a <carpeta>_processed.")
+    parser.add_argument('base_dir', nargs='?', default='.', help="Carpeta que contiene las carpetas de ejecución")
+    args = parser.parse_args(argv)
+
+    # Lista de carpetas en el directorio indicado
+    models_folders = [os.path.join(args.base_dir, f) for f in os.listdir(args.base_dir)
+                      if os.path.isdir(os.path.join(args.base_dir, f)) and not f.endswith('_processed')]
+
+    for folder in models_folders:
+        process_folder(os.path.normpath(folder))
+    return 0
 
+if __name__ == '__main__':
+    sys.exit(main())
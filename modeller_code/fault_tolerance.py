@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+# fault_tolerance.py
+
+"""
+Ejecución tolerante a fallos de los pasos de refinamiento en el Job compartido.
+
+Un paso de loop (DynamicLoopRefiner.make() o las ventanas de un loop largo)
+puede fallar, no producir modelos o quedarse colgado, y un worker de Modeller
+puede morir o crecer en memoria sin límite. TaskSupervisor ejecuta cada paso:
+
+- con un límite de tiempo (TASK_TIMEOUT, o TASK_TIMEOUT_FACTOR x la duración
+  esperada según los pasos ya medidos). Al superarlo, un watchdog mata los
+  procesos worker para que el Job deje de esperarlos;
+- con hasta TASK_MAX_RETRIES reintentos, cada uno con una semilla aleatoria nueva;
+- con un Job sano: antes de cada paso, si algún worker murió (hay menos
+  procesos worker que al crear el Job) o supera WORKER_MAX_RSS_MB, y después
+  de un error o un timeout, los workers se reemplazan creando un Job nuevo
+  (worker_pool.create_job) y cerrando el anterior.
+
+Cada fallo se añade a TASK_FAILURE_REPORT (modelo, loop, intento, semilla,
+error y acción tomada).
+
+Los workers son los procesos que arrancó cada PinnedLocalWorker del Job
+(worker_pool registra en worker.pids el líder de su grupo de procesos); su
+estado y memoria se leen de /proc (Linux) y se terminan por grupo. Otros hijos del controller (p. ej. de un ProcessPoolExecutor) y
+los lanzadores srun/ssh de los workers remotos no se tocan: un worker remoto
+muerto lo detecta el propio Job al perder su conexión.
+"""
+
+import os
+import csv
+import time
+import random
+import signal
+import datetime
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+import pipeline_log
+import walltime
+from config import NUM_PROCESSORS, TASK_MAX_RETRIES, TASK_TIMEOUT, TASK_TIMEOUT_FACTOR
+from config import WORKER_MAX_RSS_MB, TASK_FAILURE_REPORT
+
+logger = pipeline_log.get_logger(__name__)
+
+PAGE_SIZE_MB = os.sysconf('SC_PAGE_SIZE') / 1024 ** 2 if hasattr(os, 'sysconf') else 4096 / 1024 ** 2
+MODELLER_SEED_RANGE = (-50000, -2)   # Rango válido de rand_seed en Environ
+MIN_STEP_TIMEOUT = 300.0             # Segundos: el límite adaptativo nunca baja de aquí (pasos cortos con arranque lento)
+FAILURE_FIELDS = ['Time', 'Model', 'Step', 'Attempt', 'Seed', 'Error', 'Action']
+_JOB_SOCKET_ATTRS = ('listensock', '_listensock')   # Socket de escucha del Job de Modeller
+_WORKER_SOCKET_ATTRS = ('_socket',)                  # Conexión de cada worker (Communicator)
+
+# =================================================================
+# PROCESOS WORKER
+# =================================================================
+
+def process_info(pid: int) -> Optional[Dict[str, Any]]:
+    """Estado, proceso padre y memoria residente de un proceso (None si ya no existe)."""
+    try:
+        with open(f'/proc/{pid}/stat', 'r') as f:
+            stat = f.read()
+    except OSError:
+        return None
+    fields = stat[stat.rindex(')') + 2:].split()   # Desde el campo 3 (estado)
+    return {'pid': pid, 'state': fields[0], 'ppid': int(fields[1]), 'rss_mb': int(fields[21]) * PAGE_SIZE_MB}
+
+def worker_processes(job) -> List[Dict[str, Any]]:
+    """Procesos worker que arrancó el Job (worker.pids de sus PinnedLocalWorker) que siguen existiendo."""
+    processes = []
+    for worker in job:
+        for pid in getattr(worker, 'pids', []):
+            info = process_info(pid)
+            if info is not None:
+                processes.append(info)
+    return processes
+
+def kill_workers(job, grace_s: float = 5.0) -> int:
+    """Termina los procesos worker del Job y su grupo (SIGTERM y, si no salen, SIGKILL). Retorna cuántos había."""
+    processes = worker_processes(job)
+    for sig in (signal.SIGTERM, signal.SIGKILL):
+        alive = []
+        for process in processes:
+            try:
+                if os.getpgid(process['pid']) == process['pid']:
+                    os.killpg(process['pid'], sig)
+                else:
+                    os.kill(process['pid'], sig)
+                alive.append(process)
+            except ProcessLookupError:
+                pass
+        if not alive:
+            break
+        deadline = time.time() + grace_s
+        while time.time() < deadline and any(_is_running(p['pid']) for p in alive):
+            time.sleep(0.1)
+        processes = alive
+    for process in processes:
+        try:
+            os.waitpid(process['pid'], os.WNOHANG)   # Recoge los zombis
+        except ChildProcessError:
+            pass
+    return len(processes)
+
+def close_job(job) -> int:
+    """
+    Cierra los sockets de un Job descartado (el de escucha del Job y la conexión
+    de cada worker) y lo vacía, para que no queden abiertos hasta el final de la
+    ejecución. Retorna cuántos sockets cerró.
+    """
+    sockets = [getattr(job, name, None) for name in _JOB_SOCKET_ATTRS]
+    sockets += [getattr(worker, name, None) for worker in job for name in _WORKER_SOCKET_ATTRS]
+    closed = 0
+    for sock in sockets:
+        if sock is None:
+            continue
+        try:
+            sock.close()
+            closed += 1
+        except OSError:
+            pass
+    del job[:]
+    return closed
+
+def _is_running(pid: int) -> bool:
+    try:
+        with open(f'/proc/{pid}/stat', 'r') as f:
+            stat = f.read()
+    except OSError:
+        return False
+    return stat[stat.rindex(')') + 2:].split()[0] != 'Z'
+
+class StepWatchdog:
+    """
+    Límite de tiempo de un paso: si el bloque 'with' no termina en timeout_s
+    segundos, mata los procesos worker para que run_all_tasks/make() retornen
+    con error en lugar de esperar indefinidamente.
+    """
+
+    def __init__(self, timeout_s: float, label: str, job):
+        self.timeout_s = timeout_s
+        self.label = label
+        self.job = job
+        self.timed_out = False
+        self._done = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _watch(self) -> None:
+        if not self._done.wait(self.timeout_s):
+            self.timed_out = True
+            count = kill_workers(self.job)
+            logger.error(f"[TIMEOUT] {self.label} superó {self.timeout_s:.0f} s; se terminaron {count} procesos worker.",
+                         extra={'stage': 'fault_tolerance', 'count': count})
+
+    def __enter__(self) -> 'StepWatchdog':
+        if self.timeout_s and self.timeout_s > 0:
+            self._thread = threading.Thread(target=self._watch, name='step-watchdog', daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._done.set()
+        if self._thread is not None:
+            self._thread.join()
+
+# =================================================================
+# REPORTE DE FALLOS
+# =================================================================
+
+def record_failure(model: str, step: str, attempt: int, seed: Optional[int], error: str, action: str) -> None:
+    """Añade un fallo a TASK_FAILURE_REPORT (se crea con cabecera la primera vez)."""
+    new_file = not os.path.exists(TASK_FAILURE_REPORT)
+    with open(TASK_FAILURE_REPORT, 'a', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=FAILURE_FIELDS)
+        if new_file:
+            writer.writeheader()
+        writer.writerow({'Time': datetime.datetime.now().isoformat(timespec='seconds'), 'Model': model,
+                         'Step': step, 'Attempt': attempt, 'Seed': seed if seed is not None else '',
+                         'Error': error, 'Action': action})
+
+def failure_summary() -> Dict[str, Dict[str, int]]:
+    """Fallos por modelo en TASK_FAILURE_REPORT: {modelo: {acción: número}}."""
+    summary: Dict[str, Dict[str, int]] = {}
+    try:
+        with open(TASK_FAILURE_REPORT, 'r', newline='') as f:
+            for row in csv.DictReader(f):
+                actions = summary.setdefault(row['Model'], {})
+                actions[row['Action']] = actions.get(row['Action'], 0) + 1
+    except OSError:
+        pass
+    return summary
+
+# =================================================================
+# SUPERVISOR DE PASOS
+# =================================================================
+
+def retry_seed(model: str, step: str, attempt: int) -> Optional[int]:
+    """Semilla del intento: None (la de Environ por defecto) en el primero; después, una reproducible por modelo/paso/intento."""
+    if attempt == 0:
+        return None
+    return random.Random(f'{model}:{step}:{attempt}').randint(*MODELLER_SEED_RANGE)
+
+def seeded_environ(env, rand_seed: Optional[int]):
+    """Environ con otra semilla aleatoria y la misma configuración de E/S que env."""
+    if rand_seed is None:
+        return env
+    from modeller import Environ
+    seeded = Environ(rand_seed=rand_seed)
+    seeded.io.hetatm = env.io.hetatm
+    seeded.io.atom_files_directory = env.io.atom_files_directory
+    return seeded
+
+class TaskSupervisor:
+    """
+    Ejecuta pasos de refinamiento sobre un Job con límite de tiempo, reintentos
+    con semillas nuevas y reemplazo de workers. self.job es siempre el Job vigente;
+    los Jobs reemplazados se cierran y el llamador debe retomar self.job al terminar.
+    """
+
+    def __init__(self, job, create_job: Optional[Callable[[], Any]] = None):
+        self.job = job
+        self._create_job = create_job
+        self._rates = walltime.Deadline()   # Solo para medir la duración de los pasos (sin límite)
+        self._expected_workers = self._alive_workers()
+
+    def _alive_workers(self) -> int:
+        return sum(1 for p in worker_processes(self.job) if p['state'] != 'Z')
+
+    def _new_job(self):
+        if self._create_job is not None:
+            return self._create_job()
+        import worker_pool
+        return worker_pool.create_job(NUM_PROCESSORS)
+
+    def replace_workers(self, reason: str) -> Any:
+        """Termina los workers actuales, cierra su Job y crea uno nuevo con la misma configuración. Retorna el Job nuevo."""
+        count = kill_workers(self.job)
+        logger.warning(f"[WORKERS] Reemplazando {count} procesos worker ({reason}).",
+                       extra={'stage': 'fault_tolerance', 'count': count})
+        close_job(self.job)
+        self.job = self._new_job()
+        self._expected_workers = self._alive_workers()
+        return self.job
+
+    def unhealthy_reason(self) -> Optional[str]:
+        """Motivo para reemplazar los workers (muertos o con demasiada memoria), o None si están sanos."""
+        alive = [p for p in worker_processes(self.job) if p['state'] != 'Z']
+        if len(alive) < self._expected_workers:
+            return f"{self._expected_workers - len(alive)} workers muertos"
+        if WORKER_MAX_RSS_MB > 0:
+            oversized = [p for p in alive if p['rss_mb'] > WORKER_MAX_RSS_MB]
+            if oversized:
+                return f"{len(oversized)} workers superan {WORKER_MAX_RSS_MB} MB"
+        return None
+
+    def step_timeout(self, units: float) -> float:
+        """Límite de tiempo de un paso de 'units' residuos (0 = sin límite)."""
+        expected = self._rates.estimate('step', units)
+        if expected and TASK_TIMEOUT_FACTOR > 0:
+            adaptive = max(MIN_STEP_TIMEOUT, TASK_TIMEOUT_FACTOR * expected)
+            return min(adaptive, TASK_TIMEOUT) if TASK_TIMEOUT > 0 else adaptive
+        return TASK_TIMEOUT
+
+    def run(self, model: str, step: str, units: float, step_fn: Callable[[Any, Optional[int]], Any]) -> Any:
+        """
+        Ejecuta step_fn(job, rand_seed) hasta que produzca un resultado no vacío
+        o se agoten los TASK_MAX_RETRIES reintentos. Retorna el resultado, o None
+        si todos los intentos fallaron.
+        """
+        for attempt in range(TASK_MAX_RETRIES + 1):
+            reason = self.unhealthy_reason()
+            if reason:
+                record_failure(model, step, attempt, None, reason, 'workers reemplazados')
+                self.replace_workers(reason)
+
+            seed = retry_seed(model, step, attempt)
+            timeout_s = self.step_timeout(units)
+            start_time = time.time()
+            error = None
+            with StepWatchdog(timeout_s, f"{model} {step}", self.job) as watchdog:
+                try:
+                    result = step_fn(self.job, seed)
+                except Exception as e:
+                    result = None
+                    error = f"{type(e).__name__}: {e}"
+            if watchdog.timed_out:
+                error = f"tiempo límite ({timeout_s:.0f} s) superado" + (f"; {error}" if error else "")
+
+            if result and error is None:
+                self._rates.record('step', time.time() - start_time, units)
+                return result
+
+            error = error or "sin modelos válidos"
+            last_attempt = attempt == TASK_MAX_RETRIES
+            action = 'abandonado' if last_attempt else 'reintento con nueva semilla'
+            record_failure(model, step, attempt, seed, error, action)
+            logger.warning(f"    [RETRY] {step} de {model} falló (intento {attempt + 1}/{TASK_MAX_RETRIES + 1}): {error}. "
+                           f"{action.capitalize()}.", extra={'stage': 'fault_tolerance', 'model': model})
+            if error != "sin modelos válidos":
+                # Un error o un timeout pueden dejar workers colgados o a medio mensaje: se parte de un Job limpio
+                self.replace_workers('fallo del paso')
+        return None
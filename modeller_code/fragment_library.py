@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+# fragment_library.py
+
+"""
+Biblioteca de fragmentos de loop construida a partir de los templates preparados.
+
+Para cada longitud de loop L se guardan todos los segmentos contiguos de L
+residuos (más un residuo de anclaje a cada lado) con su esqueleto N/CA/C/O,
+indexados por la geometría de los anclajes. El formato en disco es una carpeta
+con arrays .npy por longitud (se abren con memory-map, solo se lee la
+longitud consultada) y un index.json con los templates de origen.
+
+Uso:
+    python3 fragment_library.py build 8vx1_DS_renum.pdb templates/*.pdb
+    python3 fragment_library.py query AUTO_1.pdb 120 131
+"""
+
+import os
+import sys
+import json
+import argparse
+from typing import List, Tuple, Dict, Any, Optional
+
+import numpy as np
+
+import config
+import stage_cache
+import pdb_utils
+import pipeline_log
+from config import CHAIN_ID, FRAGMENT_LIBRARY_DIR, FRAGMENT_MAX_LENGTH, FRAGMENT_ANCHOR_TOLERANCE, MIN_LOOP_LENGTH
+
+logger = pipeline_log.get_logger(__name__)
+
+BACKBONE_ATOMS = ('N', 'CA', 'C', 'O')
+MAX_CA_CA_DISTANCE = 4.2   # Å: por encima se considera rotura de cadena
+
+# =================================================================
+# LECTURA DE ESQUELETOS Y DESCRIPTORES DE ANCLAJE
+# =================================================================
+
+def read_backbone(pdb_file: str, chain_id: str = CHAIN_ID) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Lee el esqueleto (N, CA, C, O) de los residuos ATOM completos de una cadena.
+    Retorna (números de residuo (n,), coordenadas (n, 4, 3)).
+    """
+    residues: Dict[int, Dict[str, Tuple[float, float, float]]] = {}
+    order: List[int] = []
+    with open(pdb_file, 'r') as f:
+        for line in f:
+            if not line.startswith('ATOM') or line[21] != chain_id:
+                continue
+            atom_name = line[12:16].strip()
+            if atom_name not in BACKBONE_ATOMS:
+                continue
+            res_num = int(line[22:26])
+            if res_num not in residues:
+                residues[res_num] = {}
+                order.append(res_num)
+            residues[res_num][atom_name] = (float(line[30:38]), float(line[38:46]), float(line[46:54]))
+
+    complete = [r for r in order if len(residues[r]) == len(BACKBONE_ATOMS)]
+    coords = np.array([[residues[r][a] for a in BACKBONE_ATOMS] for r in complete], dtype=np.float32)
+    return np.array(complete, dtype=np.int32), coords.reshape(-1, len(BACKBONE_ATOMS), 3)
+
+def anchor_descriptor(n_anchor: np.ndarray, c_anchor: np.ndarray) -> np.ndarray:
+    """
+    Geometría de los anclajes de un loop a partir del esqueleto del residuo previo
+    (n_anchor) y del posterior (c_anchor): distancias CA-CA, C-N y N-C.
+    """
+    ca_ca = np.linalg.norm(n_anchor[..., 1, :] - c_anchor[..., 1, :], axis=-1)
+    c_n = np.linalg.norm(n_anchor[..., 2, :] - c_anchor[..., 0, :], axis=-1)
+    n_c = np.linalg.norm(n_anchor[..., 0, :] - c_anchor[..., 2, :], axis=-1)
+    return np.stack([ca_ca, c_n, n_c], axis=-1).astype(np.float32)
+
+# =================================================================
+# CONSTRUCCIÓN Y CARGA DE LA BIBLIOTECA
+# =================================================================
+
+def build_library(template_files: List[str], library_dir: str = FRAGMENT_LIBRARY_DIR,
+                  min_length: int = MIN_LOOP_LENGTH, max_length: int = FRAGMENT_MAX_LENGTH) -> str:
+    """
+    Construye la biblioteca de fragmentos a partir de los templates indicados.
+    Se reutiliza si los templates y los parámetros no cambiaron.
+    """
+    key = stage_cache.stage_key('fragment_library', {
+        'templates': [(f, stage_cache.file_digest(f)) for f in template_files],
+        'lengths': [min_length, max_length],
+        'chain_id': CHAIN_ID,
+        'code': stage_cache.code_version(['fragment_library.py'])
+    })
+    index_file = os.path.join(library_dir, 'index.json')
+    if stage_cache.load_stage('fragment_library', key) is not None and os.path.exists(index_file):
+        return library_dir
+
+    logger.info(f"\n[FRAGMENTS] Construyendo biblioteca de fragmentos ({min_length}-{max_length} residuos) desde {len(template_files)} template(s)...")
+    segments = []   # por template: (números, coordenadas) de cada tramo contiguo
+    for template_index, template_file in enumerate(template_files):
+        res_nums, coords = read_backbone(template_file)
+        if len(res_nums) == 0:
+            continue
+        ca_steps = np.linalg.norm(np.diff(coords[:, 1, :], axis=0), axis=-1)
+        breaks = np.where((np.diff(res_nums) != 1) | (ca_steps > MAX_CA_CA_DISTANCE))[0] + 1
+        for part_nums, part_coords in zip(np.split(res_nums, breaks), np.split(coords, breaks)):
+            segments.append((template_index, part_nums, part_coords))
+
+    os.makedirs(library_dir, exist_ok=True)
+    counts = {}
+    for length in range(min_length, max_length + 1):
+        span = length + 2   # loop + un anclaje a cada lado
+        all_coords, all_desc, all_source = [], [], []
+        for template_index, part_nums, part_coords in segments:
+            if len(part_nums) < span:
+                continue
+            # Ventanas deslizantes (n, span, 4, 3) sin copiar hasta el concatenado final
+            windows = np.lib.stride_tricks.sliding_window_view(part_coords, span, axis=0)
+            windows = np.moveaxis(windows, -1, 1)
+            all_coords.append(windows)
+            all_desc.append(anchor_descriptor(windows[:, 0], windows[:, -1]))
+            all_source.append(np.stack([np.full(len(windows), template_index, dtype=np.int32),
+                                        part_nums[1:len(windows) + 1]], axis=1))
+        if not all_coords:
+            continue
+        coords_l = np.concatenate(all_coords).astype(np.float32)
+        desc_l = np.concatenate(all_desc)
+        source_l = np.concatenate(all_source).astype(np.int32)
+        order = np.argsort(desc_l[:, 0], kind='stable')
+        np.save(os.path.join(library_dir, f'L{length:02d}_coords.npy'), coords_l[order])
+        np.save(os.path.join(library_dir, f'L{length:02d}_desc.npy'), desc_l[order])
+        np.save(os.path.join(library_dir, f'L{length:02d}_source.npy'), source_l[order])
+        counts[length] = int(len(order))
+
+    with open(index_file, 'w') as f:
+        json.dump({'templates': template_files, 'counts': counts, 'atoms': list(BACKBONE_ATOMS)}, f, indent=2)
+
+    logger.info(f"[FRAGMENTS] Biblioteca guardada en {library_dir}: {sum(counts.values())} fragmentos en {len(counts)} longitudes.")
+    stage_cache.save_stage('fragment_library', key, counts, outputs=[index_file])
+    return library_dir
+
+def find_fragments(length: int, descriptor: np.ndarray, library_dir: str = FRAGMENT_LIBRARY_DIR,
+                   max_results: int = 50, tolerance: float = FRAGMENT_ANCHOR_TOLERANCE) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Busca fragmentos de una longitud con anclajes compatibles con 'descriptor'.
+    Usa búsqueda binaria sobre la distancia CA-CA (arrays ordenados) y ordena los
+    candidatos por la diferencia RMS del descriptor completo.
+    Retorna (coordenadas (k, L+2, 4, 3), diferencias (k,)).
+    """
+    desc_file = os.path.join(library_dir, f'L{length:02d}_desc.npy')
+    if not os.path.exists(desc_file):
+        return np.empty((0, length + 2, len(BACKBONE_ATOMS), 3), dtype=np.float32), np.empty(0)
+
+    desc = np.load(desc_file, mmap_mode='r')
+    lo = np.searchsorted(desc[:, 0], descriptor[0] - tolerance, side='left')
+    hi = np.searchsorted(desc[:, 0], descriptor[0] + tolerance, side='right')
+    if hi <= lo:
+        return np.empty((0, length + 2, len(BACKBONE_ATOMS), 3), dtype=np.float32), np.empty(0)
+
+    deviation = np.sqrt(np.mean((np.asarray(desc[lo:hi]) - descriptor) ** 2, axis=1))
+    keep = np.argsort(deviation)[:max_results]
+    keep = keep[deviation[keep] <= tolerance]
+    coords = np.load(os.path.join(library_dir, f'L{length:02d}_coords.npy'), mmap_mode='r')
+    return np.asarray(coords[lo + keep]), deviation[keep]
+
+# =================================================================
+# SEMILLAS PARA EL REFINAMIENTO DE LOOPS
+# =================================================================
+
+def _superpose(mobile: np.ndarray, target: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Rotación y traslación (Kabsch) que llevan 'mobile' (n, 3) sobre 'target' (n, 3)."""
+    mobile_center = mobile.mean(axis=0)
+    target_center = target.mean(axis=0)
+    h = (mobile - mobile_center).T @ (target - target_center)
+    u, _, vt = np.linalg.svd(h)
+    d = np.sign(np.linalg.det(vt.T @ u.T))
+    rotation = vt.T @ np.diag([1.0, 1.0, d]) @ u.T
+    translation = target_center - mobile_center @ rotation.T
+    return rotation, translation
+
+def loop_seed_conformations(model_pdb: str, loop_start: int, loop_end: int,
+                            library_dir: str = FRAGMENT_LIBRARY_DIR, max_seeds: int = 20,
+                            tolerance: float = FRAGMENT_ANCHOR_TOLERANCE) -> List[Dict[str, Tuple[float, float, float]]]:
+    """
+    Genera conformaciones semilla del esqueleto de un loop para un modelo: busca
+    fragmentos con anclajes compatibles, los superpone sobre los residuos de
+    anclaje del modelo (N, CA, C) y retorna, por semilla, un diccionario
+    {'<resnum>:<átomo>': (x, y, z)} con los átomos del loop.
+    """
+    length = loop_end - loop_start + 1
+    anchor_keys = [(CHAIN_ID, loop_start - 1), (CHAIN_ID, loop_end + 1)]
+    blocks = pdb_utils.read_residue_blocks(model_pdb, anchor_keys)
+    if len(blocks) != 2:
+        return []
+
+    anchors = []
+    for key in anchor_keys:
+        atoms = {line[12:16].strip(): (float(line[30:38]), float(line[38:46]), float(line[46:54])) for line in blocks[key]}
+        if not all(a in atoms for a in BACKBONE_ATOMS):
+            return []
+        anchors.append([atoms[a] for a in BACKBONE_ATOMS])
+    anchors = np.array(anchors, dtype=np.float32)
+
+    fragments, _ = find_fragments(length, anchor_descriptor(anchors[0], anchors[1]), library_dir,
+                                  max_results=max_seeds, tolerance=tolerance)
+    target_anchor_atoms = anchors[:, :3, :].reshape(-1, 3)
+
+    seeds = []
+    for fragment in fragments:
+        mobile_anchor_atoms = fragment[[0, -1], :3, :].reshape(-1, 3)
+        rotation, translation = _superpose(mobile_anchor_atoms, target_anchor_atoms)
+        loop_coords = fragment[1:-1] @ rotation.T + translation
+        seeds.append({
+            f'{loop_start + i}:{atom}': tuple(float(v) for v in loop_coords[i, a])
+            for i in range(length) for a, atom in enumerate(BACKBONE_ATOMS)
+        })
+    return seeds
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Biblioteca de fragmentos de loop a partir de templates.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    build_parser = sub.add_parser('build', help="Construye la biblioteca")
+    build_parser.add_argument('pdb_files', nargs='*', help="Templates preparados (por defecto PDB_TEMPLATE_FILE)")
+    build_parser.add_argument('-o', '--output', default=FRAGMENT_LIBRARY_DIR)
+    query_parser = sub.add_parser('query', help="Muestra los fragmentos compatibles con un loop de un modelo")
+    query_parser.add_argument('model_pdb')
+    query_parser.add_argument('loop_start', type=int)
+    query_parser.add_argument('loop_end', type=int)
+    query_parser.add_argument('-l', '--library', default=FRAGMENT_LIBRARY_DIR)
+    args = parser.parse_args(argv)
+    pipeline_log.setup_logging(log_file=None)
+
+    if args.command == 'build':
+        build_library(args.pdb_files or [config.PDB_TEMPLATE_FILE], args.output)
+    else:
+        seeds = loop_seed_conformations(args.model_pdb, args.loop_start, args.loop_end, args.library)
+        print(f"{len(seeds)} fragmentos compatibles para el loop {args.loop_start}-{args.loop_end} de {args.model_pdb}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
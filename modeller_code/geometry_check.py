@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+# geometry_check.py
+
+"""
+Filtro geométrico rápido de modelos, sin Modeller (solo NumPy).
+
+Antes de complete_pdb + DOPE-HR, y antes de elegir un modelo como entrada del
+refinamiento de loops, se comprueba:
+
+- Roturas de cadena: distancia CA-CA entre residuos consecutivos de la misma
+  cadena mayor que GEOMETRY_MAX_CA_DISTANCE.
+- Choques: pares de átomos pesados a menos de GEOMETRY_CLASH_DISTANCE que no
+  pertenecen al mismo residuo ni a residuos consecutivos (ni puentes disulfuro),
+  contados con una rejilla de celdas (cell list) en lugar de todos los pares.
+- Átomos pesados que faltan en los residuos estándar.
+
+Los modelos que superan los límites se marcan en GEOMETRY_REPORT_FILE y en la
+columna Geometry del ranking final; con GEOMETRY_REJECT = True (desactivado por
+defecto) además no se puntúan ni se refinan y figuran como rechazados en el CSV.
+
+Uso:
+    python3 geometry_check.py models/auto/00001-01000/*.pdb
+    python3 geometry_check.py --manifest            # todos los modelos de la ejecución
+"""
+
+import os
+import sys
+import csv
+import time
+import argparse
+from typing import List, Tuple, Dict, Any, Optional
+
+import numpy as np
+
+import config
+import pipeline_log
+import output_layout
+from config import GEOMETRY_MAX_CA_DISTANCE, GEOMETRY_CLASH_DISTANCE, GEOMETRY_MAX_CLASHES
+from config import GEOMETRY_MAX_CHAIN_BREAKS, GEOMETRY_MAX_MISSING_ATOMS, GEOMETRY_REPORT_FILE
+
+logger = pipeline_log.get_logger(__name__)
+
+# Átomos pesados de cada residuo estándar (OXT es opcional)
+HEAVY_ATOMS = {
+    'ALA': ('N', 'CA', 'C', 'O', 'CB'),
+    'ARG': ('N', 'CA', 'C', 'O', 'CB', 'CG', 'CD', 'NE', 'CZ', 'NH1', 'NH2'),
+    'ASN': ('N', 'CA', 'C', 'O', 'CB', 'CG', 'OD1', 'ND2'),
+    'ASP': ('N', 'CA', 'C', 'O', 'CB', 'CG', 'OD1', 'OD2'),
+    'CYS': ('N', 'CA', 'C', 'O', 'CB', 'SG'),
+    'GLN': ('N', 'CA', 'C', 'O', 'CB', 'CG', 'CD', 'OE1', 'NE2'),
+    'GLU': ('N', 'CA', 'C', 'O', 'CB', 'CG', 'CD', 'OE1', 'OE2'),
+    'GLY': ('N', 'CA', 'C', 'O'),
+    'HIS': ('N', 'CA', 'C', 'O', 'CB', 'CG', 'ND1', 'CD2', 'CE1', 'NE2'),
+    'ILE': ('N', 'CA', 'C', 'O', 'CB', 'CG1', 'CG2', 'CD1'),
+    'LEU': ('N', 'CA', 'C', 'O', 'CB', 'CG', 'CD1', 'CD2'),
+    'LYS': ('N', 'CA', 'C', 'O', 'CB', 'CG', 'CD', 'CE', 'NZ'),
+    'MET': ('N', 'CA', 'C', 'O', 'CB', 'CG', 'SD', 'CE'),
+    'PHE': ('N', 'CA', 'C', 'O', 'CB', 'CG', 'CD1', 'CD2', 'CE1', 'CE2', 'CZ'),
+    'PRO': ('N', 'CA', 'C', 'O', 'CB', 'CG', 'CD'),
+    'SER': ('N', 'CA', 'C', 'O', 'CB', 'OG'),
+    'THR': ('N', 'CA', 'C', 'O', 'CB', 'OG1', 'CG2'),
+    'TRP': ('N', 'CA', 'C', 'O', 'CB', 'CG', 'CD1', 'CD2', 'NE1', 'CE2', 'CE3', 'CZ2', 'CZ3', 'CH2'),
+    'TYR': ('N', 'CA', 'C', 'O', 'CB', 'CG', 'CD1', 'CD2', 'CE1', 'CE2', 'CZ', 'OH'),
+    'VAL': ('N', 'CA', 'C', 'O', 'CB', 'CG1', 'CG2'),
+}
+
+_STANDARD_RESNAMES = np.array(sorted(HEAVY_ATOMS), dtype='S3')
+_HEAVY_ATOM_COUNTS = {resname.encode(): len(atoms) for resname, atoms in HEAVY_ATOMS.items()}
+_HEAVY_ATOM_NAMES = np.array(sorted({a for atoms in HEAVY_ATOMS.values() for a in atoms}), dtype='S4')
+# _VALID_ATOM[residuo estándar, nombre de átomo]: el átomo pertenece a ese tipo de residuo
+_VALID_ATOM = np.array([[name.decode() in HEAVY_ATOMS[resname.decode()] for name in _HEAVY_ATOM_NAMES]
+                        for resname in _STANDARD_RESNAMES], dtype=bool)
+
+# Celdas vecinas "hacia delante" (13 + la propia): cada par de celdas se visita una sola vez
+_HALF_NEIGHBOURS = [(dx, dy, dz) for dx in (-1, 0, 1) for dy in (-1, 0, 1) for dz in (-1, 0, 1)
+                    if (dx, dy, dz) >= (0, 0, 0)]
+
+REPORT_FIELDS = ['Model Name', 'Model Path', 'CA Breaks', 'Clashes', 'Missing Atoms', 'Rejected', 'Reasons']
+
+# =================================================================
+# COMPROBACIONES
+# =================================================================
+
+def read_atom_table(pdb_file: str) -> Dict[str, np.ndarray]:
+    """
+    Lee los registros ATOM/HETATM (ubicación alternativa ' '/'A') como columnas
+    de NumPy: las líneas se copian a una matriz de bytes de ancho fijo y cada
+    campo se convierte de una vez, sin parsear átomo a átomo.
+    """
+    with open(pdb_file, 'rb') as f:
+        lines = [line.rstrip(b'\r\n').ljust(80)[:80] for line in f
+                 if line.startswith((b'ATOM', b'HETATM')) and line[16:17] in (b' ', b'A')]
+    table = np.frombuffer(b''.join(lines), dtype='S1').reshape(len(lines), 80)
+    field = lambda start, stop: np.ascontiguousarray(table[:, start:stop]).view(f'S{stop - start}').ravel()
+    return {
+        'name': np.char.strip(field(12, 16)),
+        'resname': np.char.strip(field(17, 20)),
+        'chain': field(21, 22),
+        'resnum': field(22, 26).astype(np.int64),
+        'xyz': field(30, 54).reshape(-1, 1).view('S8').astype(np.float64).reshape(-1, 3),
+        'element': np.char.strip(field(76, 78))
+    }
+
+def _hydrogen_mask(atoms: Dict[str, np.ndarray]) -> np.ndarray:
+    """Hidrógenos por la columna de elemento o, si no está, por el nombre del átomo."""
+    first_letter = np.char.lstrip(atoms['name'], b'0123456789').astype('S1')
+    return np.where(atoms['element'] != b'', atoms['element'] == b'H', first_letter == b'H')
+
+def ca_breaks(chains: np.ndarray, ca_xyz: np.ndarray, max_distance: float = GEOMETRY_MAX_CA_DISTANCE) -> np.ndarray:
+    """Índices i de los CA (en orden) tras los que hay una rotura: |CA(i+1) - CA(i)| > max_distance en la misma cadena."""
+    steps = np.linalg.norm(np.diff(ca_xyz, axis=0), axis=1)
+    same_chain = chains[1:] == chains[:-1]
+    return np.flatnonzero(same_chain & (steps > max_distance))
+
+def close_pairs(xyz: np.ndarray, cutoff: float) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Pares (i, j), i != j, de átomos a menos de 'cutoff' Å. Los átomos se
+    reparten en celdas de lado 'cutoff' y solo se comparan con los de su celda y
+    las 13 vecinas "hacia delante", con operaciones vectorizadas.
+    """
+    n = len(xyz)
+    if n < 2:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    cells = np.floor((xyz - xyz.min(axis=0)) / cutoff).astype(np.int64) + 1
+    dims = cells.max(axis=0) + 2   # una celda vacía de margen a cada lado
+    keys = (cells[:, 0] * dims[1] + cells[:, 1]) * dims[2] + cells[:, 2]
+    order = np.argsort(keys, kind='stable')
+    cell_count = np.bincount(keys, minlength=int(np.prod(dims)))
+    cell_start = np.cumsum(cell_count) - cell_count
+
+    pairs_i, pairs_j = [], []
+    for dx, dy, dz in _HALF_NEIGHBOURS:
+        neighbour_keys = keys + (dx * dims[1] + dy) * dims[2] + dz
+        lo = cell_start[neighbour_keys]
+        counts = cell_count[neighbour_keys]
+        total = int(counts.sum())
+        if total == 0:
+            continue
+        i = np.repeat(np.arange(n), counts)
+        offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+        j = order[np.repeat(lo, counts) + offsets]
+        keep = i < j if (dx, dy, dz) == (0, 0, 0) else np.ones(total, dtype=bool)
+        diff = xyz[i[keep]] - xyz[j[keep]]
+        close = np.einsum('ij,ij->i', diff, diff) < cutoff * cutoff
+        pairs_i.append(i[keep][close])
+        pairs_j.append(j[keep][close])
+    if not pairs_i:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    return np.concatenate(pairs_i), np.concatenate(pairs_j)
+
+def check_model(pdb_file: str) -> Dict[str, Any]:
+    """
+    Comprueba la geometría de un PDB. Retorna roturas CA-CA, choques, átomos
+    que faltan y si el modelo supera los límites ('ok') junto con los motivos.
+    """
+    atoms = read_atom_table(pdb_file)
+    chains, res_nums, names, xyz = atoms['chain'], atoms['resnum'], atoms['name'], atoms['xyz']
+    heavy = ~_hydrogen_mask(atoms)
+
+    # Índice ordinal de residuo de cada átomo (cambia con la cadena o el número)
+    residue_change = np.ones(len(names), dtype=bool)
+    residue_change[1:] = (chains[1:] != chains[:-1]) | (res_nums[1:] != res_nums[:-1])
+    residue_index = np.cumsum(residue_change) - 1
+
+    standard = np.isin(atoms['resname'], _STANDARD_RESNAMES)
+    ca = standard & (names == b'CA')
+    breaks = ca_breaks(chains[ca], xyz[ca])
+
+    heavy_xyz = xyz[heavy]
+    i, j = close_pairs(heavy_xyz, GEOMETRY_CLASH_DISTANCE)
+    heavy_residue = residue_index[heavy]
+    heavy_names = names[heavy]
+    non_bonded = np.abs(heavy_residue[i] - heavy_residue[j]) > 1
+    disulfide = (heavy_names[i] == b'SG') & (heavy_names[j] == b'SG')
+    clashes = int(np.count_nonzero(non_bonded & ~disulfide))
+
+    # Átomos esperados de los residuos estándar menos los presentes (cada átomo cuenta una vez)
+    residue_resnames = atoms['resname'][residue_change]
+    expected = sum(_HEAVY_ATOM_COUNTS.get(r, 0) for r in residue_resnames.tolist())
+    known = standard & np.isin(names, _HEAVY_ATOM_NAMES)
+    name_index = np.searchsorted(_HEAVY_ATOM_NAMES, names[known])
+    valid = _VALID_ATOM[np.searchsorted(_STANDARD_RESNAMES, atoms['resname'][known]), name_index]
+    present = len(np.unique(residue_index[known][valid] * len(_HEAVY_ATOM_NAMES) + name_index[valid]))
+    missing = expected - present
+
+    reasons = []
+    if len(breaks) > GEOMETRY_MAX_CHAIN_BREAKS:
+        reasons.append(f"{len(breaks)} roturas CA-CA")
+    if clashes > GEOMETRY_MAX_CLASHES:
+        reasons.append(f"{clashes} choques")
+    if missing > GEOMETRY_MAX_MISSING_ATOMS:
+        reasons.append(f"{missing} átomos ausentes")
+    return {'path': pdb_file, 'ca_breaks': int(len(breaks)), 'clashes': clashes,
+            'missing_atoms': missing, 'ok': not reasons, 'reasons': reasons}
+
+def safe_check(pdb_file: str) -> Dict[str, Any]:
+    """check_model que marca como rechazado un PDB ilegible en lugar de lanzar una excepción."""
+    try:
+        return check_model(pdb_file)
+    except (OSError, ValueError) as e:
+        return {'path': pdb_file, 'ca_breaks': 0, 'clashes': 0, 'missing_atoms': 0,
+                'ok': False, 'reasons': [f"PDB ilegible: {e}"]}
+
+def rejected_by_prefilter(pdb_file: str) -> Optional[Dict[str, Any]]:
+    """Resultado del filtro si el modelo debe descartarse (GEOMETRY_PREFILTER y GEOMETRY_REJECT activos); si no, None."""
+    if not (config.GEOMETRY_PREFILTER and config.GEOMETRY_REJECT):
+        return None
+    result = safe_check(pdb_file)
+    return None if result['ok'] else result
+
+def write_report(results: Dict[str, Dict[str, Any]], rejected: bool, report_file: str = GEOMETRY_REPORT_FILE) -> None:
+    """Guarda los modelos marcados por el filtro ({nombre: resultado de check_model})."""
+    temp_file = report_file + '.tmp'
+    with open(temp_file, 'w', newline='') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=REPORT_FIELDS)
+        writer.writeheader()
+        for name, result in sorted(results.items()):
+            writer.writerow({
+                'Model Name': name,
+                'Model Path': result['path'],
+                'CA Breaks': result['ca_breaks'],
+                'Clashes': result['clashes'],
+                'Missing Atoms': result['missing_atoms'],
+                'Rejected': rejected,
+                'Reasons': '; '.join(result['reasons'])
+            })
+    os.replace(temp_file, report_file)
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Filtro geométrico (roturas CA-CA, choques, átomos ausentes) de modelos PDB.")
+    parser.add_argument('pdb_files', nargs='*', help="PDBs a comprobar")
+    parser.add_argument('--manifest', action='store_true', help="Comprueba todos los modelos del manifiesto de la ejecución")
+    parser.add_argument('-o', '--output', default=GEOMETRY_REPORT_FILE, help="CSV con los modelos marcados")
+    args = parser.parse_args(argv)
+    pipeline_log.setup_logging(log_file=None)
+
+    models = {os.path.basename(f): f for f in args.pdb_files}
+    if args.manifest:
+        models.update({record['name']: record['path'] for record in output_layout.manifest_models()})
+    if not models:
+        parser.error("Indique PDBs o --manifest.")
+
+    start_time = time.time()
+    flagged = {}
+    for name, path in models.items():
+        result = safe_check(path)
+        if not result['ok']:
+            flagged[name] = result
+            print(f"{name:<45} {'; '.join(result['reasons'])}")
+    elapsed = time.time() - start_time
+    write_report(flagged, rejected=config.GEOMETRY_REJECT, report_file=args.output)
+    print(f"{len(models)} modelos comprobados en {elapsed:.1f} s ({len(models) / max(elapsed, 1e-6) * 60:.0f} modelos/min); "
+          f"{len(flagged)} marcados. Detalle en {args.output}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
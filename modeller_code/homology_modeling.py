@@ -2,7 +2,8 @@
 # homology_modeling.py
 
 import os
-from typing import List, Tuple, Dict, Any
+import time
+from typing import List, Tuple, Dict, Any, Optional
 
 from modeller import *
 from modeller.automodel import *
@@ -11,33 +12,108 @@ from modeller.selection import Selection
 from modeller.parallel import Job, LocalWorker
 
 import config
-from config import ALIGN_CODE_TEMPLATE, ALIGN_CODE_SEQUENCE, NUM_MODELS_AUTO, NUM_MODELS_TO_REFINE
+import stage_cache
+from custom_models import BatchAutoModel
+from config import ALIGN_CODE_TEMPLATE, ALIGN_CODE_SEQUENCE, NUM_MODELS_AUTO, NUM_MODELS_TO_REFINE, AUTOMODEL_BATCH_SIZE
+import pipeline_log
+import output_layout
+import geometry_check
+import cost_report
+import leaderboard
 
-def run_automodel(env: Environ, align_file: str, job: Job) -> List[str]:
+logger = pipeline_log.get_logger(__name__)
+
+def run_automodel(env: Environ, align_file: str, job: Job, knowns: Tuple[str, ...] = (ALIGN_CODE_TEMPLATE,),
+                  deadline=None, reserve_s: float = 0.0, progress_key: Optional[str] = None) -> List[Dict[str, Any]]:
     """
-    Ejecuta AutoModel, genera los modelos base, los renombra y retorna
-    los nombres de los Top N modelos seleccionados por DOPEHR.
+    Ejecuta AutoModel, genera los modelos base, los renombra (AUTO_<rank>.pdb)
+    y retorna la lista completa ordenada por DOPEHR con nombre y puntuación.
+    La selección de los Top N se hace aparte (select_models_to_refine), de
+    modo que cambiar NUM_MODELS_TO_REFINE no obliga a repetir AutoModel.
+    knowns: códigos de los templates del alineamiento (varios en modo multi-template).
+
+    Con un deadline (walltime.Deadline) activo los modelos se generan en tandas
+    y no se lanza una tanda si su duración estimada no cabe antes del límite
+    dejando reserve_s segundos (refinamiento de loops) y la reserva de ranking.
+
+    Con progress_key, el avance se guarda tras cada tanda (etapa
+    'automodel_batches' de stage_cache): último modelo generado, salidas de
+    Modeller aún sin renombrar y modelos ya renombrados. Una ejecución cortada
+    (límite de tiempo o fallo) continúa en la tanda siguiente; los modelos
+    nuevos se numeran a continuación de los ya renombrados (AUTO_<n> es el
+    rank dentro de la ejecución que los generó) y la lista retornada es el
+    conjunto completo ordenado por DOPEHR. El modelo inicial y las restricciones
+    se construyen solo en la primera tanda (BatchAutoModel); las siguientes y las
+    reanudaciones leen el .ini y el .rsr ya escritos.
     """
-    initial_models_for_loop_names: List[str] = []
+    ranked_auto_models: List[Dict[str, Any]] = []
+    progress = stage_cache.load_stage('automodel_batches', progress_key) if progress_key else None
+    progress = progress or {'last_model': 0, 'pending': [], 'renamed': []}
+
+    def save_progress(last_model: int) -> None:
+        if progress_key:
+            stage_cache.save_stage('automodel_batches', progress_key, dict(progress, last_model=last_model),
+                                   outputs=[m['name'] for m in progress['pending'] if not m.get('failure')]
+                                           + [m['path'] for m in progress['renamed']])
     
-    print(f"\n[STEP 4.1] Iniciando AutoModel (Relleno de Gaps) con {NUM_MODELS_AUTO} modelos...")
+    logger.info(f"\n[STEP 4.1] Iniciando AutoModel (Relleno de Gaps) con {NUM_MODELS_AUTO} modelos...",
+                extra={'stage': 'automodel', 'count': NUM_MODELS_AUTO})
     
-    a = AutoModel(env, 
-                  alnfile=align_file, 
-                  knowns=ALIGN_CODE_TEMPLATE, 
-                  sequence=ALIGN_CODE_SEQUENCE, 
-                  assess_methods=(assess.DOPEHR, assess.GA341))
+    a = BatchAutoModel(env,
+                       alnfile=align_file,
+                       knowns=knowns,
+                       sequence=ALIGN_CODE_SEQUENCE,
+                       assess_methods=(assess.DOPEHR, assess.GA341))
     
     a.use_parallel_job(job)
-    a.starting_model = 1
-    a.ending_model = NUM_MODELS_AUTO 
     a.library_schedule = autosched.slow
     a.max_var_iterations = 1000
-    a.make()
-    
-    results_auto = a.outputs
-    if not results_auto: 
-        print("[ERROR] AutoModel falló.")
+
+    if deadline is None or not deadline.active:
+        batch_size = NUM_MODELS_AUTO
+    else:
+        batch_size = AUTOMODEL_BATCH_SIZE or 4 * max(1, len(job))
+
+    results_auto: List[Dict[str, Any]] = list(progress['pending'])
+    if progress['last_model']:
+        logger.info(f"[RESUME] AutoModel continúa en el modelo {progress['last_model'] + 1}/{NUM_MODELS_AUTO} "
+                    f"({len(progress['renamed'])} modelos ya renombrados, {len(results_auto)} pendientes).",
+                    extra={'stage': 'automodel', 'count': progress['last_model']})
+        leaderboard.record(progress['renamed'] + results_auto, 'automodel', force=True)
+    last_done = progress['last_model']
+    # El modelo inicial y las restricciones se construyen una vez; al reanudar se usan los de la ejecución anterior
+    a.reuse_restraints = last_done > 0
+    for first_model in range(last_done + 1, NUM_MODELS_AUTO + 1, batch_size):
+        last_model = min(first_model + batch_size - 1, NUM_MODELS_AUTO)
+        batch_models = last_model - first_model + 1
+        if deadline is not None and not deadline.allows(deadline.estimate('automodel_batch', batch_models),
+                                                        len(results_auto) + len(progress['renamed']) + batch_models, reserve_s):
+            logger.warning(f"[WALLTIME] AutoModel se detiene en {last_done}/{NUM_MODELS_AUTO} modelos "
+                           f"para respetar el límite de tiempo; la próxima ejecución continúa en el modelo {last_done + 1}.",
+                           extra={'stage': 'automodel', 'count': last_done})
+            deadline.truncated.add('automodel')
+            break
+
+        batch_start = time.time()
+        a.starting_model = first_model
+        a.ending_model = last_model
+        a.make()
+        a.reuse_restraints = True
+        results_auto.extend(a.outputs)   # make() reinicia a.outputs en cada tanda
+        last_done = last_model
+        # Solo lo necesario para renombrar (a.outputs incluye objetos de Modeller no serializables)
+        progress['pending'] = [{'name': o['name'], 'DOPE-HR score': o.get('DOPE-HR score', 9999999.0),
+                                'failure': str(o['failure']) if o.get('failure') else None} for o in results_auto]
+        save_progress(last_done)
+        leaderboard.record(a.outputs, 'automodel', force=True)
+        cost_report.record_timing('automodel', time.time() - batch_start, len(job),
+                                  first_model=first_model, last_model=last_model)
+        pipeline_log.rotate_large_worker_logs('automodel')
+        if deadline is not None:
+            deadline.record('automodel_batch', time.time() - batch_start, batch_models)
+
+    if not results_auto and not progress['renamed']:
+        logger.error("AutoModel falló.")
         return []
     
     # MODIFICACIÓN CRÍTICA: Usar .get() con un valor muy alto (9999999.0) como default
@@ -45,17 +121,47 @@ def run_automodel(env: Environ, align_file: str, job: Job) -> List[str]:
     # ordenen al final (ya que un DOPE-HR score más bajo es mejor).
     sorted_auto_models = sorted(results_auto, key=lambda x: x.get('DOPE-HR score', 9999999.0))
     
-    print(f"\n[STEP 4.1.1] Renombrando los {len(sorted_auto_models)} modelos de AutoModel.")
+    logger.info(f"\n[STEP 4.1.1] Renombrando los {len(sorted_auto_models)} modelos de AutoModel.",
+                extra={'stage': 'automodel', 'count': len(sorted_auto_models)})
     
-    for model_rank, model_info in enumerate(sorted_auto_models):
+    first_rank = len(progress['renamed']) + 1
+    for model_rank, model_info in enumerate(sorted_auto_models, start=first_rank - 1):
         old_name = model_info['name']
         new_name = f'AUTO_{model_rank+1}.pdb'
         
         try:
-            os.rename(old_name, new_name)
-            if (model_rank + 1) <= NUM_MODELS_TO_REFINE:
-                initial_models_for_loop_names.append(new_name)
+            new_path = output_layout.store_model(old_name, new_name, 'auto', rank=model_rank + 1)
+            leaderboard.rename(old_name, new_name, new_path)
+            ranked_auto_models.append({
+                'name': new_name,
+                'path': new_path,
+                'DOPE-HR score': model_info.get('DOPE-HR score', 9999999.0)
+            })
         except Exception as e:
-            print(f"    [ERROR] No se pudo renombrar {old_name} a {new_name}. Error: {e}")
-            
-    return initial_models_for_loop_names
+            logger.error(f"    No se pudo renombrar {old_name} a {new_name}. Error: {e}")
+
+    output_layout.collect_intermediates('automodel')
+    ranked_auto_models = sorted(progress['renamed'] + ranked_auto_models,
+                                key=lambda x: x.get('DOPE-HR score', 9999999.0))
+    progress.update(pending=[], renamed=ranked_auto_models)
+    save_progress(last_done)
+    leaderboard.flush()
+    return ranked_auto_models
+
+def select_models_to_refine(ranked_auto_models: List[Dict[str, Any]], num_models: int = NUM_MODELS_TO_REFINE) -> List[str]:
+    """
+    Retorna los nombres de los Top N modelos de AutoModel que entran al refinamiento de loops.
+    Los rechazados por el filtro geométrico se saltan y su lugar lo ocupa el siguiente del ranking.
+    """
+    selected = []
+    for m in ranked_auto_models:
+        if len(selected) == num_models:
+            break
+        rejected = geometry_check.rejected_by_prefilter(m.get('path', m['name']))
+        if rejected:
+            logger.warning(f"[GEOMETRY] {m['name']} no entra al refinamiento: {'; '.join(rejected['reasons'])}",
+                           extra={'stage': 'automodel', 'model': m['name']})
+            continue
+        selected.append(m['name'])
+    logger.info(f"\n[STEP 4.1.2] Seleccionados {len(selected)} modelos de AutoModel para el refinamiento de loops.")
+    return selected
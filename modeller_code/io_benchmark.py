@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+# io_benchmark.py
+
+"""
+Banco de pruebas de E/S a gran escala (sin Modeller).
+
+Genera ejecuciones sintéticas de 10k-200k modelos derivados de PDB_TEMPLATE_FILE
+con coordenadas perturbadas y mide, para cada tamaño, las rutas del pipeline que
+dependen del sistema de archivos:
+
+- store_auto:       renombrado de los modelos de AutoModel (output_layout.store_model, como run_automodel)
+- store_loop:       renombrado de los modelos de loops (como run_loop_refinement)
+- intermediates:    output_layout.collect_intermediates con los .D/.V de Modeller en la carpeta de trabajo
+- ranking_scan:     descubrimiento de modelos de la evaluación final (utils.ranking_candidates)
+- ranking_stat:     clave de caché (stage_cache.file_stat_key) de cada modelo a rankear
+- extractor:        extractor_resultados.process_folder sobre la ejecución
+- this_speaker:     un conteo de this-speaker.sh (--once)
+
+El informe (IO_BENCHMARK_REPORT) guarda segundos y microsegundos por modelo de
+cada ruta y tamaño, y el exponente de escalado (pendiente log-log: 1 = lineal).
+Con --baseline se compara con un informe anterior y se marcan las rutas cuyo
+coste por modelo creció más de IO_BENCHMARK_TOLERANCE veces.
+
+Para que la generación no domine el tiempo, los modelos se toman de
+IO_BENCHMARK_VARIANTS versiones perturbadas del template (cada archivo lleva su
+propio nombre en un REMARK). Ejemplo:
+
+    python3 io_benchmark.py --sizes 10000,50000 --baseline io_benchmark_prev.json
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import random
+import shutil
+import argparse
+import contextlib
+import subprocess
+from typing import Any, Callable, Dict, List, Optional
+
+import config
+import pipeline_log
+from config import PDB_TEMPLATE_FILE, ALIGN_CODE_SEQUENCE, IO_BENCHMARK_DIR, IO_BENCHMARK_SIZES
+from config import IO_BENCHMARK_LOOP_FRACTION, IO_BENCHMARK_VARIANTS, IO_BENCHMARK_REPORT, IO_BENCHMARK_TOLERANCE
+
+logger = pipeline_log.get_logger(__name__)
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+LOOPS_PER_MODEL = 4           # Pasos de loop por modelo base en la ejecución sintética
+COORDINATE_NOISE = 0.5        # Desviación (Å) de la perturbación de coordenadas
+PATHS = ['store_auto', 'store_loop', 'intermediates', 'ranking_scan', 'ranking_stat', 'extractor', 'this_speaker']
+
+# =================================================================
+# EJECUCIÓN SINTÉTICA
+# =================================================================
+
+def perturbed_variants(template_file: str, count: int, seed: int = 0, max_atoms: int = 0) -> List[str]:
+    """Versiones del template con cada coordenada desplazada por ruido gaussiano (max_atoms > 0 recorta el modelo)."""
+    rng = random.Random(seed)
+    with open(template_file, 'r') as f:
+        lines = [line for line in f if line.startswith(('ATOM', 'HETATM'))]
+    if max_atoms > 0:
+        lines = lines[:max_atoms]
+    variants = []
+    for _ in range(count):
+        out = []
+        for line in lines:
+            x, y, z = (float(line[c:c + 8]) + rng.gauss(0.0, COORDINATE_NOISE) for c in (30, 38, 46))
+            out.append(f"{line[:30]}{x:8.3f}{y:8.3f}{z:8.3f}{line[54:]}")
+        variants.append(''.join(out) + 'END\n')
+    return variants
+
+def _write_model(path: str, name: str, variants: List[str], index: int) -> None:
+    with open(path, 'w') as f:
+        f.write(f"REMARK   6 SYNTHETIC MODEL {name}\n")
+        f.write(variants[index % len(variants)])
+
+def loop_model_names(base_count: int, per_step: int, loops: int = LOOPS_PER_MODEL) -> List[str]:
+    """Nombres de los modelos de loops de una ejecución: cadena LOOP1_R1 -> LOOP2_R1 ... por modelo base."""
+    names = []
+    for base in range(1, base_count + 1):
+        prefix = f'AUTO_{base}'
+        for loop in range(1, loops + 1):
+            names.extend(f'{prefix}_LOOP{loop}_R{rank}.pdb' for rank in range(1, per_step + 1))
+            prefix = f'{prefix}_LOOP{loop}_R1'
+    return names
+
+def _raw_name(index: int) -> str:
+    """Nombre de salida de Modeller (<código>.B9999NNNN.pdb) antes del renombrado."""
+    return f'{ALIGN_CODE_SEQUENCE}.B{99990000 + index}.pdb'
+
+def _timed(timings: Dict[str, float], path: str, fn: Callable[[], Any]) -> Any:
+    start = time.perf_counter()
+    result = fn()
+    timings[path] = time.perf_counter() - start
+    return result
+
+def run_size(run_dir: str, n_models: int, variants: List[str], loop_fraction: float) -> Dict[str, float]:
+    """
+    Crea una ejecución sintética de n_models modelos en run_dir y mide cada ruta.
+    La generación de los PDB en bruto no se mide; el renombrado sí.
+    """
+    import output_layout
+    import stage_cache
+    import utils
+    import extractor_resultados
+
+    per_step = max(1, config.NUM_MODELS_LOOP)
+    loop_target = int(n_models * loop_fraction)
+    base_count = max(1, math.ceil(loop_target / (per_step * LOOPS_PER_MODEL))) if loop_target else 0
+    loop_names = loop_model_names(base_count, per_step)[:loop_target]
+    auto_count = n_models - len(loop_names)
+
+    os.makedirs(run_dir, exist_ok=True)
+    previous_dir = os.getcwd()
+    os.chdir(run_dir)
+    timings: Dict[str, float] = {}
+    try:
+        # AutoModel: salidas en bruto e intermedios en la carpeta de trabajo, luego renombrado
+        for i in range(1, auto_count + 1):
+            _write_model(_raw_name(i), f'AUTO_{i}', variants, i)
+            for suffix in (f'D{i:08d}', f'V{99990000 + i}'):
+                open(f'{ALIGN_CODE_SEQUENCE}.{suffix}', 'w').close()
+        _timed(timings, 'store_auto', lambda: [output_layout.store_model(_raw_name(i), f'AUTO_{i}.pdb', 'auto', rank=i)
+                                               for i in range(1, auto_count + 1)])
+        _timed(timings, 'intermediates', lambda: output_layout.collect_intermediates('automodel'))
+
+        # Loops
+        for i, name in enumerate(loop_names, start=1):
+            _write_model(_raw_name(i), name[:-4], variants, auto_count + i)
+        _timed(timings, 'store_loop', lambda: [output_layout.store_model(_raw_name(i), name, 'loop')
+                                               for i, name in enumerate(loop_names, start=1)])
+
+        # Evaluación final (sin puntuar) y cosecha de resultados
+        model_paths = _timed(timings, 'ranking_scan', utils.ranking_candidates)
+        _timed(timings, 'ranking_stat', lambda: [stage_cache.file_stat_key(path) for path in model_paths.values()])
+        with open('final_ranking.csv', 'w') as f:
+            f.write('Rank,Model Name,DOPEHR Score,DOPEHR Z-score\n')
+
+        os.chdir(previous_dir)
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            _timed(timings, 'extractor', lambda: extractor_resultados.process_folder(run_dir))
+
+        speaker = os.path.join(SCRIPT_DIR, 'this-speaker.sh')
+        _timed(timings, 'this_speaker', lambda: subprocess.run(['bash', speaker, '--once'], cwd=run_dir,
+                                                               stdout=subprocess.DEVNULL, check=True))
+    finally:
+        os.chdir(previous_dir)
+    return timings
+
+# =================================================================
+# INFORME
+# =================================================================
+
+def scaling_exponent(sizes: List[int], seconds: List[float]) -> Optional[float]:
+    """Pendiente de log(segundos) frente a log(modelos): 1 = lineal, > 1 = superlineal."""
+    points = [(math.log(n), math.log(s)) for n, s in zip(sizes, seconds) if n > 0 and s > 0]
+    if len(points) < 2:
+        return None
+    mean_x = sum(x for x, _ in points) / len(points)
+    mean_y = sum(y for _, y in points) / len(points)
+    var_x = sum((x - mean_x) ** 2 for x, _ in points)
+    if var_x == 0:
+        return None
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / var_x
+
+def build_report(results: Dict[int, Dict[str, float]]) -> Dict[str, Any]:
+    sizes = sorted(results)
+    paths = {}
+    for path in PATHS:
+        seconds = [results[n][path] for n in sizes if path in results[n]]
+        measured = [n for n in sizes if path in results[n]]
+        paths[path] = {
+            'seconds': {str(n): results[n][path] for n in measured},
+            'us_per_model': {str(n): 1e6 * results[n][path] / n for n in measured},
+            'scaling_exponent': scaling_exponent(measured, seconds)
+        }
+    return {'sizes': sizes, 'filesystem': os.path.abspath(IO_BENCHMARK_DIR), 'paths': paths}
+
+def compare_with_baseline(report: Dict[str, Any], baseline: Dict[str, Any],
+                          tolerance: float = IO_BENCHMARK_TOLERANCE) -> List[str]:
+    """Rutas y tamaños cuyo coste por modelo supera tolerance veces el del informe base."""
+    regressions = []
+    for path, data in report['paths'].items():
+        previous = baseline.get('paths', {}).get(path, {}).get('us_per_model', {})
+        for size, us in data['us_per_model'].items():
+            if size in previous and previous[size] > 0 and us > tolerance * previous[size]:
+                regressions.append(f"{path} con {size} modelos: {us:.1f} µs/modelo (antes {previous[size]:.1f})")
+    return regressions
+
+def format_table(report: Dict[str, Any]) -> str:
+    sizes = [str(n) for n in report['sizes']]
+    lines = [f"{'Ruta':<15} " + ' '.join(f"{n + ' (µs/m)':>16}" for n in sizes) + f" {'Escalado':>9}", '-' * (26 + 17 * len(sizes))]
+    for path, data in report['paths'].items():
+        exponent = data['scaling_exponent']
+        lines.append(f"{path:<15} " + ' '.join(f"{data['us_per_model'].get(n, float('nan')):>16.1f}" for n in sizes)
+                     + f" {exponent if exponent is not None else float('nan'):>9.2f}")
+    return '\n'.join(lines)
+
+# =================================================================
+# CLI
+# =================================================================
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Mide las rutas de E/S del pipeline sobre ejecuciones sintéticas grandes (sin Modeller).")
+    parser.add_argument('--sizes', default=','.join(str(n) for n in IO_BENCHMARK_SIZES),
+                        help="Número de modelos de cada ejecución sintética (ej. 10000,50000)")
+    parser.add_argument('--loop-fraction', type=float, default=IO_BENCHMARK_LOOP_FRACTION,
+                        help="Fracción de los modelos que son de loops")
+    parser.add_argument('--max-atoms', type=int, default=0, help="Recorta los modelos a este número de átomos (0 = completos)")
+    parser.add_argument('--baseline', help="Informe anterior con el que comparar")
+    parser.add_argument('--keep', action='store_true', help="No borrar las ejecuciones sintéticas")
+    args = parser.parse_args(argv)
+
+    pipeline_log.setup_logging(log_file=None)
+    sizes = [int(n) for n in args.sizes.split(',') if n]
+    variants = perturbed_variants(PDB_TEMPLATE_FILE, IO_BENCHMARK_VARIANTS, max_atoms=args.max_atoms)
+
+    # Modelos más las copias de extractor; sin --keep cada ejecución se borra antes de la siguiente
+    run_bytes = [n * len(variants[0]) * (1 + args.loop_fraction) for n in sizes]
+    needed = sum(run_bytes) if args.keep else max(run_bytes)
+    os.makedirs(IO_BENCHMARK_DIR, exist_ok=True)
+    free = shutil.disk_usage(IO_BENCHMARK_DIR).free
+    if needed > free:
+        logger.error(f"Se necesitan ~{needed / 1024 ** 3:.1f} GB en {IO_BENCHMARK_DIR} y hay {free / 1024 ** 3:.1f} GB libres; "
+                     f"reduzca --sizes o use --max-atoms.")
+        return 1
+
+    results: Dict[int, Dict[str, float]] = {}
+    for n_models in sizes:
+        run_dir = os.path.abspath(os.path.join(IO_BENCHMARK_DIR, f'run_{n_models}'))
+        shutil.rmtree(run_dir, ignore_errors=True)
+        shutil.rmtree(f'{run_dir}_processed', ignore_errors=True)
+        logger.info(f"[IO] Ejecución sintética de {n_models} modelos en {run_dir}", extra={'stage': 'io_benchmark', 'count': n_models})
+        results[n_models] = run_size(run_dir, n_models, variants, args.loop_fraction)
+        if not args.keep:
+            shutil.rmtree(run_dir, ignore_errors=True)
+            shutil.rmtree(f'{run_dir}_processed', ignore_errors=True)
+
+    report = build_report(results)
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            regressions = compare_with_baseline(report, json.load(f))
+        report['regressions'] = regressions
+
+    temp_file = IO_BENCHMARK_REPORT + '.tmp'
+    with open(temp_file, 'w') as f:
+        json.dump(report, f, indent=2)
+    os.replace(temp_file, IO_BENCHMARK_REPORT)
+
+    logger.info('\n' + format_table(report))
+    for regression in regressions:
+        logger.warning(f"[IO] Regresión: {regression}", extra={'stage': 'io_benchmark'})
+    logger.info(f"[IO] Informe guardado en {IO_BENCHMARK_REPORT}")
+    return 1 if regressions else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# leaderboard.py
+
+"""
+Top-N de modelos actualizado durante la ejecución (LEADERBOARD_FILE).
+
+AutoModel (por tanda), cada paso de loop y la evaluación final añaden sus
+modelos puntuados; la tabla se reescribe de forma atómica, como mucho cada
+LEADERBOARD_MIN_INTERVAL segundos, para seguir los mejores modelos sin esperar
+al ranking final. Solo se guardan los LEADERBOARD_SIZE mejores en un montículo
+acotado (O(log N) por modelo, sin ordenar todos los modelos).
+
+El DOPE-HR de AutoModel y de los loops es el que calcula Modeller al generar el
+modelo; la evaluación final lo sustituye por el suyo y añade el Z-score, por lo
+que la columna Stage indica de dónde viene cada puntuación. Los modelos de
+AutoModel entran con el nombre de salida de Modeller y pasan a AUTO_<rank> al
+renombrarse. Para seguirlo: watch -n 10 cat live_leaderboard.csv
+"""
+
+import os
+import csv
+import time
+import heapq
+import itertools
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import pipeline_log
+from config import LIVE_LEADERBOARD, LEADERBOARD_FILE, LEADERBOARD_SIZE, LEADERBOARD_MIN_INTERVAL
+
+logger = pipeline_log.get_logger(__name__)
+
+FIELDS = ['Rank', 'Model Name', 'DOPEHR Score', 'DOPEHR Z-score', 'Stage', 'Model Path']
+
+class Leaderboard:
+    """
+    Los 'size' modelos con menor DOPE-HR. El montículo guarda (-puntuación, orden, nombre),
+    de modo que su raíz es el peor modelo del top y se sustituye en O(log N).
+    """
+
+    def __init__(self, size: int = LEADERBOARD_SIZE, path: str = LEADERBOARD_FILE,
+                 min_interval: float = LEADERBOARD_MIN_INTERVAL):
+        self.size = size
+        self.path = path
+        self.min_interval = min_interval
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self._heap: List[Tuple[float, int, str]] = []
+        self._counter = itertools.count()
+        self._dirty = False
+        self._last_write = 0.0
+        self.scored = 0
+
+    def add(self, name: str, score: Optional[float], zscore: Optional[float] = None,
+            stage: str = '', path: str = '') -> None:
+        """Añade o actualiza la puntuación de un modelo."""
+        if score is None or score != score or score in (float('inf'), 9999999.0):
+            return
+        self.scored += 1
+        entry = {'name': name, 'score': score, 'zscore': zscore, 'stage': stage, 'path': path}
+        if name in self.entries:
+            # Nueva puntuación de un modelo del top (p. ej. la evaluación final): se rehace el montículo (N pequeño)
+            self.entries[name] = entry
+            self._heap = [(-e['score'], next(self._counter), n) for n, e in self.entries.items()]
+            heapq.heapify(self._heap)
+        elif len(self._heap) < self.size:
+            self.entries[name] = entry
+            heapq.heappush(self._heap, (-score, next(self._counter), name))
+        elif score < -self._heap[0][0]:
+            _, _, dropped = heapq.heapreplace(self._heap, (-score, next(self._counter), name))
+            del self.entries[dropped]
+            self.entries[name] = entry
+        else:
+            return
+        self._dirty = True
+
+    def rename(self, old_name: str, new_name: str, path: str = '') -> None:
+        """Sigue a un modelo del top cuando se renombra (salida de Modeller -> AUTO_<rank>)."""
+        entry = self.entries.pop(old_name, None)
+        if entry is None:
+            return
+        entry.update(name=new_name, path=path or entry['path'])
+        self.entries[new_name] = entry
+        self._heap = [(s, c, new_name if n == old_name else n) for s, c, n in self._heap]
+        self._dirty = True
+
+    def ranking(self) -> List[Dict[str, Any]]:
+        return sorted(self.entries.values(), key=lambda e: e['score'])
+
+    def flush(self, force: bool = False) -> None:
+        """Reescribe el archivo (escritura atómica) si hubo cambios y pasó el intervalo mínimo."""
+        if not self._dirty or (not force and time.time() - self._last_write < self.min_interval):
+            return
+        temp_file = self.path + '.tmp'
+        try:
+            with open(temp_file, 'w', newline='') as f:
+                writer = csv.DictWriter(f, fieldnames=FIELDS)
+                writer.writeheader()
+                for rank, entry in enumerate(self.ranking(), start=1):
+                    writer.writerow({
+                        'Rank': rank,
+                        'Model Name': entry['name'],
+                        'DOPEHR Score': f"{entry['score']:.3f}",
+                        'DOPEHR Z-score': f"{entry['zscore']:.3f}" if entry['zscore'] is not None else '',
+                        'Stage': entry['stage'],
+                        'Model Path': entry['path']
+                    })
+            os.replace(temp_file, self.path)
+        except OSError as e:
+            logger.warning(f"No se pudo actualizar {self.path}. Error: {e}")
+            return
+        self._dirty = False
+        self._last_write = time.time()
+
+# =================================================================
+# TOP DE LA EJECUCIÓN
+# =================================================================
+
+_board: Optional[Leaderboard] = None
+
+def board() -> Optional[Leaderboard]:
+    """Top de la ejecución (None con LIVE_LEADERBOARD desactivado)."""
+    global _board
+    if _board is None and LIVE_LEADERBOARD:
+        _board = Leaderboard()
+    return _board
+
+def record(models: Iterable[Dict[str, Any]], stage: str, force: bool = False) -> None:
+    """
+    Añade modelos puntuados ({'name', 'DOPE-HR score'} de Modeller o
+    {'name', 'DOPEHR score', 'DOPEHR Z-score', 'path'} de la evaluación final)
+    y reescribe el top si toca.
+    """
+    top = board()
+    if top is None:
+        return
+    for model in models:
+        score = model.get('DOPEHR score', model.get('DOPE-HR score'))
+        top.add(os.path.basename(model['name']), score, model.get('DOPEHR Z-score'), stage, model.get('path', ''))
+    top.flush(force)
+
+def rename(old_name: str, new_name: str, path: str = '') -> None:
+    top = board()
+    if top is not None:
+        top.rename(os.path.basename(old_name), new_name, path)
+
+def flush() -> None:
+    """Fuerza la escritura del top (final de una etapa)."""
+    top = board()
+    if top is not None:
+        top.flush(force=True)
@@ -2,7 +2,10 @@
 # loop_refinement.py
 
 import os
-from typing import List, Tuple
+import json
+import math
+import time
+from typing import List, Tuple, Dict, Any, Optional
 
 from modeller import *
 from modeller.automodel import *
@@ -11,81 +14,539 @@ from modeller.selection import Selection
 from modeller.parallel import Job, LocalWorker
 
 import config
-from config import ALIGN_CODE_SEQUENCE, CHAIN_ID, NUM_MODELS_LOOP
+from config import ALIGN_CODE_SEQUENCE, CHAIN_ID, NUM_MODELS_LOOP, LOOP_CHECKPOINT_DIR
+from config import MIN_LOOP_LENGTH, MAX_LOOP_LENGTH, LONG_LOOP_WINDOW, LONG_LOOP_OVERLAP, LONG_LOOP_FINAL_PASS
+from config import LOOP_CROP_ENABLED, LOOP_CROP_RADIUS, LOOP_CROP_ANCHOR_RESIDUES, LOOP_CROP_DIR
+from config import FRAGMENT_SEEDING, FRAGMENT_LIBRARY_DIR, FRAGMENT_SEEDED_MD_LEVEL, LOOP_SELECTION
 from custom_models import *
+import stage_cache
+import pdb_utils
+import pipeline_log
+import output_layout
+import geometry_check
+import worker_pool
+import region_selection
+import fault_tolerance
+import cost_report
+import leaderboard
 
+logger = pipeline_log.get_logger(__name__)
 
-def run_loop_refinement(env: Environ, job: Job, initial_models_names: List[str], loop_ranges: List[Tuple[int, int]]):
+# =================================================================
+# ESTADO REANUDABLE DEL REFINAMIENTO (CHECKPOINTS)
+# =================================================================
+
+def _checkpoint_path(base_name: str) -> str:
+    """Ruta del archivo de estado asociado a un modelo base."""
+    return os.path.join(LOOP_CHECKPOINT_DIR, f'{base_name}_loop_state.json')
+
+def _file_mtime(path: str) -> Optional[float]:
+    """Fecha de modificación de un archivo, o None si no existe."""
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+def save_chain_state(base_name: str, state: Dict[str, Any]) -> None:
     """
-    Ejecuta el refinamiento secuencial de loops con DOPEHR para los modelos base.
+    Escribe el estado de la cadena de refinamiento de un modelo base.
+    La escritura es atómica (archivo temporal + os.replace) para que un corte
+    a mitad de escritura nunca deje un estado corrupto.
     """
-    
-    if not loop_ranges:
-        print("\n[STEP 5.1] Saltando refinamiento de loops: No hay loops flexibles definidos.")
+    os.makedirs(LOOP_CHECKPOINT_DIR, exist_ok=True)
+    state_file = _checkpoint_path(base_name)
+    temp_file = state_file + '.tmp'
+    with open(temp_file, 'w') as f:
+        json.dump(state, f, indent=2)
+    os.replace(temp_file, state_file)
+
+def chain_settings_key() -> str:
+    """
+    Clave de caché de los parámetros que determinan el resultado de una cadena
+    de refinamiento (número de modelos por loop y versión del código).
+    """
+    return stage_cache.stage_key('loop_chain', {
+        'NUM_MODELS_LOOP': NUM_MODELS_LOOP,
+        'CHAIN_ID': CHAIN_ID,
+        'long_loops': [MAX_LOOP_LENGTH, LONG_LOOP_WINDOW, LONG_LOOP_OVERLAP, LONG_LOOP_FINAL_PASS],
+        'crop': [LOOP_CROP_ENABLED, LOOP_CROP_RADIUS, LOOP_CROP_ANCHOR_RESIDUES],
+        'fragments': [FRAGMENT_SEEDING, FRAGMENT_SEEDED_MD_LEVEL, config.FRAGMENT_ANCHOR_TOLERANCE,
+                      stage_cache.file_digest(os.path.join(FRAGMENT_LIBRARY_DIR, 'index.json')) if FRAGMENT_SEEDING else ''],
+        'selection': [LOOP_SELECTION, config.PROFILE_SMOOTHING_WINDOW, config.PROFILE_THRESHOLD,
+                      config.PROFILE_THRESHOLD_SIGMA, config.PROFILE_MERGE_GAP, config.REFINE_MAX_SEGMENTS,
+                      config.REFINE_MAX_RESIDUES] if LOOP_SELECTION == 'profile' else [LOOP_SELECTION],
+        'code': stage_cache.code_version(['loop_refinement.py', 'custom_models.py', 'region_selection.py'])
+    })
+
+def load_chain_state(base_name: str, initial_pdb_file: str,
+                     loop_ranges: List[Tuple[int, int]]) -> Optional[Dict[str, Any]]:
+    """
+    Lee el estado guardado de un modelo base. Retorna None si no existe o si ya
+    no corresponde a la ejecución actual (otro modelo inicial, otros loops, otros
+    parámetros de refinamiento o el PDB de partida ya no está en disco), en cuyo
+    caso la cadena empieza de cero.
+    """
+    state_file = _checkpoint_path(base_name)
+    if not os.path.exists(state_file):
+        return None
+
+    try:
+        with open(state_file, 'r') as f:
+            state = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.info(f"    [CHECKPOINT] Estado ilegible en {state_file}, se reinicia la cadena. Error: {e}")
+        return None
+
+    saved_ranges = [tuple(r) for r in state.get('loop_ranges', [])]
+    if (state.get('initial_model') != initial_pdb_file or saved_ranges != list(loop_ranges)
+            or state.get('settings_key') != chain_settings_key()):
+        logger.info(f"    [CHECKPOINT] El estado de {base_name} corresponde a otra configuración de loops. Se reinicia la cadena.")
+        return None
+
+    # Si AutoModel se relanzó, el modelo inicial tiene el mismo nombre pero otro contenido
+    if state.get('initial_model_mtime') != _file_mtime(output_layout.model_path(initial_pdb_file)):
+        logger.info(f"    [CHECKPOINT] {initial_pdb_file} cambió desde el último estado guardado. Se reinicia la cadena.")
+        return None
+
+    current_best_pdb = state.get('current_best_pdb')
+    if not current_best_pdb or not os.path.exists(output_layout.model_path(current_best_pdb)):
+        logger.info(f"    [CHECKPOINT] Falta el modelo {state.get('current_best_pdb')} del estado de {base_name}. Se reinicia la cadena.")
+        return None
+
+    return state
+
+# =================================================================
+# PASO DE REFINAMIENTO Y LOOPS LARGOS POR VENTANAS
+# =================================================================
+
+def crop_for_loop(inimodel: str, start: int, end: int) -> str:
+    """
+    Recorta el entorno local del loop (loop + anclajes + residuos a LOOP_CROP_RADIUS Å)
+    en LOOP_CROP_DIR y retorna la ruta del subsistema.
+    """
+    os.makedirs(LOOP_CROP_DIR, exist_ok=True)
+    base = os.path.splitext(os.path.basename(inimodel))[0]
+    cropped_pdb = os.path.join(LOOP_CROP_DIR, f'{base}_{start}-{end}.pdb')
+    pdb_utils.crop_subsystem(inimodel, start, end, CHAIN_ID, LOOP_CROP_RADIUS, LOOP_CROP_ANCHOR_RESIDUES, cropped_pdb)
+    return cropped_pdb
+
+def expand_cropped_outputs(full_model: str, outputs: List[Dict[str, Any]], start: int, end: int) -> None:
+    """
+    Reinserta el loop de cada modelo refinado sobre un subsistema recortado en el
+    modelo completo de partida. Cada salida se sobrescribe con el modelo completo.
+    """
+    loop_keys = [(CHAIN_ID, r) for r in range(start, end + 1)]
+    for model_info in outputs:
+        if model_info.get('failure') is not None or not os.path.exists(model_info['name']):
+            continue
+        pdb_utils.splice_residues(full_model, {key: model_info['name'] for key in loop_keys}, model_info['name'])
+
+def seeds_for_loop(model_pdb: str, start: int, end: int, max_seeds: int):
+    """
+    Semillas de la biblioteca de fragmentos para un loop y el nivel de refinamiento
+    a usar: FRAGMENT_SEEDED_MD_LEVEL si hay semillas, refine.slow_large si no.
+    """
+    if not FRAGMENT_SEEDING:
+        return [], refine.slow_large
+    import fragment_library
+    seeds = fragment_library.loop_seed_conformations(model_pdb, start, end, FRAGMENT_LIBRARY_DIR, max_seeds=max_seeds)
+    if not seeds:
+        logger.info(f"    -> Sin fragmentos compatibles para {start}-{end}; se usa la conformación inicial por defecto.")
+        return [], refine.slow_large
+    logger.debug(f"    -> {len(seeds)} fragmentos semilla para {start}-{end} (refine.{FRAGMENT_SEEDED_MD_LEVEL})")
+    return seeds, getattr(refine, FRAGMENT_SEEDED_MD_LEVEL)
+
+def log_seeding(outputs: List[Dict[str, Any]], start: int, end: int, num_seeds: int) -> None:
+    """Registra la siembra lograda: fragmentos distintos usados y átomos de esqueleto sembrados."""
+    seeded = [o for o in outputs if o.get('seed') is not None]
+    if not seeded:
         return
+    fragments = len({o['seed'] for o in seeded})
+    seeded_atoms = sum(o.get('seeded_atoms', 0) for o in seeded)
+    loop_atoms = sum(o.get('loop_atoms', 0) for o in seeded)
+    coverage = f"{100.0 * seeded_atoms / loop_atoms:.0f}%" if loop_atoms else "-"
+    logger.info(f"    -> Siembra {start}-{end}: {fragments}/{num_seeds} fragmentos en {len(seeded)} muestras; "
+                f"átomos sembrados (solo N/CA/C/O): {seeded_atoms}/{loop_atoms} ({coverage})",
+                extra={'stage': 'loop_refinement', 'count': len(seeded)})
+
+def run_loop_model(env: Environ, job: Job, inimodel: str, start: int, end: int,
+                   md_level=refine.slow_large, rand_seed: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Refina un segmento con DynamicLoopRefiner repartiendo los NUM_MODELS_LOOP modelos entre los workers.
+    Con LOOP_CROP_ENABLED el refinamiento y la puntuación se hacen sobre el subsistema
+    recortado y el loop ganador de cada muestra se reinserta en el modelo completo.
+
+    Modeller construye la conformación inicial del loop una vez por make(); con
+    semillas de fragmentos cada muestra es una LoopWindowTask propia (su propio
+    make() y código de secuencia), de modo que la muestra k parte del fragmento
+    (k - 1) mod len(semillas).
+    """
+    refinement_model = crop_for_loop(inimodel, start, end) if LOOP_CROP_ENABLED else inimodel
+    try:
+        seeds, seeded_md_level = seeds_for_loop(refinement_model, start, end, NUM_MODELS_LOOP)
+        if seeds and md_level is refine.slow_large:
+            md_level = seeded_md_level
+
+        worker_pool.stage_inputs(job, [refinement_model])
+        if seeds:
+            for k in range(1, NUM_MODELS_LOOP + 1):
+                job.queue_task(LoopWindowTask(refinement_model, f'{ALIGN_CODE_SEQUENCE}_S{k}',
+                                              start, end, CHAIN_ID, k, k, seeds, md_level, rand_seed))
+            outputs = [o for task_outputs in job.run_all_tasks() for o in (task_outputs or [])]
+            log_seeding(outputs, start, end, len(seeds))
+        else:
+            ml = DynamicLoopRefiner(env,
+                                    inimodel=refinement_model,
+                                    sequence=ALIGN_CODE_SEQUENCE,
+                                    loop_start=start,
+                                    loop_end=end,
+                                    chain_id=CHAIN_ID)
+            ml.use_parallel_job(job)
+            ml.loop.starting_model = 1
+            ml.loop.ending_model = NUM_MODELS_LOOP
+            ml.loop.md_level = md_level
+            ml.loop.assess_methods = (assess.DOPEHR, assess.GA341)
+            ml.max_var_iterations = 1000
+
+            ml.make()
+            outputs = ml.loop.outputs
+
+        if LOOP_CROP_ENABLED:
+            expand_cropped_outputs(inimodel, outputs, start, end)
+    finally:
+        # El subsistema recortado se borra también si el refinamiento falla
+        if refinement_model != inimodel and os.path.exists(refinement_model):
+            os.remove(refinement_model)
+    return outputs
+
+def assign_window_residues(windows: List[Tuple[int, int]], window_scores: List[float]) -> Dict[int, int]:
+    """
+    Asigna cada residuo del loop a una ventana. Los residuos de una sola ventana
+    se toman de ella; en los solapamientos gana la ventana con mejor (menor) DOPE-HR.
+    Las ventanas sin resultados (puntuación infinita) no aportan residuos.
+    """
+    assignment: Dict[int, int] = {}
+    for k, (window_start, window_end) in enumerate(windows):
+        if math.isinf(window_scores[k]):
+            continue
+        for res_num in range(window_start, window_end + 1):
+            current = assignment.get(res_num)
+            if current is None or window_scores[k] < window_scores[current]:
+                assignment[res_num] = k
+    return assignment
+
+def refine_long_loop(env: Environ, job: Job, inimodel: str, base_name: str, loop_number: int,
+                     start: int, end: int, rand_seed: Optional[int] = None) -> Optional[str]:
+    """
+    Refina un loop más largo que MAX_LOOP_LENGTH dividiéndolo en ventanas solapadas.
+    Todas las ventanas se refinan a la vez en el pool de workers (cada ventana
+    reparte sus NUM_MODELS_LOOP modelos en varias tareas), y el mejor modelo de
+    cada ventana se combina sobre el modelo de partida. Retorna la ruta del PDB
+    combinado ({base}_LOOP{n}_MERGED.pdb) o None si ninguna ventana produjo resultados.
+    El PDB combinado no se registra aquí: refine_segment lo registra si se conserva.
+    """
+    windows = pdb_utils.split_loop_windows(start, end, LONG_LOOP_WINDOW, LONG_LOOP_OVERLAP)
+    num_workers = max(1, len(job))
+    chunks_per_window = max(1, min(NUM_MODELS_LOOP, num_workers // len(windows)))
+    models_per_chunk = math.ceil(NUM_MODELS_LOOP / chunks_per_window)
+
+    window_strings = [f"[{s}-{e}]" for s, e in windows]
+    logger.info(f"    -> Loop largo ({end - start + 1} residuos): {len(windows)} ventanas {window_strings} x {chunks_per_window} tareas en paralelo")
+
+    task_windows: List[int] = []
+    window_models: List[str] = []
+    try:
+        for k, (window_start, window_end) in enumerate(windows):
+            window_model = crop_for_loop(inimodel, window_start, window_end) if LOOP_CROP_ENABLED else inimodel
+            window_models.append(window_model)
+            window_seeds, window_md_level = seeds_for_loop(window_model, window_start, window_end, NUM_MODELS_LOOP)
+            for c in range(chunks_per_window):
+                first_model = c * models_per_chunk + 1
+                last_model = min((c + 1) * models_per_chunk, NUM_MODELS_LOOP)
+                if first_model > last_model:
+                    break
+                # Un código de secuencia por tarea evita colisiones entre los archivos intermedios
+                job.queue_task(LoopWindowTask(window_model, f'{ALIGN_CODE_SEQUENCE}_W{k+1}C{c+1}',
+                                              window_start, window_end, CHAIN_ID, first_model, last_model,
+                                              window_seeds, window_md_level, rand_seed))
+                task_windows.append(k)
+
+        worker_pool.stage_inputs(job, window_models)
+        window_outputs: List[List[Dict[str, Any]]] = [[] for _ in windows]
+        for k, outputs in zip(task_windows, job.run_all_tasks()):
+            window_outputs[k].extend(outputs or [])
+        for k, (window_start, window_end) in enumerate(windows):
+            log_seeding(window_outputs[k], window_start, window_end, NUM_MODELS_LOOP)
+
+        if LOOP_CROP_ENABLED:
+            for k, (window_start, window_end) in enumerate(windows):
+                expand_cropped_outputs(inimodel, window_outputs[k], window_start, window_end)
+    finally:
+        for window_model in window_models:
+            if window_model != inimodel and os.path.exists(window_model):
+                os.remove(window_model)
+
+    window_best_files: List[Optional[str]] = [None] * len(windows)
+    window_scores: List[float] = [float('inf')] * len(windows)
+    for k, outputs in enumerate(window_outputs):
+        sorted_outputs = sorted(outputs, key=lambda x: x.get('DOPE-HR score', 9999999.0))
+        for m, model_info in enumerate(sorted_outputs):
+            new_window_name = f'{base_name}_LOOP{loop_number}_W{k+1}_R{m+1}.pdb'
+            try:
+                new_window_path = output_layout.store_model(model_info['name'], new_window_name, 'loop_window')
+            except Exception as e:
+                logger.error(f"    No se pudo renombrar {model_info['name']} a {new_window_name}. Error: {e}")
+                continue
+            if window_best_files[k] is None:
+                window_best_files[k] = new_window_path
+                window_scores[k] = model_info.get('DOPE-HR score', 9999999.0)
+
+    assignment = assign_window_residues(windows, window_scores)
+    if not assignment:
+        logger.warning(f"    -> Advertencia: Ninguna ventana del loop {start}-{end} generó resultados válidos.")
+        return None
+
+    for k, (window_start, window_end) in enumerate(windows):
+        score_text = f"{window_scores[k]:.3f}" if window_best_files[k] else "sin resultados"
+        logger.debug(f"       Ventana {k+1} [{window_start}-{window_end}]: mejor DOPE-HR {score_text}")
+
+    replacements = {(CHAIN_ID, res_num): window_best_files[k] for res_num, k in assignment.items()}
+    merged_name = f'{base_name}_LOOP{loop_number}_MERGED.pdb'
+    merged_pdb = output_layout.model_path(merged_name, create=True)
+    pdb_utils.splice_residues(inimodel, replacements, merged_pdb)
+    logger.info(f"    -> Ventanas combinadas en {merged_pdb}")
+    return merged_pdb
+
+
+def refine_segment(env: Environ, job: Job, inimodel: str, base_name: str, loop_number: int,
+                   start: int, end: int, rand_seed: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Un paso de la cadena: refina start-end sobre inimodel (por ventanas si es un
+    loop largo) y retorna las salidas. rand_seed (reintentos) cambia la semilla de Modeller.
+    """
+    step_env = fault_tolerance.seeded_environ(env, rand_seed)
+    if (end - start + 1) > MAX_LOOP_LENGTH:
+        merged_pdb = refine_long_loop(step_env, job, inimodel, base_name, loop_number, start, end, rand_seed=rand_seed)
+        if not merged_pdb:
+            return []
+        if LONG_LOOP_FINAL_PASS:
+            # El combinado se conserva como entrada de la pasada final
+            output_layout.register_model(os.path.basename(merged_pdb), 'loop_merged', merged_pdb)
+            logger.info(f"    -> Pasada final (refine.fast) sobre el segmento completo {start}-{end}")
+            return run_loop_model(step_env, job, merged_pdb, start, end, md_level=refine.fast, rand_seed=rand_seed)
+        # Sin pasada final, el modelo combinado pasa a ser el R1 de este loop: se puntúa
+        # como las salidas de Modeller (store_model lo registra con su nombre final)
+        try:
+            score = Selection(complete_pdb(step_env, merged_pdb)).assess_dopehr()
+            logger.info(f"    -> DOPE-HR del modelo combinado: {score:.3f}")
+        except Exception as e:
+            logger.warning(f"    -> No se pudo puntuar el modelo combinado {merged_pdb}. Error: {e}")
+            score = 9999999.0
+        return [{'name': merged_pdb, 'DOPE-HR score': score}]
+    return run_loop_model(step_env, job, inimodel, start, end, rand_seed=rand_seed)
+
+def run_loop_refinement(env: Environ, job: Job, initial_models_names: List[str], loop_ranges: List[Tuple[int, int]],
+                        deadline=None) -> Job:
+    """
+    Ejecuta el refinamiento secuencial de loops con DOPEHR para los modelos base.
+    Tras cada paso de loop se guarda el estado de la cadena; al relanzar, las
+    cadenas terminadas se saltan y las parciales continúan desde el último loop.
+    Los pasos que fallaron (sin modelos tras los reintentos) no cuentan como
+    hechos: quedan en 'failed_loops' y se reintentan al reanudar. El reintento
+    parte del mejor modelo actual de la cadena ('current_best_pdb'), que ya
+    incluye los loops posteriores refinados, y no del modelo con el que falló:
+    las regiones de los loops no se solapan, así que el loop reintentado se
+    añade a la cadena en lugar de abrir una rama que perdería esos loops.
+
+    Con un deadline (walltime.Deadline) activo, antes de cada paso se comprueba que
+    su duración estimada (segundos por residuo medidos en los pasos anteriores)
+    cabe antes del límite dejando la reserva de ranking; si no, el refinamiento se
+    detiene y las cadenas pendientes quedan en su checkpoint.
+
+    Cada paso se ejecuta con fault_tolerance.TaskSupervisor: límite de tiempo,
+    reintentos con semilla nueva y reemplazo de workers muertos o sobredimensionados.
+    Los fallos se registran por modelo en TASK_FAILURE_REPORT. Retorna el Job vigente:
+    si los workers se reemplazaron, el Job recibido ya está cerrado y el llamador
+    debe seguir con el retornado.
+
+    Con LOOP_SELECTION = 'profile' cada modelo base refina sus propias regiones:
+    los peores segmentos de su perfil DOPE-HR (incluidos los huecos del
+    alineamiento con exceso de energía), dentro del presupuesto de region_selection.py.
+    """
+    profile_selection = LOOP_SELECTION == 'profile'
+
+    if not loop_ranges and not profile_selection:
+        logger.info("\n[STEP 5.1] Saltando refinamiento de loops: No hay loops flexibles definidos.")
+        return job
     
-    valid_loop_ranges = [r for r in loop_ranges if 4 <= (r[1] - r[0] + 1) <= 30]
+    valid_loop_ranges = [r for r in loop_ranges if (r[1] - r[0] + 1) >= MIN_LOOP_LENGTH]
 
-    if not valid_loop_ranges:
-        print("\n[STEP 5.1] Saltando refinamiento de loops: Ningún loop detectado cumple con la longitud requerida (4-30 residuos).")
-        return
+    if not valid_loop_ranges and not profile_selection:
+        logger.info(f"\n[STEP 5.1] Saltando refinamiento de loops: Ningún loop detectado cumple con la longitud mínima ({MIN_LOOP_LENGTH} residuos).")
+        return job
+
+    long_loop_count = sum(1 for r in valid_loop_ranges if (r[1] - r[0] + 1) > MAX_LOOP_LENGTH)
+    if long_loop_count:
+        logger.info(f"\n[STEP 5.1] {long_loop_count} loop(s) superan {MAX_LOOP_LENGTH} residuos y se refinarán por ventanas de {LONG_LOOP_WINDOW}.")
     
-    print(f"\n[STEP 5.2] Iniciando refinamiento dirigido para {len(valid_loop_ranges)} segmentos válidos...")
+    if profile_selection:
+        logger.info(f"\n[STEP 5.2] Iniciando refinamiento dirigido por el perfil DOPE-HR de cada modelo base "
+                    f"({len(valid_loop_ranges)} huecos del alineamiento como candidatos)...")
+    else:
+        logger.info(f"\n[STEP 5.2] Iniciando refinamiento dirigido para {len(valid_loop_ranges)} segmentos válidos...")
+    settings_key = chain_settings_key()
+    supervisor = fault_tolerance.TaskSupervisor(job)
+    # Modelos que entrarán al ranking: se lee el manifiesto una vez y se lleva la cuenta en memoria
+    models_in_manifest = len(output_layout.read_manifest()) if deadline is not None else 0
     
+    stopped_by_deadline = False
     for model_index, initial_pdb_file in enumerate(initial_models_names):
+        if stopped_by_deadline:
+            break
         
         base_name = initial_pdb_file.replace('.pdb', '')
         
-        print(f"\n --- Procesando Modelo Base #{model_index+1}: {initial_pdb_file} ({base_name}) ---")
+        logger.info(f"\n --- Procesando Modelo Base #{model_index+1}: {initial_pdb_file} ({base_name}) ---")
         
         current_best_pdb_for_thread = initial_pdb_file
         current_base_name_for_refinment = base_name
+        first_loop_index = 0
+        failed_loops: List[int] = []
+        # Pasos fallidos en la ejecución anterior: se reintentan (en orden) antes de continuar,
+        # sobre el mejor modelo actual de la cadena (ver docstring)
+        pending_retries: set = set()
+
+        chain_ranges = valid_loop_ranges
+        if profile_selection:
+            try:
+                chain_ranges = region_selection.regions_for_model(env, output_layout.model_path(initial_pdb_file),
+                                                                  valid_loop_ranges)
+            except Exception as e:
+                logger.warning(f"  No se pudo calcular el perfil DOPE-HR de {initial_pdb_file}; "
+                               f"se refinan los huecos del alineamiento. Error: {e}")
+        if not chain_ranges:
+            logger.info(f"  -> Ninguna región de {initial_pdb_file} requiere refinamiento. Saltando.")
+            continue
+
+        state = load_chain_state(base_name, initial_pdb_file, chain_ranges)
+        if state:
+            if state.get('completed'):
+                logger.info(f"  [CHECKPOINT] Cadena ya completada para {initial_pdb_file}. Mejor modelo: {state['current_best_pdb']}. Saltando.")
+                continue
+            current_best_pdb_for_thread = state['current_best_pdb']
+            current_base_name_for_refinment = state['current_base_name']
+            first_loop_index = state['next_loop_index']
+            pending_retries = set(state.get('failed_loops', []))
+            retry_text = f"; se reintentan los loops fallidos {sorted(pending_retries)}" if pending_retries else ""
+            logger.info(f"  [CHECKPOINT] Reanudando desde el Loop {first_loop_index+1}/{len(chain_ranges)} con {current_best_pdb_for_thread}{retry_text}")
         
         # Sequentially refine loops
-        for j, (start, end) in enumerate(valid_loop_ranges):
+        for j, (start, end) in enumerate(chain_ranges):
+
+            if j < first_loop_index and (j + 1) not in pending_retries:
+                continue
+
+            if deadline is not None:
+                step_estimate = deadline.estimate('loop_step', end - start + 1)
+                models_to_rank = models_in_manifest + NUM_MODELS_LOOP
+                if not deadline.allows(step_estimate, models_to_rank):
+                    logger.warning(f"[WALLTIME] Refinamiento de loops detenido en el Loop {j+1} del modelo base "
+                                   f"#{model_index+1} para respetar el límite de tiempo. Se reanudará en la próxima ejecución.",
+                                   extra={'stage': 'loop_refinement', 'model': base_name})
+                    deadline.truncated.add('loop_refinement')
+                    stopped_by_deadline = True
+                    break
+            step_start_time = time.time()
+            pending_retries.discard(j + 1)
             
-            print(f"  > Refinando Loop {j+1}/{len(valid_loop_ranges)}: Residuos {start} a {end}")
+            logger.info(f"  > Refinando Loop {j+1}/{len(chain_ranges)}: Residuos {start} a {end}",
+                        extra={'stage': 'loop_refinement', 'model': base_name, 'loop': f'{start}-{end}'})
             
             try:
-                ml = DynamicLoopRefiner(env,
-                                        inimodel=current_best_pdb_for_thread,
-                                        sequence=ALIGN_CODE_SEQUENCE,
-                                        loop_start=start,
-                                        loop_end=end,
-                                        chain_id=CHAIN_ID)
-
-                ml.use_parallel_job(job)
-                ml.loop.starting_model = 1
-                ml.loop.ending_model = NUM_MODELS_LOOP
-                ml.loop.md_level = refine.slow_large
-                ml.loop.assess_methods = (assess.DOPEHR, assess.GA341)
-                ml.max_var_iterations = 1000
-
-                ml.make()
-                
-                loop_models_of_this_step = ml.loop.outputs
+                current_best_path = output_layout.model_path(current_best_pdb_for_thread)
+                loop_models_of_this_step = supervisor.run(
+                    base_name, f'Loop {j+1} ({start}-{end})', end - start + 1,
+                    lambda step_job, rand_seed: refine_segment(env, step_job, current_best_path,
+                                                               current_base_name_for_refinment, j + 1,
+                                                               start, end, rand_seed)
+                )
+                cost_report.record_timing('loop', time.time() - step_start_time, len(supervisor.job),
+                                          parent=current_best_pdb_for_thread, loop=j + 1, range=[start, end],
+                                          prefix=f'{current_base_name_for_refinment}_LOOP{j+1}_R')
                 
                 if loop_models_of_this_step:
                     sorted_loop_outputs_by_loop_dopeHR = sorted(loop_models_of_this_step, key=lambda x: x.get('DOPE-HR score', 9999999.0))
                     
+                    stored_loop_models = []
                     for m, model_info in enumerate(sorted_loop_outputs_by_loop_dopeHR):
                         old_name = model_info['name']
                         new_loop_name = f'{current_base_name_for_refinment}_LOOP{j+1}_R{m+1}.pdb'
                         
                         try:
-                            os.rename(old_name, new_loop_name)
+                            new_loop_path = output_layout.store_model(old_name, new_loop_name, 'loop', loop=f'{start}-{end}',
+                                                                      score=model_info.get('DOPE-HR score'),
+                                                                      seed=model_info.get('seed'))
+                            stored_loop_models.append({'name': new_loop_name, 'path': new_loop_path,
+                                                       'DOPE-HR score': model_info.get('DOPE-HR score')})
                         except Exception as e:
-                            print(f"    [ERROR] No se pudo renombrar {old_name} a {new_loop_name}. Error: {e}")
+                            logger.error(f"    No se pudo renombrar {old_name} a {new_loop_name}. Error: {e}")
+                    models_in_manifest += len(stored_loop_models)
+                    leaderboard.record(stored_loop_models, 'loop', force=True)
                             
-                    best_of_this_loop = sorted_loop_outputs_by_loop_dopeHR[0] 
-                    current_best_pdb_for_thread = f'{current_base_name_for_refinment}_LOOP{j+1}_R1.pdb'
-                    current_base_name_for_refinment = f'{current_base_name_for_refinment}_LOOP{j+1}_R1' 
+                    # El mejor por DOPE-HR que pasa el filtro geométrico es la entrada del siguiente loop
+                    best_rank = None
+                    for m in range(1, len(sorted_loop_outputs_by_loop_dopeHR) + 1):
+                        candidate = f'{current_base_name_for_refinment}_LOOP{j+1}_R{m}.pdb'
+                        rejected = geometry_check.rejected_by_prefilter(output_layout.model_path(candidate))
+                        if not rejected:
+                            best_rank = m
+                            break
+                        logger.warning(f"    [GEOMETRY] {candidate} descartado como entrada del siguiente loop: {'; '.join(rejected['reasons'])}",
+                                       extra={'stage': 'loop_refinement', 'model': candidate})
+
+                    if best_rank is not None:
+                        current_best_pdb_for_thread = f'{current_base_name_for_refinment}_LOOP{j+1}_R{best_rank}.pdb'
+                        current_base_name_for_refinment = f'{current_base_name_for_refinment}_LOOP{j+1}_R{best_rank}'
+                    else:
+                        logger.warning(f"    -> Advertencia: ningún modelo del loop {start}-{end} pasó el filtro geométrico. Usando el modelo inicial anterior.")
                 
                 else:
-                    print(f"    -> Advertencia: DOPEHRLoopModel no generó resultados válidos para {start}-{end}. Usando el modelo inicial anterior.")
+                    logger.warning(f"    -> Advertencia: DOPEHRLoopModel no generó resultados válidos para {start}-{end} "
+                                   f"tras {config.TASK_MAX_RETRIES + 1} intentos. Usando el modelo inicial anterior.")
+                    failed_loops.append(j + 1)
 
             except Exception as e:
-                print(f"     > ERROR FATAL en DOPEHRLoopModel para {start}-{end} (Modelo Base #{model_index+1}): {e}")
-                continue
+                logger.error(f"     > ERROR FATAL en DOPEHRLoopModel para {start}-{end} (Modelo Base #{model_index+1}): {e}")
+                failed_loops.append(j + 1)
+
+            # Los pasos fallidos no cuentan como hechos: quedan en failed_loops para reintentarse al reanudar
+            next_loop_index = max(first_loop_index, j + 1)
+            unresolved_loops = sorted(set(failed_loops) | pending_retries)
+            save_chain_state(base_name, {
+                'initial_model': initial_pdb_file,
+                'initial_model_mtime': _file_mtime(output_layout.model_path(initial_pdb_file)),
+                'loop_ranges': [list(r) for r in chain_ranges],
+                'settings_key': settings_key,
+                'current_best_pdb': current_best_pdb_for_thread,
+                'current_base_name': current_base_name_for_refinment,
+                'next_loop_index': next_loop_index,
+                'failed_loops': unresolved_loops,
+                'completed': next_loop_index == len(chain_ranges) and not unresolved_loops
+            })
+            # Intermedios de este paso a su propia carpeta: el paso siguiente reutiliza los mismos nombres
+            output_layout.collect_intermediates('loop_refinement', step=os.path.join(base_name, f'LOOP{j+1}'))
+            pipeline_log.rotate_large_worker_logs('loop_refinement')
+            if deadline is not None:
+                deadline.record('loop_step', time.time() - step_start_time, end - start + 1)
             
-        print(f"\n[STEP 5.2] Refinamiento de Loops completado para el modelo base #{model_index + 1}.")
+        if not stopped_by_deadline:
+            logger.info(f"\n[STEP 5.2] Refinamiento de Loops completado para el modelo base #{model_index + 1}.",
+                        extra={'stage': 'loop_refinement', 'model': base_name})
+
+    failures = fault_tolerance.failure_summary()
+    if failures:
+        logger.warning(f"\n[FAILURES] Fallos del refinamiento por modelo base (detalle en {config.TASK_FAILURE_REPORT}):")
+        for model, actions in sorted(failures.items()):
+            logger.warning(f"  {model}: " + ', '.join(f"{count} {action}" for action, count in sorted(actions.items())))
+
+    return supervisor.job
@@ -8,6 +8,20 @@
 module load Python/3.11.3-GCCcore-12.3.0
 
 export MODELLER_CORES=$SLURM_CPUS_PER_TASK
+# Fijar cada worker a un núcleo ('core') o a su dominio NUMA ('numa'); ver cpu_placement.py
+# export MODELLER_WORKER_PINNING=numa
+
+# Comprobación previa: si el nodo no puede sostener la configuración, se termina antes de gastar la reserva
+python3 validate_setup.py --preflight > preflight.out || exit 1
 
 srun --cpus-per-task=$SLURM_CPUS_PER_TASK python3 controller.py > salida.out
 
+
+# Variante multi-nodo (worker_pool.py): el controller corre en el primer nodo y
+# lanza los workers de los demás con srun. Cambiar las cabeceras por:
+##SBATCH --nodes=2
+##SBATCH --ntasks-per-node=1
+##SBATCH --cpus-per-task=48
+# y lanzar el controller en un solo nodo:
+# export MODELLER_WORKER_LAUNCHER=srun
+# srun --nodes=1 --ntasks=1 --overlap --cpus-per-task=$SLURM_CPUS_PER_TASK python3 controller.py > salida.out
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# output_layout.py
+
+"""
+Organización jerárquica de las salidas del pipeline y manifiesto de modelos.
+
+En lugar de dejar decenas de miles de PDB en la carpeta de trabajo, cada modelo
+se guarda en una subcarpeta determinada solo por su nombre:
+
+    models/auto/00001-01000/AUTO_1.pdb          (AutoModel, por tramo de rank)
+    models/loops/AUTO_1/AUTO_1_LOOP1_R1.pdb     (cadena de loops de un modelo base)
+    models/other/3f/<nombre>.pdb                (resto, por bucket de hash)
+    models/intermediate/automodel/00001-01000/FullSeq.D...           (intermedios de Modeller,
+    models/intermediate/loop_refinement/AUTO_1/LOOP2/00001-01000/... por etapa, paso y tramo)
+
+Cada modelo generado se registra en OUTPUT_MANIFEST_FILE (una línea JSON por
+modelo: nombre, ruta y etapa). La evaluación final, extractor_resultados.py y
+this-speaker.sh consultan el manifiesto en lugar de listar directorios.
+"""
+
+import os
+import re
+import json
+import hashlib
+from typing import List, Dict, Any, Optional, Iterable
+
+import config
+import pipeline_log
+from config import OUTPUT_DIR, OUTPUT_SHARD_SIZE, OUTPUT_MANIFEST_FILE, ALIGN_CODE_SEQUENCE
+
+logger = pipeline_log.get_logger(__name__)
+
+# Archivos intermedios por modelo que Modeller escribe en la carpeta de trabajo:
+# <código>.D00000001, <código>.V99990001, <código>_W1C2.DL00010001, <código>.IL00000001.pdb, ...
+# Los modelos (.B99990001.pdb, .BL00010001.pdb) no son intermedios: se renombran con store_model.
+# Los 4 últimos dígitos son el número de modelo.
+_INTERMEDIATE_RE = re.compile(rf'^{re.escape(ALIGN_CODE_SEQUENCE)}(_W\d+C\d+|_S\d+)?\.(D|V|DL|IL)(?P<num>\d{{4,}})(\.pdb)?$')
+
+def shard_dir(model_name: str) -> str:
+    """Subcarpeta de un modelo según su nombre (sin listar ningún directorio)."""
+    stem = os.path.splitext(os.path.basename(model_name))[0]
+    if '_LOOP' in stem:
+        return os.path.join(OUTPUT_DIR, 'loops', stem.split('_LOOP', 1)[0])
+    auto_match = re.fullmatch(r'AUTO_(\d+)', stem)
+    if auto_match:
+        first = (int(auto_match.group(1)) - 1) // OUTPUT_SHARD_SIZE * OUTPUT_SHARD_SIZE + 1
+        return os.path.join(OUTPUT_DIR, 'auto', f'{first:05d}-{first + OUTPUT_SHARD_SIZE - 1:05d}')
+    bucket = hashlib.sha1(stem.encode()).hexdigest()[:2]
+    return os.path.join(OUTPUT_DIR, 'other', bucket)
+
+def model_path(model_name: str, create: bool = False) -> str:
+    """Ruta de un modelo dentro del árbol de salidas. Con create=True crea su subcarpeta."""
+    directory = shard_dir(model_name)
+    if create:
+        os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, os.path.basename(model_name))
+
+# =================================================================
+# MANIFIESTO DE MODELOS
+# =================================================================
+
+def register_model(model_name: str, stage: str, path: Optional[str] = None, **info: Any) -> None:
+    """
+    Añade un modelo al manifiesto. El archivo solo crece (una línea por registro)
+    y, si un nombre se registra varias veces, prevalece el último registro.
+    Las rutas se guardan relativas a la carpeta de la ejecución.
+    """
+    record = {'name': os.path.basename(model_name), 'path': path or model_path(model_name), 'stage': stage}
+    record.update(info)
+    os.makedirs(os.path.dirname(OUTPUT_MANIFEST_FILE) or '.', exist_ok=True)
+    with open(OUTPUT_MANIFEST_FILE, 'a') as f:
+        f.write(json.dumps(record) + '\n')
+
+def read_manifest(run_dir: str = '.') -> Dict[str, Dict[str, Any]]:
+    """
+    Lee el manifiesto de una ejecución: {nombre: registro}. Las líneas incompletas
+    (corte a mitad de escritura) se ignoran.
+    """
+    records: Dict[str, Dict[str, Any]] = {}
+    try:
+        with open(os.path.join(run_dir, OUTPUT_MANIFEST_FILE), 'r') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                records[record['name']] = record
+    except OSError:
+        pass
+    return records
+
+def manifest_models(stages: Optional[Iterable[str]] = None, run_dir: str = '.') -> List[Dict[str, Any]]:
+    """Registros del manifiesto (opcionalmente solo de ciertas etapas) cuyo archivo sigue en disco."""
+    wanted = set(stages) if stages is not None else None
+    return [record for record in read_manifest(run_dir).values()
+            if (wanted is None or record.get('stage') in wanted)
+            and os.path.exists(os.path.join(run_dir, record['path']))]
+
+def store_model(source_file: str, model_name: str, stage: str, **info: Any) -> str:
+    """Mueve un PDB recién generado a su subcarpeta, lo registra en el manifiesto y retorna su ruta."""
+    destination = model_path(model_name, create=True)
+    os.replace(source_file, destination)
+    register_model(model_name, stage, destination, **info)
+    return destination
+
+def intermediate_dir(stage: str, model_number: int, step: Optional[str] = None) -> str:
+    """
+    Subcarpeta de los intermedios de un modelo: por etapa, paso (p. ej.
+    'AUTO_1/LOOP2', para que los intermedios con el mismo nombre de pasos
+    distintos no se sobrescriban) y tramo de OUTPUT_SHARD_SIZE modelos.
+    """
+    first = (max(model_number, 1) - 1) // OUTPUT_SHARD_SIZE * OUTPUT_SHARD_SIZE + 1
+    parts = [OUTPUT_DIR, 'intermediate', stage] + ([step] if step else [])
+    return os.path.join(*parts, f'{first:05d}-{first + OUTPUT_SHARD_SIZE - 1:05d}')
+
+def collect_intermediates(stage: str, step: Optional[str] = None) -> int:
+    """
+    Mueve los archivos intermedios de Modeller (.D, .V, .DL, .IL) de la carpeta
+    de trabajo a OUTPUT_DIR/intermediate/<etapa>[/<paso>]/<tramo>. Retorna cuántos movió.
+    """
+    moved = 0
+    created = set()
+    with os.scandir('.') as entries:
+        for entry in entries:
+            match = _INTERMEDIATE_RE.match(entry.name)
+            if not match or not entry.is_file():
+                continue
+            destination = intermediate_dir(stage, int(match.group('num')[-4:]), step)
+            if destination not in created:
+                os.makedirs(destination, exist_ok=True)
+                created.add(destination)
+            try:
+                os.replace(entry.name, os.path.join(destination, entry.name))
+                moved += 1
+            except OSError as e:
+                logger.warning(f"No se pudo mover el intermedio {entry.name}. Error: {e}")
+    if moved:
+        logger.debug(f"[OUTPUT] {moved} archivos intermedios de Modeller movidos a "
+                     f"{os.path.join(OUTPUT_DIR, 'intermediate', stage, step or '')}",
+                     extra={'stage': stage, 'count': moved})
+    return moved
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+# pdb_utils.py
+
+"""
+Utilidades de texto PDB que no requieren Modeller: lectura de residuos por
+bloques y combinación (splicing) de residuos de varios modelos en uno.
+"""
+
+import os
+from typing import List, Tuple, Dict, Iterable, Set
+
+ResidueKey = Tuple[str, int]
+
+def residue_key(line: str) -> ResidueKey:
+    """Identificador (cadena, número) del residuo de un registro ATOM/HETATM."""
+    return line[21], int(line[22:26])
+
+def is_atom_record(line: str) -> bool:
+    return line.startswith(('ATOM', 'HETATM'))
+
+def read_residue_blocks(pdb_file: str, keys: Iterable[ResidueKey] = None) -> Dict[ResidueKey, List[str]]:
+    """
+    Lee los registros ATOM/HETATM de un PDB agrupados por residuo.
+    Si se indica keys, solo se conservan esos residuos.
+    """
+    wanted: Set[ResidueKey] = set(keys) if keys is not None else None
+    blocks: Dict[ResidueKey, List[str]] = {}
+    with open(pdb_file, 'r') as f:
+        for line in f:
+            if not is_atom_record(line):
+                continue
+            key = residue_key(line)
+            if wanted is not None and key not in wanted:
+                continue
+            blocks.setdefault(key, []).append(line)
+    return blocks
+
+def splice_residues(base_pdb: str, replacements: Dict[ResidueKey, str], output_pdb: str) -> str:
+    """
+    Escribe output_pdb copiando base_pdb, pero tomando los residuos indicados en
+    replacements ({(cadena, resnum): pdb_origen}) de su PDB de origen.
+    Pensado para modelos del mismo sistema en los que solo se movieron esos
+    residuos (ej. ventanas de un loop refinadas por separado).
+    """
+    keys_by_source: Dict[str, List[ResidueKey]] = {}
+    for key, source in replacements.items():
+        keys_by_source.setdefault(source, []).append(key)
+
+    replacement_blocks: Dict[ResidueKey, List[str]] = {}
+    for source, keys in keys_by_source.items():
+        blocks = read_residue_blocks(source, keys)
+        missing = set(keys) - set(blocks)
+        if missing:
+            raise ValueError(f"{source} no contiene los residuos {sorted(missing)}")
+        replacement_blocks.update(blocks)
+
+    written: Set[ResidueKey] = set()
+    temp_output = output_pdb + '.tmp'
+    with open(base_pdb, 'r') as f_in, open(temp_output, 'w') as f_out:
+        for line in f_in:
+            if is_atom_record(line):
+                key = residue_key(line)
+                if key in replacement_blocks:
+                    if key not in written:
+                        f_out.writelines(replacement_blocks[key])
+                        written.add(key)
+                    continue
+            f_out.write(line)
+    os.replace(temp_output, output_pdb)
+    return output_pdb
+
+def split_loop_windows(start: int, end: int, window: int, overlap: int) -> List[Tuple[int, int]]:
+    """
+    Divide el segmento [start, end] en ventanas de 'window' residuos repartidas
+    de forma uniforme, con un solapamiento mínimo de 'overlap' residuos entre
+    ventanas consecutivas.
+    """
+    length = end - start + 1
+    if length <= window:
+        return [(start, end)]
+    step = max(1, window - overlap)
+    num_windows = -(-(length - window) // step) + 1
+    windows = []
+    for k in range(num_windows):
+        window_start = start + round(k * (length - window) / (num_windows - 1))
+        windows.append((window_start, window_start + window - 1))
+    return windows
+
+def _atom_xyz(line: str) -> Tuple[float, float, float]:
+    return float(line[30:38]), float(line[38:46]), float(line[46:54])
+
+def crop_subsystem(pdb_file: str, loop_start: int, loop_end: int, chain_id: str,
+                   radius: float, anchor_residues: int, output_pdb: str, max_gap: int = 2) -> str:
+    """
+    Escribe un subsistema recortado alrededor de un loop: el loop, sus
+    'anchor_residues' residuos de anclaje a cada lado y todo residuo con algún
+    átomo a menos de 'radius' Å de un átomo del loop. Huecos de hasta 'max_gap'
+    residuos entre residuos seleccionados se rellenan para no fragmentar de más.
+
+    El fragmento que contiene el loop conserva la cadena y la numeración
+    originales (para poder seleccionarlo y reinsertarlo); el resto de fragmentos
+    contiguos se escriben en cadenas distintas para que Modeller no cree enlaces
+    peptídicos artificiales entre ellos.
+    """
+    blocks = read_residue_blocks(pdb_file)
+    loop_keys = [(chain_id, r) for r in range(loop_start, loop_end + 1)]
+    missing = [k for k in loop_keys if k not in blocks]
+    if missing:
+        raise ValueError(f"{pdb_file} no contiene los residuos del loop {missing}")
+
+    # Rejilla de celdas de lado 'radius' con los átomos del loop
+    cell_size = radius
+    radius_sq = radius * radius
+    grid: Dict[Tuple[int, int, int], List[Tuple[float, float, float]]] = {}
+    for key in loop_keys:
+        for line in blocks[key]:
+            xyz = _atom_xyz(line)
+            cell = (int(xyz[0] // cell_size), int(xyz[1] // cell_size), int(xyz[2] // cell_size))
+            grid.setdefault(cell, []).append(xyz)
+
+    selected: Set[ResidueKey] = set(loop_keys)
+    for r in range(loop_start - anchor_residues, loop_end + anchor_residues + 1):
+        if (chain_id, r) in blocks:
+            selected.add((chain_id, r))
+
+    for key, lines in blocks.items():
+        if key in selected:
+            continue
+        found = False
+        for line in lines:
+            x, y, z = _atom_xyz(line)
+            cx, cy, cz = int(x // cell_size), int(y // cell_size), int(z // cell_size)
+            for dx in (-1, 0, 1):
+                for dy in (-1, 0, 1):
+                    for dz in (-1, 0, 1):
+                        for lx, ly, lz in grid.get((cx + dx, cy + dy, cz + dz), ()):
+                            if (x - lx) ** 2 + (y - ly) ** 2 + (z - lz) ** 2 <= radius_sq:
+                                found = True
+                                break
+                        if found:
+                            break
+                    if found:
+                        break
+                if found:
+                    break
+            if found:
+                break
+        if found:
+            selected.add(key)
+
+    # Rellenar huecos cortos y agrupar en fragmentos contiguos (orden original del PDB)
+    ordered_keys = list(blocks.keys())
+    for chain in {k[0] for k in selected}:
+        numbers = sorted(k[1] for k in selected if k[0] == chain)
+        for a, b in zip(numbers, numbers[1:]):
+            if 1 < b - a <= max_gap + 1:
+                selected.update((chain, r) for r in range(a + 1, b) if (chain, r) in blocks)
+
+    fragments: List[List[ResidueKey]] = []
+    previous = None
+    for key in ordered_keys:
+        if key not in selected:
+            previous = None
+            continue
+        if previous is not None and previous[0] == key[0] and key[1] == previous[1] + 1:
+            fragments[-1].append(key)
+        else:
+            fragments.append([key])
+        previous = key
+
+    free_chain_ids = [c for c in "BCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789A" if c != chain_id]
+    if len(fragments) - 1 > len(free_chain_ids):
+        raise ValueError(f"El subsistema tiene {len(fragments)} fragmentos, más que cadenas disponibles.")
+
+    temp_output = output_pdb + '.tmp'
+    with open(temp_output, 'w') as f_out:
+        for fragment in fragments:
+            if (chain_id, loop_start) in fragment:
+                new_chain = chain_id
+            else:
+                new_chain = free_chain_ids.pop(0)
+            for key in fragment:
+                for line in blocks[key]:
+                    f_out.write(line[:21] + new_chain + line[22:])
+            f_out.write("TER\n")
+        f_out.write("END\n")
+    os.replace(temp_output, output_pdb)
+    return output_pdb
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# pipeline_log.py
+
+"""
+Logging estructurado y con niveles para los módulos del pipeline.
+
+- Consola (salida.out): solo el mensaje, como los print() de siempre.
+- Archivo PIPELINE_LOG_FILE: una línea JSON por evento (hora, nivel, módulo,
+  mensaje y campos extra como 'stage', 'model' o 'loop').
+- LOG_MODE = 'summary': hitos de etapa, avisos y errores; Modeller en
+  log.minimal() y sin el detalle por modelo/iteración.
+  LOG_MODE = 'full': todo, incluido log.verbose() de Modeller.
+- Los logs de los workers de Modeller se comprimen (gzip) y rotan en
+  WORKER_LOG_DIR al final de cada etapa y, dentro de ella, tras cada tanda o
+  paso de loop en que alguno supere WORKER_LOG_MAX_MB, conservando las
+  WORKER_LOG_KEEP rotaciones más recientes.
+- El nivel no se repite en el texto de los mensajes: la consola antepone
+  [WARNING]/[ERROR] y el log JSON lo guarda en 'level'.
+"""
+
+import os
+import sys
+import glob
+import gzip
+import json
+import time
+import logging
+from typing import List, Optional
+
+import config
+from config import LOG_MODE, PIPELINE_LOG_FILE, WORKER_LOG_DIR, WORKER_LOG_KEEP, WORKER_LOG_PATTERNS, WORKER_LOG_MAX_MB
+
+_ROOT_LOGGER_NAME = 'pipeline'
+_STRUCTURED_FIELDS = ('stage', 'model', 'loop', 'duration_s', 'count', 'score')
+
+def get_logger(module_name: str) -> logging.Logger:
+    """Logger de un módulo del pipeline (hijo de 'pipeline')."""
+    return logging.getLogger(f'{_ROOT_LOGGER_NAME}.{module_name}')
+
+class JsonLinesFormatter(logging.Formatter):
+    """Formatea cada registro como un objeto JSON en una línea."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        event = {
+            'time': round(record.created, 3),
+            'level': record.levelname,
+            'module': record.name.split('.', 1)[-1],
+            'message': record.getMessage().strip(),
+        }
+        for field in _STRUCTURED_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                event[field] = value
+        if record.exc_info:
+            event['exception'] = self.formatException(record.exc_info)
+        return json.dumps(event, ensure_ascii=False)
+
+class ConsoleFormatter(logging.Formatter):
+    """Solo el mensaje; los avisos y errores llevan [WARNING]/[ERROR] tras la sangría inicial."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        message = super().format(record)
+        if record.levelno < logging.WARNING:
+            return message
+        body = message.lstrip('\n ')
+        return f"{message[:len(message) - len(body)]}[{record.levelname}] {body}"
+
+def setup_logging(mode: str = LOG_MODE, log_file: Optional[str] = PIPELINE_LOG_FILE) -> logging.Logger:
+    """
+    Configura los handlers del logger 'pipeline' (idempotente).
+    En modo 'summary' se emite desde INFO; en 'full' desde DEBUG.
+    """
+    level = logging.DEBUG if mode == 'full' else logging.INFO
+    root = logging.getLogger(_ROOT_LOGGER_NAME)
+    root.setLevel(level)
+    root.propagate = False
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
+
+    console = logging.StreamHandler(sys.stdout)
+    console.setFormatter(ConsoleFormatter('%(message)s'))
+    root.addHandler(console)
+
+    if log_file:
+        file_handler = logging.FileHandler(log_file, mode='a', encoding='utf-8')
+        file_handler.setFormatter(JsonLinesFormatter())
+        root.addHandler(file_handler)
+
+    return root
+
+def configure_modeller_log(mode: str = LOG_MODE) -> None:
+    """Nivel de log propio de Modeller: verbose en 'full', minimal en 'summary'."""
+    from modeller import log
+    if mode == 'full':
+        log.verbose()
+    else:
+        log.minimal()
+
+def _worker_log_files() -> List[str]:
+    files = []
+    for pattern in WORKER_LOG_PATTERNS:
+        files.extend(f for f in glob.glob(pattern) if os.path.isfile(f))
+    return sorted(set(files))
+
+def open_worker_log(path: str):
+    """
+    Abre (vaciándolo) el log de un worker en modo O_APPEND: al rotarlo, el
+    worker sigue escribiendo al final del archivo vaciado, sin dejar un hueco
+    de bytes nulos (archivo disperso) donde estaba el contenido anterior.
+    """
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | os.O_APPEND, 0o644)
+    return os.fdopen(fd, 'wb')
+
+def rotate_worker_logs(stage: str, min_size_mb: float = 0.0) -> int:
+    """
+    Comprime el contenido actual de los logs de los workers en
+    WORKER_LOG_DIR/<log>.<hora>.<etapa>.gz y los vacía (copytruncate: los
+    workers los abren con open_worker_log y siguen escribiendo al final). El
+    vaciado sigue inmediatamente a la última lectura en EOF, así que solo se
+    pierde lo que un worker escriba entre esa lectura y el truncado; rotar entre
+    tandas, con los workers en espera, evita también ese margen. Con
+    min_size_mb solo se rota si algún log lo supera (rotación dentro de una
+    etapa). Se conservan las WORKER_LOG_KEEP rotaciones más recientes de cada
+    worker. Retorna el número de logs rotados.
+    """
+    logger = get_logger('pipeline_log')
+    log_files = _worker_log_files()
+    if min_size_mb > 0 and not any(os.path.getsize(f) > min_size_mb * 1024 ** 2 for f in log_files):
+        return 0
+    os.makedirs(WORKER_LOG_DIR, exist_ok=True)
+    stamp = time.strftime('%Y%m%d-%H%M%S')
+    rotated = 0
+
+    for log_path in log_files:
+        if os.path.getsize(log_path) == 0:
+            continue
+        archive = os.path.join(WORKER_LOG_DIR, f'{os.path.basename(log_path)}.{stamp}.{stage}.gz')
+        try:
+            with open(log_path, 'r+b') as f_in, gzip.open(archive, 'wb', compresslevel=6) as f_out:
+                # Lo que el worker escriba mientras se comprime un bloque se lee en la vuelta
+                # siguiente; se vacía por el mismo descriptor justo tras la lectura en EOF
+                while True:
+                    chunk = f_in.read(1 << 20)
+                    if not chunk:
+                        os.ftruncate(f_in.fileno(), 0)
+                        break
+                    f_out.write(chunk)
+            rotated += 1
+        except OSError as e:
+            logger.warning(f"[LOG] No se pudo rotar el log de worker {log_path}. Error: {e}")
+            continue
+
+        archives = sorted(glob.glob(os.path.join(WORKER_LOG_DIR, f'{os.path.basename(log_path)}.*.gz')))
+        for old_archive in archives[:-WORKER_LOG_KEEP] if WORKER_LOG_KEEP > 0 else []:
+            os.remove(old_archive)
+
+    if rotated:
+        logger.log(logging.DEBUG if min_size_mb > 0 else logging.INFO, f"[LOG] {rotated} logs de workers comprimidos en {WORKER_LOG_DIR} (etapa: {stage})",
+                    extra={'stage': stage, 'count': rotated})
+    return rotated
+
+def rotate_large_worker_logs(stage: str) -> int:
+    """Rotación dentro de una etapa (tras una tanda o un paso de loop): solo si algún log supera WORKER_LOG_MAX_MB."""
+    return rotate_worker_logs(stage, WORKER_LOG_MAX_MB) if WORKER_LOG_MAX_MB > 0 else 0
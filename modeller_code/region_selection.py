@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+# region_selection.py
+
+"""
+Selección de las regiones a refinar según el perfil de energía DOPE-HR.
+
+Los huecos del alineamiento predichos como coil (find_missing_residues +
+get_flexible_missing_ranges) no siempre son las regiones peor modeladas: algunos
+quedan bien y hay segmentos alineados con mala energía. Con
+LOOP_SELECTION = 'profile', para cada modelo base se calcula el perfil DOPE-HR
+por residuo (normalizado y suavizado por Modeller), se marcan los residuos por
+encima del umbral y se agrupan en segmentos candidatos junto con los huecos del
+alineamiento. Cada candidato se puntúa por su exceso de energía sobre el umbral
+y solo los peores, dentro de REFINE_MAX_SEGMENTS y REFINE_MAX_RESIDUES, pasan a
+DynamicLoopRefiner. Los segmentos más largos que REFINE_MAX_RESIDUES se dividen
+en tramos que caben en el presupuesto (pdb_utils.split_loop_windows). Los huecos
+sin exceso de energía y los candidatos que no caben se registran en el log.
+"""
+
+import os
+import sys
+import argparse
+import statistics
+from typing import Dict, List, Optional, Tuple
+
+import pdb_utils
+import pipeline_log
+from config import CHAIN_ID, MIN_LOOP_LENGTH, PROFILE_SMOOTHING_WINDOW, PROFILE_THRESHOLD, PROFILE_THRESHOLD_SIGMA
+from config import PROFILE_MERGE_GAP, REFINE_MAX_SEGMENTS, REFINE_MAX_RESIDUES, ENERGY_PROFILE_DIR
+
+logger = pipeline_log.get_logger(__name__)
+
+Profile = List[Tuple[int, float]]   # (número de residuo, energía DOPE-HR suavizada)
+
+# =================================================================
+# PERFIL DE ENERGÍA
+# =================================================================
+
+def read_profile_file(profile_file: str) -> List[float]:
+    """Energías de un perfil de Modeller (ENERGY_PROFILE): última columna de cada línea de datos."""
+    energies = []
+    with open(profile_file, 'r') as f:
+        for line in f:
+            fields = line.split()
+            if fields and not line.startswith('#'):
+                energies.append(float(fields[-1]))
+    return energies
+
+def residue_energy_profile(env, pdb_file: str, chain_id: str = CHAIN_ID) -> Profile:
+    """
+    Perfil DOPE-HR por residuo de la cadena chain_id de un modelo. El perfil se
+    guarda en ENERGY_PROFILE_DIR (<modelo>.profile) y se reutiliza mientras el
+    PDB no cambie.
+    """
+    from modeller.scripts import complete_pdb
+    from modeller.selection import Selection
+
+    os.makedirs(ENERGY_PROFILE_DIR, exist_ok=True)
+    base = os.path.splitext(os.path.basename(pdb_file))[0]
+    profile_file = os.path.join(ENERGY_PROFILE_DIR, f'{base}.profile')
+
+    mdl = complete_pdb(env, pdb_file)
+    if not (os.path.exists(profile_file) and os.path.getmtime(profile_file) >= os.path.getmtime(pdb_file)):
+        temp_file = profile_file + '.tmp'
+        Selection(mdl).assess_dopehr(output='ENERGY_PROFILE NO_REPORT', file=temp_file,
+                                     normalize_profile=True, smoothing_window=PROFILE_SMOOTHING_WINDOW)
+        os.replace(temp_file, profile_file)
+
+    energies = read_profile_file(profile_file)
+    if len(energies) != len(mdl.residues):
+        raise ValueError(f"El perfil {profile_file} tiene {len(energies)} residuos y el modelo {len(mdl.residues)}")
+    return [(int(residue.num), energy) for residue, energy in zip(mdl.residues, energies)
+            if residue.chain.name == chain_id and not residue.hetatm]
+
+# =================================================================
+# SEGMENTOS CANDIDATOS
+# =================================================================
+
+def profile_threshold(profile: Profile, threshold: Optional[float] = PROFILE_THRESHOLD,
+                      sigma: float = PROFILE_THRESHOLD_SIGMA) -> float:
+    """Umbral fijo (PROFILE_THRESHOLD) o, si es None, media + sigma desviaciones del propio perfil."""
+    if threshold is not None:
+        return threshold
+    energies = [energy for _, energy in profile]
+    if len(energies) < 2:
+        return float('inf')
+    return statistics.fmean(energies) + sigma * statistics.pstdev(energies)
+
+def segment_excess(energy_by_residue: Dict[int, float], start: int, end: int, threshold: float) -> float:
+    """Exceso de energía de un segmento: suma de lo que cada residuo supera el umbral."""
+    return sum(max(0.0, energy_by_residue.get(r, threshold) - threshold) for r in range(start, end + 1))
+
+def _merge_ranges(ranges: List[Tuple[int, int]], gap: int) -> List[Tuple[int, int]]:
+    """Une los rangos que se solapan o están separados por 'gap' residuos o menos."""
+    merged: List[Tuple[int, int]] = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + gap + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+def _pad_to_min_length(start: int, end: int, first: int, last: int, min_length: int) -> Tuple[int, int]:
+    """Amplía un segmento por ambos lados hasta min_length residuos sin salir de la cadena."""
+    while end - start + 1 < min_length and (start > first or end < last):
+        if start > first:
+            start -= 1
+        if end - start + 1 < min_length and end < last:
+            end += 1
+    return start, end
+
+def candidate_segments(profile: Profile, gap_ranges: List[Tuple[int, int]], threshold: float,
+                       merge_gap: int = PROFILE_MERGE_GAP,
+                       min_length: int = MIN_LOOP_LENGTH,
+                       max_length: int = REFINE_MAX_RESIDUES) -> List[Dict[str, object]]:
+    """
+    Segmentos candidatos: tramos de residuos por encima del umbral (unidos si los
+    separan merge_gap residuos o menos) y huecos del alineamiento, fusionados
+    cuando se solapan. Los segmentos de más de max_length residuos (0 = sin
+    límite) se dividen en tramos de max_length, puntuados por separado.
+    Retorna [{'range', 'excess', 'source'}] con excess > 0.
+    """
+    if not profile:
+        return []
+    energy_by_residue = dict(profile)
+    residue_numbers = [r for r, _ in profile]
+    first, last = min(residue_numbers), max(residue_numbers)
+
+    high_runs = _merge_ranges([(r, r) for r, e in profile if e > threshold], merge_gap)
+    padded_runs = [_pad_to_min_length(s, e, first, last, min_length) for s, e in high_runs]
+    gap_set = {tuple(r) for r in gap_ranges}
+
+    candidates = []
+    for start, end in _merge_ranges(padded_runs + [tuple(r) for r in gap_ranges], 0):
+        contains_gap = any(s >= start and e <= end for s, e in gap_set)
+        source = 'gap' if (start, end) in gap_set else ('profile+gap' if contains_gap else 'profile')
+        pieces = pdb_utils.split_loop_windows(start, end, max_length, 0) if max_length else [(start, end)]
+        for piece_start, piece_end in pieces:
+            excess = segment_excess(energy_by_residue, piece_start, piece_end, threshold)
+            if excess <= 0.0:
+                logger.debug(f"  [PROFILE] {piece_start}-{piece_end} ({source}) sin exceso de energía; se omite.",
+                             extra={'stage': 'loop_refinement'})
+                continue
+            candidates.append({'range': (piece_start, piece_end), 'excess': excess,
+                               'source': source if len(pieces) == 1 else f'{source}, tramo'})
+    return candidates
+
+def select_segments(candidates: List[Dict[str, object]], max_segments: int = REFINE_MAX_SEGMENTS,
+                    max_residues: int = REFINE_MAX_RESIDUES) -> List[Dict[str, object]]:
+    """
+    Los candidatos con más exceso de energía que caben en el presupuesto
+    (max_segments segmentos, max_residues residuos en total; 0 = sin límite),
+    en orden de la secuencia.
+    """
+    selected = []
+    residues = 0
+    for candidate in sorted(candidates, key=lambda c: c['excess'], reverse=True):
+        start, end = candidate['range']
+        length = end - start + 1
+        if max_segments and len(selected) >= max_segments:
+            reason = f"ya hay {max_segments} segmentos (REFINE_MAX_SEGMENTS)"
+        elif max_residues and residues + length > max_residues:
+            reason = f"{length} residuos no caben en el presupuesto ({residues}/{max_residues}, REFINE_MAX_RESIDUES)"
+        else:
+            selected.append(candidate)
+            residues += length
+            continue
+        logger.info(f"  [PROFILE] Se omite {start}-{end} ({candidate['source']}, exceso {candidate['excess']:.3f}): {reason}",
+                    extra={'stage': 'loop_refinement', 'count': length})
+    return sorted(selected, key=lambda c: c['range'])
+
+def regions_for_model(env, pdb_file: str, gap_ranges: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """Regiones a refinar en un modelo base según su perfil DOPE-HR y los huecos del alineamiento."""
+    profile = residue_energy_profile(env, pdb_file)
+    threshold = profile_threshold(profile)
+    candidates = candidate_segments(profile, gap_ranges, threshold)
+    selected = select_segments(candidates)
+
+    logger.info(f"  [PROFILE] {os.path.basename(pdb_file)}: {len(candidates)} segmentos sobre el umbral "
+                f"({threshold:.4f}); se refinan {len(selected)}: "
+                + (', '.join(f"{c['range'][0]}-{c['range'][1]} ({c['source']}, {c['excess']:.3f})" for c in selected) or 'ninguno'),
+                extra={'stage': 'loop_refinement', 'model': os.path.basename(pdb_file), 'count': len(selected)})
+    return [c['range'] for c in selected]
+
+# =================================================================
+# CLI
+# =================================================================
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Segmentos a refinar según el perfil DOPE-HR de un modelo.")
+    parser.add_argument('pdb_file', help="Modelo a analizar")
+    parser.add_argument('--gaps', default='',
+                        help="Huecos del alineamiento a puntuar también (ej. '45-52,130-141')")
+    args = parser.parse_args(argv)
+
+    pipeline_log.setup_logging(log_file=None)
+    from modeller import Environ
+
+    env = Environ()
+    env.io.hetatm = True
+    env.io.atom_files_directory = ['.', '../atom_files']
+
+    gap_ranges = [tuple(int(v) for v in item.split('-')) for item in args.gaps.split(',') if item]
+    regions_for_model(env, args.pdb_file, gap_ranges)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
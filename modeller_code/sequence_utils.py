@@ -0,0 +1,349 @@
+#!/usr/bin/env python3
+# sequence_utils.py
+
+"""
+Utilidades de texto de secuencias que no requieren Modeller: residuos HETATM
+del template, lectura de alineamientos PIR, estructura secundaria del SS2 y
+detección de loops. Se importan en milisegundos, por lo que sirven para
+herramientas ligeras y scripts en lote; utils.py las reexporta para el pipeline.
+
+Los archivos de entrada (SS2, PDB de los templates) se leen una sola vez por
+ejecución: las lecturas se memorizan mientras el archivo no cambie.
+
+El módulo no importa config ni pipeline_log (que leen /proc/cpuinfo y el perfil
+de autotune al importarse): los valores de configuración llegan como
+argumentos y el logger es el hijo de 'pipeline' que configura pipeline_log.
+"""
+
+import os
+import re
+import copy
+import logging
+import functools
+from typing import List, Tuple, Dict, Any, Optional
+
+logger = logging.getLogger(f'pipeline.{__name__}')   # = pipeline_log.get_logger(__name__)
+
+def _parsed_once(parse):
+    """
+    Memoriza una función de lectura cuyo primer argumento es un archivo de
+    entrada: se vuelve a leer solo si cambia la fecha de modificación del archivo.
+    """
+    cache: Dict[Tuple[Any, ...], Any] = {}
+
+    @functools.wraps(parse)
+    def wrapper(path, *args, **kwargs):
+        try:
+            stamp = os.stat(path).st_mtime_ns
+        except OSError:
+            return parse(path, *args, **kwargs)
+        key = (os.path.abspath(path), stamp, args, tuple(sorted(kwargs.items())))
+        if key not in cache:
+            cache[key] = parse(path, *args, **kwargs)
+        return copy.copy(cache[key])
+    return wrapper
+
+# =================================================================
+# UTILIDADES PARA RESIDUOS HETATM / BLK
+# =================================================================
+
+@_parsed_once
+def extract_hetatm_residues(pdb_file: str, chain_id: str) -> List[Dict[str, Any]]:
+    """
+    Extrae información de residuos HETATM del archivo PDB template.
+    
+    Retorna una lista de diccionarios con información de cada residuo HETATM:
+    - resname: nombre del residuo (ej: BLK, HOH, etc.)
+    - resnum: número de residuo
+    - chain: cadena
+    - position_in_sequence: posición relativa en la secuencia (después de qué residuo ATOM)
+    """
+    hetatm_residues = []
+    last_atom_resnum = 0
+    seen_hetatm = set()
+    
+    try:
+        with open(pdb_file, 'r') as f:
+            for line in f:
+                if line.startswith('ATOM'):
+                    res_chain = line[21:22].strip()
+                    if res_chain == chain_id:
+                        try:
+                            resnum = int(line[22:26].strip())
+                            last_atom_resnum = max(last_atom_resnum, resnum)
+                        except ValueError:
+                            continue
+                
+                elif line.startswith('HETATM'):
+                    res_chain = line[21:22].strip()
+                    if res_chain == chain_id:
+                        resname = line[17:20].strip()
+                        try:
+                            resnum = int(line[22:26].strip())
+                        except ValueError:
+                            continue
+                        
+                        res_key = (resname, resnum, res_chain)
+                        if res_key not in seen_hetatm:
+                            seen_hetatm.add(res_key)
+                            hetatm_residues.append({
+                                'resname': resname,
+                                'resnum': resnum,
+                                'chain': res_chain,
+                                'position_after_atom_resnum': last_atom_resnum
+                            })
+        
+        hetatm_residues.sort(key=lambda x: x['resnum'])
+        
+        if hetatm_residues:
+            logger.info(f"\n[HETATM] Se detectaron {len(hetatm_residues)} residuos HETATM en {pdb_file} (cadena {chain_id}):")
+            for het in hetatm_residues:
+                logger.debug(f"  - {het['resname']} (resnum={het['resnum']}) después del residuo ATOM {het['position_after_atom_resnum']}")
+        
+        return hetatm_residues
+        
+    except FileNotFoundError:
+        logger.warning(f"Archivo PDB '{pdb_file}' no encontrado. No se detectaron residuos HETATM.")
+        return []
+
+def insert_blk_in_alignment(aligned_seq: str, hetatm_residues: List[Dict[str, Any]], 
+                            template_pdb_length: int) -> str:
+    """
+    Inserta caracteres '.' (BLK) en la secuencia alineada para representar residuos HETATM.
+    
+    Los residuos HETATM se insertan al final de la secuencia alineada, ya que típicamente
+    están al final del archivo PDB después de todos los residuos ATOM.
+    """
+    if not hetatm_residues:
+        return aligned_seq
+    
+    # Contar cuántos residuos no-gap tenemos en la secuencia alineada del template
+    residue_count = sum(1 for c in aligned_seq if c != '-')
+    
+    # Agregar un '.' por cada residuo HETATM al final de la secuencia
+    blk_chars = '.' * len(hetatm_residues)
+    aligned_seq_with_blk = aligned_seq + blk_chars
+    
+    logger.debug(f"\n[HETATM] Insertando {len(hetatm_residues)} caracteres BLK ('.') al final del alineamiento del template")
+    
+    return aligned_seq_with_blk
+
+# =================================================================
+# UTILIDADES DE ALINEAMIENTO Y PIR
+# =================================================================
+
+@_parsed_once
+def extract_ss_from_ss2(ss2_file: str, seq_full: str) -> str:
+    """Extrae la estructura secundaria predicha de un archivo PSIPRED SS2."""
+    ss_string = ""
+    seq_length = len(seq_full)
+    try:
+        with open(ss2_file, 'r') as f:
+            for line in f:
+                if line.startswith('#') or not line.strip(): 
+                    continue
+                parts = line.split()
+                if len(parts) >= 3:
+                    ss_string += parts[2]
+                    if len(ss_string) >= seq_length: 
+                        break
+        
+        if len(ss_string) < seq_length:
+            logger.warning(f"Longitud de SS extraída ({len(ss_string)}) es menor que la longitud de la secuencia objetivo ({seq_length}). Rellenando con 'C'.")
+            ss_string += 'C' * (seq_length - len(ss_string))
+
+        ss_string_sliced = ss_string[:seq_length]
+        logger.debug(f"[STEP 2.1] Estructura Secundaria extraída. Longitud utilizada: {len(ss_string_sliced)} para la línea CDE.")
+        return ss_string_sliced
+        
+    except FileNotFoundError:
+        logger.error(f"ERROR: Archivo PSIPRED SS2 '{ss2_file}' no encontrado.")
+        return ""
+
+def read_sequences_from_ali_temp(ali_file: str) -> Tuple[str, str]:
+    """Lee las secuencias alineadas (incluyendo gaps) de un archivo PIR/ALI."""
+    sequences_raw = ["", ""]
+    seq_index = -1
+    allowed_chars_re = re.compile(r'[A-Z\-\*\.]')  # Agregado '.' para BLK
+    
+    try:
+        with open(ali_file, 'r') as f:
+            lines = f.readlines()
+            in_sequence_block = False
+            current_raw_sequence = ""
+            for line in lines:
+                line_stripped = line.strip()
+                if line_stripped.startswith('>P1;'):
+                    if in_sequence_block:
+                        cleaned_sequence = "".join(allowed_chars_re.findall(current_raw_sequence.upper()))
+                        sequences_raw[seq_index] = cleaned_sequence.split('*')[0]
+                        current_raw_sequence = "" 
+                    seq_index += 1
+                    in_sequence_block = True
+                    continue 
+                if in_sequence_block and line_stripped:
+                    if line_stripped.startswith(('structureX', 'sequence', 'CDE:', '#')): 
+                        continue
+                    current_raw_sequence += line_stripped 
+                    if '*' in line_stripped and seq_index == 1:
+                        cleaned_sequence = "".join(allowed_chars_re.findall(current_raw_sequence.upper()))
+                        sequences_raw[seq_index] = cleaned_sequence.split('*')[0]
+                        break 
+        
+        if len(sequences_raw[0]) == 0 or len(sequences_raw[1]) == 0:
+            raise ValueError("No se pudieron extraer dos secuencias alineadas válidas del archivo PIR.")
+        
+        return sequences_raw[0], sequences_raw[1]
+    except Exception as e:
+        raise IOError(f"Error al leer el archivo de alineamiento PIR. Revise el formato. Error: {e}")
+
+def read_aligned_sequences_from_ali(ali_file: str) -> List[Tuple[str, str]]:
+    """
+    Lee todas las entradas (código, secuencia alineada) de un archivo PIR/ALI.
+    Versión general de read_sequences_from_ali_temp para alineamientos con varios templates.
+    """
+    entries: List[Tuple[str, str]] = []
+    allowed_chars_re = re.compile(r'[A-Z\-\*\.]')
+    current_code = None
+    current_raw_sequence = ""
+
+    with open(ali_file, 'r') as f:
+        for line in f:
+            line_stripped = line.strip()
+            if line_stripped.startswith('>P1;'):
+                current_code = line_stripped[4:]
+                current_raw_sequence = ""
+                continue
+            if current_code is None or not line_stripped:
+                continue
+            if line_stripped.startswith(('structure', 'sequence', 'CDE:', '#')):
+                continue
+            current_raw_sequence += line_stripped
+            if '*' in line_stripped:
+                cleaned_sequence = "".join(allowed_chars_re.findall(current_raw_sequence.upper()))
+                entries.append((current_code, cleaned_sequence.split('*')[0]))
+                current_code = None
+
+    if len(entries) < 2:
+        raise ValueError(f"Se esperaban al menos dos secuencias alineadas en {ali_file}, se encontraron {len(entries)}.")
+    return entries
+
+def alignment_sequences(aln) -> List[Tuple[str, str]]:
+    """
+    Entradas (código, secuencia alineada) de un objeto Alignment de Modeller,
+    leídas de sus posiciones en memoria en lugar de escribir y releer un PIR.
+    Los huecos son '-' y los residuos BLK '.', igual que en el archivo PIR.
+    """
+    positions = list(aln.positions)
+    entries: List[Tuple[str, str]] = []
+    for seq in aln:
+        chars = []
+        for position in positions:
+            residue = position.get_residue(seq)
+            chars.append(residue.code.upper() if residue is not None else '-')
+        entries.append((seq.code, "".join(chars)))
+    return entries
+
+def build_cde_line(aligned_target_seq: str, ss_string: str) -> str:
+    """
+    Línea CDE del target: la estructura secundaria de cada residuo, '.' en los
+    huecos y 'C' si el SS2 es más corto que la secuencia.
+    """
+    ss_iter = iter(ss_string)
+    return "CDE:" + "".join('.' if char == '-' else next(ss_iter, 'C') for char in aligned_target_seq)
+
+def pir_entry(code: str, description: str, aligned_seq: str, comment: Optional[str] = None) -> str:
+    """Texto de una entrada PIR (cabecera, descripción, comentario opcional y secuencia)."""
+    comment_line = f"{comment}\n" if comment else ""
+    return f">P1;{code}\n{description}\n{comment_line}{aligned_seq}*\n"
+
+def merge_template_sequences(aligned_template_seqs: List[str]) -> str:
+    """
+    Combina las secuencias alineadas de varios templates en una sola: en cada
+    columna se toma el primer residuo presente. Así un residuo del target solo
+    cuenta como faltante (loop) si ningún template lo cubre.
+    """
+    if len(aligned_template_seqs) == 1:
+        return aligned_template_seqs[0]
+    merged = []
+    for column in zip(*aligned_template_seqs):
+        residues = [c for c in column if c != '-']
+        merged.append(residues[0] if residues else '-')
+    return "".join(merged)
+
+# =================================================================
+# UTILIDADES DE DETECCIÓN DE LOOPS
+# =================================================================
+
+def agrupar_rangos(lista: List[int]) -> List[Tuple[int, int]]:
+    """Agrupa una lista de números de residuo individuales en rangos secuenciales."""
+    if not lista: 
+        return []
+    lista = sorted(lista)
+    ranges = []
+    start = lista[0]
+    end = lista[0]
+    for n in lista[1:]:
+        if n == end + 1: 
+            end = n
+        else: 
+            ranges.append((start, end))
+            start = n
+            end = n
+    ranges.append((start, end))
+    return ranges
+
+def find_missing_residues(aligned_template_seq: str, aligned_target_seq: str) -> List[Tuple[int, int]]:
+    """
+    Identifica los segmentos de inserción (loops) en la secuencia objetivo.
+    Ignora los residuos BLK (representados por '.') en el análisis de loops.
+    """
+    missing_residues: List[int] = []
+    target_res_num = 0 
+
+    if len(aligned_template_seq) != len(aligned_target_seq):
+        logger.error("\n[ERROR FATAL] Las longitudes de las secuencias alineadas son diferentes. No se puede detectar los loops.")
+        return []
+
+    for template_char, target_char in zip(aligned_template_seq, aligned_target_seq):
+        
+        # Ignorar residuos BLK - no son parte de la proteína
+        if template_char == '.':
+            continue
+        
+        if target_char != '-':
+            target_res_num += 1
+        
+        if template_char == '-' and target_char.isalpha():
+            missing_residues.append(target_res_num)
+        
+    missing_ranges = agrupar_rangos(missing_residues)
+    
+    range_strings = [f"[{s}-{e}]" if s != e else f"[{s}]" for s, e in missing_ranges]
+    logger.info(f"\n[STEP 1] Rangos de residuos faltantes (loops) detectados: {range_strings}")
+    
+    return missing_ranges
+
+def get_flexible_missing_ranges(missing_ranges: List[Tuple[int, int]], ss2_file: str,
+                                seq_full: str) -> List[Tuple[int, int]]:
+    """
+    Filtra los loops para incluir SOLO aquellos residuos predichos como 'Coil' ('C')
+    según el SS2 de la secuencia completa. utils.get_flexible_missing_ranges usa
+    SS2_FILE y sequence_full de config.py.
+    """
+    ss_string_full = extract_ss_from_ss2(ss2_file, seq_full)
+    if not ss_string_full: 
+        return missing_ranges
+        
+    flexible_residues_to_refine = set()
+    for start, end in missing_ranges:
+        for res_num in range(start, end + 1):
+            ss_index = res_num - 1
+            if ss_index < len(ss_string_full) and ss_string_full[ss_index] == 'C':
+                flexible_residues_to_refine.add(res_num)
+
+    final_flexible_ranges = agrupar_rangos(list(flexible_residues_to_refine))
+    range_strings = [f"[{s}-{e}]" if s != e else f"[{s}]" for s, e in final_flexible_ranges]
+    logger.info(f"\n[STEP 4.0] Loops flexibles ('C') dentro de regiones faltantes seleccionados para refinamiento: {range_strings}")
+    
+    return final_flexible_ranges
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# stage_cache.py
+
+import os
+import json
+import hashlib
+from typing import List, Dict, Any, Optional, Iterable
+
+import config
+from config import STAGE_CACHE_DIR, USE_STAGE_CACHE
+import pipeline_log
+
+logger = pipeline_log.get_logger(__name__)
+
+# =================================================================
+# CACHÉ DE ETAPAS DIRIGIDA POR CONTENIDO
+# =================================================================
+# Cada etapa del pipeline guarda sus salidas junto a una clave (hash) calculada
+# a partir de sus entradas reales: contenido de archivos, valores de config
+# relevantes y la versión del código que la ejecuta. Si la clave coincide y los
+# archivos de salida siguen en disco con el mismo tamaño, la etapa no se repite.
+
+_digest_memo: Dict[str, Any] = {}
+
+def file_digest(path: str) -> str:
+    """SHA-256 del contenido de un archivo ('' si no existe). Se memoriza por (tamaño, mtime)."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return ''
+    memo_key = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+    if memo_key in _digest_memo:
+        return _digest_memo[memo_key]
+
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    digest = h.hexdigest()
+    _digest_memo[memo_key] = digest
+    return digest
+
+def code_version(module_files: Iterable[str]) -> str:
+    """Hash combinado del código fuente de los módulos que implementan una etapa."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    h = hashlib.sha256()
+    for module_file in sorted(module_files):
+        h.update(module_file.encode())
+        h.update(file_digest(os.path.join(here, module_file)).encode())
+    return h.hexdigest()
+
+def stage_key(stage: str, inputs: Dict[str, Any]) -> str:
+    """Clave de una etapa: hash de su nombre y de sus entradas serializadas de forma canónica."""
+    payload = json.dumps({'stage': stage, 'inputs': inputs}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+def _stage_file(stage: str) -> str:
+    return os.path.join(STAGE_CACHE_DIR, f'{stage}.json')
+
+def _write_json_atomic(path: str, data: Any) -> None:
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    temp_file = path + '.tmp'
+    with open(temp_file, 'w') as f:
+        json.dump(data, f)
+    os.replace(temp_file, path)
+
+def load_stage(stage: str, key: str) -> Optional[Any]:
+    """
+    Retorna el resultado guardado de una etapa si su clave coincide y todas sus
+    salidas existen con el tamaño registrado. En otro caso retorna None.
+    """
+    if not USE_STAGE_CACHE:
+        return None
+
+    try:
+        with open(_stage_file(stage), 'r') as f:
+            record = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if record.get('key') != key:
+        logger.info(f"[CACHE] Entradas de la etapa '{stage}' modificadas. Se ejecutará de nuevo.")
+        return None
+
+    for path, size in record.get('outputs', {}).items():
+        try:
+            if os.path.getsize(path) != size:
+                raise OSError(f"tamaño distinto: {path}")
+        except OSError:
+            logger.info(f"[CACHE] Falta o cambió la salida '{path}' de la etapa '{stage}'. Se ejecutará de nuevo.")
+            return None
+
+    logger.info(f"[CACHE] Etapa '{stage}' sin cambios. Reutilizando resultado guardado.")
+    return record.get('result')
+
+def last_result(stage: str) -> Optional[Any]:
+    """
+    Último resultado guardado de una etapa, sin comprobar su clave. Para
+    herramientas de análisis que consultan una ejecución ya terminada.
+    """
+    try:
+        with open(_stage_file(stage), 'r') as f:
+            return json.load(f).get('result')
+    except (OSError, ValueError):
+        return None
+
+def save_stage(stage: str, key: str, result: Any, outputs: Iterable[str] = ()) -> None:
+    """Guarda el resultado de una etapa junto con el tamaño de sus archivos de salida."""
+    if not USE_STAGE_CACHE:
+        return
+
+    output_sizes = {}
+    for path in outputs:
+        try:
+            output_sizes[path] = os.path.getsize(path)
+        except OSError:
+            logger.info(f"[CACHE] La salida '{path}' de la etapa '{stage}' no existe. No se guarda en caché.")
+            return
+
+    try:
+        _write_json_atomic(_stage_file(stage), {'key': key, 'result': result, 'outputs': output_sizes})
+    except OSError as e:
+        logger.warning(f"No se pudo guardar la caché de la etapa '{stage}'. Error: {e}")
+
+# =================================================================
+# CACHÉ POR ARCHIVO (EVALUACIÓN DE MODELOS)
+# =================================================================
+
+def file_stat_key(path: str) -> str:
+    """Identificador barato de la versión de un archivo (tamaño y mtime), sin leer su contenido."""
+    st = os.stat(path)
+    return f"{st.st_size}:{st.st_mtime_ns}"
+
+def load_item_cache(name: str, version: str) -> Dict[str, Any]:
+    """Lee una caché por elementos (ej. puntuaciones por modelo). Se descarta si cambió la versión."""
+    if not USE_STAGE_CACHE:
+        return {}
+    try:
+        with open(_stage_file(name), 'r') as f:
+            record = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if record.get('version') != version:
+        return {}
+    return record.get('items', {})
+
+def save_item_cache(name: str, version: str, items: Dict[str, Any]) -> None:
+    """Guarda una caché por elementos."""
+    if not USE_STAGE_CACHE:
+        return
+    try:
+        _write_json_atomic(_stage_file(name), {'version': version, 'items': items})
+    except OSError as e:
+        logger.warning(f"No se pudo guardar la caché '{name}'. Error: {e}")
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+# template_prep.py
+
+"""
+Preparación automática del template PDB (sustituye los pasos manuales del README):
+limpieza de aguas/iones, eliminación de metadata, unión de cadenas en una sola,
+renumeración de residuos y conversión de cadenas seleccionadas a HETATM.
+
+No requiere Modeller: procesa el PDB línea a línea y guarda el resultado en
+caché según el hash del archivo de entrada y de los parámetros.
+
+Uso:
+    python3 template_prep.py 8vx1.pdb
+    python3 template_prep.py 8vx1.pdb --hetatm-chains B,C -o 8vx1_prep.pdb
+    python3 template_prep.py templates/*.pdb --exclude HOH,NA,CL
+"""
+
+import os
+import sys
+import argparse
+from typing import List, Dict, Any, Optional, Iterable
+
+import config
+import stage_cache
+import pipeline_log
+from config import CHAIN_ID, TEMPLATE_EXCLUDE_RESNAMES, TEMPLATE_HETATM_CHAINS
+
+logger = pipeline_log.get_logger(__name__)
+
+THREE_TO_ONE = {
+    'ALA': 'A', 'ARG': 'R', 'ASN': 'N', 'ASP': 'D', 'CYS': 'C', 'GLN': 'Q', 'GLU': 'E',
+    'GLY': 'G', 'HIS': 'H', 'ILE': 'I', 'LEU': 'L', 'LYS': 'K', 'MET': 'M', 'PHE': 'F',
+    'PRO': 'P', 'SER': 'S', 'THR': 'T', 'TRP': 'W', 'TYR': 'Y', 'VAL': 'V',
+    'MSE': 'M', 'HSD': 'H', 'HSE': 'H', 'HIE': 'H', 'HID': 'H'
+}
+
+def prepared_template_name(raw_pdb: str) -> str:
+    """Nombre por defecto del template preparado: original_prep.pdb"""
+    root, _ = os.path.splitext(raw_pdb)
+    return f"{root}_prep.pdb"
+
+def _prep_stage_key(raw_pdb: str, chain_id: str, exclude_resnames: Iterable[str],
+                    hetatm_chains: Iterable[str], keep_chains: Optional[Iterable[str]]) -> str:
+    return stage_cache.stage_key('template_prep', {
+        'raw': stage_cache.file_digest(raw_pdb),
+        'chain_id': chain_id,
+        'exclude': sorted(exclude_resnames),
+        'hetatm_chains': sorted(hetatm_chains),
+        'keep_chains': sorted(keep_chains) if keep_chains else None,
+        'code': stage_cache.code_version(['template_prep.py'])
+    })
+
+def prepare_template(raw_pdb: str,
+                     output_pdb: Optional[str] = None,
+                     chain_id: str = CHAIN_ID,
+                     exclude_resnames: Iterable[str] = TEMPLATE_EXCLUDE_RESNAMES,
+                     hetatm_chains: Iterable[str] = TEMPLATE_HETATM_CHAINS,
+                     keep_chains: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+    """
+    Prepara un PDB crudo para usarlo como template de Modeller.
+
+    - Conserva solo registros ATOM/HETATM/TER (elimina REMARK, HEADER, CONECT...).
+    - Descarta los residuos cuyo nombre está en exclude_resnames (aguas, iones...).
+    - Descarta ubicaciones alternativas distintas de ' '/'A'.
+    - Si keep_chains se indica, descarta el resto de cadenas originales.
+    - Escribe como HETATM las cadenas originales de hetatm_chains y como ATOM el resto.
+    - Reasigna todos los residuos a la cadena chain_id y los renumera desde 1.
+
+    Retorna un resumen con el archivo de salida, residuos ATOM/HETATM y la
+    secuencia de una letra de la proteína (útil para 'pdb_aa' en config.py).
+    """
+    output_pdb = output_pdb or prepared_template_name(raw_pdb)
+    exclude = {r.strip().upper() for r in exclude_resnames}
+    hetatm_set = set(hetatm_chains)
+    keep_set = set(keep_chains) if keep_chains else None
+
+    stage_name = f"template_prep_{os.path.basename(output_pdb)}"
+    key = _prep_stage_key(raw_pdb, chain_id, exclude, hetatm_set, keep_set)
+    cached = stage_cache.load_stage(stage_name, key)
+    if cached:
+        logger.info(f"[PREP] Template preparado reutilizado desde caché: {output_pdb}")
+        return cached
+
+    current_residue = None
+    new_resnum = 0
+    atom_serial = 0
+    removed_residues = set()
+    atom_residues = 0
+    hetatm_residues = 0
+    sequence_one_letter = []
+    last_written_record = None
+
+    temp_output = output_pdb + '.tmp'
+    with open(raw_pdb, 'r') as f_in, open(temp_output, 'w') as f_out:
+        for line in f_in:
+            record_name = line[0:6].strip()
+
+            if record_name in ("ATOM", "HETATM"):
+                resname = line[17:20].strip()
+                original_chain = line[21]
+                altloc = line[16]
+
+                if resname.upper() in exclude:
+                    removed_residues.add((resname, original_chain, line[22:27]))
+                    continue
+                if keep_set is not None and original_chain.strip() not in keep_set:
+                    continue
+                if altloc not in (' ', 'A'):
+                    continue
+
+                # (resname, cadena original, número + código de inserción originales)
+                res_id = (resname, original_chain, line[22:27])
+                is_hetatm = original_chain.strip() in hetatm_set
+
+                if res_id != current_residue:
+                    new_resnum += 1
+                    current_residue = res_id
+                    if is_hetatm:
+                        hetatm_residues += 1
+                    else:
+                        atom_residues += 1
+                        sequence_one_letter.append(THREE_TO_ONE.get(resname.upper(), 'X'))
+
+                atom_serial += 1
+                new_record_name = "HETATM" if is_hetatm else "ATOM  "
+                # Columnas: registro (1-6), serial (7-11), altloc vacío (17), cadena (22),
+                # número de residuo (23-26) e inserción vacía (27)
+                new_line = (new_record_name + f"{atom_serial % 100000:5d}" + line[11:16] + ' '
+                            + line[17:21] + chain_id + f"{new_resnum:4d}" + ' ' + line[27:])
+                if not new_line.endswith('\n'):
+                    new_line += '\n'
+                f_out.write(new_line)
+                last_written_record = record_name
+
+            elif record_name == "TER":
+                # Un solo TER por bloque y solo si hubo átomos antes
+                if last_written_record in ("ATOM", "HETATM"):
+                    f_out.write(f"TER   {(atom_serial + 1) % 100000:5d}      {current_residue[0]:>3} {chain_id}{new_resnum:4d}\n")
+                    last_written_record = "TER"
+
+        f_out.write("END\n")
+    os.replace(temp_output, output_pdb)
+
+    summary = {
+        'output': output_pdb,
+        'atom_residues': atom_residues,
+        'hetatm_residues': hetatm_residues,
+        'removed_residues': len(removed_residues),
+        'sequence': ''.join(sequence_one_letter)
+    }
+
+    logger.info(f"[PREP] Template preparado: {raw_pdb} -> {output_pdb}")
+    logger.info(f"[PREP]   Residuos ATOM: {atom_residues} | HETATM: {hetatm_residues} | Eliminados: {len(removed_residues)} | Cadena: {chain_id}")
+
+    stage_cache.save_stage(stage_name, key, summary, outputs=[output_pdb])
+    return summary
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Prepara templates PDB para el pipeline de Modeller.")
+    parser.add_argument('pdb_files', nargs='+', help="PDB(s) crudos a preparar")
+    parser.add_argument('-o', '--output', help="Archivo de salida (solo con un PDB de entrada)")
+    parser.add_argument('--chain', default=CHAIN_ID, help="Cadena final de todos los residuos")
+    parser.add_argument('--hetatm-chains', default=','.join(TEMPLATE_HETATM_CHAINS),
+                        help="Cadenas originales a escribir como HETATM, separadas por comas (ej: B,D)")
+    parser.add_argument('--exclude', default=','.join(TEMPLATE_EXCLUDE_RESNAMES),
+                        help="Nombres de residuo a eliminar, separados por comas")
+    parser.add_argument('--keep-chains', default='',
+                        help="Conservar solo estas cadenas originales, separadas por comas")
+    parser.add_argument('--show-sequence', action='store_true',
+                        help="Imprime la secuencia de una letra resultante (para 'pdb_aa')")
+    args = parser.parse_args(argv)
+    pipeline_log.setup_logging(log_file=None)
+
+    if args.output and len(args.pdb_files) > 1:
+        parser.error("-o/--output solo puede usarse con un único PDB de entrada.")
+
+    split = lambda value: [v.strip() for v in value.split(',') if v.strip()]
+
+    status = 0
+    for pdb_file in args.pdb_files:
+        try:
+            summary = prepare_template(pdb_file,
+                                       output_pdb=args.output,
+                                       chain_id=args.chain,
+                                       exclude_resnames=split(args.exclude),
+                                       hetatm_chains=split(args.hetatm_chains),
+                                       keep_chains=split(args.keep_chains) or None)
+            if args.show_sequence:
+                print(f"{summary['output']}: {summary['sequence']}")
+        except OSError as e:
+            print(f"[ERROR] No se pudo preparar {pdb_file}. Error: {e}")
+            status = 1
+    return status
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# template_selection.py
+
+"""
+Modo multi-template: alinea sequence_full contra cada PDB candidato de un
+directorio en un pool de procesos, rankea los templates por cobertura e
+identidad del alineamiento y selecciona los mejores para el PIR y AutoModel.
+"""
+
+import os
+import re
+import csv
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import List, Tuple, Dict, Any
+
+import config
+import stage_cache
+import pipeline_log
+from config import CHAIN_ID, sequence_full, NUM_PROCESSORS, TEMPLATE_RANKING_FILE
+
+logger = pipeline_log.get_logger(__name__)
+
+def template_code_from_file(pdb_file: str) -> str:
+    """Código de alineamiento de un template: nombre del archivo sin extensión ni caracteres especiales."""
+    base = os.path.splitext(os.path.basename(pdb_file))[0]
+    return re.sub(r'[^A-Za-z0-9_]', '_', base)
+
+def alignment_coverage_identity(aligned_template_seq: str, aligned_target_seq: str) -> Tuple[float, float]:
+    """
+    Cobertura: fracción de residuos del target alineados con un residuo del template.
+    Identidad: fracción de esos pares alineados con el mismo aminoácido.
+    Las columnas BLK ('.') no cuentan.
+    """
+    target_residues = 0
+    aligned_pairs = 0
+    identical_pairs = 0
+    for template_char, target_char in zip(aligned_template_seq, aligned_target_seq):
+        if template_char == '.' or target_char in ('-', '.'):
+            continue
+        target_residues += 1
+        if template_char != '-':
+            aligned_pairs += 1
+            if template_char == target_char:
+                identical_pairs += 1
+
+    coverage = aligned_pairs / target_residues if target_residues else 0.0
+    identity = identical_pairs / aligned_pairs if aligned_pairs else 0.0
+    return coverage, identity
+
+def _score_template(template_file: str) -> Dict[str, Any]:
+    """
+    Alinea un template candidato contra la secuencia objetivo (se ejecuta en un
+    proceso del pool, con su propio Environ de Modeller).
+    """
+    from modeller import Environ, Alignment, Model, log
+    import sequence_utils
+
+    log.none()
+    env = Environ()
+    env.io.hetatm = True
+    env.io.atom_files_directory = ['.', '../atom_files']
+
+    code = template_code_from_file(template_file)
+    aln = Alignment(env)
+    mdl = Model(env, file=template_file)
+    aln.append_model(mdl, align_codes=code, atom_files=template_file)
+    aln.append_sequence(sequence_full)
+    aln[1].code = config.ALIGN_CODE_SEQUENCE
+    aln.salign()
+    aligned_entries = sequence_utils.alignment_sequences(aln)
+
+    coverage, identity = alignment_coverage_identity(aligned_entries[0][1], aligned_entries[1][1])
+    return {
+        'code': code,
+        'file': template_file,
+        'coverage': coverage,
+        'identity': identity,
+        'score': coverage * identity
+    }
+
+def rank_templates(template_dir: str, processes: int = NUM_PROCESSORS) -> List[Dict[str, Any]]:
+    """
+    Alinea en paralelo todos los PDB de template_dir contra sequence_full y los
+    ordena por cobertura x identidad (desempate por cobertura). El ranking se
+    guarda en caché según el contenido de los templates y de la secuencia.
+    """
+    template_files = sorted(
+        os.path.join(template_dir, f) for f in os.listdir(template_dir) if f.lower().endswith('.pdb')
+    )
+    if not template_files:
+        raise FileNotFoundError(f"No hay archivos PDB candidatos en '{template_dir}'.")
+
+    key = stage_cache.stage_key('template_ranking', {
+        'templates': {f: stage_cache.file_digest(f) for f in template_files},
+        'sequence_full': sequence_full,
+        'chain_id': CHAIN_ID,
+        'code': stage_cache.code_version(['template_selection.py', 'sequence_utils.py'])
+    })
+    cached = stage_cache.load_stage('template_ranking', key)
+    if cached:
+        return cached
+
+    logger.info(f"\n[STEP 2.0] Alineando {len(template_files)} templates candidatos con {processes} procesos...")
+    results: List[Dict[str, Any]] = []
+    with ProcessPoolExecutor(max_workers=max(1, processes)) as pool:
+        futures = {pool.submit(_score_template, f): f for f in template_files}
+        for future in as_completed(futures):
+            template_file = futures[future]
+            try:
+                result = future.result()
+                results.append(result)
+                logger.debug(f"  -> {template_file:<40} | Cobertura: {result['coverage']:.3f} | Identidad: {result['identity']:.3f}")
+            except Exception as e:
+                logger.error(f"  Falló el alineamiento de {template_file}. Error: {e}")
+
+    ranking = sorted(results, key=lambda r: (r['score'], r['coverage']), reverse=True)
+
+    try:
+        with open(TEMPLATE_RANKING_FILE, 'w', newline='') as csvfile:
+            writer = csv.DictWriter(csvfile, fieldnames=['Rank', 'Code', 'File', 'Coverage', 'Identity', 'Score'])
+            writer.writeheader()
+            for rank, r in enumerate(ranking, start=1):
+                writer.writerow({
+                    'Rank': rank, 'Code': r['code'], 'File': r['file'],
+                    'Coverage': f"{r['coverage']:.3f}", 'Identity': f"{r['identity']:.3f}", 'Score': f"{r['score']:.3f}"
+                })
+        logger.info(f"[STEP 2.0] Ranking de templates exportado a: {TEMPLATE_RANKING_FILE}")
+    except OSError as e:
+        logger.warning(f"No se pudo escribir el ranking de templates. Error: {e}")
+
+    stage_cache.save_stage('template_ranking', key, ranking)
+    return ranking
+
+def select_templates(ranking: List[Dict[str, Any]], num_templates: int) -> List[Tuple[str, str]]:
+    """Retorna los (código, archivo) de los mejores templates para el PIR y los 'knowns' de AutoModel."""
+    selected = [(r['code'], r['file']) for r in ranking[:max(1, num_templates)]]
+    logger.info(f"[STEP 2.0] Templates seleccionados: {', '.join(code for code, _ in selected)}")
+    return selected
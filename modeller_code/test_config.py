@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Pruebas de la resolución de NUM_PROCESSORS y NUM_MODELS_LOOP en config.py
+(perfil de autotune o CPUs de SLURM).
+No requieren Modeller: python3 -m pytest test_config.py
+"""
+
+import json
+import importlib
+
+import pytest
+
+import config
+
+@pytest.fixture
+def reload_config(tmp_path, monkeypatch):
+    """Recarga config.py con el entorno de la prueba y lo deja como estaba al terminar."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('SLURM_CPUS_PER_TASK', '8')
+    monkeypatch.setenv('MODELLER_NODE_TYPE', 'nodo-prueba')
+    yield lambda: importlib.reload(config)
+    monkeypatch.undo()
+    importlib.reload(config)
+
+def write_profile(tmp_path, processors, models_loop):
+    profile_dir = tmp_path / 'autotune_profiles'
+    profile_dir.mkdir()
+    (profile_dir / 'nodo-prueba.json').write_text(json.dumps({'NUM_PROCESSORS': processors, 'NUM_MODELS_LOOP': models_loop}))
+
+def test_without_profile_uses_slurm_cpus(reload_config, monkeypatch):
+    monkeypatch.setenv('MODELLER_USE_AUTOTUNE', '0')
+    reload_config()
+    assert (config.NUM_PROCESSORS, config.NUM_MODELS_LOOP) == (8, 8)
+    assert config.AUTOTUNE_OVERRIDES == {}
+
+def test_profile_fills_unset_values(reload_config, monkeypatch, tmp_path):
+    write_profile(tmp_path, processors=12, models_loop=24)
+    monkeypatch.setenv('MODELLER_USE_AUTOTUNE', '1')
+    reload_config()
+    assert (config.NUM_PROCESSORS, config.NUM_MODELS_LOOP) == (12, 24)
+    assert config.AUTOTUNE_OVERRIDES == {'NUM_PROCESSORS': (8, 12), 'NUM_MODELS_LOOP': (8, 24)}
+
+def test_missing_profile_falls_back_to_slurm_cpus(reload_config, monkeypatch):
+    monkeypatch.setenv('MODELLER_USE_AUTOTUNE', '1')
+    reload_config()
+    assert (config.NUM_PROCESSORS, config.NUM_MODELS_LOOP) == (8, 8)
+    assert config.AUTOTUNE_PROFILE == {}
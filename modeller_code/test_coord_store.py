@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Pruebas del almacén de coordenadas (coord_store.py): se escriben PDBs
+sintéticos, se construye el almacén y se leen de vuelta las coordenadas.
+No requieren Modeller: python3 -m pytest test_coord_store.py
+"""
+
+import os
+import json
+
+import numpy as np
+import pytest
+
+import coord_store
+import output_layout
+
+# (residuo, nombre de residuo, átomo) del modelo de referencia
+ATOMS = [(1, 'MET', 'N'), (1, 'MET', 'CA'), (1, 'MET', 'C'),
+         (2, 'GLY', 'N'), (2, 'GLY', 'CA'), (2, 'GLY', 'C'),
+         (3, 'LYS', 'N'), (3, 'LYS', 'CA'), (3, 'LYS', 'C')]
+
+def model_xyz(model_number):
+    return np.array([(model_number, i, 0.5 * i - model_number) for i in range(len(ATOMS))], dtype=np.float32)
+
+def write_model(path, xyz, atoms=ATOMS, altloc_b=False):
+    lines = []
+    for serial, ((resnum, resname, name), (x, y, z)) in enumerate(zip(atoms, xyz), start=1):
+        lines.append(f"ATOM  {serial:5d}  {name:<3} {resname:3} A{resnum:4d}    {x:8.3f}{y:8.3f}{z:8.3f}  1.00  0.00\n")
+        if altloc_b:
+            lines.append(f"ATOM  {serial:5d}  {name:<3}B{resname:3} A{resnum:4d}    {99.0:8.3f}{99.0:8.3f}{99.0:8.3f}  0.50  0.00\n")
+    path.write_text(''.join(lines) + 'END\n')
+    return str(path)
+
+@pytest.fixture
+def models(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(coord_store.stage_cache, 'USE_STAGE_CACHE', True)
+    monkeypatch.setattr(coord_store.stage_cache, 'STAGE_CACHE_DIR', str(tmp_path / '.stage_cache'))
+    records = []
+    for number in (1, 2, 3):
+        path = write_model(tmp_path / f'AUTO_{number}.pdb', model_xyz(number), altloc_b=number == 2)
+        records.append({'name': f'AUTO_{number}.pdb', 'path': path, 'stage': 'automodel',
+                        'DOPEHR score': -1000.0 - number, 'DOPEHR Z-score': -1.0})
+    # Orden de átomos distinto, sin el CA del residuo 3 y con un átomo que no está en la referencia
+    xyz = model_xyz(4)
+    order = [8, 7, 6, 3, 4, 5, 0, 1, 2]
+    atoms = [ATOMS[i] for i in order if i != 7] + [(3, 'LYS', 'CB')]
+    coords = np.vstack([xyz[[i for i in order if i != 7]], [[7.0, 7.0, 7.0]]])
+    path = write_model(tmp_path / 'AUTO_1_LOOP1_R1.pdb', coords, atoms=atoms)
+    records.append({'name': 'AUTO_1_LOOP1_R1.pdb', 'path': path, 'stage': 'loop_refinement'})
+    return records
+
+def test_read_atoms_ignores_alternate_locations(models):
+    keys, resnames, xyz = coord_store.read_atoms(models[1]['path'])
+    assert keys == [('A', resnum, name) for resnum, _, name in ATOMS]
+    assert resnames == [resname for _, resname, _ in ATOMS]
+    np.testing.assert_allclose(xyz, model_xyz(2))
+
+def test_atom_and_residue_index():
+    keys = [('A', resnum, name) for resnum, _, name in ATOMS]
+    atoms, residues = coord_store.atom_index(keys, [resname for _, resname, _ in ATOMS])
+    assert atoms['residue'].tolist() == [0, 0, 0, 1, 1, 1, 2, 2, 2]
+    assert [tuple(r) for r in residues.tolist()] == [('A', 1, 'MET', 0, 3), ('A', 2, 'GLY', 3, 6), ('A', 3, 'LYS', 6, 9)]
+
+def test_build_and_open_round_trip(models):
+    store_dir = coord_store.build_store(models, 'store')
+    store = coord_store.open_store(store_dir)
+    assert len(store) == 4 and store.coords.shape == (4, 9, 3)
+    assert isinstance(store.coords, np.memmap)
+    for row in range(3):
+        np.testing.assert_allclose(store.coords[row], model_xyz(row + 1))
+    # El modelo con otro orden se coloca átomo a átomo; el CA ausente queda en NaN y el CB sobrante se descarta
+    expected = model_xyz(4)
+    expected[7] = np.nan
+    np.testing.assert_allclose(store.coords[3], expected)
+
+    assert [m['Model Name'] for m in store.models] == [m['name'] for m in models]
+    assert store.models[0]['DOPEHR Score'] == '-1001.000' and store.models[3]['DOPEHR Score'] == 'inf'
+    with open(os.path.join(store_dir, 'index.json')) as f:
+        index = json.load(f)
+    assert index['shape'] == [4, 9, 3] and index['reference_model'] == 'AUTO_1.pdb'
+    assert index['missing_atoms'] == {'AUTO_1_LOOP1_R1.pdb': 1}
+    assert index['extra_atoms'] == {'AUTO_1_LOOP1_R1.pdb': 1}
+
+def test_select_slices(models):
+    store = coord_store.open_store(coord_store.build_store(models, 'store'))
+    loop_ca = store.select(['CA'], residue_range=(2, 3))
+    np.testing.assert_allclose(loop_ca[:3], np.stack([model_xyz(n)[[4, 7]] for n in (1, 2, 3)]))
+    # Un tramo contiguo de átomos es una vista del memory-map
+    residue_2 = store.select(residue_range=(2, 2), chain_id='A')
+    assert np.shares_memory(residue_2, store.coords)
+    np.testing.assert_allclose(residue_2[0], model_xyz(1)[3:6])
+    subset = store.select(['N'], models=['AUTO_3.pdb', 'AUTO_1.pdb'])
+    np.testing.assert_allclose(subset, np.stack([model_xyz(3)[[0, 3, 6]], model_xyz(1)[[0, 3, 6]]]))
+    assert store.select(['CA'], chain_id='B').shape == (4, 0, 3)
+
+def test_build_reused_until_a_model_changes(models, tmp_path):
+    coord_store.build_store(models, 'store')
+    mtime = os.stat('store/coords.npy').st_mtime_ns
+    assert coord_store.build_store(models, 'store') == 'store'
+    assert os.stat('store/coords.npy').st_mtime_ns == mtime
+    write_model(tmp_path / 'AUTO_3.pdb', model_xyz(30))
+    coord_store.build_store(models, 'store')
+    np.testing.assert_allclose(coord_store.open_store('store').coords[2], model_xyz(30))
+
+def test_build_store_without_models(tmp_path):
+    assert coord_store.build_store([{'name': 'AUTO_1.pdb', 'path': str(tmp_path / 'AUTO_1.pdb')}], 'store') is None
+
+def test_ranked_models_from_manifest_and_scores(models):
+    for model in models:
+        output_layout.register_model(model['name'], model['stage'], model['path'])
+    scores = {'AUTO_2.pdb': {'DOPEHR score': -1500.0, 'DOPEHR Z-score': -1.5},
+              'AUTO_3.pdb': {'DOPEHR score': -1200.0, 'DOPEHR Z-score': -1.2}}
+    coord_store.stage_cache.save_item_cache('ranking_scores', coord_store.stage_cache.code_version(['utils.py']), scores)
+    # Los no evaluados van al final, por nombre
+    assert [m['name'] for m in coord_store.ranked_models()] == \
+           ['AUTO_2.pdb', 'AUTO_3.pdb', 'AUTO_1.pdb', 'AUTO_1_LOOP1_R1.pdb']
+    assert [m['name'] for m in coord_store.ranked_models(top_k=1)] == ['AUTO_2.pdb']
+    assert [m['name'] for m in coord_store.ranked_models(stages=['loop_refinement'])] == ['AUTO_1_LOOP1_R1.pdb']
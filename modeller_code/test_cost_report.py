@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Pruebas del informe de coste-eficiencia (cost_report.py): mediciones,
+estadísticas y mejora de DOPE-HR por CPU-hora de una ejecución sintética.
+No requieren Modeller: python3 -m pytest test_cost_report.py
+"""
+
+import json
+import itertools
+import statistics
+
+import numpy as np
+import pytest
+
+import cost_report
+
+def test_read_timings_last_measurement_wins(tmp_path, monkeypatch):
+    timings_file = str(tmp_path / 'stage_timings.jsonl')
+    monkeypatch.setattr(cost_report, 'STAGE_TIMINGS_FILE', timings_file)
+    cost_report.record_timing('automodel', 100.0, 4, first_model=1, last_model=8)
+    cost_report.record_timing('automodel', 120.0, 4, first_model=9, last_model=16)
+    cost_report.record_timing('automodel', 110.0, 4, first_model=1, last_model=8)   # tanda repetida al reanudar
+    cost_report.record_timing('loop', 50.0, 2, prefix='AUTO_1_LOOP1_R')
+    cost_report.record_timing('final_evaluation', 30.0, 1)
+    with open(timings_file, 'a') as f:
+        f.write('{"stage": "loop", "seco')
+    entries = cost_report.read_timings(timings_file)
+    assert [(e['stage'], e['seconds']) for e in entries] == \
+           [('automodel', 110.0), ('automodel', 120.0), ('loop', 50.0), ('final_evaluation', 30.0)]
+    assert cost_report.cpu_hours(entries) == pytest.approx((110 * 4 + 120 * 4 + 50 * 2 + 30) / 3600)
+    assert cost_report.read_timings(str(tmp_path / 'no_existe.jsonl')) == []
+
+def test_distribution_matches_linear_percentiles():
+    values = [-3.0, 7.5, 1.0, -12.0, 4.0, 0.5, 9.0]
+    d = cost_report.distribution(values)
+    for key, q in (('p10', 10), ('p25', 25), ('median', 50), ('p75', 75), ('p90', 90)):
+        assert d[key] == pytest.approx(np.percentile(values, q))
+    assert (d['min'], d['max'], d['mean']) == (-12.0, 9.0, pytest.approx(statistics.fmean(values)))
+
+@pytest.mark.parametrize('k', [1, 2, 3, 5, 6])
+def test_expected_best_of_matches_enumeration(k):
+    scores = sorted([-100.0, -90.0, -95.0, -80.0, -70.0, -99.0])
+    subsets = list(itertools.combinations(scores, k))
+    assert cost_report.expected_best_of(scores, k) == pytest.approx(sum(min(s) for s in subsets) / len(subsets))
+
+def test_expected_best_of_clamps_sample_size():
+    scores = [-3.0, -2.0, -1.0]
+    assert cost_report.expected_best_of(scores, 0) == pytest.approx(-2.0)
+    assert cost_report.expected_best_of(scores, 10) == -3.0
+
+def test_parent_model():
+    assert cost_report.parent_model('AUTO_3_LOOP1_R2_LOOP2_R1.pdb') == 'AUTO_3_LOOP1_R2.pdb'
+    assert cost_report.parent_model('AUTO_3_LOOP1_R2.pdb') == 'AUTO_3.pdb'
+    assert cost_report.parent_model('AUTO_3.pdb') is None
+
+# AutoModel: 4 modelos. Paso 1 (AUTO_1, loop 1) y paso 2 (su mejor modelo, loop 2); paso 3 (AUTO_2, loop 1) empeora
+SCORES = {'AUTO_1.pdb': -100.0, 'AUTO_2.pdb': -90.0, 'AUTO_3.pdb': -80.0, 'AUTO_4.pdb': -70.0,
+          'AUTO_1_LOOP1_R1.pdb': -110.0, 'AUTO_1_LOOP1_R2.pdb': -105.0,
+          'AUTO_1_LOOP1_R1_LOOP2_R1.pdb': -130.0, 'AUTO_1_LOOP1_R1_LOOP2_R2.pdb': -100.0,
+          'AUTO_2_LOOP1_R1.pdb': -85.0, 'AUTO_5.pdb': float('inf')}
+
+TIMINGS = [
+    {'stage': 'automodel', 'seconds': 3600.0, 'workers': 2, 'first_model': 1, 'last_model': 2},
+    {'stage': 'automodel', 'seconds': 1800.0, 'workers': 2, 'first_model': 3, 'last_model': 4},
+    {'stage': 'loop', 'seconds': 1800.0, 'workers': 4, 'parent': 'AUTO_1.pdb', 'loop': 1, 'range': [10, 15],
+     'prefix': 'AUTO_1_LOOP1_R'},
+    {'stage': 'loop', 'seconds': 900.0, 'workers': 4, 'parent': 'AUTO_1_LOOP1_R1.pdb', 'loop': 2, 'range': [20, 25],
+     'prefix': 'AUTO_1_LOOP1_R1_LOOP2_R'},
+    {'stage': 'loop', 'seconds': 1800.0, 'workers': 2, 'parent': 'AUTO_2.pdb', 'loop': 1, 'range': [10, 15],
+     'prefix': 'AUTO_2_LOOP1_R'},
+    {'stage': 'final_evaluation', 'seconds': 360.0, 'workers': 1},
+]
+
+@pytest.fixture
+def report():
+    ranking = [{'name': name, 'DOPEHR score': score} for name, score in SCORES.items()]
+    return cost_report.build_report(ranking, TIMINGS)
+
+def test_report_automodel(report):
+    auto = report['automodel']
+    assert (auto['models'], auto['cpu_hours'], auto['best']) == (4, 3.0, -100.0)
+    # Mejor esperado: n=1 la media; n=2 (-100·3 - 90·2 - 80·1) / 6; n=4 el mejor
+    assert auto['expected_best'] == pytest.approx({'1': -85.0, '2': -560 / 6, '4': -100.0})
+    assert auto['second_half_gain'] == pytest.approx(-560 / 6 + 100)
+    assert auto['second_half_gain_per_cpu_hour'] == pytest.approx((-560 / 6 + 100) / 1.5)
+
+def test_report_loop_steps_use_only_their_own_outputs(report):
+    # El paso 1 se mide con R1 y R2, no con los modelos del paso 2 que parten de R1
+    assert [(s['parent'], s['models'], s['parent_score'], s['best_score'], s['gain'], s['cpu_hours'])
+            for s in report['steps']] == [
+        ('AUTO_1.pdb', 2, -100.0, -110.0, 10.0, 2.0),
+        ('AUTO_1_LOOP1_R1.pdb', 2, -110.0, -130.0, 20.0, 1.0),
+        ('AUTO_2.pdb', 1, -90.0, -85.0, -5.0, 1.0)]
+
+def test_report_loop_aggregates(report):
+    loops = report['loop_refinement']
+    assert (loops['steps'], loops['models'], loops['cpu_hours']) == (3, 5, 4.0)
+    assert (loops['best_final'], loops['best_gain'], loops['best_gain_per_cpu_hour']) == (-130.0, 30.0, 7.5)
+    assert loops['by_loop'] == {
+        '1': {'steps': 2, 'improved': 1, 'mean_gain': 2.5, 'cpu_hours': 3.0, 'gain_per_cpu_hour': pytest.approx(5 / 3)},
+        '2': {'steps': 1, 'improved': 1, 'mean_gain': 20.0, 'cpu_hours': 1.0, 'gain_per_cpu_hour': 20.0}}
+    assert list(loops['by_range']) == ['10-15', '20-25']
+    assert loops['by_range']['10-15'] == loops['by_loop']['1']
+    assert report['final_evaluation'] == {'cpu_hours': 0.1, 'models': 9}
+
+def test_report_without_loop_steps():
+    ranking = [{'name': 'AUTO_1.pdb', 'DOPEHR score': -100.0}]
+    report = cost_report.build_report(ranking, [])
+    assert report['automodel']['second_half_gain'] == 0.0
+    assert report['automodel']['second_half_gain_per_cpu_hour'] is None
+    assert report['loop_refinement']['best_gain_per_cpu_hour'] is None
+    assert report['loop_refinement']['by_loop'] == {}
+
+def test_write_report(report, tmp_path):
+    report_file, table_file = str(tmp_path / 'cost_report.json'), str(tmp_path / 'cost_report.txt')
+    table = cost_report.write_report(report, report_file, table_file)
+    assert json.load(open(report_file))['loop_refinement']['best_gain'] == 30.0
+    assert open(table_file).read() == table + '\n'
+    lines = table.splitlines()
+    assert any(line.startswith('Refinamiento loops') and '30.000' in line and '7.500' in line for line in lines)
+    assert 'Por segmento:' in lines
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Pruebas del plan de colocación de workers en CPUs y dominios NUMA (cpu_placement.py)
+con topologías sintéticas. No requieren Modeller: python3 -m pytest test_cpu_placement.py
+"""
+
+import logging
+
+import pytest
+
+import cpu_placement
+
+TWO_SOCKETS = {0: [0, 1, 2, 3], 1: [4, 5, 6, 7]}
+
+def worker_cpus(plan):
+    return [w['cpus'] for w in plan['workers']]
+
+def test_parse_cpulist():
+    assert cpu_placement.parse_cpulist('0-3,8,10-11\n') == [0, 1, 2, 3, 8, 10, 11]
+    assert cpu_placement.parse_cpulist('') == []
+
+def test_plan_none_does_not_pin():
+    plan = cpu_placement.plan_placement(3, 'none', reserved=1, domains=TWO_SOCKETS)
+    assert plan['controller'] == []
+    assert plan['workers'] == [{'cpus': [], 'domain': None}] * 3
+
+def test_plan_core_round_robin_over_domains():
+    plan = cpu_placement.plan_placement(4, 'core', reserved=1, domains=TWO_SOCKETS)
+    assert plan['controller'] == [0]
+    assert worker_cpus(plan) == [[1], [4], [2], [5]]
+    assert [w['domain'] for w in plan['workers']] == [0, 1, 0, 1]
+
+def test_plan_core_never_uses_controller_cpus():
+    plan = cpu_placement.plan_placement(7, 'core', reserved=1, domains=TWO_SOCKETS)
+    used = [cpu for cpus in worker_cpus(plan) for cpu in cpus]
+    assert 0 not in used and sorted(used) == [1, 2, 3, 4, 5, 6, 7]
+
+def test_plan_core_oversubscription_warns(caplog):
+    with caplog.at_level(logging.WARNING, logger='pipeline.cpu_placement'):
+        plan = cpu_placement.plan_placement(5, 'core', reserved=0, domains={0: [0, 1]})
+    assert worker_cpus(plan) == [[0], [1], [0], [1], [0]]
+    assert any('[PINNING]' in r.getMessage() for r in caplog.records)
+
+def test_plan_numa_pins_to_whole_domain():
+    plan = cpu_placement.plan_placement(3, 'numa', reserved=2, domains=TWO_SOCKETS)
+    assert plan['controller'] == [0, 1]
+    assert worker_cpus(plan) == [[2, 3], [4, 5, 6, 7], [2, 3]]
+
+def test_plan_reserved_cpus_fill_a_whole_domain():
+    plan = cpu_placement.plan_placement(2, 'core', reserved=4, domains=TWO_SOCKETS)
+    assert plan['controller'] == [0, 1, 2, 3]
+    assert worker_cpus(plan) == [[4], [5]]
+    assert [w['domain'] for w in plan['workers']] == [1, 1]
+
+def test_plan_keeps_at_least_one_cpu_for_workers():
+    plan = cpu_placement.plan_placement(2, 'core', reserved=10, domains={0: [0, 1, 2]})
+    assert plan['controller'] == [0, 1]
+    assert worker_cpus(plan) == [[2], [2]]
+
+def test_plan_keeps_numa_node_numbers():
+    # Reserva limitada a los nodos 2 y 3 de la máquina
+    plan = cpu_placement.plan_placement(4, 'core', reserved=1, domains={2: [16, 17], 3: [24, 25]})
+    assert [w['domain'] for w in plan['workers']] == [2, 3, 3, 2]
+    assert worker_cpus(plan) == [[17], [24], [25], [17]]
+
+def test_numa_domains_by_node_number():
+    domains = cpu_placement.numa_domains([0, 1])
+    assert sorted(cpu for cpus in domains.values() for cpu in cpus) == [0, 1]
+    assert all(isinstance(node, int) for node in domains)
+
+def test_plan_unknown_mode():
+    with pytest.raises(ValueError):
+        cpu_placement.plan_placement(2, 'socket', domains=TWO_SOCKETS)
+
+def test_thread_environ():
+    env = cpu_placement.thread_environ(2)
+    assert set(env) == set(cpu_placement.THREAD_VARIABLES) and set(env.values()) == {'2'}
+    assert cpu_placement.thread_environ(0) == {}
+    assert cpu_placement.thread_env_prefix(0) == ''
+    assert cpu_placement.thread_env_prefix(1).startswith('env OMP_NUM_THREADS=1 ')
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Pruebas de la proyección del modo de ensayo (dry_run.py) con una calibración
+fija: 100 s por modelo de AutoModel, 5 s por residuo de loop y 2 s de
+evaluación por modelo.
+No requieren Modeller: python3 -m pytest test_dry_run.py
+"""
+
+import sys
+import json
+import types
+import importlib
+
+import pytest
+
+import config
+import dry_run as dry_run_module
+
+SETTINGS = {'NUM_PROCESSORS': 4, 'NUM_MODELS_AUTO': 10, 'NUM_MODELS_TO_REFINE': 2, 'NUM_MODELS_LOOP': 4,
+            'MIN_LOOP_LENGTH': 4, 'MAX_LOOP_LENGTH': 30, 'LONG_LOOP_WINDOW': 20, 'LONG_LOOP_OVERLAP': 6,
+            'LONG_LOOP_FINAL_PASS': False}
+
+# Loop de 10 residuos, uno de 2 (no se refina) y uno de 40 (tres ventanas de 20: 40-59, 50-69, 60-79)
+LOOPS = [(10, 19), (30, 31), (40, 79)]
+
+CALIBRATION = {'workers': 4, 'auto_models': 4, 'auto_seconds': 100.0, 'auto_files': 8, 'auto_bytes': 4 * 1024 ** 2,
+               'loop': [10, 19], 'loop_models': 4, 'loop_seconds': 50.0, 'loop_files': 4,
+               'loop_bytes': 2 * 1024 ** 2, 'eval_seconds': 2.0}
+
+@pytest.fixture
+def dry_run(tmp_path, monkeypatch):
+    """Recarga dry_run.py con SETTINGS (los valores por defecto de project se fijan al importar)."""
+    monkeypatch.chdir(tmp_path)
+    for name, value in SETTINGS.items():
+        monkeypatch.setattr(config, name, value)
+    yield importlib.reload(dry_run_module)
+    monkeypatch.undo()
+    importlib.reload(dry_run_module)
+
+def test_per_model_worker_seconds():
+    # 4 modelos en 4 workers: uno por worker; 8 modelos: dos por worker; 2 modelos: solo 2 workers trabajaron
+    assert dry_run_module._per_model_worker_seconds(100.0, 4, 4) == 100.0
+    assert dry_run_module._per_model_worker_seconds(100.0, 8, 4) == 50.0
+    assert dry_run_module._per_model_worker_seconds(100.0, 2, 4) == 100.0
+    assert dry_run_module._per_model_worker_seconds(None, 4, 4) is None
+    assert dry_run_module._per_model_worker_seconds(100.0, 0, 4) is None
+
+def test_loop_plan_skips_short_and_splits_long_loops(dry_run):
+    assert dry_run.loop_plan(LOOPS) == [
+        {'loop': [10, 19], 'window_lengths': [10], 'final_pass': False},
+        {'loop': [40, 79], 'window_lengths': [20, 20, 20], 'final_pass': False}]
+
+def test_project_stages(dry_run):
+    estimate = dry_run.project(CALIBRATION, LOOPS)
+    # AutoModel: 10 modelos en 3 oleadas de 4 workers
+    assert estimate['stages']['automodel'] == {'wall_s': 300.0, 'cpu_s': 1000.0, 'models': 10}
+    # Cadena: loop de 10 (4 modelos de 50 s, una oleada) + 3 ventanas de 20 (12 modelos de 100 s, tres oleadas)
+    assert estimate['stages']['loop_refinement'] == {'wall_s': 2 * 350.0, 'cpu_s': 2 * 1400.0, 'models': 2 * 16}
+    assert estimate['stages']['final_evaluation'] == {'wall_s': 84.0, 'cpu_s': 84.0, 'models': 42}
+    assert estimate['wall_s'] == 1084.0
+    assert estimate['cpu_hours'] == pytest.approx(3884.0 / 3600.0)
+    assert estimate['disk_gb'] == pytest.approx((10 * 1 + 32 * 0.5) / 1024)
+    assert estimate['files'] == 10 * 2 + 32 * 1
+    assert estimate['per_model'] == {'auto_s': 100.0, 'loop_s_per_residue': 5.0, 'eval_s': 2.0}
+
+def test_project_final_pass_over_long_loop(dry_run, monkeypatch):
+    monkeypatch.setattr(dry_run, 'LONG_LOOP_FINAL_PASS', True)
+    stage = dry_run.project(CALIBRATION, LOOPS)['stages']['loop_refinement']
+    # Pasada sobre los 40 residuos: 4 modelos de 200 s en una oleada
+    assert stage == {'wall_s': 2 * 550.0, 'cpu_s': 2 * 2200.0, 'models': 2 * 20}
+
+def test_project_without_loop_calibration(dry_run):
+    calibration = dict(CALIBRATION, loop=None, loop_seconds=None, loop_models=0)
+    estimate = dry_run.project(calibration, LOOPS)
+    assert estimate['stages']['loop_refinement'] == {'wall_s': 0, 'cpu_s': 0, 'models': 0}
+    assert estimate['per_model']['loop_s_per_residue'] is None
+
+@pytest.mark.parametrize('budget_s, expected', [
+    (1300.0, {'fits': True, 'NUM_MODELS_AUTO': 10, 'NUM_MODELS_TO_REFINE': 2}),
+    # Planificable: 720 s. Con 2 cadenas ni sin AutoModel caben (764 s); con 1 cadena (382 s) caben 3 oleadas de 108 s
+    (800.0, {'fits': False, 'NUM_MODELS_AUTO': 10, 'NUM_MODELS_TO_REFINE': 1}),
+    (700.0, {'fits': False, 'NUM_MODELS_AUTO': 8, 'NUM_MODELS_TO_REFINE': 1}),
+    (400.0, {'fits': False, 'NUM_MODELS_AUTO': None, 'NUM_MODELS_TO_REFINE': None}),
+])
+def test_suggest_for_budget(dry_run, budget_s, expected):
+    assert dry_run.suggest_for_budget(CALIBRATION, LOOPS, budget_s) == expected
+
+def test_run_dry_run_writes_report(dry_run, monkeypatch):
+    calls = []
+
+    def measure_worker_count(workers, models_per_worker, alignment_file, loop_range):
+        calls.append((workers, models_per_worker, loop_range))
+        return CALIBRATION
+
+    monkeypatch.setitem(sys.modules, 'autotune', types.SimpleNamespace(measure_worker_count=measure_worker_count))
+    report = dry_run.run_dry_run(LOOPS, time_budget='0-00:11:40')
+    # Se calibra con el primer loop de longitud refinable sin dividir
+    assert calls == [(4, config.DRY_RUN_MODELS_PER_WORKER, (10, 19))]
+    assert report['recommended_slurm_time'] == '0-00:21:00'
+    assert report['budget'] == {'time_budget': '0-00:11:40', 'seconds': 700.0, 'fits': False,
+                                'NUM_MODELS_AUTO': 8, 'NUM_MODELS_TO_REFINE': 1}
+    with open(dry_run.DRY_RUN_REPORT_FILE) as f:
+        assert json.load(f) == json.loads(json.dumps(report))
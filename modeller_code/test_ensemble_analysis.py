@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Pruebas del RMSD por pares y la superposición del análisis del conjunto
+(ensemble_analysis.py). No requieren Modeller: python3 -m pytest test_ensemble_analysis.py
+"""
+
+import numpy as np
+import pytest
+
+import ensemble_analysis
+
+def random_rotation(rng):
+    q, r = np.linalg.qr(rng.normal(size=(3, 3)))
+    q *= np.sign(np.diag(r))
+    if np.linalg.det(q) < 0:
+        q[:, 0] *= -1
+    return q
+
+def reference_rmsd(a, b):
+    """RMSD tras superposición óptima (Kabsch) de un par, sin vectorizar."""
+    a = a - a.mean(axis=0)
+    b = b - b.mean(axis=0)
+    u, _, vt = np.linalg.svd(a.T @ b)
+    d = np.sign(np.linalg.det(u @ vt))
+    u[:, -1] *= d
+    return np.sqrt(((a @ (u @ vt) - b) ** 2).sum(axis=1).mean())
+
+@pytest.fixture
+def ensemble():
+    """12 modelos de 40 átomos: una estructura base con ruido, rotada y trasladada."""
+    rng = np.random.default_rng(7)
+    base = rng.normal(size=(40, 3)) * 8.0
+    models = [(base + rng.normal(scale=0.5, size=base.shape)) @ random_rotation(rng) + rng.normal(size=3) * 20
+              for _ in range(12)]
+    return np.stack(models)
+
+def test_pairwise_rmsd_matches_per_pair_kabsch(ensemble):
+    rmsd = ensemble_analysis.pairwise_rmsd(ensemble)
+    expected = np.array([[reference_rmsd(a, b) for b in ensemble] for a in ensemble])
+    np.testing.assert_allclose(rmsd, expected, atol=1e-6)
+
+def test_pairwise_rmsd_symmetric_with_zero_diagonal(ensemble):
+    rmsd = ensemble_analysis.pairwise_rmsd(ensemble)
+    np.testing.assert_allclose(rmsd, rmsd.T, atol=1e-9)
+    assert np.all(np.diag(rmsd) == 0.0)
+
+@pytest.mark.parametrize('block', [1, 5, 12, 100])
+def test_pairwise_rmsd_independent_of_block_size(ensemble, block):
+    np.testing.assert_allclose(ensemble_analysis.pairwise_rmsd(ensemble, block=block),
+                               ensemble_analysis.pairwise_rmsd(ensemble), atol=1e-9)
+
+def test_pairwise_rmsd_rigid_copies_are_identical(ensemble):
+    rng = np.random.default_rng(1)
+    copies = np.stack([ensemble[0], ensemble[0] @ random_rotation(rng) + 15.0])
+    assert ensemble_analysis.pairwise_rmsd(copies)[0, 1] == pytest.approx(0.0, abs=1e-5)
+
+def test_pairwise_rmsd_does_not_superpose_mirror_images(ensemble):
+    mirrored = np.stack([ensemble[0], ensemble[0] * np.array([-1.0, 1.0, 1.0])])
+    rmsd = ensemble_analysis.pairwise_rmsd(mirrored)[0, 1]
+    assert rmsd == pytest.approx(reference_rmsd(*mirrored), abs=1e-6)
+    assert rmsd > 1.0
+
+def test_superpose_aligns_rigid_copies_in_float32(ensemble):
+    rng = np.random.default_rng(3)
+    copies = np.stack([ensemble[0] @ random_rotation(rng) + rng.normal(size=3) * 10 for _ in range(4)])
+    copies = copies.astype(np.float32)
+    aligned, _ = ensemble_analysis.superpose(copies, np.ones(copies.shape[1], dtype=bool))
+    assert aligned.dtype == np.float32
+    np.testing.assert_allclose(aligned, np.broadcast_to(aligned[0], aligned.shape), atol=1e-3)
+
+def test_fixed_frame_rmsd_without_refitting(ensemble):
+    shifted = np.stack([ensemble[0], ensemble[0] + np.array([3.0, 0.0, 0.0])])
+    rmsd = ensemble_analysis.fixed_frame_rmsd(shifted)
+    assert rmsd[0, 1] == pytest.approx(3.0)
+    assert ensemble_analysis.pairwise_rmsd(shifted)[0, 1] == pytest.approx(0.0, abs=1e-6)
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Pruebas de la recolección de resultados de una carpeta de ejecución
+(extractor_resultados.py). No requieren Modeller: python3 -m pytest test_extractor_resultados.py
+"""
+
+import os
+import json
+
+import output_layout
+import extractor_resultados
+
+AUXILIARY_CSVS = ('live_leaderboard.csv', 'geometry_report.csv', 'task_failures.csv', 'template_ranking.csv')
+
+def write(path, text=''):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(text)
+
+def make_run(folder, with_ranking=True):
+    """Carpeta de ejecución con el árbol de salidas, su manifiesto y los CSV de una ejecución por defecto."""
+    records = [
+        {'name': 'AUTO_1.pdb', 'path': os.path.join('models', 'auto', '00001-01000', 'AUTO_1.pdb'), 'stage': 'auto'},
+        {'name': 'AUTO_1_LOOP1_R1.pdb', 'path': os.path.join('models', 'loops', 'AUTO_1', 'AUTO_1_LOOP1_R1.pdb'), 'stage': 'loop'},
+        {'name': 'AUTO_1_LOOP1_R2.pdb', 'path': os.path.join('models', 'loops', 'AUTO_1', 'AUTO_1_LOOP1_R2.pdb'), 'stage': 'loop'},
+    ]
+    for record in records:
+        write(os.path.join(folder, record['path']), 'END\n')
+    write(os.path.join(folder, output_layout.OUTPUT_MANIFEST_FILE), ''.join(json.dumps(r) + '\n' for r in records))
+    for name in AUXILIARY_CSVS:
+        write(os.path.join(folder, name), 'Model Name\n')
+    if with_ranking:
+        write(os.path.join(folder, extractor_resultados.RANKING_CSV), 'Rank,Model Name\n1,AUTO_1_LOOP1_R2.pdb\n')
+
+def test_process_folder_copies_ranking_among_several_csvs(tmp_path):
+    folder = str(tmp_path / 'run1')
+    make_run(folder)
+    assert extractor_resultados.process_folder(folder) == 2
+    processed = sorted(os.listdir(folder + '_processed'))
+    assert processed == ['AUTO_1_LOOP1_R1.pdb', 'AUTO_1_LOOP1_R2.pdb', extractor_resultados.RANKING_CSV]
+
+def test_process_folder_without_ranking(tmp_path):
+    folder = str(tmp_path / 'run1')
+    make_run(folder, with_ranking=False)
+    extractor_resultados.process_folder(folder)
+    assert not any(name.endswith('.csv') for name in os.listdir(folder + '_processed'))
+
+def test_process_folder_flat_layout(tmp_path):
+    folder = str(tmp_path / 'run1')
+    write(os.path.join(folder, 'AUTO_3_LOOP2_R1.pdb'), 'END\n')
+    write(os.path.join(folder, 'AUTO_3.pdb'), 'END\n')
+    write(os.path.join(folder, extractor_resultados.RANKING_CSV), 'Rank\n')
+    write(os.path.join(folder, 'geometry_report.csv'), 'Model Name\n')
+    assert extractor_resultados.process_folder(folder) == 1
+    assert sorted(os.listdir(folder + '_processed')) == ['AUTO_3_LOOP2_R1.pdb', extractor_resultados.RANKING_CSV]
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Pruebas del supervisor de pasos (fault_tolerance.py) con un Job falso cuyos
+workers son procesos 'sleep' reales.
+No requieren Modeller: python3 -m pytest test_fault_tolerance.py
+"""
+
+import csv
+import time
+import subprocess
+
+import pytest
+
+import fault_tolerance
+
+class FakeSocket:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+class FakeWorker:
+    """Worker con el líder de su grupo de procesos en pids, como PinnedLocalWorker."""
+    def __init__(self, pid):
+        self.pids = [pid]
+        self._socket = FakeSocket()
+
+class FakeJob(list):
+    def __init__(self, workers):
+        list.__init__(self, workers)
+        self.listensock = FakeSocket()
+
+@pytest.fixture
+def spawn_job():
+    """Crea Jobs falsos con n workers y termina sus procesos al final de la prueba."""
+    processes = []
+
+    def spawn(num_workers=2):
+        workers = []
+        for _ in range(num_workers):
+            process = subprocess.Popen(['sleep', '60'], start_new_session=True)
+            processes.append(process)
+            workers.append(FakeWorker(process.pid))
+        return FakeJob(workers)
+
+    yield spawn
+    for process in processes:
+        process.kill()
+        process.wait()
+
+@pytest.fixture
+def failure_report(tmp_path, monkeypatch):
+    monkeypatch.setattr(fault_tolerance, 'TASK_FAILURE_REPORT', str(tmp_path / 'task_failures.csv'))
+    return tmp_path / 'task_failures.csv'
+
+def read_failures(path):
+    with open(path, newline='') as f:
+        return list(csv.DictReader(f))
+
+# =================================================================
+# step_timeout
+# =================================================================
+
+def test_step_timeout_without_measurements_is_the_fixed_limit(monkeypatch):
+    monkeypatch.setattr(fault_tolerance, 'TASK_TIMEOUT', 1000)
+    assert fault_tolerance.TaskSupervisor(FakeJob([])).step_timeout(20) == 1000
+
+def test_step_timeout_adapts_to_measured_steps(monkeypatch):
+    monkeypatch.setattr(fault_tolerance, 'TASK_TIMEOUT', 5000)
+    monkeypatch.setattr(fault_tolerance, 'TASK_TIMEOUT_FACTOR', 3.0)
+    supervisor = fault_tolerance.TaskSupervisor(FakeJob([]))
+    supervisor._rates.record('step', 100.0, 10)   # 10 s por residuo
+    assert supervisor.step_timeout(20) == 600.0
+    # Nunca por debajo del mínimo ni por encima de TASK_TIMEOUT
+    assert supervisor.step_timeout(1) == fault_tolerance.MIN_STEP_TIMEOUT
+    assert supervisor.step_timeout(1000) == 5000
+    monkeypatch.setattr(fault_tolerance, 'TASK_TIMEOUT', 0)
+    assert supervisor.step_timeout(1000) == 30000.0
+
+# =================================================================
+# unhealthy_reason / replace_workers
+# =================================================================
+
+def test_unhealthy_reason_healthy_workers(spawn_job, monkeypatch):
+    monkeypatch.setattr(fault_tolerance, 'WORKER_MAX_RSS_MB', 0)
+    assert fault_tolerance.TaskSupervisor(spawn_job(2)).unhealthy_reason() is None
+
+def test_unhealthy_reason_dead_worker(spawn_job, monkeypatch):
+    monkeypatch.setattr(fault_tolerance, 'WORKER_MAX_RSS_MB', 0)
+    job = spawn_job(2)
+    supervisor = fault_tolerance.TaskSupervisor(job)
+    fault_tolerance.kill_workers(FakeJob([job[0]]))
+    assert supervisor.unhealthy_reason() == "1 workers muertos"
+
+def test_unhealthy_reason_oversized_worker(spawn_job, monkeypatch):
+    monkeypatch.setattr(fault_tolerance, 'WORKER_MAX_RSS_MB', 0.001)
+    assert fault_tolerance.TaskSupervisor(spawn_job(2)).unhealthy_reason() == "2 workers superan 0.001 MB"
+
+def test_replace_workers_closes_old_job(spawn_job):
+    old_job, new_job = spawn_job(2), spawn_job(3)
+    old_sockets = [old_job.listensock] + [worker._socket for worker in old_job]
+    old_pids = [worker.pids[0] for worker in old_job]
+    supervisor = fault_tolerance.TaskSupervisor(old_job, create_job=lambda: new_job)
+
+    assert supervisor.replace_workers('prueba') is new_job
+    assert supervisor.job is new_job
+    assert all(sock.closed for sock in old_sockets)
+    assert len(old_job) == 0
+    assert all(fault_tolerance.process_info(pid) is None for pid in old_pids)
+    assert supervisor._expected_workers == 3
+
+# =================================================================
+# run: reintentos con semilla nueva
+# =================================================================
+
+def test_run_retries_with_new_seeds_and_replaces_job_after_error(spawn_job, failure_report, monkeypatch):
+    monkeypatch.setattr(fault_tolerance, 'TASK_MAX_RETRIES', 2)
+    monkeypatch.setattr(fault_tolerance, 'TASK_TIMEOUT', 0)
+    monkeypatch.setattr(fault_tolerance, 'WORKER_MAX_RSS_MB', 0)
+    first_job, second_job = spawn_job(1), spawn_job(1)
+    supervisor = fault_tolerance.TaskSupervisor(first_job, create_job=lambda: second_job)
+    outcomes = [[], RuntimeError('worker caído'), [{'name': 'M.pdb'}]]
+    calls = []
+
+    def step_fn(job, seed):
+        calls.append((job, seed))
+        outcome = outcomes[len(calls) - 1]
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    assert supervisor.run('AUTO_1', 'Loop 1 (10-20)', 11, step_fn) == [{'name': 'M.pdb'}]
+    seeds = [seed for _, seed in calls]
+    assert seeds == [None] + [fault_tolerance.retry_seed('AUTO_1', 'Loop 1 (10-20)', a) for a in (1, 2)]
+    assert all(fault_tolerance.MODELLER_SEED_RANGE[0] <= s <= fault_tolerance.MODELLER_SEED_RANGE[1] for s in seeds[1:])
+    # Sin modelos se reintenta en el mismo Job; tras un error, en uno nuevo
+    assert [job for job, _ in calls] == [first_job, first_job, second_job]
+    assert supervisor.job is second_job
+    assert [(row['Attempt'], row['Action']) for row in read_failures(failure_report)] == \
+           [('0', 'reintento con nueva semilla'), ('1', 'reintento con nueva semilla')]
+
+def test_run_timeout_kills_workers_and_gives_up(spawn_job, failure_report, monkeypatch):
+    monkeypatch.setattr(fault_tolerance, 'TASK_MAX_RETRIES', 0)
+    monkeypatch.setattr(fault_tolerance, 'TASK_TIMEOUT', 0.2)
+    monkeypatch.setattr(fault_tolerance, 'WORKER_MAX_RSS_MB', 0)
+    job = spawn_job(1)
+    pid = job[0].pids[0]
+    supervisor = fault_tolerance.TaskSupervisor(job, create_job=lambda: FakeJob([]))
+
+    def hanging_step(step_job, seed):
+        while fault_tolerance.process_info(pid) is not None:
+            time.sleep(0.05)
+        return [{'name': 'tarde.pdb'}]
+
+    assert supervisor.run('AUTO_1', 'Loop 2 (30-40)', 11, hanging_step) is None
+    rows = read_failures(failure_report)
+    assert len(rows) == 1 and rows[0]['Action'] == 'abandonado'
+    assert rows[0]['Error'].startswith('tiempo límite')
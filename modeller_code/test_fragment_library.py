@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Pruebas de la biblioteca de fragmentos de loop (fragment_library.py) con un
+template sintético (cadena aleatoria con pasos CA-CA de 3.8 Å).
+No requieren Modeller: python3 -m pytest test_fragment_library.py
+"""
+
+import json
+
+import numpy as np
+import pytest
+
+import fragment_library
+
+def write_template(path, num_residues=40, gap_after=None, seed=0):
+    """Esqueleto N/CA/C/O en cadena A; con gap_after, la numeración salta 10 residuos tras ese residuo."""
+    rng = np.random.default_rng(seed)
+    ca = np.cumsum(rng.normal(size=(num_residues, 3)), axis=0)
+    steps = np.diff(ca, axis=0)
+    ca[1:] = ca[0] + np.cumsum(3.8 * steps / np.linalg.norm(steps, axis=1, keepdims=True), axis=0)
+    lines, serial = [], 0
+    for i, ca_xyz in enumerate(ca):
+        resnum = i + 1 + (10 if gap_after is not None and i + 1 > gap_after else 0)
+        for atom, offset in zip(fragment_library.BACKBONE_ATOMS, rng.normal(scale=0.8, size=(4, 3))):
+            xyz = ca_xyz if atom == 'CA' else ca_xyz + offset
+            serial += 1
+            lines.append(f"ATOM  {serial:5d}  {atom:<3} GLY A{resnum:4d}    "
+                         f"{xyz[0]:8.3f}{xyz[1]:8.3f}{xyz[2]:8.3f}  1.00  0.00           {atom[0]}\n")
+    path.write_text(''.join(lines) + "END\n")
+    return str(path)
+
+@pytest.fixture
+def library(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(fragment_library.stage_cache, 'USE_STAGE_CACHE', True)
+    monkeypatch.setattr(fragment_library.stage_cache, 'STAGE_CACHE_DIR', str(tmp_path / '.stage_cache'))
+    template = write_template(tmp_path / 'template.pdb')
+    library_dir = fragment_library.build_library([template], str(tmp_path / 'lib'), min_length=4, max_length=8)
+    return template, library_dir
+
+def test_read_backbone_skips_incomplete_residues(tmp_path):
+    template = write_template(tmp_path / 't.pdb', num_residues=5)
+    lines = [line for line in open(template) if not (line[22:26] == '   3' and line[12:16].strip() == 'O')]
+    (tmp_path / 't.pdb').write_text(''.join(lines))
+    res_nums, coords = fragment_library.read_backbone(template)
+    assert res_nums.tolist() == [1, 2, 4, 5]
+    assert coords.shape == (4, 4, 3)
+
+def test_build_library_counts_and_sorted_index(library):
+    _, library_dir = library
+    index = json.load(open(f'{library_dir}/index.json'))
+    # 40 residuos: L + 2 residuos por ventana
+    assert index['counts'] == {str(length): 40 - (length + 2) + 1 for length in range(4, 9)}
+    desc = np.load(f'{library_dir}/L06_desc.npy')
+    assert np.all(np.diff(desc[:, 0]) >= 0)
+    source = np.load(f'{library_dir}/L06_source.npy')
+    # El primer residuo del loop de cada fragmento, sin repetir
+    assert sorted(source[:, 1].tolist()) == list(range(2, 35))
+
+def test_build_library_splits_at_chain_breaks(tmp_path, monkeypatch):
+    monkeypatch.setattr(fragment_library.stage_cache, 'USE_STAGE_CACHE', False)
+    template = write_template(tmp_path / 'gap.pdb', num_residues=20, gap_after=10)
+    library_dir = fragment_library.build_library([template], str(tmp_path / 'lib'), min_length=4, max_length=4)
+    source = np.load(f'{library_dir}/L04_source.npy')
+    # Dos tramos de 10 residuos: 5 ventanas de 6 en cada uno, ninguna cruza el salto
+    assert sorted(source[:, 1].tolist()) == [2, 3, 4, 5, 6, 22, 23, 24, 25, 26]
+
+def test_build_library_reused_from_cache(library, caplog):
+    template, library_dir = library
+    caplog.set_level('INFO', logger='pipeline.fragment_library')
+    fragment_library.build_library([template], library_dir, min_length=4, max_length=8)
+    assert 'Construyendo' not in caplog.text
+
+def test_find_fragments_matches_brute_force(library):
+    _, library_dir = library
+    desc = np.load(f'{library_dir}/L05_desc.npy')
+    coords = np.load(f'{library_dir}/L05_coords.npy')
+    query = desc[len(desc) // 2] + np.float32(0.3)
+    found, deviation = fragment_library.find_fragments(5, query, library_dir, max_results=100, tolerance=2.0)
+
+    all_deviation = np.sqrt(np.mean((desc - query) ** 2, axis=1))
+    expected = [i for i in np.argsort(all_deviation)
+                if all_deviation[i] <= 2.0 and abs(desc[i, 0] - query[0]) <= 2.0]
+    np.testing.assert_allclose(deviation, all_deviation[expected], rtol=1e-6)
+    np.testing.assert_allclose(found, coords[expected])
+    assert found.shape[1:] == (7, 4, 3)
+
+def test_find_fragments_without_length_or_match(library):
+    _, library_dir = library
+    found, deviation = fragment_library.find_fragments(20, np.zeros(3, dtype=np.float32), library_dir)
+    assert found.shape == (0, 22, 4, 3) and len(deviation) == 0
+    found, _ = fragment_library.find_fragments(5, np.full(3, 1000.0, dtype=np.float32), library_dir)
+    assert len(found) == 0
+
+def test_loop_seed_reproduces_the_template_loop(library):
+    template, library_dir = library
+    seeds = fragment_library.loop_seed_conformations(template, 12, 17, library_dir, max_seeds=5, tolerance=0.5)
+    assert seeds
+    _, coords = fragment_library.read_backbone(template)
+    for resnum in range(12, 18):
+        for a, atom in enumerate(fragment_library.BACKBONE_ATOMS):
+            np.testing.assert_allclose(seeds[0][f'{resnum}:{atom}'], coords[resnum - 1, a], atol=1e-3)
+
+def test_loop_seed_missing_anchor(library, tmp_path):
+    template, library_dir = library
+    lines = [line for line in open(template) if line[22:26] != '  11']
+    (tmp_path / 'sin_anclaje.pdb').write_text(''.join(lines))
+    assert fragment_library.loop_seed_conformations(str(tmp_path / 'sin_anclaje.pdb'), 12, 17, library_dir) == []
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Pruebas del filtro geométrico (geometry_check.py) con PDB sintéticos.
+No requieren Modeller: python3 -m pytest test_geometry_check.py
+"""
+
+import numpy as np
+
+import geometry_check
+
+def atom_line(serial, name, resname, chain, resnum, xyz, element=None):
+    """Registro ATOM en columnas fijas de PDB."""
+    element = element or name[0]
+    x, y, z = xyz
+    return (f"ATOM  {serial:5d}  {name:<3} {resname:3} {chain}{resnum:4d}    "
+            f"{x:8.3f}{y:8.3f}{z:8.3f}  1.00  0.00          {element:>2}\n")
+
+def glycine_chain(num_residues, chain='A', ca_step=3.8, skip_atoms=(), first_resnum=1, origin=(0.0, 0.0, 0.0)):
+    """Cadena recta de glicinas (N, CA, C, O) desde origin con los CA separados ca_step Å en x."""
+    offsets = {'N': (-1.2, 0.8, 0.0), 'CA': (0.0, 0.0, 0.0), 'C': (1.2, 0.8, 0.0), 'O': (1.2, 2.0, 0.0)}
+    lines = []
+    for i in range(num_residues):
+        resnum = first_resnum + i
+        for name, (dx, dy, dz) in offsets.items():
+            if (resnum, name) in skip_atoms:
+                continue
+            lines.append(atom_line(len(lines) + 1, name, 'GLY', chain, resnum, (origin[0] + ca_step * i + dx, origin[1] + dy, origin[2] + dz)))
+    return lines
+
+def write_pdb(path, lines):
+    path.write_text(''.join(lines) + "END\n")
+    return str(path)
+
+def test_read_atom_table_columns(tmp_path):
+    pdb = write_pdb(tmp_path / 'm.pdb', glycine_chain(2))
+    atoms = geometry_check.read_atom_table(pdb)
+    assert atoms['name'].tolist() == [b'N', b'CA', b'C', b'O'] * 2
+    assert atoms['resnum'].tolist() == [1] * 4 + [2] * 4
+    assert atoms['chain'].tolist() == [b'A'] * 8
+    np.testing.assert_allclose(atoms['xyz'][5], [3.8, 0.0, 0.0])
+
+def test_ca_breaks_only_within_a_chain():
+    chains = np.array([b'A', b'A', b'A', b'B'])
+    ca_xyz = np.array([[0.0, 0, 0], [3.8, 0, 0], [12.0, 0, 0], [30.0, 0, 0]])
+    assert geometry_check.ca_breaks(chains, ca_xyz, max_distance=4.3).tolist() == [1]
+
+def test_close_pairs_matches_brute_force():
+    xyz = np.random.default_rng(0).uniform(0, 15, size=(300, 3))
+    i, j = geometry_check.close_pairs(xyz, 2.2)
+    found = {(min(a, b), max(a, b)) for a, b in zip(i.tolist(), j.tolist())}
+    dist = np.linalg.norm(xyz[:, None] - xyz[None], axis=-1)
+    expected = {(a, b) for a, b in zip(*np.nonzero(np.triu(dist < 2.2, k=1)))}
+    assert found == expected
+    assert len(found) == len(i)   # Cada par aparece una sola vez
+
+def test_check_model_clean_chain(tmp_path):
+    result = geometry_check.check_model(write_pdb(tmp_path / 'm.pdb', glycine_chain(10)))
+    assert (result['ca_breaks'], result['clashes'], result['missing_atoms']) == (0, 0, 0)
+    assert result['ok'] and result['reasons'] == []
+
+def test_check_model_counts_breaks_and_missing_atoms(tmp_path, monkeypatch):
+    # El segundo tramo empieza 10 Å más arriba: rotura entre los residuos 5 y 6
+    lines = (glycine_chain(5, skip_atoms={(2, 'O')})
+             + glycine_chain(5, first_resnum=6, origin=(15.2, 10.0, 0.0), skip_atoms={(7, 'O')}))
+    monkeypatch.setattr(geometry_check, 'GEOMETRY_MAX_CHAIN_BREAKS', 0)
+    monkeypatch.setattr(geometry_check, 'GEOMETRY_MAX_MISSING_ATOMS', 1)
+    result = geometry_check.check_model(write_pdb(tmp_path / 'm.pdb', lines))
+    assert result['ca_breaks'] == 1
+    assert result['missing_atoms'] == 2
+    assert result['clashes'] == 0
+    assert not result['ok'] and len(result['reasons']) == 2
+
+def test_check_model_clashes_skip_neighbours_and_disulfides(tmp_path, monkeypatch):
+    lines = glycine_chain(6)
+    # Un residuo lejano en la cadena colocado sobre el residuo 1: choques
+    lines.append(atom_line(100, 'CA', 'GLY', 'A', 50, (0.5, 0.0, 0.0)))
+    # Dos SG a distancia de enlace disulfuro no cuentan
+    lines.append(atom_line(101, 'SG', 'CYS', 'A', 60, (40.0, 0.0, 0.0), element='S'))
+    lines.append(atom_line(102, 'SG', 'CYS', 'A', 70, (41.5, 0.0, 0.0), element='S'))
+    monkeypatch.setattr(geometry_check, 'GEOMETRY_MAX_CLASHES', 0)
+    result = geometry_check.check_model(write_pdb(tmp_path / 'm.pdb', lines))
+    assert result['clashes'] == 4   # Los cuatro átomos del residuo 1
+    assert not result['ok']
+
+def test_check_model_ignores_hydrogens(tmp_path):
+    lines = glycine_chain(3)
+    lines.append(atom_line(50, 'H', 'GLY', 'A', 3, (7.6, 0.3, 0.0)))
+    lines.append(atom_line(51, 'HA2', 'GLY', 'A', 1, (7.7, 0.1, 0.0)))
+    assert geometry_check.check_model(write_pdb(tmp_path / 'm.pdb', lines))['clashes'] == 0
+
+def test_safe_check_unreadable_file(tmp_path):
+    result = geometry_check.safe_check(str(tmp_path / 'missing.pdb'))
+    assert not result['ok']
+    assert result['reasons'][0].startswith('PDB ilegible')
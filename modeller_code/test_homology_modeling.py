@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Pruebas de las tandas de AutoModel (homology_modeling.run_automodel) con un
+AutoModel falso que escribe PDB vacíos y cuenta cuántas veces se preparan el
+modelo inicial y las restricciones.
+No requieren Modeller: python3 -m pytest test_homology_modeling.py
+"""
+
+import importlib
+
+import pytest
+
+import config
+
+class StubAutoModel:
+    """AutoModel mínimo: make() llama a homcsr() y genera starting_model..ending_model."""
+    builds = 0
+    batches = []
+
+    def __init__(self, env, alnfile, knowns, sequence, assess_methods=()):
+        self.sequence = sequence
+        self.inifile = sequence + '.ini'
+        self.csrfile = sequence + '.rsr'
+        self.starting_model = 1
+        self.ending_model = 1
+        self.outputs = []
+        self.restraints = StubRestraints()
+
+    def use_parallel_job(self, job):
+        self.job = job
+
+    def homcsr(self, exit_stage):
+        StubAutoModel.builds += 1
+        for path in (self.inifile, self.csrfile):
+            with open(path, 'w') as f:
+                f.write('preparado\n')
+
+    def read_initial_model(self):
+        with open(self.inifile) as f:
+            assert f.read() == 'preparado\n'
+
+    def make(self, exit_stage=0):
+        self.outputs = []
+        self.homcsr(exit_stage)
+        StubAutoModel.batches.append((self.starting_model, self.ending_model))
+        for num in range(self.starting_model, self.ending_model + 1):
+            name = f'{self.sequence}.B9999{num:04d}.pdb'
+            with open(name, 'w') as f:
+                f.write(f'REMARK modelo {num}\nEND\n')
+            # Puntuación decreciente: el último modelo generado es el mejor
+            self.outputs.append({'name': name, 'DOPE-HR score': -1000.0 * num, 'failure': None})
+
+class StubRestraints:
+    def __init__(self):
+        self.files = []
+
+    def clear(self):
+        self.files = []
+
+    def append(self, file):
+        self.files.append(file)
+
+class FakeDeadline:
+    """Deadline activo que permite un número fijo de tandas."""
+    def __init__(self, batches_allowed):
+        self.active = True
+        self.batches_allowed = batches_allowed
+        self.truncated = set()
+
+    def estimate(self, task, units=1.0):
+        return 0.0
+
+    def allows(self, seconds, num_models_to_rank, reserve=0.0):
+        self.batches_allowed -= 1
+        return self.batches_allowed >= 0
+
+    def record(self, task, seconds, units=1.0):
+        pass
+
+@pytest.fixture
+def homology_modeling(fake_modeller, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    fake_modeller['modeller.automodel'].AutoModel = StubAutoModel
+    monkeypatch.setattr(StubAutoModel, 'builds', 0)
+    monkeypatch.setattr(StubAutoModel, 'batches', [])
+    module = importlib.import_module('homology_modeling')
+    monkeypatch.setattr(module, 'NUM_MODELS_AUTO', 6)
+    monkeypatch.setattr(module, 'AUTOMODEL_BATCH_SIZE', 2)
+    monkeypatch.setattr(module.stage_cache, 'USE_STAGE_CACHE', True)
+    for name in ('record', 'rename', 'flush'):
+        monkeypatch.setattr(module.leaderboard, name, lambda *args, **kwargs: None)
+    monkeypatch.setattr(module.cost_report, 'record_timing', lambda *args, **kwargs: None)
+    monkeypatch.setattr(module.pipeline_log, 'rotate_large_worker_logs', lambda *args, **kwargs: None)
+    return module
+
+def run(module, deadline):
+    return module.run_automodel(object(), 'alignment.ali', [object()] * 2, deadline=deadline, progress_key='clave')
+
+def test_batches_build_restraints_once(homology_modeling):
+    ranked = run(homology_modeling, FakeDeadline(batches_allowed=10))
+    assert StubAutoModel.batches == [(1, 2), (3, 4), (5, 6)]
+    assert StubAutoModel.builds == 1
+    # AUTO_<rank> por DOPE-HR sobre las salidas de todas las tandas
+    assert [m['name'] for m in ranked] == [f'AUTO_{i}.pdb' for i in range(1, 7)]
+    assert [m['DOPE-HR score'] for m in ranked] == [-6000.0, -5000.0, -4000.0, -3000.0, -2000.0, -1000.0]
+
+def test_resume_continues_numbering_and_reuses_restraints(homology_modeling):
+    deadline = FakeDeadline(batches_allowed=2)
+    first = run(homology_modeling, deadline)
+    assert 'automodel' in deadline.truncated
+    assert [m['name'] for m in first] == ['AUTO_1.pdb', 'AUTO_2.pdb', 'AUTO_3.pdb', 'AUTO_4.pdb']
+
+    resumed = run(homology_modeling, FakeDeadline(batches_allowed=10))
+    assert StubAutoModel.batches == [(1, 2), (3, 4), (5, 6)]
+    assert StubAutoModel.builds == 1
+    # Los modelos nuevos se numeran a continuación de los ya renombrados
+    by_name = {m['name']: m['DOPE-HR score'] for m in resumed}
+    assert by_name == {'AUTO_1.pdb': -4000.0, 'AUTO_2.pdb': -3000.0, 'AUTO_3.pdb': -2000.0, 'AUTO_4.pdb': -1000.0,
+                       'AUTO_5.pdb': -6000.0, 'AUTO_6.pdb': -5000.0}
+    assert [m['name'] for m in resumed][:2] == ['AUTO_5.pdb', 'AUTO_6.pdb']
+
+def test_fresh_run_rebuilds_stale_restraints(homology_modeling, tmp_path):
+    (tmp_path / (config.ALIGN_CODE_SEQUENCE + '.ini')).write_text('de otra ejecución\n')
+    (tmp_path / (config.ALIGN_CODE_SEQUENCE + '.rsr')).write_text('de otra ejecución\n')
+    run(homology_modeling, None)
+    assert StubAutoModel.batches == [(1, 6)]
+    assert StubAutoModel.builds == 1
+    assert (tmp_path / (config.ALIGN_CODE_SEQUENCE + '.ini')).read_text() == 'preparado\n'
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Pruebas del generador de ejecuciones sintéticas y del informe de
+io_benchmark.py, con un template de 5 átomos y ejecuciones de pocos modelos.
+No requieren Modeller: python3 -m pytest test_io_benchmark.py
+"""
+
+import os
+import shutil
+
+import pytest
+
+import config
+import cost_report
+import output_layout
+import io_benchmark
+
+def atom_line(serial, x):
+    return f"ATOM  {serial:5d}  CA  GLY A{serial:4d}    {x:8.3f}{0.0:8.3f}{0.0:8.3f}  1.00  0.00           C\n"
+
+@pytest.fixture
+def template(tmp_path):
+    path = tmp_path / 'template.pdb'
+    path.write_text('HEADER    PRUEBA\n' + ''.join(atom_line(i, 10.0 * i) for i in range(1, 6)) + 'TER\nEND\n')
+    return str(path)
+
+def coordinates(variant):
+    return [tuple(float(line[c:c + 8]) for c in (30, 38, 46)) for line in variant.splitlines() if line.startswith('ATOM')]
+
+def test_perturbed_variants_are_reproducible(template):
+    variants = io_benchmark.perturbed_variants(template, 3, seed=7)
+    assert len(variants) == 3 and len(set(variants)) == 3
+    assert variants == io_benchmark.perturbed_variants(template, 3, seed=7)
+    assert variants != io_benchmark.perturbed_variants(template, 3, seed=8)
+
+def test_perturbed_variants_only_move_coordinates(template):
+    original = open(template).read().splitlines()[1:6]
+    noise = io_benchmark.COORDINATE_NOISE
+    for variant in io_benchmark.perturbed_variants(template, 4):
+        lines = variant.splitlines()
+        # Solo los registros de átomos, terminados en END
+        assert lines[-1] == 'END' and len(lines) == 6
+        for line, reference in zip(lines, original):
+            assert line[:30] == reference[:30] and line[54:] == reference[54:]
+        for (x, y, z), serial in zip(coordinates(variant), range(1, 6)):
+            assert max(abs(x - 10.0 * serial), abs(y), abs(z)) < 6 * noise
+
+def test_perturbed_variants_max_atoms(template):
+    variant = io_benchmark.perturbed_variants(template, 1, max_atoms=2)[0]
+    assert len(coordinates(variant)) == 2
+
+def test_loop_model_names_follow_the_best_model_chain():
+    names = io_benchmark.loop_model_names(base_count=2, per_step=2, loops=2)
+    assert names[:4] == ['AUTO_1_LOOP1_R1.pdb', 'AUTO_1_LOOP1_R2.pdb',
+                         'AUTO_1_LOOP1_R1_LOOP2_R1.pdb', 'AUTO_1_LOOP1_R1_LOOP2_R2.pdb']
+    assert len(names) == len(set(names)) == 2 * 2 * 2
+    # Cada paso parte de un modelo base o del R1 de un paso anterior
+    for name in names:
+        parent = cost_report.parent_model(name)
+        assert parent in ('AUTO_1.pdb', 'AUTO_2.pdb') or parent in names[:names.index(name)]
+
+def test_write_model_cycles_through_variants(tmp_path):
+    path = str(tmp_path / 'm.pdb')
+    io_benchmark._write_model(path, 'AUTO_7', ['A\n', 'B\n', 'C\n'], 7)
+    assert open(path).read() == 'REMARK   6 SYNTHETIC MODEL AUTO_7\nB\n'
+
+@pytest.mark.skipif(shutil.which('bash') is None, reason='this-speaker.sh necesita bash')
+def test_run_size_builds_a_complete_run(template, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(config, 'NUM_MODELS_LOOP', 2)
+    variants = io_benchmark.perturbed_variants(template, 3)
+    run_dir = str(tmp_path / 'run_20')
+    timings = io_benchmark.run_size(run_dir, 20, variants, loop_fraction=0.5)
+    assert set(timings) == set(io_benchmark.PATHS) and all(t >= 0 for t in timings.values())
+    assert os.getcwd() == str(tmp_path)
+
+    manifest = output_layout.read_manifest(run_dir)
+    assert sorted(r['stage'] for r in manifest.values()) == ['auto'] * 10 + ['loop'] * 10
+    assert sorted(n for n, r in manifest.items() if r['stage'] == 'auto') == sorted(f'AUTO_{i}.pdb' for i in range(1, 11))
+    # Loops: 2 modelos base con cadenas de 4 pasos de 2 modelos, recortadas a 10
+    assert sorted(n for n, r in manifest.items() if r['stage'] == 'loop') == \
+           sorted(io_benchmark.loop_model_names(2, 2)[:10])
+    for name, record in manifest.items():
+        with open(os.path.join(run_dir, record['path'])) as f:
+            assert f.readline() == f'REMARK   6 SYNTHETIC MODEL {name[:-4]}\n'
+    # Nada queda en la carpeta de trabajo: modelos renombrados e intermedios recogidos
+    assert sorted(os.listdir(run_dir)) == ['final_ranking.csv', 'models']
+    intermediates = os.path.join(run_dir, 'models', 'intermediate', 'automodel', '00001-01000')
+    assert len(os.listdir(intermediates)) == 2 * 10
+    assert os.path.isdir(run_dir + '_processed')
+
+def test_scaling_exponent():
+    sizes = [1000, 2000, 4000]
+    assert io_benchmark.scaling_exponent(sizes, [1.0, 2.0, 4.0]) == pytest.approx(1.0)
+    assert io_benchmark.scaling_exponent(sizes, [1.0, 4.0, 16.0]) == pytest.approx(2.0)
+    assert io_benchmark.scaling_exponent([1000], [1.0]) is None
+    assert io_benchmark.scaling_exponent([1000, 1000], [1.0, 2.0]) is None
+    assert io_benchmark.scaling_exponent(sizes, [0.0, 0.0, 4.0]) is None
+
+def test_report_and_baseline_comparison():
+    results = {1000: {'store_auto': 0.1, 'ranking_scan': 0.01}, 2000: {'store_auto': 0.2, 'ranking_scan': 0.04}}
+    report = io_benchmark.build_report(results)
+    assert report['sizes'] == [1000, 2000]
+    assert report['paths']['store_auto']['us_per_model'] == {'1000': pytest.approx(100.0), '2000': pytest.approx(100.0)}
+    assert report['paths']['ranking_scan']['scaling_exponent'] == pytest.approx(2.0)
+    assert report['paths']['extractor'] == {'seconds': {}, 'us_per_model': {}, 'scaling_exponent': None}
+
+    baseline = {'paths': {'store_auto': {'us_per_model': {'1000': 100.0, '2000': 50.0}},
+                          'ranking_scan': {'us_per_model': {'1000': 10.0}}}}
+    assert io_benchmark.compare_with_baseline(report, baseline, tolerance=1.5) == \
+           ['store_auto con 2000 modelos: 100.0 µs/modelo (antes 50.0)']
+    table = io_benchmark.format_table(report).splitlines()
+    assert table[2].split() == ['store_auto', '100.0', '100.0', '1.00']
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Pruebas del top-N de modelos durante la ejecución (leaderboard.py).
+No requieren Modeller: python3 -m pytest test_leaderboard.py
+"""
+
+import csv
+import random
+
+import leaderboard
+
+def names(board):
+    return [e['name'] for e in board.ranking()]
+
+def read_rows(path):
+    with open(path, newline='') as f:
+        return list(csv.DictReader(f))
+
+def test_keeps_lowest_scores_in_any_order(tmp_path):
+    scores = {f'm{i}': random.Random(i).uniform(-60000, -20000) for i in range(200)}
+    board = leaderboard.Leaderboard(size=10, path=str(tmp_path / 'top.csv'))
+    for name, score in scores.items():
+        board.add(name, score)
+    assert names(board) == sorted(scores, key=scores.get)[:10]
+    assert board.scored == 200
+
+def test_ignores_failed_models(tmp_path):
+    board = leaderboard.Leaderboard(size=5, path=str(tmp_path / 'top.csv'))
+    for score in (None, float('nan'), float('inf'), 9999999.0):
+        board.add('failed', score)
+    assert board.ranking() == [] and board.scored == 0
+
+def test_new_score_of_a_listed_model_replaces_the_old_one(tmp_path):
+    board = leaderboard.Leaderboard(size=2, path=str(tmp_path / 'top.csv'))
+    board.add('a', -300.0, stage='automodel')
+    board.add('b', -200.0, stage='automodel')
+    board.add('a', -100.0, zscore=-1.5, stage='final')
+    assert names(board) == ['b', 'a']
+    assert board.entries['a']['stage'] == 'final' and board.entries['a']['zscore'] == -1.5
+    # 'a' es ahora el peor del top y es el que sale
+    board.add('c', -150.0)
+    assert names(board) == ['b', 'c']
+
+def test_rename_follows_the_model(tmp_path):
+    board = leaderboard.Leaderboard(size=2, path=str(tmp_path / 'top.csv'))
+    board.add('seq.B99990001.pdb', -100.0, path='seq.B99990001.pdb')
+    board.add('seq.B99990002.pdb', -200.0, path='seq.B99990002.pdb')
+    board.rename('seq.B99990001.pdb', 'AUTO_2.pdb', 'models/auto/AUTO_2.pdb')
+    board.rename('missing.pdb', 'AUTO_9.pdb')
+    assert names(board) == ['seq.B99990002.pdb', 'AUTO_2.pdb']
+    assert board.entries['AUTO_2.pdb']['path'] == 'models/auto/AUTO_2.pdb'
+    # El montículo también usa el nombre nuevo
+    board.add('LOOP_1.pdb', -150.0)
+    assert names(board) == ['seq.B99990002.pdb', 'LOOP_1.pdb']
+
+def test_flush_writes_ranked_csv(tmp_path):
+    path = tmp_path / 'top.csv'
+    board = leaderboard.Leaderboard(size=3, path=str(path), min_interval=0.0)
+    board.add('a', -100.0, stage='automodel', path='models/a.pdb')
+    board.add('b', -250.5, zscore=-1.25, stage='final', path='models/b.pdb')
+    board.flush()
+    rows = read_rows(path)
+    assert [(r['Rank'], r['Model Name'], r['DOPEHR Score'], r['DOPEHR Z-score']) for r in rows] == \
+           [('1', 'b', '-250.500', '-1.250'), ('2', 'a', '-100.000', '')]
+    assert rows[0]['Stage'] == 'final' and rows[0]['Model Path'] == 'models/b.pdb'
+    assert not (tmp_path / 'top.csv.tmp').exists()
+
+def test_flush_respects_min_interval_unless_forced(tmp_path):
+    path = tmp_path / 'top.csv'
+    board = leaderboard.Leaderboard(size=3, path=str(path), min_interval=3600.0)
+    board.add('a', -100.0)
+    board.flush(force=True)
+    board.add('b', -200.0)
+    board.flush()
+    assert len(read_rows(path)) == 1
+    board.flush(force=True)
+    assert len(read_rows(path)) == 2
+
+def test_flush_without_changes_does_not_write(tmp_path):
+    path = tmp_path / 'top.csv'
+    leaderboard.Leaderboard(size=3, path=str(path)).flush(force=True)
+    assert not path.exists()
+
+def test_record_reads_modeller_and_final_scores(tmp_path, monkeypatch):
+    board = leaderboard.Leaderboard(size=5, path=str(tmp_path / 'top.csv'))
+    monkeypatch.setattr(leaderboard, '_board', board)
+    leaderboard.record([{'name': 'run/seq.B99990001.pdb', 'DOPE-HR score': -100.0}], 'automodel')
+    leaderboard.record([{'name': 'LOOP_1.pdb', 'DOPEHR score': -300.0, 'DOPEHR Z-score': -2.0,
+                         'path': 'models/loop/LOOP_1.pdb'}], 'final', force=True)
+    assert names(board) == ['LOOP_1.pdb', 'seq.B99990001.pdb']
+    assert len(read_rows(tmp_path / 'top.csv')) == 2
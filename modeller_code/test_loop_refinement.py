@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Pruebas del checkpoint de las cadenas de loops (loop_refinement.py): se
+escribe el estado con pasos falsos (refine_segment sustituido), se corta la
+ejecución y se reanuda.
+No requieren Modeller: python3 -m pytest test_loop_refinement.py
+"""
+
+import json
+import importlib
+
+import pytest
+
+import config
+
+LOOPS = [(10, 15), (20, 25), (30, 35)]
+
+class Interrupted(BaseException):
+    """Corte de la ejecución (como un KeyboardInterrupt o el fin de la reserva)."""
+
+@pytest.fixture
+def loop_refinement(fake_modeller, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    module = importlib.import_module('loop_refinement')
+    monkeypatch.setattr(module.fault_tolerance, 'TASK_MAX_RETRIES', 0)
+    monkeypatch.setattr(module.fault_tolerance, 'TASK_FAILURE_REPORT', str(tmp_path / 'task_failures.csv'))
+    monkeypatch.setattr(module.geometry_check, 'rejected_by_prefilter', lambda path: None)
+    monkeypatch.setattr(module.leaderboard, 'record', lambda *args, **kwargs: None)
+    monkeypatch.setattr(module.cost_report, 'record_timing', lambda *args, **kwargs: None)
+    monkeypatch.setattr(module.pipeline_log, 'rotate_large_worker_logs', lambda *args, **kwargs: None)
+    initial = module.output_layout.model_path('AUTO_1.pdb', create=True)
+    with open(initial, 'w') as f:
+        f.write('REMARK modelo inicial\nEND\n')
+    return module
+
+def fake_steps(monkeypatch, module, outcomes):
+    """Sustituye refine_segment: outcomes[loop] es 'ok', 'fail' (sin modelos) o 'cut'. Retorna las llamadas."""
+    calls = []
+
+    def refine_segment(env, job, inimodel, base_name, loop_number, start, end, rand_seed=None):
+        calls.append((loop_number, base_name))
+        outcome = outcomes[loop_number]
+        if outcome == 'cut':
+            raise Interrupted()
+        if outcome == 'fail':
+            return []
+        outputs = []
+        for num in (1, 2):
+            name = f'{config.ALIGN_CODE_SEQUENCE}.BL{num:04d}0001.pdb'
+            with open(name, 'w') as f:
+                f.write(f'REMARK {base_name} loop {loop_number}\nEND\n')
+            outputs.append({'name': name, 'DOPE-HR score': -100.0 * num})
+        return outputs
+
+    monkeypatch.setattr(module, 'refine_segment', refine_segment)
+    return calls
+
+def chain_state(module):
+    with open(module._checkpoint_path('AUTO_1')) as f:
+        return json.load(f)
+
+def test_checkpoint_written_after_each_step(loop_refinement, monkeypatch):
+    calls = fake_steps(monkeypatch, loop_refinement, {1: 'ok', 2: 'ok', 3: 'cut'})
+    with pytest.raises(Interrupted):
+        loop_refinement.run_loop_refinement(object(), [], ['AUTO_1.pdb'], LOOPS)
+    assert calls == [(1, 'AUTO_1'), (2, 'AUTO_1_LOOP1_R1'), (3, 'AUTO_1_LOOP1_R1_LOOP2_R1')]
+    state = chain_state(loop_refinement)
+    assert state['next_loop_index'] == 2 and not state['completed']
+    assert state['current_best_pdb'] == 'AUTO_1_LOOP1_R1_LOOP2_R1.pdb'
+    assert state['failed_loops'] == []
+    assert state['loop_ranges'] == [list(r) for r in LOOPS]
+
+def test_resume_continues_at_next_loop(loop_refinement, monkeypatch):
+    fake_steps(monkeypatch, loop_refinement, {1: 'ok', 2: 'ok', 3: 'cut'})
+    with pytest.raises(Interrupted):
+        loop_refinement.run_loop_refinement(object(), [], ['AUTO_1.pdb'], LOOPS)
+
+    calls = fake_steps(monkeypatch, loop_refinement, {1: 'cut', 2: 'cut', 3: 'ok'})
+    job = []
+    assert loop_refinement.run_loop_refinement(object(), job, ['AUTO_1.pdb'], LOOPS) is job
+    assert calls == [(3, 'AUTO_1_LOOP1_R1_LOOP2_R1')]
+    state = chain_state(loop_refinement)
+    assert state['completed'] and state['current_best_pdb'] == 'AUTO_1_LOOP1_R1_LOOP2_R1_LOOP3_R1.pdb'
+
+    # Una cadena completada no se vuelve a refinar
+    calls = fake_steps(monkeypatch, loop_refinement, {1: 'cut', 2: 'cut', 3: 'cut'})
+    loop_refinement.run_loop_refinement(object(), job, ['AUTO_1.pdb'], LOOPS)
+    assert calls == []
+
+def test_failed_loop_is_retried_on_current_best_model(loop_refinement, monkeypatch):
+    fake_steps(monkeypatch, loop_refinement, {1: 'ok', 2: 'fail', 3: 'ok'})
+    loop_refinement.run_loop_refinement(object(), [], ['AUTO_1.pdb'], LOOPS)
+    state = chain_state(loop_refinement)
+    assert state['failed_loops'] == [2] and state['next_loop_index'] == 3 and not state['completed']
+    assert state['current_best_pdb'] == 'AUTO_1_LOOP1_R1_LOOP3_R1.pdb'
+
+    # El reintento parte del mejor modelo actual, que ya incluye el loop 3
+    calls = fake_steps(monkeypatch, loop_refinement, {1: 'cut', 2: 'ok', 3: 'cut'})
+    loop_refinement.run_loop_refinement(object(), [], ['AUTO_1.pdb'], LOOPS)
+    assert calls == [(2, 'AUTO_1_LOOP1_R1_LOOP3_R1')]
+    state = chain_state(loop_refinement)
+    assert state['failed_loops'] == [] and state['completed']
+    assert state['current_best_pdb'] == 'AUTO_1_LOOP1_R1_LOOP3_R1_LOOP2_R1.pdb'
+
+def test_changed_loops_restart_the_chain(loop_refinement, monkeypatch):
+    fake_steps(monkeypatch, loop_refinement, {1: 'ok', 2: 'ok', 3: 'ok'})
+    loop_refinement.run_loop_refinement(object(), [], ['AUTO_1.pdb'], LOOPS)
+    calls = fake_steps(monkeypatch, loop_refinement, {1: 'ok', 2: 'ok'})
+    loop_refinement.run_loop_refinement(object(), [], ['AUTO_1.pdb'], LOOPS[:2])
+    assert [loop for loop, _ in calls] == [1, 2]
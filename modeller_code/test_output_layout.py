@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Pruebas del árbol de salidas y del manifiesto de modelos (output_layout.py).
+No requieren Modeller: python3 -m pytest test_output_layout.py
+"""
+
+import os
+
+import pytest
+
+import output_layout
+
+@pytest.fixture(autouse=True)
+def run_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(output_layout, 'OUTPUT_SHARD_SIZE', 1000)
+    return tmp_path
+
+@pytest.mark.parametrize('name, expected', [
+    ('AUTO_1.pdb', 'models/auto/00001-01000'),
+    ('AUTO_1000.pdb', 'models/auto/00001-01000'),
+    ('AUTO_1001.pdb', 'models/auto/01001-02000'),
+    ('AUTO_12.pdb', 'models/auto/00001-01000'),
+    ('AUTO_1_LOOP1_R1.pdb', 'models/loops/AUTO_1'),
+    ('AUTO_1001_LOOP1_R2_LOOP3_R1.pdb', 'models/loops/AUTO_1001'),
+])
+def test_shard_dir_by_name(name, expected):
+    assert output_layout.shard_dir(name) == expected
+    assert output_layout.shard_dir(f'otra/carpeta/{name}') == expected
+
+def test_other_models_hashed_into_stable_buckets():
+    directory = output_layout.shard_dir('refinado.pdb')
+    assert os.path.dirname(directory) == 'models/other' and len(os.path.basename(directory)) == 2
+    assert output_layout.shard_dir('refinado.pdb') == directory
+
+def test_model_path_creates_only_on_request():
+    path = output_layout.model_path('AUTO_5.pdb')
+    assert path == 'models/auto/00001-01000/AUTO_5.pdb'
+    assert not os.path.exists(os.path.dirname(path))
+    output_layout.model_path('AUTO_5.pdb', create=True)
+    assert os.path.isdir(os.path.dirname(path))
+
+def test_store_model_moves_and_registers():
+    with open('FullSeq.B99990001.pdb', 'w') as f:
+        f.write('END\n')
+    path = output_layout.store_model('FullSeq.B99990001.pdb', 'AUTO_1.pdb', 'automodel', molpdf=12.5)
+    assert path == 'models/auto/00001-01000/AUTO_1.pdb'
+    assert os.path.exists(path) and not os.path.exists('FullSeq.B99990001.pdb')
+    assert output_layout.read_manifest() == {
+        'AUTO_1.pdb': {'name': 'AUTO_1.pdb', 'path': path, 'stage': 'automodel', 'molpdf': 12.5}}
+
+def test_manifest_last_record_wins_and_skips_torn_lines(run_dir):
+    output_layout.register_model('AUTO_1.pdb', 'automodel')
+    output_layout.register_model('AUTO_1.pdb', 'automodel', molpdf=3.0)
+    output_layout.register_model('AUTO_1_LOOP1_R1.pdb', 'loop_refinement')
+    with open(output_layout.OUTPUT_MANIFEST_FILE, 'a') as f:
+        f.write('{"name": "AUTO_2.pdb", "pa')
+    manifest = output_layout.read_manifest()
+    assert sorted(manifest) == ['AUTO_1.pdb', 'AUTO_1_LOOP1_R1.pdb']
+    assert manifest['AUTO_1.pdb']['molpdf'] == 3.0
+    # Desde otra carpeta, con la ruta de la ejecución
+    os.chdir('/')
+    assert sorted(output_layout.read_manifest(str(run_dir))) == ['AUTO_1.pdb', 'AUTO_1_LOOP1_R1.pdb']
+    assert output_layout.read_manifest(str(run_dir / 'no_existe')) == {}
+
+def test_manifest_models_filters_by_stage_and_existing_file(run_dir):
+    for name, stage in (('AUTO_1.pdb', 'automodel'), ('AUTO_2.pdb', 'automodel'),
+                        ('AUTO_1_LOOP1_R1.pdb', 'loop_refinement')):
+        with open(output_layout.model_path(name, create=True), 'w') as f:
+            f.write('END\n')
+        output_layout.register_model(name, stage)
+    os.remove(output_layout.model_path('AUTO_2.pdb'))
+    assert [r['name'] for r in output_layout.manifest_models()] == ['AUTO_1.pdb', 'AUTO_1_LOOP1_R1.pdb']
+    assert [r['name'] for r in output_layout.manifest_models(['automodel'])] == ['AUTO_1.pdb']
+    os.chdir('/')
+    assert len(output_layout.manifest_models(run_dir=str(run_dir))) == 2
+
+@pytest.mark.parametrize('model_number, step, expected', [
+    (1, None, 'models/intermediate/automodel/00001-01000'),
+    (0, None, 'models/intermediate/automodel/00001-01000'),
+    (2500, None, 'models/intermediate/automodel/02001-03000'),
+    (3, 'AUTO_1/LOOP2', 'models/intermediate/automodel/AUTO_1/LOOP2/00001-01000'),
+])
+def test_intermediate_dir(model_number, step, expected):
+    assert output_layout.intermediate_dir('automodel', model_number, step) == expected
+
+def test_collect_intermediates_moves_only_modeller_intermediates():
+    names = ['FullSeq.D00000001', 'FullSeq.V99991001', 'FullSeq_W1C2.DL00010002',
+             'FullSeq.IL00000003.pdb', 'FullSeq.B99990001.pdb', 'OtroSeq.D00000001', 'notas.txt']
+    for name in names:
+        with open(name, 'w') as f:
+            f.write('x\n')
+    assert output_layout.collect_intermediates('loop_refinement', 'AUTO_1/LOOP1') == 4
+    base = 'models/intermediate/loop_refinement/AUTO_1/LOOP1'
+    assert sorted(os.listdir(f'{base}/00001-01000')) == \
+           ['FullSeq.D00000001', 'FullSeq.IL00000003.pdb', 'FullSeq_W1C2.DL00010002']
+    # El número de modelo son los 4 últimos dígitos: V99991001 es el modelo 1001
+    assert os.listdir(f'{base}/01001-02000') == ['FullSeq.V99991001']
+    assert sorted(os.listdir('.')) == ['FullSeq.B99990001.pdb', 'OtroSeq.D00000001', 'models', 'notas.txt']
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Pruebas de las utilidades de texto PDB (pdb_utils.py).
+No requieren Modeller: python3 -m pytest test_pdb_utils.py
+"""
+
+import pytest
+
+import pdb_utils
+
+def atom_line(serial, name, resnum, xyz, chain='A', resname='GLY'):
+    """Registro ATOM en columnas fijas de PDB."""
+    x, y, z = xyz
+    return (f"ATOM  {serial:5d}  {name:<3} {resname:3} {chain}{resnum:4d}    "
+            f"{x:8.3f}{y:8.3f}{z:8.3f}  1.00  0.00           {name[0]}\n")
+
+def write_model(path, ca_xyz, chain='A'):
+    """PDB con un residuo (CA y C) por coordenada, numerados desde 1."""
+    lines = ["REMARK   6 modelo de prueba\n"]
+    for i, (x, y, z) in enumerate(ca_xyz):
+        lines.append(atom_line(2 * i + 1, 'CA', i + 1, (x, y, z), chain))
+        lines.append(atom_line(2 * i + 2, 'C', i + 1, (x + 1.0, y, z), chain))
+    path.write_text(''.join(lines) + "TER\nEND\n")
+    return str(path)
+
+def atom_records(path):
+    return [line for line in open(path) if pdb_utils.is_atom_record(line)]
+
+# =================================================================
+# split_loop_windows / splice_residues
+# =================================================================
+
+def test_split_loop_windows_short_segment_is_one_window():
+    assert pdb_utils.split_loop_windows(10, 25, window=20, overlap=5) == [(10, 25)]
+
+@pytest.mark.parametrize('start, end, window, overlap', [(1, 100, 30, 5), (120, 171, 20, 4), (5, 36, 10, 0)])
+def test_split_loop_windows_cover_segment_with_overlap(start, end, window, overlap):
+    windows = pdb_utils.split_loop_windows(start, end, window, overlap)
+    assert windows[0][0] == start and windows[-1][1] == end
+    assert all(b - a + 1 == window for a, b in windows)
+    for (_, previous_end), (next_start, _) in zip(windows, windows[1:]):
+        assert previous_end - next_start + 1 >= overlap
+
+def test_split_loop_windows_overlap_not_below_window():
+    windows = pdb_utils.split_loop_windows(1, 12, window=4, overlap=4)
+    assert windows[0] == (1, 4) and windows[-1] == (9, 12)
+    assert all(b - a == 3 for a, b in windows)
+
+def test_splice_residues_takes_listed_residues_from_their_source(tmp_path):
+    base = write_model(tmp_path / 'base.pdb', [(3.8 * i, 0.0, 0.0) for i in range(6)])
+    window_1 = write_model(tmp_path / 'w1.pdb', [(3.8 * i, 5.0, 0.0) for i in range(6)])
+    window_2 = write_model(tmp_path / 'w2.pdb', [(3.8 * i, 9.0, 0.0) for i in range(6)])
+    output = str(tmp_path / 'merged.pdb')
+
+    pdb_utils.splice_residues(base, {('A', 2): window_1, ('A', 3): window_1, ('A', 5): window_2}, output)
+
+    blocks = pdb_utils.read_residue_blocks(output)
+    y_by_residue = {key[1]: float(lines[0][38:46]) for key, lines in blocks.items()}
+    assert y_by_residue == {1: 0.0, 2: 5.0, 3: 5.0, 4: 0.0, 5: 9.0, 6: 0.0}
+    # Orden de residuos, número de átomos y registros no atómicos iguales al modelo base
+    assert [pdb_utils.residue_key(line) for line in atom_records(output)] == \
+           [pdb_utils.residue_key(line) for line in atom_records(base)]
+    assert open(output).readline().startswith('REMARK')
+    assert not (tmp_path / 'merged.pdb.tmp').exists()
+
+def test_splice_residues_missing_residue_in_source(tmp_path):
+    base = write_model(tmp_path / 'base.pdb', [(3.8 * i, 0.0, 0.0) for i in range(6)])
+    short = write_model(tmp_path / 'short.pdb', [(3.8 * i, 0.0, 0.0) for i in range(3)])
+    with pytest.raises(ValueError):
+        pdb_utils.splice_residues(base, {('A', 5): short}, str(tmp_path / 'merged.pdb'))
+
+# =================================================================
+# crop_subsystem
+# =================================================================
+
+def folded_model(path):
+    """30 residuos en línea recta salvo el 16 y el 25, plegados junto al loop 10-12."""
+    ca_xyz = [(3.8 * i, 0.0, 0.0) for i in range(30)]
+    ca_xyz[15] = (3.8 * 10, 4.0, 0.0)
+    ca_xyz[24] = (3.8 * 11, -4.0, 0.0)
+    return write_model(path, ca_xyz)
+
+def fragments(path):
+    """Fragmentos del PDB separados por TER como [(cadena, [resnums])]."""
+    result, current = [], []
+    for line in open(path):
+        if line.startswith('TER'):
+            result.append((current[0][0], [r for _, r in dict.fromkeys(current)]))
+            current = []
+        elif pdb_utils.is_atom_record(line):
+            current.append(pdb_utils.residue_key(line))
+    return result
+
+def test_crop_subsystem_selects_loop_anchors_and_neighbours(tmp_path):
+    model = folded_model(tmp_path / 'model.pdb')
+    output = str(tmp_path / 'crop.pdb')
+    pdb_utils.crop_subsystem(model, 10, 12, 'A', radius=6.0, anchor_residues=2, output_pdb=output, max_gap=2)
+    # 8-14: loop y anclajes; 16 por cercanía; 15 rellena el hueco; 25 va en otra cadena
+    assert fragments(output) == [('A', list(range(8, 17))), ('B', [25])]
+    assert open(output).read().endswith("END\n")
+
+def test_crop_subsystem_without_gap_filling(tmp_path):
+    model = folded_model(tmp_path / 'model.pdb')
+    output = str(tmp_path / 'crop.pdb')
+    pdb_utils.crop_subsystem(model, 10, 12, 'A', radius=6.0, anchor_residues=2, output_pdb=output, max_gap=0)
+    assert fragments(output) == [('A', list(range(8, 15))), ('B', [16]), ('C', [25])]
+
+def test_crop_subsystem_keeps_original_coordinates(tmp_path):
+    model = folded_model(tmp_path / 'model.pdb')
+    output = str(tmp_path / 'crop.pdb')
+    pdb_utils.crop_subsystem(model, 10, 12, 'A', radius=6.0, anchor_residues=2, output_pdb=output)
+    # Solo cambia la cadena de los fragmentos que no contienen el loop
+    original = {line[:21] + line[22:] for line in atom_records(model)}
+    cropped = atom_records(output)
+    assert cropped and all(line[:21] + line[22:] in original for line in cropped)
+
+def test_crop_subsystem_missing_loop_residue(tmp_path):
+    model = write_model(tmp_path / 'model.pdb', [(3.8 * i, 0.0, 0.0) for i in range(10)])
+    with pytest.raises(ValueError):
+        pdb_utils.crop_subsystem(model, 8, 12, 'A', radius=6.0, anchor_residues=2,
+                                 output_pdb=str(tmp_path / 'crop.pdb'))
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Pruebas de la rotación de los logs de los workers (pipeline_log.py): un
+"worker" escribe por un descriptor de open_worker_log mientras se rota.
+No requieren Modeller: python3 -m pytest test_pipeline_log.py
+"""
+
+import os
+import gzip
+import glob
+import itertools
+
+import pytest
+
+import pipeline_log
+
+@pytest.fixture
+def worker_log(tmp_path, monkeypatch):
+    """Log de un worker abierto como lo abre worker_pool; retorna (ruta, descriptor)."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(pipeline_log, 'WORKER_LOG_DIR', str(tmp_path / 'worker_logs'))
+    monkeypatch.setattr(pipeline_log, 'WORKER_LOG_PATTERNS', ('*.worker*',))
+    monkeypatch.setattr(pipeline_log, 'WORKER_LOG_KEEP', 5)
+    stamps = (f'20260101-0000{second:02d}' for second in itertools.count())
+    monkeypatch.setattr(pipeline_log.time, 'strftime', lambda fmt: next(stamps))
+    path = tmp_path / 'sali.worker0'
+    path.write_bytes(b'contenido de una ejecucion anterior\n')
+    log = pipeline_log.open_worker_log(str(path))
+    yield str(path), log.fileno()
+    log.close()
+
+def archived(path):
+    """Contenido de las rotaciones comprimidas de un log, de la más antigua a la más reciente."""
+    archives = sorted(glob.glob(os.path.join(pipeline_log.WORKER_LOG_DIR, os.path.basename(path) + '.*.gz')))
+    return [gzip.GzipFile(archive).read() for archive in archives]
+
+def test_rotation_archives_and_empties_the_log(worker_log):
+    path, fd = worker_log
+    assert os.path.getsize(path) == 0
+    os.write(fd, b'tanda 1\n')
+    assert pipeline_log.rotate_worker_logs('automodel') == 1
+    assert archived(path) == [b'tanda 1\n']
+    assert glob.glob(os.path.join(pipeline_log.WORKER_LOG_DIR, '*.automodel.gz'))
+    # El worker sigue escribiendo al principio del log vaciado, sin hueco de bytes nulos
+    os.write(fd, b'tanda 2\n')
+    assert open(path, 'rb').read() == b'tanda 2\n'
+    # Los logs vacíos no se rotan
+    os.ftruncate(fd, 0)
+    assert pipeline_log.rotate_worker_logs('final') == 0
+
+def test_rotation_only_above_size_limit(worker_log, monkeypatch):
+    path, fd = worker_log
+    os.write(fd, b'x' * 2048)
+    assert pipeline_log.rotate_worker_logs('loop_refinement', min_size_mb=1) == 0
+    monkeypatch.setattr(pipeline_log, 'WORKER_LOG_MAX_MB', 0)
+    assert pipeline_log.rotate_large_worker_logs('loop_refinement') == 0
+    monkeypatch.setattr(pipeline_log, 'WORKER_LOG_MAX_MB', 1 / 1024)
+    assert pipeline_log.rotate_large_worker_logs('loop_refinement') == 1
+    assert archived(path) == [b'x' * 2048]
+
+def test_rotation_keeps_latest_archives(worker_log, monkeypatch):
+    path, fd = worker_log
+    monkeypatch.setattr(pipeline_log, 'WORKER_LOG_KEEP', 2)
+    for batch in range(4):
+        os.write(fd, f'tanda {batch}\n'.encode())
+        pipeline_log.rotate_worker_logs('automodel')
+    assert archived(path) == [b'tanda 2\n', b'tanda 3\n']
+
+class WritingGzipFile(gzip.GzipFile):
+    """Archivo gzip que simula al worker escribiendo en su log durante la compresión y al cerrarla."""
+
+    def __init__(self, fd, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.worker_fd = fd
+        self.writes = 0
+
+    def write(self, data):
+        self.writes += 1
+        if self.writes == 1:
+            os.write(self.worker_fd, b'escrito durante la compresion\n')
+        return super().write(data)
+
+    def close(self):
+        if not self.closed:
+            os.write(self.worker_fd, b'escrito al cerrar la copia\n')
+        super().close()
+
+def test_rotation_does_not_lose_writes_at_copy_truncate_boundary(worker_log, monkeypatch):
+    path, fd = worker_log
+    monkeypatch.setattr(pipeline_log.gzip, 'open',
+                        lambda filename, mode, compresslevel: WritingGzipFile(fd, filename, mode, compresslevel))
+    os.write(fd, b'tanda 1\n')
+    assert pipeline_log.rotate_worker_logs('automodel') == 1
+    # Lo escrito mientras se comprimía va a la rotación; lo escrito tras el vaciado queda en el log
+    assert archived(path) == [b'tanda 1\nescrito durante la compresion\n']
+    assert open(path, 'rb').read() == b'escrito al cerrar la copia\n'
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Pruebas de la selección de regiones por perfil DOPE-HR (region_selection.py)
+con perfiles sintéticos. No requieren Modeller: python3 -m pytest test_region_selection.py
+"""
+
+import logging
+
+import pytest
+
+import region_selection
+
+def make_profile(high, length=50):
+    """Perfil de 'length' residuos con energía 0 salvo los indicados en high ({resnum: energía})."""
+    return [(r, high.get(r, 0.0)) for r in range(1, length + 1)]
+
+def ranges(candidates):
+    return [c['range'] for c in candidates]
+
+# =================================================================
+# candidate_segments
+# =================================================================
+
+def test_candidate_segments_merges_close_high_residues():
+    profile = make_profile({10: 1.0, 11: 1.0, 12: 1.0, 30: 0.5, 32: 0.5})
+    candidates = region_selection.candidate_segments(profile, [], 0.2, merge_gap=2, min_length=1, max_length=0)
+    assert ranges(candidates) == [(10, 12), (30, 32)]
+    assert [c['excess'] for c in candidates] == pytest.approx([2.4, 0.6])
+    assert {c['source'] for c in candidates} == {'profile'}
+
+def test_candidate_segments_alignment_gaps():
+    profile = make_profile({10: 1.0, 11: 1.0, 12: 1.0, 21: 0.5})
+    gaps = [(11, 14), (20, 22), (40, 42)]
+    candidates = region_selection.candidate_segments(profile, gaps, 0.2, merge_gap=2, min_length=1, max_length=0)
+    # (40, 42) no supera el umbral y se omite
+    assert [(c['range'], c['source']) for c in candidates] == [((10, 14), 'profile+gap'), ((20, 22), 'gap')]
+
+def test_candidate_segments_pads_short_runs_inside_the_chain():
+    profile = make_profile({1: 1.0, 20: 1.0})
+    candidates = region_selection.candidate_segments(profile, [], 0.2, merge_gap=0, min_length=5, max_length=0)
+    assert ranges(candidates) == [(1, 5), (18, 22)]
+
+def test_candidate_segments_splits_segments_longer_than_max_length():
+    profile = make_profile({r: 1.0 for r in range(10, 30)})
+    candidates = region_selection.candidate_segments(profile, [], 0.2, merge_gap=0, min_length=1, max_length=8)
+    pieces = ranges(candidates)
+    assert pieces[0][0] == 10 and pieces[-1][1] == 29
+    assert all(end - start + 1 <= 8 for start, end in pieces)
+    assert all(c['source'] == 'profile, tramo' for c in candidates)
+
+def test_candidate_segments_empty_profile():
+    assert region_selection.candidate_segments([], [(3, 6)], 0.2) == []
+
+def test_profile_threshold_fixed_or_from_profile():
+    profile = make_profile({5: 2.0}, length=4)
+    assert region_selection.profile_threshold(profile, threshold=0.7) == 0.7
+    assert region_selection.profile_threshold(profile, threshold=None, sigma=0.0) == pytest.approx(0.0)
+    assert region_selection.profile_threshold(profile[:1], threshold=None) == float('inf')
+
+# =================================================================
+# select_segments
+# =================================================================
+
+def candidate(start, end, excess):
+    return {'range': (start, end), 'excess': excess, 'source': 'profile'}
+
+def test_select_segments_worst_first_returned_in_sequence_order():
+    candidates = [candidate(1, 5, 1.0), candidate(10, 14, 3.0), candidate(20, 24, 2.0)]
+    selected = region_selection.select_segments(candidates, max_segments=2, max_residues=0)
+    assert ranges(selected) == [(10, 14), (20, 24)]
+
+def test_select_segments_residue_budget_skips_and_logs(caplog):
+    candidates = [candidate(1, 10, 5.0), candidate(20, 29, 4.0), candidate(40, 42, 1.0)]
+    with caplog.at_level(logging.INFO, logger='pipeline.region_selection'):
+        selected = region_selection.select_segments(candidates, max_segments=0, max_residues=15)
+    # El segundo no cabe; el tercero (más corto) sí
+    assert ranges(selected) == [(1, 10), (40, 42)]
+    skipped = [r.getMessage() for r in caplog.records if 'Se omite' in r.getMessage()]
+    assert len(skipped) == 1 and '20-29' in skipped[0]
+
+def test_select_segments_without_limits():
+    candidates = [candidate(30, 31, 0.1), candidate(1, 2, 0.2)]
+    assert ranges(region_selection.select_segments(candidates, max_segments=0, max_residues=0)) == [(1, 2), (30, 31)]
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Pruebas de las utilidades de secuencia sin Modeller (sequence_utils.py).
+python3 -m pytest test_sequence_utils.py
+"""
+
+import os
+
+import sequence_utils
+
+def test_build_cde_line_maps_ss_to_residues_and_dots_to_gaps():
+    assert sequence_utils.build_cde_line("AC--DE-F", "HHEC") == "CDE:HH..EC.C"
+
+def test_build_cde_line_pads_short_ss_with_coil():
+    assert sequence_utils.build_cde_line("ACDEF", "HE") == "CDE:HECCC"
+
+def test_build_cde_line_ignores_extra_ss():
+    assert sequence_utils.build_cde_line("-AC", "HHHH") == "CDE:.HH"
+
+def test_build_cde_line_same_length_as_alignment():
+    aligned = "MK--TAYIAK-QR" * 20
+    line = sequence_utils.build_cde_line(aligned, "C" * 200)
+    assert len(line) == len("CDE:") + len(aligned)
+
+def test_pir_entry_with_and_without_comment():
+    assert sequence_utils.pir_entry("seq", "sequence:seq::::::::", "AC-D") == \
+        ">P1;seq\nsequence:seq::::::::\nAC-D*\n"
+    assert sequence_utils.pir_entry("seq", "sequence:seq::::::::", "AC-D", "CDE:HH.E") == \
+        ">P1;seq\nsequence:seq::::::::\nCDE:HH.E\nAC-D*\n"
+
+# =================================================================
+# alignment_sequences (Alignment de Modeller simulado)
+# =================================================================
+
+class StubResidue:
+    def __init__(self, code):
+        self.code = code
+
+class StubSequence:
+    """Secuencia de un Alignment: {índice de posición: código de residuo}."""
+    def __init__(self, code, residues):
+        self.code = code
+        self.residues = residues
+
+class StubPosition:
+    def __init__(self, index):
+        self.index = index
+
+    def get_residue(self, seq):
+        code = seq.residues.get(self.index)
+        return StubResidue(code) if code is not None else None
+
+class StubAlignment(list):
+    def __init__(self, sequences, length):
+        list.__init__(self, sequences)
+        self.positions = [StubPosition(i) for i in range(length)]
+
+def test_alignment_sequences_reads_gaps_and_blk_from_positions():
+    template = StubSequence('8vx1', {0: 'm', 1: 'k', 3: 't', 4: '.'})
+    target = StubSequence('FullSeq', {0: 'm', 1: 'k', 2: 'a', 3: 't'})
+    aln = StubAlignment([template, target], length=5)
+    assert sequence_utils.alignment_sequences(aln) == [('8vx1', 'MK-T.'), ('FullSeq', 'MKAT-')]
+
+def test_alignment_sequences_matches_pir_reader(tmp_path):
+    aln = StubAlignment([StubSequence('t1', {0: 'a', 2: 'c'}), StubSequence('t2', {1: 'd'}),
+                         StubSequence('FullSeq', {0: 'a', 1: 'd', 2: 'c'})], length=3)
+    entries = sequence_utils.alignment_sequences(aln)
+    pir = tmp_path / 'aln.ali'
+    pir.write_text(''.join(sequence_utils.pir_entry(code, 'structureX:x', seq) for code, seq in entries))
+    assert sequence_utils.read_aligned_sequences_from_ali(str(pir)) == entries
+
+# =================================================================
+# _parsed_once (lecturas memorizadas por archivo)
+# =================================================================
+
+def counting_parser():
+    calls = []
+
+    @sequence_utils._parsed_once
+    def parse(path, suffix=''):
+        calls.append(path)
+        return [open(path).read().strip() + suffix]
+    return parse, calls
+
+def test_parsed_once_reads_each_file_once(tmp_path):
+    parse, calls = counting_parser()
+    path = tmp_path / 'a.txt'
+    path.write_text('uno\n')
+    assert parse(str(path)) == parse(str(path)) == ['uno']
+    assert len(calls) == 1
+    # Otros argumentos son otra lectura
+    assert parse(str(path), suffix='!') == ['uno!']
+    assert len(calls) == 2
+
+def test_parsed_once_returns_copies(tmp_path):
+    parse, _ = counting_parser()
+    path = tmp_path / 'a.txt'
+    path.write_text('uno\n')
+    parse(str(path)).append('modificado')
+    assert parse(str(path)) == ['uno']
+
+def test_parsed_once_rereads_modified_file(tmp_path):
+    parse, calls = counting_parser()
+    path = tmp_path / 'a.txt'
+    path.write_text('uno\n')
+    parse(str(path))
+    path.write_text('dos\n')
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert parse(str(path)) == ['dos']
+    assert len(calls) == 2
+
+def test_parsed_once_missing_file_is_not_cached(tmp_path):
+    calls = []
+
+    @sequence_utils._parsed_once
+    def parse(path):
+        calls.append(path)
+        return []
+    missing = str(tmp_path / 'falta.txt')
+    parse(missing)
+    parse(missing)
+    assert len(calls) == 2
+
+def test_extract_ss_from_ss2_parsed_once(tmp_path, monkeypatch):
+    ss2 = tmp_path / 'seq.ss2'
+    ss2.write_text("# PSIPRED VFORMAT\n\n   1 M C   1.0 0.0 0.0\n   2 K H   0.0 1.0 0.0\n   3 T E   0.0 0.0 1.0\n")
+    assert sequence_utils.extract_ss_from_ss2(str(ss2), 'MKTA') == 'CHEC'
+    # La segunda lectura sale de la memoria aunque el archivo ya no se pueda abrir
+    monkeypatch.setattr('builtins.open', None)
+    assert sequence_utils.extract_ss_from_ss2(str(ss2), 'MKTA') == 'CHEC'
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Pruebas de la caché de etapas dirigida por contenido (stage_cache.py).
+No requieren Modeller: python3 -m pytest test_stage_cache.py
+"""
+
+import pytest
+
+import stage_cache
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(stage_cache, 'USE_STAGE_CACHE', True)
+    monkeypatch.setattr(stage_cache, 'STAGE_CACHE_DIR', str(tmp_path / '.stage_cache'))
+
+def test_stage_key_is_canonical():
+    key = stage_cache.stage_key('alignment', {'a': 1, 'b': [1, 2]})
+    assert key == stage_cache.stage_key('alignment', {'b': [1, 2], 'a': 1})
+    assert key != stage_cache.stage_key('alignment', {'a': 2, 'b': [1, 2]})
+    assert key != stage_cache.stage_key('automodel', {'a': 1, 'b': [1, 2]})
+
+def test_file_digest_follows_content(tmp_path):
+    path = tmp_path / 'template.pdb'
+    path.write_text('ATOM 1\n')
+    first = stage_cache.file_digest(str(path))
+    path.write_text('ATOM 2\n')
+    assert stage_cache.file_digest(str(path)) != first
+    path.write_text('ATOM 1\n')
+    assert stage_cache.file_digest(str(path)) == first
+    assert stage_cache.file_digest(str(tmp_path / 'falta.pdb')) == ''
+
+def test_code_version_depends_on_modules():
+    assert stage_cache.code_version(['stage_cache.py']) == stage_cache.code_version(['stage_cache.py'])
+    assert stage_cache.code_version(['stage_cache.py']) != stage_cache.code_version(['stage_cache.py', 'config.py'])
+
+def test_save_and_load_stage(tmp_path):
+    output = tmp_path / 'alignment.ali'
+    output.write_text('>P1;x\n')
+    stage_cache.save_stage('alignment', 'k1', {'loops': [[1, 5]]}, outputs=[str(output)])
+    assert stage_cache.load_stage('alignment', 'k1') == {'loops': [[1, 5]]}
+    assert stage_cache.last_result('alignment') == {'loops': [[1, 5]]}
+
+def test_load_stage_invalidated_by_key_and_outputs(tmp_path):
+    output = tmp_path / 'alignment.ali'
+    output.write_text('>P1;x\n')
+    stage_cache.save_stage('alignment', 'k1', 'resultado', outputs=[str(output)])
+    assert stage_cache.load_stage('alignment', 'k2') is None
+    output.write_text('>P1;x\nmás largo\n')
+    assert stage_cache.load_stage('alignment', 'k1') is None
+    output.unlink()
+    assert stage_cache.load_stage('alignment', 'k1') is None
+
+def test_save_stage_skips_missing_outputs(tmp_path):
+    stage_cache.save_stage('automodel', 'k1', 'resultado', outputs=[str(tmp_path / 'AUTO_1.pdb')])
+    assert stage_cache.load_stage('automodel', 'k1') is None
+
+def test_disabled_cache(monkeypatch):
+    stage_cache.save_stage('alignment', 'k1', 'resultado')
+    monkeypatch.setattr(stage_cache, 'USE_STAGE_CACHE', False)
+    assert stage_cache.load_stage('alignment', 'k1') is None
+    assert stage_cache.load_item_cache('ranking_scores', 'v1') == {}
+
+def test_item_cache_discarded_on_version_change():
+    stage_cache.save_item_cache('ranking_scores', 'v1', {'AUTO_1.pdb': {'key': '10:1'}})
+    assert stage_cache.load_item_cache('ranking_scores', 'v1') == {'AUTO_1.pdb': {'key': '10:1'}}
+    assert stage_cache.load_item_cache('ranking_scores', 'v2') == {}
+
+def test_file_stat_key_changes_with_file(tmp_path):
+    path = tmp_path / 'AUTO_1.pdb'
+    path.write_text('END\n')
+    key = stage_cache.file_stat_key(str(path))
+    path.write_text('REMARK\nEND\n')
+    assert stage_cache.file_stat_key(str(path)) != key
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Pruebas de la preparación de templates (template_prep.py) y de su caché.
+No requieren Modeller: python3 -m pytest test_template_prep.py
+"""
+
+import os
+
+import pytest
+
+import template_prep
+
+def atom_line(serial, name, resname, chain, resnum, record='ATOM  ', altloc=' '):
+    return (f"{record}{serial:5d}  {name:<3}{altloc}{resname:3} {chain}{resnum:4d}    "
+            f"{1.0:8.3f}{2.0:8.3f}{3.0:8.3f}  1.00  0.00           {name[0]}\n")
+
+RAW_PDB = (
+    "HEADER    PRUEBA\n"
+    "REMARK   2 RESOLUTION.\n"
+    + atom_line(1, 'N', 'MET', 'A', 5) + atom_line(2, 'CA', 'MET', 'A', 5)
+    + atom_line(3, 'CA', 'LYS', 'A', 6) + atom_line(4, 'CB', 'LYS', 'A', 6, altloc='B')
+    + "TER       5      LYS A   6\n"
+    + atom_line(6, 'C1', 'LIG', 'B', 1, record='HETATM')
+    + atom_line(7, 'O', 'HOH', 'A', 301, record='HETATM')
+    + "CONECT    1    2\nEND\n"
+)
+
+@pytest.fixture
+def raw_pdb(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(template_prep.stage_cache, 'USE_STAGE_CACHE', True)
+    monkeypatch.setattr(template_prep.stage_cache, 'STAGE_CACHE_DIR', str(tmp_path / '.stage_cache'))
+    path = tmp_path / '8vx1.pdb'
+    path.write_text(RAW_PDB)
+    return str(path)
+
+def prepare(raw_pdb, **kwargs):
+    kwargs.setdefault('exclude_resnames', ['HOH'])
+    kwargs.setdefault('hetatm_chains', ['B'])
+    return template_prep.prepare_template(raw_pdb, chain_id='A', **kwargs)
+
+def test_prepare_template_cleans_and_renumbers(raw_pdb):
+    summary = prepare(raw_pdb)
+    assert summary['output'] == raw_pdb.replace('.pdb', '_prep.pdb')
+    assert (summary['atom_residues'], summary['hetatm_residues'], summary['removed_residues']) == (2, 1, 1)
+    assert summary['sequence'] == 'MK'
+    lines = open(summary['output']).read().splitlines()
+    records = [line for line in lines if line.startswith(('ATOM', 'HETATM'))]
+    # Sin metadata, sin agua, sin la ubicación alternativa B; una sola cadena renumerada desde 1
+    assert [(line[:6].strip(), line[17:20], line[21], int(line[22:26])) for line in records] == \
+           [('ATOM', 'MET', 'A', 1), ('ATOM', 'MET', 'A', 1), ('ATOM', 'LYS', 'A', 2), ('HETATM', 'LIG', 'A', 3)]
+    assert not any(line.startswith(('HEADER', 'REMARK', 'CONECT')) for line in lines)
+    assert lines[-1] == 'END'
+
+def test_prepare_template_reuses_cached_result(raw_pdb, caplog):
+    first = prepare(raw_pdb)
+    mtime = os.stat(first['output']).st_mtime_ns
+    caplog.set_level('INFO', logger='pipeline.template_prep')
+    assert prepare(raw_pdb) == first
+    assert 'reutilizado desde caché' in caplog.text
+    assert os.stat(first['output']).st_mtime_ns == mtime
+
+@pytest.mark.parametrize('change', ['parameters', 'raw', 'output'])
+def test_prepare_template_cache_invalidation(raw_pdb, change):
+    first = prepare(raw_pdb)
+    kwargs = {}
+    if change == 'parameters':
+        kwargs['hetatm_chains'] = []
+    elif change == 'raw':
+        with open(raw_pdb, 'a') as f:
+            f.write(atom_line(8, 'CA', 'GLY', 'A', 7))
+    else:
+        os.remove(first['output'])
+    second = prepare(raw_pdb, **kwargs)
+    assert os.path.exists(second['output'])
+    expected = {'parameters': (3, 0, 'MKX'), 'raw': (3, 1, 'MKG'), 'output': (2, 1, 'MK')}[change]
+    assert (second['atom_residues'], second['hetatm_residues'], second['sequence']) == expected
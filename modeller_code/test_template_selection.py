@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Pruebas del ranking de templates (template_selection.py). El alineamiento de
+Modeller de cada candidato se sustituye por puntuaciones fijas.
+No requieren Modeller: python3 -m pytest test_template_selection.py
+"""
+
+import os
+import csv
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import template_selection
+
+def test_template_code_from_file():
+    assert template_selection.template_code_from_file('templates/8vx1-DS.renum.pdb') == '8vx1_DS_renum'
+
+def test_coverage_and_identity_ignore_blk_and_target_gaps():
+    # Target: 6 residuos (la columna '.'/'-' no cuenta); 5 alineados con el template; 4 idénticos
+    coverage, identity = template_selection.alignment_coverage_identity('MK-TAV.', 'MKLTGV-')
+    assert coverage == pytest.approx(5 / 6)
+    assert identity == pytest.approx(4 / 5)
+    assert template_selection.alignment_coverage_identity('---', 'ABC') == (0.0, 0.0)
+
+# Cobertura e identidad de cada candidato (None: el alineamiento falla)
+SCORES = {'a.pdb': (0.9, 0.5), 'b.pdb': (0.6, 0.75), 'c.pdb': (0.8, 0.6), 'd.pdb': None}
+
+@pytest.fixture
+def template_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(template_selection.stage_cache, 'USE_STAGE_CACHE', True)
+    monkeypatch.setattr(template_selection.stage_cache, 'STAGE_CACHE_DIR', str(tmp_path / '.stage_cache'))
+    monkeypatch.setattr(template_selection, 'TEMPLATE_RANKING_FILE', str(tmp_path / 'template_ranking.csv'))
+    monkeypatch.setattr(template_selection, 'ProcessPoolExecutor', ThreadPoolExecutor)
+    directory = tmp_path / 'templates'
+    directory.mkdir()
+    for name in SCORES:
+        (directory / name).write_text(f'REMARK {name}\nEND\n')
+    (directory / 'notas.txt').write_text('no es un template\n')
+    return directory
+
+def fake_scorer(calls):
+    def score(template_file):
+        calls.append(os.path.basename(template_file))
+        values = SCORES[os.path.basename(template_file)]
+        if values is None:
+            raise RuntimeError('salign falló')
+        coverage, identity = values
+        return {'code': template_selection.template_code_from_file(template_file), 'file': template_file,
+                'coverage': coverage, 'identity': identity, 'score': coverage * identity}
+    return score
+
+def test_rank_templates_orders_by_score_then_coverage(template_dir, monkeypatch):
+    calls = []
+    monkeypatch.setattr(template_selection, '_score_template', fake_scorer(calls))
+    ranking = template_selection.rank_templates(str(template_dir), processes=2)
+    # c tiene el mejor score (0.48); a y b empatan (0.45) y a va antes por cobertura; d falla y no entra
+    assert [r['code'] for r in ranking] == ['c', 'a', 'b']
+    assert sorted(calls) == ['a.pdb', 'b.pdb', 'c.pdb', 'd.pdb']
+    with open(template_selection.TEMPLATE_RANKING_FILE, newline='') as f:
+        rows = list(csv.DictReader(f))
+    assert [(row['Rank'], row['Code'], row['Score']) for row in rows] == \
+           [('1', 'c', '0.480'), ('2', 'a', '0.450'), ('3', 'b', '0.450')]
+
+def test_rank_templates_cached_until_templates_change(template_dir, monkeypatch):
+    calls = []
+    monkeypatch.setattr(template_selection, '_score_template', fake_scorer(calls))
+    first = template_selection.rank_templates(str(template_dir), processes=2)
+    calls.clear()
+    assert template_selection.rank_templates(str(template_dir), processes=2) == first
+    assert calls == []
+    (template_dir / 'b.pdb').write_text('REMARK otra estructura\nEND\n')
+    template_selection.rank_templates(str(template_dir), processes=2)
+    assert sorted(calls) == ['a.pdb', 'b.pdb', 'c.pdb', 'd.pdb']
+
+def test_rank_templates_empty_directory(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        template_selection.rank_templates(str(tmp_path))
+
+def test_select_templates_takes_at_least_one():
+    ranking = [{'code': 'c', 'file': 'c.pdb'}, {'code': 'a', 'file': 'a.pdb'}]
+    assert template_selection.select_templates(ranking, 1) == [('c', 'c.pdb')]
+    assert template_selection.select_templates(ranking, 0) == [('c', 'c.pdb')]
+    assert template_selection.select_templates(ranking, 5) == [('c', 'c.pdb'), ('a', 'a.pdb')]
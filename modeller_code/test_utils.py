@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Pruebas de la evaluación final y el ranking (utils.py) con la puntuación de
+Modeller sustituida por una función falsa.
+No requieren Modeller: python3 -m pytest test_utils.py
+"""
+
+import csv
+import types
+
+import pytest
+
+import config
+import utils
+
+def glycine_pdb(path, num_residues=6, clash=False):
+    """Cadena recta de glicinas (N, CA, C, O); con clash, un CA lejano en la secuencia cae sobre el residuo 1."""
+    offsets = {'N': (-1.2, 0.8), 'CA': (0.0, 0.0), 'C': (1.2, 0.8), 'O': (1.2, 2.0)}
+    atoms = [(name, i + 1, 3.8 * i + dx, dy) for i in range(num_residues) for name, (dx, dy) in offsets.items()]
+    if clash:
+        atoms.append(('CA', 50, 0.5, 0.0))
+    lines = [f"ATOM  {n:5d}  {name:<3} GLY A{resnum:4d}    {x:8.3f}{y:8.3f}{0.0:8.3f}  1.00  0.00           {name[0]}\n"
+             for n, (name, resnum, x, y) in enumerate(atoms, start=1)]
+    path.write_text(''.join(lines) + "END\n")
+
+@pytest.fixture
+def run_dir(tmp_path, monkeypatch):
+    """Carpeta de ejecución con un modelo limpio y otro con choques, y la evaluación de Modeller falseada."""
+    monkeypatch.chdir(tmp_path)
+    glycine_pdb(tmp_path / 'AUTO_1.pdb')
+    glycine_pdb(tmp_path / 'AUTO_2.pdb', clash=True)
+    monkeypatch.setattr(config, 'GEOMETRY_PREFILTER', True)
+    monkeypatch.setattr(utils.geometry_check, 'GEOMETRY_MAX_CLASHES', 0)
+    monkeypatch.setattr(utils.stage_cache, 'USE_STAGE_CACHE', True)
+    monkeypatch.setattr(utils.leaderboard, 'record', lambda *args, **kwargs: None)
+    monkeypatch.setattr(utils.leaderboard, 'flush', lambda: None)
+    evaluated = []
+    scores = {'AUTO_1.pdb': (-200.0, -1.0), 'AUTO_2.pdb': (-300.0, -2.0)}
+
+    def fake_evaluate(env, pdb_file):
+        evaluated.append(pdb_file)
+        return scores[pdb_file]
+
+    monkeypatch.setattr(utils, 'evaluate_model', fake_evaluate)
+    return evaluated
+
+def fake_env():
+    return types.SimpleNamespace(io=types.SimpleNamespace(atom_files_directory=None))
+
+def ranking_geometry():
+    with open('final_models_ranking.csv', newline='') as f:
+        return {row['Model Name']: (row['Rank'], row['Geometry']) for row in csv.DictReader(f)}
+
+@pytest.mark.parametrize('reject', [False, True])
+def test_cached_scores_keep_geometry_flags(run_dir, monkeypatch, reject):
+    monkeypatch.setattr(config, 'GEOMETRY_REJECT', reject)
+    first_ranking, _ = utils.final_evaluation_and_ranking(fake_env())
+    first_csv = ranking_geometry()
+    assert first_csv['AUTO_1.pdb'][1] == 'ok'
+    assert '4 choques' in first_csv['AUTO_2.pdb'][1]
+
+    run_dir.clear()
+    second_ranking, _ = utils.final_evaluation_and_ranking(fake_env())
+    # Sin volver a puntuar: las puntuaciones salen de la caché y las marcas del filtro se mantienen
+    assert run_dir == []
+    assert ranking_geometry() == first_csv
+    assert [m['name'] for m in second_ranking] == [m['name'] for m in first_ranking]
+    if reject:
+        assert [m['name'] for m in second_ranking] == ['AUTO_1.pdb']
+        assert first_csv['AUTO_2.pdb'] == ('', 'rechazado: 4 choques')
+    else:
+        assert [m['name'] for m in second_ranking] == ['AUTO_2.pdb', 'AUTO_1.pdb']
+
+def test_reject_applies_to_models_scored_in_a_previous_run(run_dir, monkeypatch):
+    monkeypatch.setattr(config, 'GEOMETRY_REJECT', False)
+    utils.final_evaluation_and_ranking(fake_env())
+    monkeypatch.setattr(config, 'GEOMETRY_REJECT', True)
+    ranking, _ = utils.final_evaluation_and_ranking(fake_env())
+    assert [m['name'] for m in ranking] == ['AUTO_1.pdb']
+    assert ranking_geometry()['AUTO_2.pdb'] == ('', 'rechazado: 4 choques')
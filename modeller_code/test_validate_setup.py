@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Pruebas del preflight de capacidad (validate_setup.py --preflight): proyección
+de las salidas y veredicto de validate_capacity con disco, inodos, escritura,
+CPUs y reserva de SLURM simulados.
+No requieren Modeller: python3 -m pytest test_validate_setup.py
+"""
+
+import os
+import time
+import types
+
+import pytest
+
+import config
+import stage_cache
+import output_layout
+import validate_setup
+
+@pytest.fixture
+def run_config(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(stage_cache, 'USE_STAGE_CACHE', True)
+    monkeypatch.setattr(stage_cache, 'STAGE_CACHE_DIR', str(tmp_path / '.stage_cache'))
+    settings = {'NUM_PROCESSORS': 4, 'NUM_MODELS_AUTO': 100, 'NUM_MODELS_TO_REFINE': 2, 'NUM_MODELS_LOOP': 5,
+                'LOOP_SELECTION': 'gaps', 'REFINE_MAX_SEGMENTS': 4, 'PDB_TEMPLATE_FILE': 'template.pdb',
+                'RAW_PDB_TEMPLATE_FILE': None, 'sequence_full': 'A' * 200, 'pdb_aa': 'A' * 100,
+                'PREFLIGHT_OUTPUT_FACTOR': 2.0, 'PREFLIGHT_FILES_PER_MODEL': 3, 'PREFLIGHT_SPACE_MARGIN': 1.2,
+                'PREFLIGHT_WRITE_MB': 1, 'PREFLIGHT_MIN_WRITE_MBPS': 20}
+    for name, value in settings.items():
+        monkeypatch.setattr(config, name, value)
+    (tmp_path / 'template.pdb').write_bytes(b'x' * 1000)
+
+def test_projected_outputs_from_template_size(run_config):
+    projection = validate_setup.projected_outputs()
+    # Sin loops detectados: REFINE_MAX_SEGMENTS segmentos; 100 + 2 x 4 x 5 modelos de 2000 bytes (template x 200/100)
+    assert projection == {'models': 140, 'loop_segments': 4, 'bytes': 140 * 2000 * 2.0, 'files': 140 * 3}
+
+def test_projected_outputs_from_detected_loops_and_manifest(run_config, tmp_path):
+    stage_cache.save_stage('loops', 'k', [[10, 15], [20, 25]])
+    for name, size in (('AUTO_1.pdb', 3000), ('AUTO_2.pdb', 5000)):
+        path = output_layout.model_path(name, create=True)
+        with open(path, 'wb') as f:
+            f.write(b'x' * size)
+        output_layout.register_model(name, 'automodel')
+    projection = validate_setup.projected_outputs()
+    # Modo 'gaps': los 2 loops detectados; tamaño medio de los modelos ya generados
+    assert projection == {'models': 120, 'loop_segments': 2, 'bytes': 120 * 4000 * 2.0, 'files': 120 * 3}
+
+def test_projected_outputs_profile_mode_prefers_segment_limit(run_config, monkeypatch):
+    stage_cache.save_stage('loops', 'k', [[10, 15], [20, 25]])
+    monkeypatch.setattr(config, 'LOOP_SELECTION', 'profile')
+    assert validate_setup.projected_outputs()['loop_segments'] == 4
+    monkeypatch.setattr(config, 'REFINE_MAX_SEGMENTS', 0)
+    assert validate_setup.projected_outputs()['loop_segments'] == 2
+
+def test_measure_write_throughput_cleans_up(run_config, tmp_path):
+    assert validate_setup.measure_write_throughput(2) > 0
+    assert not list(tmp_path.glob('.preflight_write_*'))
+
+@pytest.fixture
+def node(run_config, fake_modeller, monkeypatch):
+    """Nodo simulado que cumple todo; las pruebas cambian un valor cada una."""
+    import utils
+    import walltime
+    fake_modeller['modeller'].Environ = lambda: types.SimpleNamespace(io=types.SimpleNamespace())
+    state = types.SimpleNamespace(cpus=4, free_bytes=10 * 1024 ** 3, total_inodes=10 ** 6, free_inodes=10 ** 6,
+                                  write_mbps=500.0, eval_seconds=0.0, remaining_s=None)
+    monkeypatch.setattr(os, 'sched_getaffinity', lambda pid: set(range(state.cpus)), raising=False)
+    monkeypatch.setattr(validate_setup.shutil, 'disk_usage',
+                        lambda path: types.SimpleNamespace(total=0, used=0, free=state.free_bytes))
+    monkeypatch.setattr(os, 'statvfs',
+                        lambda path: types.SimpleNamespace(f_files=state.total_inodes, f_favail=state.free_inodes))
+    monkeypatch.setattr(validate_setup, 'measure_write_throughput', lambda size_mb: state.write_mbps)
+    monkeypatch.setattr(utils, 'evaluate_model', lambda env, path: time.sleep(state.eval_seconds))
+    monkeypatch.setattr(walltime, 'slurm_end_time',
+                        lambda: None if state.remaining_s is None else time.time() + state.remaining_s)
+    return state
+
+def test_capacity_passes_on_a_sufficient_node(node, capsys):
+    assert validate_setup.validate_capacity()
+    output = capsys.readouterr().out
+    assert 'FALLA' not in output and 'AVISO' not in output
+    assert 'Salidas proyectadas: 140 modelos' in output
+
+@pytest.mark.parametrize('field, value, expected', [
+    ('cpus', 3, True),                         # NUM_PROCESSORS = 4 > 3 CPUs: aviso (2 hilos por CPU)
+    ('cpus', 1, False),                        # más del doble de las CPUs
+    ('free_bytes', 600_000, False),            # 560 000 bytes proyectados x 1.2
+    ('free_bytes', 700_000, True),
+    ('free_inodes', 503, False),               # 420 archivos x 1.2 = 504 inodos
+    ('free_inodes', 504, True),
+    ('total_inodes', 0, True),                 # sin información de inodos: aviso
+    ('write_mbps', 19.0, False),
+    ('remaining_s', 3600, True),
+])
+def test_capacity_verdict(node, field, value, expected, capsys):
+    setattr(node, field, value)
+    assert validate_setup.validate_capacity() is expected
+    output = capsys.readouterr().out
+    assert ('FALLA' in output) is not expected
+
+def test_capacity_fails_when_final_evaluation_exceeds_reservation(node, capsys):
+    # 140 modelos x 0.05 s por evaluación (7 s) superan los 5 s que quedan de la reserva
+    node.eval_seconds = 0.05
+    node.remaining_s = 5
+    assert not validate_setup.validate_capacity()
+    assert 'supera el tiempo restante de la reserva' in capsys.readouterr().out
+
+def test_capacity_fails_when_evaluation_breaks(node, monkeypatch, capsys):
+    import utils
+
+    def broken(env, path):
+        raise RuntimeError('sin biblioteca DOPE-HR')
+
+    monkeypatch.setattr(utils, 'evaluate_model', broken)
+    assert not validate_setup.validate_capacity()
+    assert 'sin biblioteca DOPE-HR' in capsys.readouterr().out
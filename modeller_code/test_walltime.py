@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Pruebas de la planificación por límite de tiempo (walltime.py).
+No requieren Modeller ni SLURM: python3 -m pytest test_walltime.py
+"""
+
+import time
+
+import pytest
+
+import walltime
+
+@pytest.mark.parametrize('value, seconds', [
+    ('30', 30 * 60),
+    ('05:30', 5 * 60 + 30),
+    ('12:00:00', 12 * 3600),
+    ('01:02:03', 3600 + 2 * 60 + 3),
+    ('2-06', 2 * 86400 + 6 * 3600),
+    ('1-00:30', 86400 + 30 * 60),
+    ('3-04:05:06', 3 * 86400 + 4 * 3600 + 5 * 60 + 6),
+])
+def test_parse_duration_slurm_formats(value, seconds):
+    assert walltime.parse_duration(value) == seconds
+
+@pytest.mark.parametrize('value', ['UNLIMITED', 'NOT_SET', '', '1:xx'])
+def test_parse_duration_invalid(value):
+    with pytest.raises(ValueError):
+        walltime.parse_duration(value)
+
+def test_format_duration_rounds_up_to_the_minute():
+    assert walltime.format_duration(0) == "0-00:00:00"
+    assert walltime.format_duration(61) == "0-00:02:00"
+    assert walltime.format_duration(2 * 86400 + 3 * 3600) == "2-03:00:00"
+    assert walltime.parse_duration(walltime.format_duration(93784)) >= 93784
+
+def test_parse_deadline_duration_from_now():
+    before = time.time()
+    assert before + 3600 <= walltime.parse_deadline('01:00:00') <= time.time() + 3600
+
+def test_deadline_without_limit_allows_everything():
+    deadline = walltime.Deadline()
+    assert not deadline.active
+    assert deadline.remaining() == float('inf')
+    assert deadline.allows(1e9, 10 ** 6)
+
+def test_deadline_estimate_from_recorded_rates():
+    deadline = walltime.Deadline(time.time() + 3600)
+    assert deadline.estimate('automodel_batch', 10) == 0.0
+    deadline.record('automodel_batch', 40.0, 8)
+    deadline.record('automodel_batch', 20.0, 4)
+    assert deadline.estimate('automodel_batch', 10) == pytest.approx(50.0)
+
+def test_deadline_allows_keeps_ranking_reserve(monkeypatch):
+    monkeypatch.setattr(walltime, 'WALLTIME_SAFETY_MARGIN', 100.0)
+    deadline = walltime.Deadline(time.time() + 1000)
+    deadline.eval_seconds = 1.0
+    reserve = deadline.ranking_reserve(100)
+    assert reserve == pytest.approx(100.0 + 100 * walltime.RANKING_COST_FACTOR)
+    assert deadline.allows(500.0, 100)
+    assert not deadline.allows(900.0, 100)
+    assert not deadline.allows(500.0, 100, reserve=400.0)
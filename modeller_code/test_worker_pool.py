@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Pruebas de la lectura de nodos de la reserva y del pool con nodos simulados
+('standin') de worker_pool.py.
+No requieren Modeller ni SLURM: python3 -m pytest test_worker_pool.py
+"""
+
+import os
+import time
+import shlex
+
+import pytest
+
+import worker_pool
+
+@pytest.mark.parametrize('nodelist, hosts', [
+    ('node01', ['node01']),
+    ('node[01-03,07]', ['node01', 'node02', 'node03', 'node07']),
+    ('node[01-03,07],gpu[1-2]-ib', ['node01', 'node02', 'node03', 'node07', 'gpu1-ib', 'gpu2-ib']),
+    ('cn[098-101]', ['cn098', 'cn099', 'cn100', 'cn101']),
+    ('rack[1-2]-n[1,3]', ['rack1-n1', 'rack1-n3', 'rack2-n1', 'rack2-n3']),
+    ('a1, b2,a1', ['a1', 'b2']),
+    ('', []),
+])
+def test_expand_nodelist(nodelist, hosts):
+    assert worker_pool.expand_nodelist(nodelist) == hosts
+
+@pytest.mark.parametrize('value, counts', [
+    ('48', [48]),
+    ('48(x2),24', [48, 48, 24]),
+    ('16,32(x3)', [16, 32, 32, 32]),
+    ('', []),
+])
+def test_expand_cpus_per_node(value, counts):
+    assert worker_pool.expand_cpus_per_node(value) == counts
+
+def test_allocated_nodes_from_slurm(monkeypatch):
+    monkeypatch.setattr(worker_pool, 'WORKER_NODES', '')
+    monkeypatch.setattr(worker_pool, 'WORKERS_PER_NODE', 0)
+    monkeypatch.setenv('SLURM_JOB_NODELIST', 'node[01-03]')
+    monkeypatch.setenv('SLURM_JOB_CPUS_PER_NODE', '48(x2),24')
+    assert worker_pool.allocated_nodes() == [('node01', 48), ('node02', 48), ('node03', 24)]
+
+def test_allocated_nodes_fixed_workers_and_mismatched_cpus(monkeypatch):
+    monkeypatch.setattr(worker_pool, 'WORKER_NODES', 'n[1-2]')
+    monkeypatch.setattr(worker_pool, 'NUM_PROCESSORS', 8)
+    monkeypatch.setenv('SLURM_JOB_CPUS_PER_NODE', '48')
+    monkeypatch.setattr(worker_pool, 'WORKERS_PER_NODE', 0)
+    assert worker_pool.allocated_nodes() == [('n1', 8), ('n2', 8)]
+    monkeypatch.setattr(worker_pool, 'WORKERS_PER_NODE', 4)
+    assert worker_pool.allocated_nodes() == [('n1', 4), ('n2', 4)]
+
+def test_allocated_nodes_outside_slurm(monkeypatch):
+    monkeypatch.setattr(worker_pool, 'WORKER_NODES', '')
+    monkeypatch.delenv('SLURM_JOB_NODELIST', raising=False)
+    monkeypatch.delenv('SLURM_NODELIST', raising=False)
+    assert worker_pool.allocated_nodes() == []
+
+# =================================================================
+# POOL CON NODOS SIMULADOS (standin)
+# =================================================================
+
+# Tarea trivial de cada worker: espera a que llegue go.txt (copiado antes de la tanda) y escribe su salida
+WORKER_TASK = 'sh -c ' + shlex.quote(
+    'for i in $(seq 200); do [ -f go.txt ] && break; sleep 0.05; done; '
+    'tr a-z A-Z < input.txt > "out_$(basename "$PWD").txt"')
+
+class FakeWorker:
+    def __init__(self):
+        pass
+
+    def _start(self, path, id, output):
+        pass
+
+class FakeJob(list):
+    """Job mínimo de Modeller: start() arranca los workers y run_all_tasks() espera la salida de cada nodo."""
+
+    def __init__(self, seq=(), host=None):
+        list.__init__(self, seq)
+        self.host = host
+
+    def start(self):
+        for i, worker in enumerate(self):
+            worker._start(WORKER_TASK, i, f'worker{i}.log')
+
+    def run_all_tasks(self):
+        outputs = [os.path.join(w.node.workdir, f'out_{w.node.host}.txt') for w in self]
+        deadline = time.time() + 10
+        while time.time() < deadline and not all(os.path.exists(path) for path in outputs):
+            time.sleep(0.05)
+        return outputs
+
+@pytest.fixture
+def standin_pool(fake_modeller, tmp_path, monkeypatch):
+    for name, cls in (('Job', FakeJob), ('Worker', FakeWorker), ('LocalWorker', FakeWorker)):
+        setattr(fake_modeller['modeller.parallel'], name, cls)
+    run_dir = tmp_path / 'run'
+    run_dir.mkdir()
+    monkeypatch.chdir(run_dir)
+    monkeypatch.setattr(worker_pool, 'WORKER_SCRATCH_DIR', str(tmp_path / 'scratch'))
+    monkeypatch.setattr(worker_pool.cpu_placement, 'pin_controller', lambda plan: None)
+    (run_dir / 'input.txt').write_text('hola\n')
+    return tmp_path
+
+def test_standin_command_runs_in_node_workdir():
+    launcher = worker_pool.get_launcher('standin')
+    assert launcher.command('node1', '/scratch/run 1/node1', 'python3 worker.py') == \
+        "cd '/scratch/run 1/node1' && python3 worker.py"
+
+def test_standin_pool_syncs_inputs_and_collects_outputs(standin_pool):
+    job = worker_pool.create_job(0, 'standin', nodes=[('node1', 1), ('node2', 1)], shared_filesystem=False)
+    pool = job.worker_pool
+    assert [n.host for n in pool.nodes] == ['node1', 'node2'] and pool.transfers
+    # Las entradas se copian a la carpeta de cada nodo al crear el Job
+    for node in pool.nodes:
+        assert open(os.path.join(node.workdir, 'input.txt')).read() == 'hola\n'
+        assert not os.path.exists(os.path.join(node.workdir, 'go.txt'))
+
+    # Los archivos nuevos se copian antes de la tanda y las salidas se recogen al terminarla
+    open('go.txt', 'w').close()
+    job.run_all_tasks()
+    assert open('out_node1.txt').read() == open('out_node2.txt').read() == 'HOLA\n'
+    for node in pool.nodes:
+        assert 'go.txt' in node.synced and 'out_node1.txt' in node.synced
+
+def test_stage_inputs_copies_files_outside_the_run_folder(standin_pool):
+    job = worker_pool.create_job(0, 'standin', nodes=[('node1', 1)], shared_filesystem=False)
+    os.makedirs('models/loops')
+    with open('models/loops/m.pdb', 'w') as f:
+        f.write('END\n')
+    worker_pool.stage_inputs(job, ['models/loops/m.pdb'])
+    open('go.txt', 'w').close()
+    job.run_all_tasks()
+    node = job.worker_pool.nodes[0]
+    assert open(os.path.join(node.workdir, 'models', 'loops', 'm.pdb')).read() == 'END\n'
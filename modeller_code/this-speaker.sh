@@ -1,14 +1,29 @@
 #!/bin/bash
 
-# Bucle infinito para contar los archivos y mostrarlos continuamente
+MANIFEST="models/manifest.jsonl"
+
+# Con --once se hace un solo conteo y se sale (lo usa io_benchmark.py para medirlo)
+ONCE=0
+[ "$1" = "--once" ] && ONCE=1
+
+# Bucle infinito para contar los modelos y mostrarlos continuamente
 while true; do
-    # Cuenta los archivos con extensión .pdb en el directorio actual
+    # Modelos ya guardados en el árbol de salidas: nombres distintos registrados en el manifiesto
+    # (no se lista ningún directorio de modelos, solo se lee el manifiesto)
+    if [ -f "$MANIFEST" ]; then
+        numero_modelos=$(grep -o '"name": "[^"]*"' "$MANIFEST" | sort -u | wc -l)
+    else
+        numero_modelos=0
+    fi
+
+    # Modelos en curso: PDB que Modeller todavía no ha movido desde el directorio actual
     # La opción -f en find asegura que solo se cuenten archivos (no directorios)
-    # wc -l cuenta las líneas (que corresponden a los archivos encontrados)
-    numero_archivos=$(find . -maxdepth 1 -type f -name "*.pdb" | wc -l)
+    numero_en_curso=$(find . -maxdepth 1 -type f -name "*.pdb" | wc -l)
 
     # Imprime el resultado
-    echo "Número de archivos .pdb en el directorio actual: $numero_archivos"
+    echo "Modelos registrados en $MANIFEST: $numero_modelos | Archivos .pdb en el directorio actual: $numero_en_curso"
+
+    [ "$ONCE" -eq 1 ] && break
 
     # Espera 2 segundos antes de repetir el conteo
     sleep 2
@@ -1,462 +1,362 @@
 #!/usr/bin/env python3
 # utils.py
 
+"""
+Etapas del pipeline que usan Modeller (alineamiento con salign y evaluación
+DOPE-HR). Modeller se importa dentro de las funciones que lo necesitan, de modo
+que importar utils no lo carga. Las utilidades de texto (HETATM, PIR, SS2,
+loops) viven en sequence_utils.py y se reexportan aquí.
+"""
+
 import os
-import re
 import csv
-from typing import List, Tuple, Dict, Any
-
-from modeller import *
-from modeller.automodel import *
-from modeller.scripts import complete_pdb
-from modeller.selection import Selection
-from modeller.parallel import Job, LocalWorker
+import shutil
+from typing import List, Tuple, Dict, Any, Optional, TYPE_CHECKING
 
 import config
+import stage_cache
+import pipeline_log
+import output_layout
+import geometry_check
+import leaderboard
 from config import SS2_FILE, sequence_full, PDB_TEMPLATE_FILE, ALIGN_CODE_TEMPLATE, ALIGN_CODE_SEQUENCE, pdb_aa, CHAIN_ID
+from sequence_utils import (extract_hetatm_residues, insert_blk_in_alignment, extract_ss_from_ss2,
+                            read_sequences_from_ali_temp, read_aligned_sequences_from_ali, alignment_sequences,
+                            build_cde_line, pir_entry, merge_template_sequences,
+                            agrupar_rangos, find_missing_residues)
+import sequence_utils
 
-# =================================================================
-# UTILIDADES PARA RESIDUOS HETATM / BLK
-# =================================================================
+if TYPE_CHECKING:
+    from modeller import Environ
 
-def extract_hetatm_residues(pdb_file: str, chain_id: str) -> List[Dict[str, Any]]:
-    """
-    Extrae información de residuos HETATM del archivo PDB template.
-    
-    Retorna una lista de diccionarios con información de cada residuo HETATM:
-    - resname: nombre del residuo (ej: BLK, HOH, etc.)
-    - resnum: número de residuo
-    - chain: cadena
-    - position_in_sequence: posición relativa en la secuencia (después de qué residuo ATOM)
-    """
-    hetatm_residues = []
-    last_atom_resnum = 0
-    seen_hetatm = set()
-    
-    try:
-        with open(pdb_file, 'r') as f:
-            for line in f:
-                if line.startswith('ATOM'):
-                    res_chain = line[21:22].strip()
-                    if res_chain == chain_id:
-                        try:
-                            resnum = int(line[22:26].strip())
-                            last_atom_resnum = max(last_atom_resnum, resnum)
-                        except ValueError:
-                            continue
-                
-                elif line.startswith('HETATM'):
-                    res_chain = line[21:22].strip()
-                    if res_chain == chain_id:
-                        resname = line[17:20].strip()
-                        try:
-                            resnum = int(line[22:26].strip())
-                        except ValueError:
-                            continue
-                        
-                        res_key = (resname, resnum, res_chain)
-                        if res_key not in seen_hetatm:
-                            seen_hetatm.add(res_key)
-                            hetatm_residues.append({
-                                'resname': resname,
-                                'resnum': resnum,
-                                'chain': res_chain,
-                                'position_after_atom_resnum': last_atom_resnum
-                            })
-        
-        hetatm_residues.sort(key=lambda x: x['resnum'])
-        
-        if hetatm_residues:
-            print(f"\n[HETATM] Se detectaron {len(hetatm_residues)} residuos HETATM en {pdb_file} (cadena {chain_id}):")
-            for het in hetatm_residues:
-                print(f"  - {het['resname']} (resnum={het['resnum']}) después del residuo ATOM {het['position_after_atom_resnum']}")
-        
-        return hetatm_residues
-        
-    except FileNotFoundError:
-        print(f"[WARNING] Archivo PDB '{pdb_file}' no encontrado. No se detectaron residuos HETATM.")
-        return []
+logger = pipeline_log.get_logger(__name__)
 
-def insert_blk_in_alignment(aligned_seq: str, hetatm_residues: List[Dict[str, Any]], 
-                            template_pdb_length: int) -> str:
-    """
-    Inserta caracteres '.' (BLK) en la secuencia alineada para representar residuos HETATM.
-    
-    Los residuos HETATM se insertan al final de la secuencia alineada, ya que típicamente
-    están al final del archivo PDB después de todos los residuos ATOM.
-    """
-    if not hetatm_residues:
-        return aligned_seq
-    
-    # Contar cuántos residuos no-gap tenemos en la secuencia alineada del template
-    residue_count = sum(1 for c in aligned_seq if c != '-')
-    
-    # Agregar un '.' por cada residuo HETATM al final de la secuencia
-    blk_chars = '.' * len(hetatm_residues)
-    aligned_seq_with_blk = aligned_seq + blk_chars
-    
-    print(f"\n[HETATM] Insertando {len(hetatm_residues)} caracteres BLK ('.') al final del alineamiento del template")
-    
-    return aligned_seq_with_blk
+def get_flexible_missing_ranges(missing_ranges: List[Tuple[int, int]], ss2_file: str = SS2_FILE,
+                                seq_full: str = sequence_full) -> List[Tuple[int, int]]:
+    """sequence_utils.get_flexible_missing_ranges con SS2_FILE y sequence_full de config.py por defecto."""
+    return sequence_utils.get_flexible_missing_ranges(missing_ranges, ss2_file, seq_full)
 
 # =================================================================
 # UTILIDADES DE ALINEAMIENTO Y PIR
 # =================================================================
 
-def extract_ss_from_ss2(ss2_file: str, seq_full: str) -> str:
-    """Extrae la estructura secundaria predicha de un archivo PSIPRED SS2."""
-    ss_string = ""
-    seq_length = len(seq_full)
-    try:
-        with open(ss2_file, 'r') as f:
-            for line in f:
-                if line.startswith('#') or not line.strip(): 
-                    continue
-                parts = line.split()
-                if len(parts) >= 3:
-                    ss_string += parts[2]
-                    if len(ss_string) >= seq_length: 
-                        break
-        
-        if len(ss_string) < seq_length:
-            print(f"[WARNING] Longitud de SS extraída ({len(ss_string)}) es menor que la longitud de la secuencia objetivo ({seq_length}). Rellenando con 'C'.")
-            ss_string += 'C' * (seq_length - len(ss_string))
-
-        ss_string_sliced = ss_string[:seq_length]
-        print(f"[STEP 2.1] Estructura Secundaria extraída. Longitud utilizada: {len(ss_string_sliced)} para la línea CDE.")
-        return ss_string_sliced
-        
-    except FileNotFoundError:
-        print(f"ERROR: Archivo PSIPRED SS2 '{ss2_file}' no encontrado.")
-        return ""
-
-def read_sequences_from_ali_temp(ali_file: str) -> Tuple[str, str]:
-    """Lee las secuencias alineadas (incluyendo gaps) de un archivo PIR/ALI."""
-    sequences_raw = ["", ""]
-    seq_index = -1
-    allowed_chars_re = re.compile(r'[A-Z\-\*\.]')  # Agregado '.' para BLK
-    
-    try:
-        with open(ali_file, 'r') as f:
-            lines = f.readlines()
-            in_sequence_block = False
-            current_raw_sequence = ""
-            for line in lines:
-                line_stripped = line.strip()
-                if line_stripped.startswith('>P1;'):
-                    if in_sequence_block:
-                        cleaned_sequence = "".join(allowed_chars_re.findall(current_raw_sequence.upper()))
-                        sequences_raw[seq_index] = cleaned_sequence.split('*')[0]
-                        current_raw_sequence = "" 
-                    seq_index += 1
-                    in_sequence_block = True
-                    continue 
-                if in_sequence_block and line_stripped:
-                    if line_stripped.startswith(('structureX', 'sequence', 'CDE:', '#')): 
-                        continue
-                    current_raw_sequence += line_stripped 
-                    if '*' in line_stripped and seq_index == 1:
-                        cleaned_sequence = "".join(allowed_chars_re.findall(current_raw_sequence.upper()))
-                        sequences_raw[seq_index] = cleaned_sequence.split('*')[0]
-                        break 
-        
-        if len(sequences_raw[0]) == 0 or len(sequences_raw[1]) == 0:
-            raise ValueError("No se pudieron extraer dos secuencias alineadas válidas del archivo PIR.")
-        
-        return sequences_raw[0], sequences_raw[1]
-    except Exception as e:
-        raise IOError(f"Error al leer el archivo de alineamiento PIR. Revise el formato. Error: {e}")
-
-def generate_pir_files(env: Environ, align_file_modeller: str, align_file_cde: str, manual_mode: bool) -> Tuple[str, str, str]:
+def generate_pir_files(env: 'Environ', align_file_modeller: str, align_file_cde: str, manual_mode: bool,
+                       templates: Optional[List[Tuple[str, str]]] = None) -> Tuple[str, str, str]:
     """
     Genera los archivos PIR finales (con y sin línea CDE) necesarios para Modeller.
     Incluye soporte para residuos HETATM (BLK).
+
+    templates: lista de (código de alineamiento, archivo PDB). Por defecto es el
+    template único de config.py. Con varios templates, la secuencia de template
+    retornada es la combinación de todos ellos (ver merge_template_sequences).
+
+    Las secuencias alineadas se leen directamente del objeto Alignment y las dos
+    variantes PIR comparten el texto de los templates, que se construye una vez.
     """
+    from modeller import Alignment, Model
     
     aligned_template_seq = ""
     aligned_target_seq = ""
     cde_line_full = ""
+    templates = templates or [(ALIGN_CODE_TEMPLATE, PDB_TEMPLATE_FILE)]
     
     if manual_mode:
-        print(f"\n[STEP 2] Usando Alineamiento Manual: {config.MANUAL_ALIGNMENT_FILE}")
+        logger.info(f"\n[STEP 2] Usando Alineamiento Manual: {config.MANUAL_ALIGNMENT_FILE}")
         try:
-            os.system(f'cp {config.MANUAL_ALIGNMENT_FILE} {align_file_modeller}')
+            shutil.copyfile(config.MANUAL_ALIGNMENT_FILE, align_file_modeller)
             aligned_template_seq, aligned_target_seq = read_sequences_from_ali_temp(align_file_modeller)
             
             if not os.path.exists(config.MANUAL_ALIGNMENT_CDE_FILE):
                 raise FileNotFoundError(f"Se requiere el archivo PIR con CDE: '{config.MANUAL_ALIGNMENT_CDE_FILE}' en modo manual.")
-            os.system(f'cp {config.MANUAL_ALIGNMENT_CDE_FILE} {align_file_cde}')
+            shutil.copyfile(config.MANUAL_ALIGNMENT_CDE_FILE, align_file_cde)
             
-            extract_ss_from_ss2(SS2_FILE, sequence_full) 
             cde_line_full = f"# CDE line copied from {config.MANUAL_ALIGNMENT_CDE_FILE} for reference."
             
         except Exception as e:
-            print(f"ERROR FATAL en modo manual. Asegúrese de que ambos archivos existen y tienen el formato PIR correcto. Error: {e}")
+            logger.error(f"ERROR FATAL en modo manual. Asegúrese de que ambos archivos existen y tienen el formato PIR correcto. Error: {e}")
             return "", "", ""
             
     else:
-        print("\n[STEP 2] Generando Alineamiento Automático con Modeller.salign()")
+        logger.info(f"\n[STEP 2] Generando Alineamiento Automático con Modeller.salign() ({len(templates)} template(s))")
         
-        # 1. Detectar residuos HETATM en el template para información
-        hetatm_residues = extract_hetatm_residues(PDB_TEMPLATE_FILE, CHAIN_ID)
+        # 1. Detectar residuos HETATM en los templates para información
+        for _, template_file in templates:
+            extract_hetatm_residues(template_file, CHAIN_ID)
         
         # 2. Generar alineamiento básico con Modeller
         # IMPORTANTE: Cuando env.io.hetatm=True, Modeller YA incluye los HETATM como BLK (.)
         aln = Alignment(env)
-        mdl = Model(env, file=PDB_TEMPLATE_FILE)
-        aln.append_model(mdl, align_codes=ALIGN_CODE_TEMPLATE, atom_files=PDB_TEMPLATE_FILE)
+        for template_code, template_file in templates:
+            mdl = Model(env, file=template_file)
+            aln.append_model(mdl, align_codes=template_code, atom_files=template_file)
         aln.append_sequence(sequence_full) 
-        aln[1].code = ALIGN_CODE_SEQUENCE
+        aln[len(templates)].code = ALIGN_CODE_SEQUENCE
         aln.salign()
-        
-        temp_ali_file = "temp_modeller_ali.pir"
-        try:
-            aln.write(file=temp_ali_file, alignment_format='PIR')
-            aligned_template_seq, aligned_target_seq = read_sequences_from_ali_temp(temp_ali_file)
-        except Exception as e:
-            print(f"ERROR FATAL: Problema al escribir o leer el archivo temporal de Modeller. Error: {e}")
-            return "", "", ""
-        finally:
-            if os.path.exists(temp_ali_file): 
-                os.remove(temp_ali_file)
+        aligned_entries = alignment_sequences(aln)
+
+        aligned_template_seqs = [seq for _, seq in aligned_entries[:-1]]
+        aligned_target_seq = aligned_entries[-1][1]
 
         # 3. Verificar si Modeller ya incluyó los BLK automáticamente
-        blk_count_in_template = aligned_template_seq.count('.')
+        blk_count_in_template = sum(seq.count('.') for seq in aligned_template_seqs)
         
         if blk_count_in_template > 0:
-            print(f"\n[HETATM] Modeller detectó automáticamente {blk_count_in_template} residuos BLK en el template")
-            print(f"[HETATM] Estos ya están incluidos en el alineamiento como caracteres '.'")
-            
-            # Modeller ya incluyó los BLK, usamos las secuencias tal cual
-            aligned_template_seq_with_blk = aligned_template_seq
-            aligned_target_seq_with_blk = aligned_target_seq
-            
-            # Ajustar el target para tener gaps donde el template tiene BLK
-            # Verificar si necesitamos agregar gaps al target
-            if len(aligned_template_seq) != len(aligned_target_seq):
-                print(f"[WARNING] Longitudes diferentes: template={len(aligned_template_seq)}, target={len(aligned_target_seq)}")
-                # Agregar gaps faltantes al target
-                len_diff = len(aligned_template_seq) - len(aligned_target_seq)
-                if len_diff > 0:
-                    aligned_target_seq_with_blk = aligned_target_seq + ('-' * len_diff)
-                    print(f"[HETATM] Agregando {len_diff} gaps al target para igualar longitudes")
+            logger.info(f"\n[HETATM] Modeller detectó automáticamente {blk_count_in_template} residuos BLK en el/los template(s)")
+            logger.debug(f"[HETATM] Estos ya están incluidos en el alineamiento como caracteres '.'")
         else:
-            print(f"\n[HETATM] No se detectaron BLK en el alineamiento automático de Modeller")
-            print(f"[HETATM] Esto puede ocurrir si el PDB no tiene HETATM o si env.io.hetatm no está configurado")
-            aligned_template_seq_with_blk = aligned_template_seq
-            aligned_target_seq_with_blk = aligned_target_seq
-
-        # 4. Calcular la longitud real del template (incluyendo HETATM si están presentes)
-        # Contar residuos no-gap en la secuencia del template
-        template_residue_count = sum(1 for c in aligned_template_seq_with_blk if c not in ['-', ' '])
-        template_total_length = template_residue_count
-        
-        template_title = f">P1;{ALIGN_CODE_TEMPLATE}"
-        template_description = f"structureX:{PDB_TEMPLATE_FILE}:1:{CHAIN_ID}:{template_total_length}:{CHAIN_ID}:::-1.00:-1.00"
-        fullseq_title = f">P1;{ALIGN_CODE_SEQUENCE}"
+            logger.info(f"\n[HETATM] No se detectaron BLK en el alineamiento automático de Modeller")
+            logger.debug(f"[HETATM] Esto puede ocurrir si el PDB no tiene HETATM o si env.io.hetatm no está configurado")
+
+        # Igualar longitudes: agregar gaps al final de las secuencias más cortas
+        alignment_length = max(len(seq) for seq in aligned_template_seqs + [aligned_target_seq])
+        if len(aligned_target_seq) != alignment_length:
+            len_diff = alignment_length - len(aligned_target_seq)
+            logger.warning(f"Longitudes diferentes: template={alignment_length}, target={len(aligned_target_seq)}")
+            logger.info(f"[HETATM] Agregando {len_diff} gaps al target para igualar longitudes")
+        aligned_target_seq_with_blk = aligned_target_seq.ljust(alignment_length, '-')
+        aligned_template_seqs_with_blk = [seq.ljust(alignment_length, '-') for seq in aligned_template_seqs]
+
+        # 4. Entradas PIR de los templates: longitud real de cada uno (incluyendo HETATM si están presentes)
+        templates_pir = "".join(
+            pir_entry(template_code,
+                      f"structureX:{template_file}:1:{CHAIN_ID}:{len(template_seq) - template_seq.count('-')}:{CHAIN_ID}:::-1.00:-1.00",
+                      template_seq)
+            for (template_code, template_file), template_seq in zip(templates, aligned_template_seqs_with_blk)
+        )
         fullseq_description = f"sequence:{ALIGN_CODE_SEQUENCE}:1::{len(sequence_full)}::::-1.00:-1.00"
 
-        # 6. Generar línea CDE con estructura secundaria
+        # 5. Generar línea CDE con estructura secundaria
         ss_string_full = extract_ss_from_ss2(SS2_FILE, sequence_full)
         if not ss_string_full: 
             return "", "", ""
-
-        cde_content = ""
-        ss_index = 0
-        for char in aligned_target_seq_with_blk:
-            if char == '-': 
-                cde_content += '.' 
-            else:
-                if ss_index < len(ss_string_full):
-                    cde_content += ss_string_full[ss_index]
-                    ss_index += 1
-                else: 
-                    cde_content += 'C' 
-
-        cde_line_full = "CDE:" + cde_content
-        cde_line_commented = "# " + cde_line_full
-
-        # 7. Escribir archivos PIR
-        pir_content_modeller = [
-            template_title + "\n", 
-            template_description + "\n", 
-            f"{aligned_template_seq_with_blk}*\n", 
-            fullseq_title + "\n", 
-            fullseq_description + "\n", 
-            f"{aligned_target_seq_with_blk}*\n"
-        ]
-        pir_content_cde = [
-            template_title + "\n", 
-            template_description + "\n", 
-            f"{aligned_template_seq_with_blk}*\n", 
-            fullseq_title + "\n", 
-            fullseq_description + "\n", 
-            cde_line_commented + "\n", 
-            f"{aligned_target_seq_with_blk}*\n"
-        ]
-
-        with open(align_file_modeller, 'w') as f: 
-            f.writelines(pir_content_modeller)
-        with open(align_file_cde, 'w') as f: 
-            f.writelines(pir_content_cde)
+        cde_line_full = build_cde_line(aligned_target_seq_with_blk, ss_string_full)
+
+        # 6. Escribir las dos variantes PIR (sin y con la línea CDE comentada)
+        pir_variants = {
+            align_file_modeller: templates_pir + pir_entry(ALIGN_CODE_SEQUENCE, fullseq_description,
+                                                           aligned_target_seq_with_blk),
+            align_file_cde: templates_pir + pir_entry(ALIGN_CODE_SEQUENCE, fullseq_description,
+                                                      aligned_target_seq_with_blk, comment="# " + cde_line_full)
+        }
+        for pir_file, pir_text in pir_variants.items():
+            with open(pir_file, 'w') as f:
+                f.write(pir_text)
         
         # Usar las secuencias actualizadas con BLK para el retorno
-        aligned_template_seq = aligned_template_seq_with_blk
+        aligned_template_seq = merge_template_sequences(aligned_template_seqs_with_blk)
         aligned_target_seq = aligned_target_seq_with_blk
 
-    print(f"\n[STEP 3] Archivo de Alineamiento PIR (LIMPIO) generado para Modeller: {align_file_modeller}")
+    logger.info(f"\n[STEP 3] Archivo de Alineamiento PIR (LIMPIO) generado para Modeller: {align_file_modeller}")
     return cde_line_full, aligned_template_seq, aligned_target_seq
 
 # =================================================================
-# UTILIDADES DE DETECCIÓN DE LOOPS
+# UTILIDADES DE EVALUACIÓN Y REPORTE
 # =================================================================
 
-def agrupar_rangos(lista: List[int]) -> List[Tuple[int, int]]:
-    """Agrupa una lista de números de residuo individuales en rangos secuenciales."""
-    if not lista: 
-        return []
-    lista = sorted(lista)
-    ranges = []
-    start = lista[0]
-    end = lista[0]
-    for n in lista[1:]:
-        if n == end + 1: 
-            end = n
-        else: 
-            ranges.append((start, end))
-            start = n
-            end = n
-    ranges.append((start, end))
-    return ranges
-
-def find_missing_residues(aligned_template_seq: str, aligned_target_seq: str) -> List[Tuple[int, int]]:
+def evaluate_model(env: 'Environ', pdb_file: str) -> Tuple[float, float]:
+    """Puntuación DOPE-HR y Z-score DOPE-HR normalizado de un PDB."""
+    from modeller.scripts import complete_pdb
+    from modeller.selection import Selection
+    mdl = complete_pdb(env, pdb_file)
+    atmsel = Selection(mdl.chains[0])
+    return atmsel.assess_dopehr(), mdl.assess_normalized_dopehr()
+
+def ranking_candidates() -> Dict[str, str]:
     """
-    Identifica los segmentos de inserción (loops) en la secuencia objetivo.
-    Ignora los residuos BLK (representados por '.') en el análisis de loops.
+    Modelos a evaluar en el ranking final: {nombre: ruta}. Se leen del
+    manifiesto de salidas; solo si no existe (estructura plana anterior) se
+    lista la carpeta de trabajo.
+    """
+    model_paths = {record['name']: record['path'] for record in output_layout.manifest_models()}
+    if not model_paths:
+        model_paths = {
+            f: f for f in os.listdir()
+            if f.endswith(".pdb")
+            and f != PDB_TEMPLATE_FILE
+            and (f.startswith("AUTO_") or "_LOOP" in f)
+        }
+    return model_paths
+
+def final_evaluation_and_ranking(env: 'Environ', deadline=None) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """
+    Evalúa y rankea todos los PDBs generados. Los modelos se obtienen del
+    manifiesto de salidas (output_layout); solo si no existe (ejecuciones con la
+    estructura plana anterior) se lista la carpeta de trabajo.
+
+    Con un deadline (walltime.Deadline) activo, los modelos de loops se evalúan
+    primero y, si el tiempo se agota, los restantes se omiten para que el ranking
+    y el CSV se escriban siempre antes del límite.
+
+    Las puntuaciones calculadas se guardan en la caché 'ranking_scores' cada
+    RANKING_CACHE_SAVE_EVERY modelos y cuando el límite de tiempo detiene la
+    evaluación, de modo que una ejecución cortada no pierde lo ya evaluado.
+
+    Con GEOMETRY_PREFILTER, antes de complete_pdb cada modelo pasa el filtro
+    geométrico (geometry_check.py); los marcados se listan en GEOMETRY_REPORT_FILE
+    y en la columna Geometry del CSV. Con GEOMETRY_REJECT no se puntúan ni entran
+    al ranking, pero figuran al final del CSV como rechazados. El resultado del
+    filtro se guarda en 'ranking_scores' junto a la puntuación, así que un modelo
+    reutilizado de la caché conserva sus marcas y su rechazo.
     """
-    missing_residues: List[int] = []
-    target_res_num = 0 
-
-    if len(aligned_template_seq) != len(aligned_target_seq):
-        print("\n[ERROR FATAL] Las longitudes de las secuencias alineadas son diferentes. No se puede detectar los loops.")
-        return []
-
-    for template_char, target_char in zip(aligned_template_seq, aligned_target_seq):
-        
-        # Ignorar residuos BLK - no son parte de la proteína
-        if template_char == '.':
-            continue
-        
-        if target_char != '-':
-            target_res_num += 1
-        
-        if template_char == '-' and target_char.isalpha():
-            missing_residues.append(target_res_num)
-        
-    missing_ranges = agrupar_rangos(missing_residues)
-    
-    range_strings = [f"[{s}-{e}]" if s != e else f"[{s}]" for s, e in missing_ranges]
-    print(f"\n[STEP 1] Rangos de residuos faltantes (loops) detectados: {range_strings}")
-    
-    return missing_ranges
-
-def get_flexible_missing_ranges(missing_ranges: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
-    """Filtra los loops para incluir SOLO aquellos residuos predichos como 'Coil' ('C')."""
-    ss_string_full = extract_ss_from_ss2(SS2_FILE, sequence_full) 
-    if not ss_string_full: 
-        return missing_ranges
-        
-    flexible_residues_to_refine = set()
-    for start, end in missing_ranges:
-        for res_num in range(start, end + 1):
-            ss_index = res_num - 1
-            if ss_index < len(ss_string_full) and ss_string_full[ss_index] == 'C':
-                flexible_residues_to_refine.add(res_num)
-
-    final_flexible_ranges = agrupar_rangos(list(flexible_residues_to_refine))
-    range_strings = [f"[{s}-{e}]" if s != e else f"[{s}]" for s, e in final_flexible_ranges]
-    print(f"\n[STEP 4.0] Loops flexibles ('C') dentro de regiones faltantes seleccionados para refinamiento: {range_strings}")
-    
-    return final_flexible_ranges
-
-# =================================================================
-# UTILIDADES DE EVALUACIÓN Y REPORTE
-# =================================================================
-
-def final_evaluation_and_ranking(env: Environ) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
-    """Escanea, evalúa y rankea todos los PDBs generados."""
     
-    print(f"\n{'='*75}\n[STEP 6] INICIANDO EVALUACIÓN FINAL DE TODOS LOS MODELOS PDB\n")
+    logger.info(f"\n{'='*75}\n[STEP 6] INICIANDO EVALUACIÓN FINAL DE TODOS LOS MODELOS PDB\n")
     
-    pdbs_to_calculate_dopeHR = [
-        f for f in os.listdir() 
-        if f.endswith(".pdb") 
-        and f != PDB_TEMPLATE_FILE 
-        and (f.startswith("AUTO_") or "_LOOP" in f)
-    ]
+    model_paths = ranking_candidates()
+    pdbs_to_calculate_dopeHR = sorted(model_paths, key=lambda name: ('_LOOP' not in name, name))
     
     if not pdbs_to_calculate_dopeHR:
-        print("[FINAL] No se encontraron archivos PDB generados para evaluar.")
+        logger.info("[FINAL] No se encontraron archivos PDB generados para evaluar.")
         return [], {}
     
     final_results: List[Dict[str, Any]] = []
 
     env.io.atom_files_directory = ['.', '../atom_files'] 
+
+    # Puntuaciones ya calculadas en ejecuciones anteriores (clave: tamaño + mtime del PDB)
+    scores_version = stage_cache.code_version(['utils.py'])
+    cached_scores = stage_cache.load_item_cache('ranking_scores', scores_version)
+    updated_scores: Dict[str, Any] = {}
+    reused_count = 0
+    skipped_count = 0
+    flagged_geometry: Dict[str, Dict[str, Any]] = {}
+    unsaved_count = 0
+
+    def save_scores_checkpoint() -> None:
+        # Incluye las entradas aún no revisadas de la caché para no perderlas si la ejecución se corta
+        stage_cache.save_item_cache('ranking_scores', scores_version, {**cached_scores, **updated_scores})
     
     for filename in pdbs_to_calculate_dopeHR:
+        model_file = model_paths[filename]
+        file_key = stage_cache.file_stat_key(model_file)
+        cached = cached_scores.get(filename)
+        if not (cached and cached['key'] == file_key) and deadline is not None \
+                and not deadline.allows(deadline.eval_seconds, 0):
+            if skipped_count == 0 and unsaved_count:
+                save_scores_checkpoint()
+                unsaved_count = 0
+            skipped_count += 1
+            continue
+        cache_hit = bool(cached and cached['key'] == file_key)
+        # El resultado del filtro se guarda con la puntuación: un modelo en caché conserva sus marcas
+        geometry = cached.get('geometry') if cache_hit else None
+        if config.GEOMETRY_PREFILTER:
+            if geometry is None:
+                geometry = geometry_check.safe_check(model_file)
+            if not geometry['ok']:
+                flagged_geometry[filename] = geometry
+                logger.debug(f"  -> [GEOMETRY] {filename}: {'; '.join(geometry['reasons'])}",
+                             extra={'stage': 'final', 'model': filename})
+                if config.GEOMETRY_REJECT:
+                    if cache_hit:
+                        updated_scores[filename] = {**cached, 'geometry': geometry}
+                    continue
+
+        if cache_hit:
+            final_results.append({
+                'name': filename,
+                'path': model_file,
+                'DOPEHR score': cached['DOPEHR score'],
+                'DOPEHR Z-score': cached['DOPEHR Z-score']
+            })
+            updated_scores[filename] = {**cached, 'geometry': geometry}
+            leaderboard.record(final_results[-1:], 'final')
+            reused_count += 1
+            continue
+
         try:
-            mdl = complete_pdb(env, filename)
-            atmsel = Selection(mdl.chains[0])
-            dopeHR_score = atmsel.assess_dopehr()
-            normalized_dopeHR_zscore = mdl.assess_normalized_dopehr() 
+            dopeHR_score, normalized_dopeHR_zscore = evaluate_model(env, model_file)
             
             final_results.append({
                 'name': filename,
+                'path': model_file,
                 'DOPEHR score': dopeHR_score,
                 'DOPEHR Z-score': normalized_dopeHR_zscore
             })
+            updated_scores[filename] = {
+                'key': file_key,
+                'DOPEHR score': dopeHR_score,
+                'DOPEHR Z-score': normalized_dopeHR_zscore,
+                'geometry': geometry
+            }
+            leaderboard.record(final_results[-1:], 'final')
+            unsaved_count += 1
+            if config.RANKING_CACHE_SAVE_EVERY > 0 and unsaved_count >= config.RANKING_CACHE_SAVE_EVERY:
+                save_scores_checkpoint()
+                unsaved_count = 0
             
-            print(f"  -> Evaluado {filename:<40} | DOPEHR: {dopeHR_score:.3f} | Z-score: {normalized_dopeHR_zscore:.3f}")
+            logger.debug(f"  -> Evaluado {filename:<40} | DOPEHR: {dopeHR_score:.3f} | Z-score: {normalized_dopeHR_zscore:.3f}",
+                         extra={'stage': 'final', 'model': filename, 'score': normalized_dopeHR_zscore})
             
         except Exception as e:
-            print(f"  [ERROR] Falló la evaluación de {filename}. Error: {e}")
+            logger.error(f"  Falló la evaluación de {filename}. Error: {e}")
             final_results.append({
                 'name': filename,
+                'path': model_file,
                 'DOPEHR score': float('inf'),
                 'DOPEHR Z-score': float('inf')
             })
             continue
 
+    if reused_count:
+        logger.info(f"[CACHE] {reused_count} modelos sin cambios reutilizan su puntuación DOPEHR guardada.")
+    if flagged_geometry:
+        action = "no se puntúan" if config.GEOMETRY_REJECT else "se puntúan igualmente"
+        logger.warning(f"[GEOMETRY] {len(flagged_geometry)} modelos con roturas, choques o átomos ausentes ({action}). "
+                       f"Detalle en {config.GEOMETRY_REPORT_FILE}", extra={'stage': 'final', 'count': len(flagged_geometry)})
+        try:
+            geometry_check.write_report(flagged_geometry, config.GEOMETRY_REJECT)
+        except OSError as e:
+            logger.warning(f"No se pudo guardar {config.GEOMETRY_REPORT_FILE}. Error: {e}")
+    if skipped_count:
+        logger.warning(f"[WALLTIME] Límite de tiempo cercano: {skipped_count} modelos no se evaluaron y no entran en el ranking.",
+                       extra={'stage': 'final', 'count': skipped_count})
+    stage_cache.save_item_cache('ranking_scores', scores_version, updated_scores)
+    leaderboard.flush()
+
     final_ranking = sorted(final_results, key=lambda x: x['DOPEHR score'], reverse=False)
     best_final_models = final_ranking[:config.NUM_BEST_FINAL_MODELS]
 
-    print(f"\n{'='*75}")
-    print(f"RANKING FINAL - Top {config.NUM_BEST_FINAL_MODELS} Modelos por DOPEHR Score")
-    print(f"{'='*75}\n")
-    print(f"{'Rank':<6} {'Nombre del Modelo':<45} {'DOPEHR':<12} {'Z-score':<12}")
-    print(f"{'-'*75}")
+    logger.info(f"\n{'='*75}")
+    logger.info(f"RANKING FINAL - Top {config.NUM_BEST_FINAL_MODELS} Modelos por DOPEHR Score")
+    logger.info(f"{'='*75}\n")
+    logger.info(f"{'Rank':<6} {'Nombre del Modelo':<45} {'DOPEHR':<12} {'Z-score':<12}")
+    logger.info(f"{'-'*75}")
     
     for rank, model_data in enumerate(best_final_models, start=1):
-        print(f"{rank:<6} {model_data['name']:<45} {model_data['DOPEHR score']:<12.3f} {model_data['DOPEHR Z-score']:<12.3f}")
+        logger.info(f"{rank:<6} {model_data['name']:<45} {model_data['DOPEHR score']:<12.3f} {model_data['DOPEHR Z-score']:<12.3f}")
     
-    print(f"\n{'='*75}\n")
+    logger.info(f"\n{'='*75}\n")
 
     csv_filename = "final_models_ranking.csv"
     try:
         with open(csv_filename, 'w', newline='') as csvfile:
-            fieldnames = ['Rank', 'Model Name', 'DOPEHR Score', 'DOPEHR Z-score']
+            fieldnames = ['Rank', 'Model Name', 'DOPEHR Score', 'DOPEHR Z-score', 'Model Path', 'Geometry']
             writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
             writer.writeheader()
             for rank, model_data in enumerate(best_final_models, start=1):
+                flagged = flagged_geometry.get(model_data['name'])
                 writer.writerow({
                     'Rank': rank,
                     'Model Name': model_data['name'],
                     'DOPEHR Score': f"{model_data['DOPEHR score']:.3f}",
-                    'DOPEHR Z-score': f"{model_data['DOPEHR Z-score']:.3f}"
+                    'DOPEHR Z-score': f"{model_data['DOPEHR Z-score']:.3f}",
+                    'Model Path': model_data['path'],
+                    'Geometry': '; '.join(flagged['reasons']) if flagged else 'ok'
                 })
-        print(f"[FINAL] Ranking exportado a: {csv_filename}\n")
+            if config.GEOMETRY_REJECT:
+                # Rechazados por el filtro: sin rank ni puntuación, pero visibles en el CSV
+                for name, flagged in sorted(flagged_geometry.items()):
+                    writer.writerow({
+                        'Rank': '',
+                        'Model Name': name,
+                        'DOPEHR Score': '',
+                        'DOPEHR Z-score': '',
+                        'Model Path': flagged['path'],
+                        'Geometry': 'rechazado: ' + '; '.join(flagged['reasons'])
+                    })
+        logger.info(f"[FINAL] Ranking exportado a: {csv_filename}\n")
     except Exception as e:
-        print(f"[WARNING] No se pudo escribir el archivo CSV de ranking. Error: {e}")
+        logger.warning(f"No se pudo escribir el archivo CSV de ranking. Error: {e}")
     
     best_model = best_final_models[0] if best_final_models else {}
     return final_ranking, best_model
@@ -2,10 +2,19 @@
 """
 Script de validación para el pipeline de Modeller con soporte HETATM/BLK
 Verifica que todos los componentes están instalados y configurados correctamente.
+
+Con --preflight comprueba además que el nodo puede sostener la ejecución
+configurada en config.py antes de lanzarla: CPUs disponibles frente a
+NUM_PROCESSORS, velocidad de escritura, espacio libre e inodos frente a las
+salidas proyectadas, y el coste de una evaluación complete_pdb + DOPE-HR.
+Termina con código 1 si alguna comprobación falla (ver modeller_lanzador.sh).
 """
 
 import sys
 import os
+import time
+import shutil
+import argparse
 
 def validate_files():
     """Verifica que todos los archivos necesarios existen"""
@@ -13,12 +22,18 @@ def validate_files():
     print("VALIDACIÓN DE ARCHIVOS")
     print("="*70)
     
-    required_files = [
-        '8vx1_DS_renum_HETATM.pdb',
-        'P1_DHX_secondary_strucuture.ss2',
+    import config
+    input_files = [config.RAW_PDB_TEMPLATE_FILE or config.PDB_TEMPLATE_FILE, config.SS2_FILE]
+    if config.USE_MANUAL_ALIGNMENT:
+        input_files += [config.MANUAL_ALIGNMENT_FILE, config.MANUAL_ALIGNMENT_CDE_FILE]
+    if config.TEMPLATE_DIRECTORY:
+        input_files.append(config.TEMPLATE_DIRECTORY)
+
+    required_files = input_files + [
         'controller.py',
         'config.py',
         'utils.py',
+        'sequence_utils.py',
         'homology_modeling.py',
         'loop_refinement.py',
         'custom_models.py'
@@ -41,18 +56,30 @@ def validate_imports():
     print("VALIDACIÓN DE IMPORTACIONES")
     print("="*70)
     
+    try:
+        # Capa de texto sin Modeller (secuencias, PIR, SS2, PDB): debe cargar en milisegundos
+        print("  Importando utilidades sin Modeller...", end=" ")
+        start_time = time.time()
+        import config
+        import sequence_utils
+        import pdb_utils
+        print(f"✓ OK ({(time.time() - start_time) * 1000:.0f} ms)")
+    except ImportError as e:
+        print(f"✗ ERROR: {e}")
+        return False
+    
     try:
         print("  Importando modeller...", end=" ")
+        start_time = time.time()
         from modeller import Environ, Alignment, Model
         from modeller.automodel import AutoModel, assess, autosched
-        print("✓ OK")
+        print(f"✓ OK ({time.time() - start_time:.1f} s)")
     except ImportError as e:
         print(f"✗ ERROR: {e}")
         return False
     
     try:
         print("  Importando módulos del proyecto...", end=" ")
-        import config
         import utils
         import homology_modeling
         import loop_refinement
@@ -72,13 +99,13 @@ def validate_hetatm_detection():
     print("="*70)
     
     try:
-        import utils
+        import sequence_utils
         import config
         
         print(f"\n  Analizando archivo: {config.PDB_TEMPLATE_FILE}")
         print(f"  Cadena: {config.CHAIN_ID}\n")
         
-        hetatm_residues = utils.extract_hetatm_residues(
+        hetatm_residues = sequence_utils.extract_hetatm_residues(
             config.PDB_TEMPLATE_FILE, 
             config.CHAIN_ID
         )
@@ -129,11 +156,11 @@ def show_alignment_preview():
     print("="*70)
     
     try:
-        import utils
+        import sequence_utils
         import config
         
         # Detectar HETATM
-        hetatm_residues = utils.extract_hetatm_residues(
+        hetatm_residues = sequence_utils.extract_hetatm_residues(
             config.PDB_TEMPLATE_FILE, 
             config.CHAIN_ID
         )
@@ -161,8 +188,152 @@ def show_alignment_preview():
         print(f"  ✗ ERROR: {e}")
         return False
 
-def main():
+# =================================================================
+# PREFLIGHT: CAPACIDAD DEL NODO PARA LA EJECUCIÓN CONFIGURADA
+# =================================================================
+
+def _format_bytes(num_bytes):
+    return f"{num_bytes / 1024 ** 3:.2f} GB" if num_bytes >= 1024 ** 3 else f"{num_bytes / 1024 ** 2:.1f} MB"
+
+def projected_outputs():
+    """
+    Modelos, bytes y archivos que dejará la ejecución configurada. El tamaño por
+    modelo se toma de los modelos ya generados (manifiesto) o, si no hay, del
+    template escalado a la longitud de la secuencia objetivo; PREFLIGHT_OUTPUT_FACTOR
+    cubre los intermedios de Modeller (.D, .V, .ini, .rsr...).
+    """
+    import config
+    import stage_cache
+    import output_layout
+
+    if config.LOOP_SELECTION == 'profile':
+        segments = config.REFINE_MAX_SEGMENTS or len(stage_cache.last_result('loops') or []) or 1
+    else:
+        segments = len(stage_cache.last_result('loops') or []) or config.REFINE_MAX_SEGMENTS or 1
+    num_models = config.NUM_MODELS_AUTO + config.NUM_MODELS_TO_REFINE * segments * config.NUM_MODELS_LOOP
+
+    existing = [os.path.getsize(r['path']) for r in output_layout.manifest_models()[:200]]
+    if existing:
+        model_bytes = sum(existing) / len(existing)
+    else:
+        template = config.PDB_TEMPLATE_FILE if os.path.exists(config.PDB_TEMPLATE_FILE) else config.RAW_PDB_TEMPLATE_FILE
+        model_bytes = os.path.getsize(template) * len(config.sequence_full) / max(1, len(config.pdb_aa))
+    return {
+        'models': num_models,
+        'loop_segments': segments,
+        'bytes': num_models * model_bytes * config.PREFLIGHT_OUTPUT_FACTOR,
+        'files': num_models * config.PREFLIGHT_FILES_PER_MODEL
+    }
+
+def measure_write_throughput(size_mb):
+    """MB/s escribiendo size_mb MB en bloques de 1 MB con fsync, en la carpeta de trabajo."""
+    test_file = f'.preflight_write_{os.getpid()}.tmp'
+    block = os.urandom(1024 * 1024)
+    start_time = time.time()
+    try:
+        with open(test_file, 'wb') as f:
+            for _ in range(size_mb):
+                f.write(block)
+            f.flush()
+            os.fsync(f.fileno())
+        return size_mb / max(time.time() - start_time, 1e-6)
+    finally:
+        if os.path.exists(test_file):
+            os.remove(test_file)
+
+def validate_capacity():
+    """Comprueba que el nodo y la carpeta de trabajo pueden sostener la ejecución configurada"""
+    print("="*70)
+    print("PREFLIGHT: CAPACIDAD PARA LA EJECUCIÓN CONFIGURADA")
+    print("="*70)
+
+    import config
+    ok = True
+
+    # CPUs: NUM_PROCESSORS puede ser el doble de las CPUs si cada una tiene 2 hilos (ver README)
+    available_cpus = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count()
+    if config.NUM_PROCESSORS > 2 * available_cpus:
+        print(f"  ✗ FALLA  NUM_PROCESSORS = {config.NUM_PROCESSORS} con solo {available_cpus} CPUs disponibles")
+        ok = False
+    elif config.NUM_PROCESSORS > available_cpus:
+        print(f"  ⚠ AVISO  NUM_PROCESSORS = {config.NUM_PROCESSORS} > {available_cpus} CPUs disponibles (solo rinde con 2 hilos por CPU)")
+    else:
+        print(f"  ✓ OK     NUM_PROCESSORS = {config.NUM_PROCESSORS} ({available_cpus} CPUs disponibles)")
+
+    try:
+        projection = projected_outputs()
+    except (OSError, TypeError) as e:
+        print(f"  ✗ FALLA  No se pudo proyectar el tamaño de las salidas: {e}")
+        return False
+    print(f"\n  Salidas proyectadas: {projection['models']} modelos ({projection['loop_segments']} segmentos por cadena), "
+          f"{_format_bytes(projection['bytes'])}, {projection['files']} archivos")
+
+    # Espacio e inodos
+    usage = shutil.disk_usage('.')
+    needed_bytes = projection['bytes'] * config.PREFLIGHT_SPACE_MARGIN
+    status = "✓ OK    " if usage.free >= needed_bytes else "✗ FALLA "
+    print(f"  {status} Espacio libre: {_format_bytes(usage.free)} (necesario {_format_bytes(needed_bytes)})")
+    ok = ok and usage.free >= needed_bytes
+
+    stats = os.statvfs('.')
+    needed_files = int(projection['files'] * config.PREFLIGHT_SPACE_MARGIN)
+    if stats.f_files == 0:
+        print("  ⚠ AVISO  El sistema de archivos no informa de inodos")
+    else:
+        status = "✓ OK    " if stats.f_favail >= needed_files else "✗ FALLA "
+        print(f"  {status} Inodos libres: {stats.f_favail} (necesarios {needed_files})")
+        ok = ok and stats.f_favail >= needed_files
+
+    # Velocidad de escritura
+    try:
+        throughput = measure_write_throughput(config.PREFLIGHT_WRITE_MB)
+    except OSError as e:
+        print(f"  ✗ FALLA  No se pudo escribir en la carpeta de trabajo: {e}")
+        return False
+    write_minutes = projection['bytes'] / 1024 ** 2 / throughput / 60.0
+    status = "✓ OK    " if throughput >= config.PREFLIGHT_MIN_WRITE_MBPS else "✗ FALLA "
+    print(f"  {status} Escritura: {throughput:.0f} MB/s (mínimo {config.PREFLIGHT_MIN_WRITE_MBPS} MB/s; "
+          f"~{write_minutes:.1f} min para todas las salidas)")
+    ok = ok and throughput >= config.PREFLIGHT_MIN_WRITE_MBPS
+
+    # Evaluación de un modelo (complete_pdb + DOPE-HR), como en la evaluación final
+    try:
+        import utils
+        import walltime
+        from modeller import Environ
+        env = Environ()
+        env.io.hetatm = True
+        env.io.atom_files_directory = ['.', '../atom_files']
+        start_time = time.time()
+        utils.evaluate_model(env, config.PDB_TEMPLATE_FILE)
+        eval_seconds = time.time() - start_time
+    except Exception as e:
+        print(f"  ✗ FALLA  complete_pdb + DOPE-HR sobre {config.PDB_TEMPLATE_FILE}: {e}")
+        return False
+    ranking_seconds = eval_seconds * projection['models']
+    print(f"  ✓ OK     complete_pdb + DOPE-HR: {eval_seconds:.2f} s/modelo "
+          f"(evaluación final ~{walltime.format_duration(ranking_seconds)})")
+
+    end_time = walltime.slurm_end_time()
+    if end_time is not None:
+        remaining = end_time - time.time()
+        if ranking_seconds > remaining:
+            print(f"  ✗ FALLA  Solo la evaluación final ({walltime.format_duration(ranking_seconds)}) supera "
+                  f"el tiempo restante de la reserva ({walltime.format_duration(remaining)})")
+            ok = False
+        else:
+            print(f"  ✓ OK     Tiempo restante de la reserva: {walltime.format_duration(remaining)}")
+
+    print()
+    return ok
+
+def main(argv=None):
     """Ejecuta todas las validaciones"""
+    parser = argparse.ArgumentParser(description="Validación del pipeline de Modeller.")
+    parser.add_argument('--preflight', action='store_true',
+                        help="Comprueba además CPUs, disco, escritura y coste de evaluación para la ejecución configurada")
+    args = parser.parse_args(argv)
+
     print("\n" + "="*70)
     print("VALIDACIÓN DEL PIPELINE DE MODELLER CON SOPORTE HETATM/BLK")
     print("="*70 + "\n")
@@ -171,9 +342,13 @@ def main():
     
     results.append(("Archivos", validate_files()))
     results.append(("Importaciones", validate_imports()))
-    results.append(("Entorno Modeller", validate_environment()))
-    results.append(("Detección HETATM", validate_hetatm_detection()))
-    results.append(("Vista previa alineamiento", show_alignment_preview()))
+    if args.preflight:
+        # Falla rápido: si faltan archivos o Modeller no carga, no tiene sentido medir la capacidad
+        results.append(("Capacidad (preflight)", all(passed for _, passed in results) and validate_capacity()))
+    else:
+        results.append(("Entorno Modeller", validate_environment()))
+        results.append(("Detección HETATM", validate_hetatm_detection()))
+        results.append(("Vista previa alineamiento", show_alignment_preview()))
     
     # Resumen final
     print("="*70)
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+# walltime.py
+
+"""
+Planificación según el tiempo restante de la reserva.
+
+Si el trabajo tiene un límite de tiempo (SLURM_JOB_END_TIME, 'squeue %L' o
+--deadline del controller), AutoModel se ejecuta en tandas y el refinamiento de
+loops paso a paso, comprobando antes de cada tanda/paso que su duración estimada
+(medida en las anteriores) cabe sin invadir el tiempo reservado para la
+evaluación final y el CSV. Esa reserva se calcula con el coste medido de
+evaluar un modelo (complete_pdb + DOPE-HR) por el número de modelos a rankear.
+Las cadenas de loops que se detienen quedan en su checkpoint y continúan en la
+siguiente ejecución.
+"""
+
+import os
+import math
+import time
+import datetime
+import subprocess
+from typing import Dict, Optional, Set, Tuple
+
+import config
+import pipeline_log
+from config import WALLTIME_AWARE, WALLTIME_SAFETY_MARGIN, RANKING_SECONDS_PER_MODEL
+
+logger = pipeline_log.get_logger(__name__)
+
+RANKING_COST_FACTOR = 1.2   # Margen sobre el coste medido de evaluar cada modelo
+
+def parse_duration(value: str) -> float:
+    """
+    Convierte una duración con el formato de --time de SLURM a segundos:
+    'MM', 'MM:SS', 'HH:MM:SS', 'D-HH', 'D-HH:MM' o 'D-HH:MM:SS'.
+    """
+    days = 0
+    if '-' in value:
+        day_part, value = value.split('-', 1)
+        days = int(day_part)
+        parts = [int(p) for p in value.split(':')]
+        parts += [0] * (3 - len(parts))           # D-HH, D-HH:MM
+        hours, minutes, seconds = parts
+    else:
+        parts = [int(p) for p in value.split(':')]
+        if len(parts) == 1:
+            hours, minutes, seconds = 0, parts[0], 0
+        elif len(parts) == 2:
+            hours, minutes, seconds = 0, parts[0], parts[1]
+        else:
+            hours, minutes, seconds = parts
+    return float(((days * 24 + hours) * 60 + minutes) * 60 + seconds)
+
+def format_duration(seconds: float) -> str:
+    """Segundos a formato de SLURM D-HH:MM:SS (redondeando hacia arriba al minuto)."""
+    minutes = int(math.ceil(seconds / 60.0))
+    days, minutes = divmod(minutes, 24 * 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{days}-{hours:02d}:{minutes:02d}:00"
+
+def slurm_end_time() -> Optional[float]:
+    """
+    Hora de fin (epoch) de la reserva de SLURM actual: SLURM_JOB_END_TIME si
+    existe; si no, el tiempo restante que informa 'squeue -o %L'. None si el
+    trabajo no corre en SLURM o no tiene límite.
+    """
+    if os.environ.get('SLURM_JOB_END_TIME'):
+        return float(os.environ['SLURM_JOB_END_TIME'])
+    job_id = os.environ.get('SLURM_JOB_ID')
+    if not job_id:
+        return None
+    try:
+        output = subprocess.run(['squeue', '-h', '-j', job_id, '-o', '%L'],
+                                capture_output=True, text=True, timeout=30).stdout.strip()
+        return time.time() + parse_duration(output)
+    except (OSError, subprocess.SubprocessError, ValueError):
+        # UNLIMITED, NOT_SET, o squeue no disponible
+        return None
+
+def parse_deadline(value: str) -> float:
+    """Deadline explícito: fecha/hora ISO ('2026-10-20T08:00') o duración desde ahora ('12:00:00')."""
+    try:
+        return datetime.datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        return time.time() + parse_duration(value)
+
+class Deadline:
+    """
+    Límite de tiempo de la ejecución y estimaciones de duración medidas por etapa.
+    Sin límite (end_time None) todas las comprobaciones lo permiten todo.
+    """
+
+    def __init__(self, end_time: Optional[float] = None):
+        self.end_time = end_time
+        self.eval_seconds = RANKING_SECONDS_PER_MODEL
+        self.truncated: Set[str] = set()
+        self._rates: Dict[str, Tuple[float, float]] = {}   # tarea -> (segundos, unidades) acumulados
+
+    @classmethod
+    def from_environment(cls, deadline: Optional[str] = None) -> 'Deadline':
+        """Deadline explícito si se indica; si no, el fin de la reserva de SLURM (si WALLTIME_AWARE)."""
+        if deadline:
+            return cls(parse_deadline(deadline))
+        return cls(slurm_end_time() if WALLTIME_AWARE else None)
+
+    @property
+    def active(self) -> bool:
+        return self.end_time is not None
+
+    def remaining(self) -> float:
+        """Segundos hasta el límite (infinito si no hay límite)."""
+        return self.end_time - time.time() if self.active else float('inf')
+
+    def ranking_reserve(self, num_models: int) -> float:
+        """Tiempo reservado para evaluar num_models modelos y exportar el ranking."""
+        return WALLTIME_SAFETY_MARGIN + num_models * self.eval_seconds * RANKING_COST_FACTOR
+
+    def record(self, task: str, seconds: float, units: float = 1.0) -> None:
+        """Registra la duración medida de una tarea (units: modelos, residuos...)."""
+        total_seconds, total_units = self._rates.get(task, (0.0, 0.0))
+        self._rates[task] = (total_seconds + seconds, total_units + units)
+
+    def estimate(self, task: str, units: float = 1.0) -> float:
+        """Duración estimada de una tarea según las mediciones previas (0 si aún no hay ninguna)."""
+        total_seconds, total_units = self._rates.get(task, (0.0, 0.0))
+        return total_seconds / total_units * units if total_units else 0.0
+
+    def allows(self, seconds: float, num_models_to_rank: int, reserve: float = 0.0) -> bool:
+        """
+        True si una tarea de 'seconds' segundos termina antes del límite dejando
+        la reserva de ranking de num_models_to_rank modelos más 'reserve' segundos.
+        """
+        if not self.active:
+            return True
+        return seconds <= self.remaining() - self.ranking_reserve(num_models_to_rank) - reserve
+
+    def measure_evaluation(self, env, pdb_file: str) -> None:
+        """Mide el coste de evaluar un modelo (como en la evaluación final) para la reserva de ranking."""
+        import utils
+        start = time.time()
+        try:
+            utils.evaluate_model(env, pdb_file)
+        except Exception as e:
+            logger.warning(f"No se pudo medir el coste de evaluación con {pdb_file}. Error: {e}")
+            return
+        self.eval_seconds = max(0.1, time.time() - start)
+        logger.info(f"[WALLTIME] Coste de evaluación medido: {self.eval_seconds:.2f} s/modelo. "
+                    f"Tiempo restante: {format_duration(self.remaining())}", extra={'stage': 'walltime'})
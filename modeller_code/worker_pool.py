@@ -0,0 +1,531 @@
+#!/usr/bin/env python3
+# worker_pool.py
+
+"""
+Pool de workers de Modeller repartido entre varios nodos de la reserva.
+
+Un único Job reúne los workers locales del nodo del controller (LocalWorker) y
+los de los demás nodos asignados (SLURM_JOB_NODELIST o WORKER_NODES), de modo
+que AutoModel, el refinamiento de loops y las ventanas de loops largos ven un
+solo pool más grande. Los workers remotos se lanzan con WORKER_LAUNCHER:
+
+- 'srun':    un 'srun --nodelist=<nodo>' por worker dentro de la reserva.
+- 'ssh':     'ssh <nodo>' (nodos sin srun, p. ej. fuera de SLURM).
+- 'standin': los nodos remotos se simulan con subprocesos locales, cada uno en
+             su propia carpeta; sirve para probar el pool en una sola máquina
+             (python3 worker_pool.py test --hosts nodoA,nodoB).
+- 'local':   solo workers locales (comportamiento original).
+
+Con WORKER_SHARED_FILESYSTEM los workers remotos trabajan en la misma carpeta
+que el controller. Si no, cada nodo trabaja en WORKER_SCRATCH_DIR: antes de
+cada tanda de tareas (run_all_tasks) se copian los archivos de entrada nuevos o
+modificados (carpeta de trabajo, TEMPLATE_DIRECTORY y los registrados con
+stage_inputs) y al terminarla se recogen los archivos que los workers crearon.
+"""
+
+import os
+import re
+import sys
+import shlex
+import shutil
+import socket
+import argparse
+import subprocess
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import config
+import pipeline_log
+import cpu_placement
+from config import NUM_PROCESSORS, WORKER_LAUNCHER, WORKER_NODES, WORKERS_PER_NODE
+from config import WORKER_SHARED_FILESYSTEM, WORKER_SCRATCH_DIR, WORKER_MASTER_HOST
+
+logger = pipeline_log.get_logger(__name__)
+
+LAUNCHERS = ('local', 'srun', 'ssh', 'standin')
+
+# =================================================================
+# NODOS DE LA RESERVA
+# =================================================================
+
+def _split_top_level(text: str) -> List[str]:
+    """Separa por comas que no estén dentro de corchetes."""
+    parts, depth, current = [], 0, ''
+    for char in text:
+        if char == '[':
+            depth += 1
+        elif char == ']':
+            depth -= 1
+        if char == ',' and depth == 0:
+            parts.append(current)
+            current = ''
+        else:
+            current += char
+    if current:
+        parts.append(current)
+    return [p.strip() for p in parts if p.strip()]
+
+def _expand_brackets(pattern: str) -> List[str]:
+    """Expande el primer grupo '[..]' (rangos con ceros a la izquierda) y recursivamente el resto."""
+    match = re.search(r'\[([^\]]+)\]', pattern)
+    if not match:
+        return [pattern]
+    prefix, suffix = pattern[:match.start()], pattern[match.end():]
+    values = []
+    for item in match.group(1).split(','):
+        if '-' in item:
+            low, high = item.split('-', 1)
+            width = len(low)
+            values.extend(f'{n:0{width}d}' for n in range(int(low), int(high) + 1))
+        else:
+            values.append(item)
+    return [name for value in values for name in _expand_brackets(prefix + value + suffix)]
+
+def expand_nodelist(nodelist: str) -> List[str]:
+    """
+    Expande una lista de nodos con el formato compacto de SLURM:
+    'node[01-03,07],gpu[1-2]-ib' -> node01, node02, node03, node07, gpu1-ib, gpu2-ib.
+    """
+    hosts: List[str] = []
+    for part in _split_top_level(nodelist):
+        for host in _expand_brackets(part):
+            if host not in hosts:
+                hosts.append(host)
+    return hosts
+
+def expand_cpus_per_node(value: str) -> List[int]:
+    """SLURM_JOB_CPUS_PER_NODE ('48(x2),24') a una lista por nodo: [48, 48, 24]."""
+    counts: List[int] = []
+    for item in value.split(','):
+        match = re.fullmatch(r'\s*(\d+)(?:\(x(\d+)\))?\s*', item)
+        if match:
+            counts.extend([int(match.group(1))] * int(match.group(2) or 1))
+    return counts
+
+def _short_name(host: str) -> str:
+    return host.split('.')[0]
+
+def allocated_nodes() -> List[Tuple[str, int]]:
+    """
+    Nodos de la reserva y workers por nodo: WORKER_NODES o SLURM_JOB_NODELIST;
+    WORKERS_PER_NODE o las CPUs que SLURM asigna a cada nodo (NUM_PROCESSORS si no se conocen).
+    """
+    nodelist = WORKER_NODES or os.environ.get('SLURM_JOB_NODELIST') or os.environ.get('SLURM_NODELIST')
+    if not nodelist:
+        return []
+    hosts = expand_nodelist(nodelist)
+    cpus = expand_cpus_per_node(os.environ.get('SLURM_JOB_CPUS_PER_NODE', ''))
+    if len(cpus) != len(hosts):
+        cpus = [NUM_PROCESSORS] * len(hosts)
+    return [(host, WORKERS_PER_NODE or n) for host, n in zip(hosts, cpus)]
+
+# =================================================================
+# LANZADORES
+# =================================================================
+
+class Launcher:
+    """
+    Arranca un worker en un nodo y mueve archivos entre la carpeta del controller
+    y la carpeta de trabajo del nodo. Las transferencias por defecto usan rsync.
+    """
+
+    name = 'base'
+
+    def command(self, host: str, workdir: str, worker_command: str) -> str:
+        raise NotImplementedError
+
+    def prepare(self, host: str, workdir: str) -> None:
+        self._run(['ssh', '-o', 'BatchMode=yes', host, f'mkdir -p {shlex.quote(workdir)}'])
+
+    def stage_in(self, host: str, workdir: str, files: List[str]) -> None:
+        """Copia 'files' (rutas relativas a la carpeta actual) a workdir en el nodo."""
+        self._run(['rsync', '-a', '--relative', '--files-from=-', './', f'{host}:{workdir}/'],
+                  input_text='\n'.join(files) + '\n')
+
+    def collect(self, host: str, workdir: str) -> List[str]:
+        """Trae los archivos de primer nivel nuevos o modificados de workdir. Retorna sus nombres."""
+        output = self._run(['rsync', '-a', '--update', '--out-format=%n', '--exclude=*/',
+                            f'{host}:{workdir}/', './'])
+        return [line.strip() for line in output.splitlines() if line.strip()]
+
+    @staticmethod
+    def _run(cmd: List[str], input_text: Optional[str] = None) -> str:
+        result = subprocess.run(cmd, input=input_text, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise OSError(f"'{' '.join(cmd[:2])} ...' falló ({result.returncode}): {result.stderr.strip()}")
+        return result.stdout
+
+class SrunLauncher(Launcher):
+    """Un paso de srun por worker, fijado al nodo y a una CPU de la reserva."""
+
+    name = 'srun'
+
+    def command(self, host: str, workdir: str, worker_command: str) -> str:
+        inner = f'cd {shlex.quote(workdir)} && {worker_command}'
+        return (f'srun --nodes=1 --ntasks=1 --cpus-per-task=1 --exact --nodelist={shlex.quote(host)} '
+                f'bash -c {shlex.quote(inner)}')
+
+class SSHLauncher(Launcher):
+    name = 'ssh'
+
+    def command(self, host: str, workdir: str, worker_command: str) -> str:
+        inner = f'cd {shlex.quote(workdir)} && {worker_command}'
+        return f'ssh -o BatchMode=yes {shlex.quote(host)} {shlex.quote(inner)}'
+
+class LocalStandInLauncher(Launcher):
+    """
+    Simula nodos remotos en esta máquina: cada 'nodo' es una carpeta propia y
+    sus workers son subprocesos locales. Las transferencias son copias locales,
+    por lo que el ciclo completo (lanzar, copiar entradas, recoger salidas) se
+    puede probar sin una reserva multi-nodo.
+    """
+
+    name = 'standin'
+
+    def command(self, host: str, workdir: str, worker_command: str) -> str:
+        return f'cd {shlex.quote(workdir)} && {worker_command}'
+
+    def prepare(self, host: str, workdir: str) -> None:
+        os.makedirs(workdir, exist_ok=True)
+
+    def stage_in(self, host: str, workdir: str, files: List[str]) -> None:
+        for path in files:
+            target = os.path.join(workdir, path)
+            os.makedirs(os.path.dirname(target) or '.', exist_ok=True)
+            shutil.copy2(path, target)
+
+    def collect(self, host: str, workdir: str) -> List[str]:
+        collected = []
+        for entry in os.scandir(workdir):
+            if not entry.is_file():
+                continue
+            stat = entry.stat()
+            try:
+                local = os.stat(entry.name)
+                if local.st_mtime_ns >= stat.st_mtime_ns and local.st_size == stat.st_size:
+                    continue
+            except FileNotFoundError:
+                pass
+            shutil.copy2(entry.path, entry.name)
+            collected.append(entry.name)
+        return collected
+
+def get_launcher(name: str = WORKER_LAUNCHER) -> Optional[Launcher]:
+    """Lanzador configurado (None para 'local')."""
+    if name not in LAUNCHERS:
+        raise ValueError(f"WORKER_LAUNCHER desconocido: '{name}' (opciones: {', '.join(LAUNCHERS)})")
+    return {'srun': SrunLauncher, 'ssh': SSHLauncher, 'standin': LocalStandInLauncher}.get(name, lambda: None)()
+
+# =================================================================
+# SINCRONIZACIÓN DE ARCHIVOS (sin sistema de archivos compartido)
+# =================================================================
+
+def _input_files(extra: Iterable[str]) -> Dict[str, Tuple[int, int]]:
+    """
+    Archivos que los workers pueden necesitar, con (tamaño, mtime): los de primer
+    nivel de la carpeta de trabajo, los de TEMPLATE_DIRECTORY y los registrados.
+    """
+    files: Dict[str, Tuple[int, int]] = {}
+
+    def add(path: str) -> None:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return
+        files[os.path.normpath(path)] = (stat.st_size, stat.st_mtime_ns)
+
+    for entry in os.scandir('.'):
+        if entry.is_file():
+            add(entry.name)
+    template_dir = config.TEMPLATE_DIRECTORY
+    if template_dir and os.path.isdir(template_dir) and not os.path.isabs(template_dir):
+        for entry in os.scandir(template_dir):
+            if entry.is_file():
+                add(entry.path)
+    for path in extra:
+        if not os.path.isabs(path):
+            add(path)
+    return files
+
+class _RemoteNode:
+    """Un nodo remoto del pool: lanzador, carpeta de trabajo y archivos ya copiados."""
+
+    def __init__(self, host: str, workers: int, launcher: Launcher, workdir: str):
+        self.host = host
+        self.workers = workers
+        self.launcher = launcher
+        self.workdir = workdir
+        self.synced: Dict[str, Tuple[int, int]] = {}
+
+class WorkerPool:
+    """
+    Nodos remotos de un Job y sus transferencias. Con sistema de archivos
+    compartido (o sin nodos remotos) sync_inputs y collect_outputs no hacen nada.
+    """
+
+    def __init__(self, launcher: Optional[Launcher], nodes: List[_RemoteNode], shared_filesystem: bool):
+        self.launcher = launcher
+        self.nodes = nodes
+        self.shared_filesystem = shared_filesystem
+        self.pending_inputs: List[str] = []
+
+    @property
+    def transfers(self) -> bool:
+        return bool(self.nodes) and not self.shared_filesystem
+
+    def sync_inputs(self) -> None:
+        """Copia a cada nodo los archivos de entrada nuevos o modificados desde la última tanda."""
+        if not self.transfers:
+            return
+        files = _input_files(self.pending_inputs)
+        self.pending_inputs = []
+        for node in self.nodes:
+            changed = sorted(path for path, key in files.items() if node.synced.get(path) != key)
+            if not changed:
+                continue
+            node.launcher.stage_in(node.host, node.workdir, changed)
+            node.synced.update({path: files[path] for path in changed})
+            logger.debug(f"[POOL] {len(changed)} archivos copiados a {node.host}:{node.workdir}",
+                         extra={'stage': 'worker_pool', 'count': len(changed)})
+
+    def collect_outputs(self) -> None:
+        """
+        Recoge en la carpeta de trabajo los archivos creados por los workers remotos.
+        Se marcan como ya sincronizados: son salidas, no entradas de otras tareas.
+        """
+        if not self.transfers:
+            return
+        collected: List[str] = []
+        for node in self.nodes:
+            try:
+                collected.extend(node.launcher.collect(node.host, node.workdir))
+            except OSError as e:
+                logger.error(f"No se pudieron recoger las salidas de {node.host}. Error: {e}")
+        outputs = _input_files(collected)
+        for node in self.nodes:
+            node.synced.update(outputs)
+        logger.debug(f"[POOL] {len(collected)} archivos recogidos de los nodos remotos",
+                     extra={'stage': 'worker_pool', 'count': len(collected)})
+
+def stage_inputs(job, paths: Iterable[str]) -> None:
+    """
+    Registra archivos fuera de la carpeta de trabajo (modelo de partida de un
+    loop, subsistemas recortados...) para copiarlos en la próxima tanda de tareas.
+    """
+    pool = getattr(job, 'worker_pool', None)
+    if pool is not None and pool.transfers:
+        pool.pending_inputs.extend(paths)
+
+# =================================================================
+# JOB DE MODELLER
+# =================================================================
+
+def _modeller_classes():
+    """Clases Job/Worker del pool (Modeller se importa solo al crear el Job)."""
+    from modeller.parallel import Job, Worker, LocalWorker
+
+    class PinnedLocalWorker(LocalWorker):
+        """
+        LocalWorker que arranca con la afinidad de CPU y los límites de hilos de su
+        plan (cpu_placement). El proceso se lanza como el de LocalWorker, pero en
+        su propia sesión (pids: el líder del grupo, para que fault_tolerance mida
+        y termine solo los workers del Job) y con el log abierto en O_APPEND
+        (pipeline_log.open_worker_log), de modo que rotarlo no deja archivos dispersos.
+        """
+
+        def __init__(self, cpus: List[int], env: Dict[str, str]):
+            LocalWorker.__init__(self)
+            self.cpus = cpus
+            self.thread_env = env
+            self.pids: List[int] = []
+
+        def _start(self, path, id, output):
+            Worker._start(self, path, id, output)
+            with cpu_placement.applied(self.cpus, self.thread_env), pipeline_log.open_worker_log(output) as log:
+                process = subprocess.Popen(path, shell=True, stdout=log, stderr=subprocess.STDOUT,
+                                           start_new_session=True)
+            self.pids = [process.pid]
+
+    class RemoteWorker(Worker):
+        """
+        Worker arrancado en otro nodo mediante un Launcher, con el mismo contrato
+        que los workers de cola de Modeller (SGEPEWorker): el proceso se lanza en
+        segundo plano y se conecta al Job por su socket.
+        """
+
+        def __init__(self, node: _RemoteNode):
+            Worker.__init__(self)
+            self.node = node
+
+        def _start(self, path, id, output):
+            Worker._start(self, path, id, output)
+            cmdline = self.node.launcher.command(self.node.host, self.node.workdir,
+                                                 cpu_placement.thread_env_prefix() + path)
+            with pipeline_log.open_worker_log(output) as log:
+                subprocess.Popen(cmdline, shell=True, stdout=log, stderr=subprocess.STDOUT)
+
+        def __repr__(self):
+            return f"<RemoteWorker on {self.node.host}>"
+
+    class PoolJob(Job):
+        """Job que copia las entradas antes de cada tanda de tareas y recoge las salidas al terminarla."""
+
+        def __init__(self, pool: WorkerPool, host: Optional[str] = None):
+            Job.__init__(self, host=host)
+            self.worker_pool = pool
+
+        def run_all_tasks(self):
+            self.worker_pool.sync_inputs()
+            try:
+                return Job.run_all_tasks(self)
+            finally:
+                self.worker_pool.collect_outputs()
+
+        def yield_tasks_unordered(self):
+            self.worker_pool.sync_inputs()
+            try:
+                for result in Job.yield_tasks_unordered(self):
+                    yield result
+            finally:
+                self.worker_pool.collect_outputs()
+
+    return Job, RemoteWorker, PoolJob, PinnedLocalWorker
+
+def _remote_workdir(host: str, launcher: Launcher, shared_filesystem: bool) -> str:
+    if shared_filesystem:
+        return os.getcwd()
+    run_tag = os.environ.get('SLURM_JOB_ID') or f'pid{os.getpid()}'
+    return os.path.join(os.path.abspath(WORKER_SCRATCH_DIR), run_tag, host)
+
+def plan_nodes(local_workers: int = NUM_PROCESSORS, launcher_name: str = WORKER_LAUNCHER,
+               nodes: Optional[List[Tuple[str, int]]] = None) -> Tuple[Optional[Launcher], List[Tuple[str, int]]]:
+    """
+    Lanzador y nodos remotos (host, workers). El nodo del controller no se incluye:
+    sus workers son los local_workers LocalWorker. Con el lanzador 'standin' todos
+    los nodos indicados son remotos simulados.
+    """
+    launcher = get_launcher(launcher_name)
+    if launcher is None:
+        return None, []
+    nodes = allocated_nodes() if nodes is None else nodes
+    if launcher.name != 'standin':
+        local_names = {_short_name(socket.gethostname()), _short_name(socket.getfqdn())}
+        nodes = [(host, n) for host, n in nodes if _short_name(host) not in local_names]
+    return launcher, [(host, n) for host, n in nodes if n > 0]
+
+def create_job(local_workers: int = NUM_PROCESSORS, launcher_name: str = WORKER_LAUNCHER,
+               nodes: Optional[List[Tuple[str, int]]] = None,
+               shared_filesystem: bool = WORKER_SHARED_FILESYSTEM):
+    """
+    Crea y arranca el Job del pipeline: local_workers LocalWorker en este nodo y,
+    según WORKER_LAUNCHER, los workers de los demás nodos de la reserva.
+    """
+    Job, RemoteWorker, PoolJob, PinnedLocalWorker = _modeller_classes()
+    placement = cpu_placement.plan_placement(local_workers)
+    thread_env = cpu_placement.thread_environ()
+
+    launcher, remote_nodes = plan_nodes(local_workers, launcher_name, nodes)
+    if not remote_nodes:
+        job = Job()
+        logger.info(f"[PARALLEL] Configurando {local_workers} workers locales.")
+        for worker in placement['workers']:
+            job.append(PinnedLocalWorker(worker['cpus'], thread_env))
+        job.start()
+        _apply_controller_placement(job, placement)
+        return job
+
+    pool_nodes = [_RemoteNode(host, n, launcher, _remote_workdir(host, launcher, shared_filesystem))
+                  for host, n in remote_nodes]
+    pool = WorkerPool(launcher, pool_nodes, shared_filesystem)
+    master_host = 'localhost' if launcher.name == 'standin' else (WORKER_MASTER_HOST or socket.getfqdn())
+    job = PoolJob(pool, host=master_host)
+    for worker in placement['workers']:
+        job.append(PinnedLocalWorker(worker['cpus'], thread_env))
+    for node in pool_nodes:
+        if pool.transfers:
+            node.launcher.prepare(node.host, node.workdir)
+        for _ in range(node.workers):
+            job.append(RemoteWorker(node))
+
+    # Los workers remotos necesitan los módulos del pipeline antes de recibir tareas
+    pool.sync_inputs()
+    remote_total = sum(node.workers for node in pool_nodes)
+    logger.info(f"[PARALLEL] Configurando {local_workers} workers locales + {remote_total} workers en "
+                f"{len(pool_nodes)} nodos ({launcher.name}, "
+                f"{'carpeta compartida' if not pool.transfers else 'copia de entradas/salidas'}).",
+                extra={'stage': 'worker_pool', 'count': local_workers + remote_total})
+    for node in pool_nodes:
+        logger.debug(f"[POOL] {node.host}: {node.workers} workers en {node.workdir}", extra={'stage': 'worker_pool'})
+    job.start()
+    _apply_controller_placement(job, placement)
+    return job
+
+def _apply_controller_placement(job, placement: Dict[str, object]) -> None:
+    """Con los workers ya arrancados, fija el controller a sus CPUs reservadas y muestra la colocación."""
+    cpu_placement.pin_controller(placement)
+    cpu_placement.log_placement(placement, [pid for worker in job for pid in getattr(worker, 'pids', [])])
+
+# =================================================================
+# CLI
+# =================================================================
+
+def run_probe(job, num_tasks: int) -> int:
+    """Reparte num_tasks tareas de prueba en el pool y comprueba que sus archivos llegan a la carpeta de trabajo."""
+    from custom_models import WorkerProbeTask
+
+    for probe_id in range(num_tasks):
+        job.queue_task(WorkerProbeTask(probe_id))
+    results = job.run_all_tasks()
+    missing = [r['file'] for r in results if r and not os.path.exists(r['file'])]
+
+    by_host: Dict[str, int] = {}
+    for result in results:
+        if result:
+            by_host[result['host']] = by_host.get(result['host'], 0) + 1
+    for host, count in sorted(by_host.items()):
+        logger.info(f"  {host:<30} {count} tareas")
+    for result in results:
+        if result and os.path.exists(result['file']):
+            os.remove(result['file'])
+    if missing:
+        logger.error(f"{len(missing)} archivos de salida no se recogieron: {missing[:5]}")
+        return 1
+    logger.info(f"[POOL] {len(results)} tareas completadas; todas las salidas se recogieron.")
+    return 0
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Pool de workers de Modeller en varios nodos.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    nodes_parser = subparsers.add_parser('nodes', help="Muestra los nodos y workers que usaría el pool.")
+    nodes_parser.add_argument('--launcher', default=WORKER_LAUNCHER, choices=LAUNCHERS)
+
+    test_parser = subparsers.add_parser('test', help="Arranca el pool y reparte tareas de prueba.")
+    test_parser.add_argument('--launcher', default='standin', choices=LAUNCHERS)
+    test_parser.add_argument('--hosts', default=None,
+                             help="Nodos (formato SLURM, ej. 'nodo[1-2]'); por defecto, los de la reserva.")
+    test_parser.add_argument('--workers-per-node', type=int, default=2)
+    test_parser.add_argument('--local-workers', type=int, default=1)
+    test_parser.add_argument('--tasks', type=int, default=8)
+    test_parser.add_argument('--shared', action='store_true',
+                             help="Los nodos comparten la carpeta de trabajo (sin copias).")
+    args = parser.parse_args(argv)
+
+    pipeline_log.setup_logging(log_file=None)
+
+    if args.command == 'nodes':
+        launcher, remote_nodes = plan_nodes(launcher_name=args.launcher)
+        logger.info(f"Nodo del controller: {socket.gethostname()} ({NUM_PROCESSORS} workers locales)")
+        for host, workers in remote_nodes:
+            logger.info(f"  {host:<30} {workers} workers")
+        if launcher is None:
+            logger.info("WORKER_LAUNCHER = 'local': solo se usan workers locales.")
+        return 0
+
+    nodes = None
+    if args.hosts:
+        nodes = [(host, args.workers_per_node) for host in expand_nodelist(args.hosts)]
+    job = create_job(args.local_workers, args.launcher, nodes, shared_filesystem=args.shared)
+    return run_probe(job, args.tasks)
+
+if __name__ == '__main__':
+    sys.exit(main())